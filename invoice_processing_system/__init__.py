@@ -0,0 +1,4 @@
+# Nạp Celery app khi Django khởi động để @shared_task dùng đúng cấu hình broker
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
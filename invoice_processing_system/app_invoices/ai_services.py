@@ -6,37 +6,28 @@ Tích hợp các AI model để phân loại, trích xuất và phân tích hóa
 
 import os
 import re
-import json
 import logging
+import threading
+import time
+from importlib.util import find_spec
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-import numpy as np
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report
-import joblib
-
-# AI Libraries
-try:
-    from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-    from sentence_transformers import SentenceTransformer
-    import spacy
-    TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    TRANSFORMERS_AVAILABLE = False
+
+# AI Libraries: chỉ kiểm tra đã cài hay chưa (không import), module nặng được
+# import ở lần dùng đầu tiên để web worker / lệnh manage.py không phải trả giá khởi động
+TRANSFORMERS_AVAILABLE = all(find_spec(name) is not None for name in ('transformers', 'sentence_transformers', 'spacy'))
+if not TRANSFORMERS_AVAILABLE:
     print("⚠️ Transformers không được cài đặt. Một số tính năng AI sẽ bị hạn chế.")
 
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+OPENAI_AVAILABLE = find_spec('openai') is not None
+if not OPENAI_AVAILABLE:
     print("⚠️ OpenAI không được cài đặt. Chatbot AI sẽ không hoạt động.")
 
 from django.conf import settings
 from django.utils import timezone
 
+from .text_scanner import InvoiceTextScan, AMOUNT
+
 logger = logging.getLogger(__name__)
 
 class InvoiceAIClassifier:
@@ -51,9 +42,64 @@ class InvoiceAIClassifier:
             'Điện', 'Nước', 'Internet', 'Điện thoại', 'Xăng dầu', 
             'Văn phòng phẩm', 'Thiết bị', 'Dịch vụ', 'Khác'
         ]
+        # File model cũ (trước registry), chỉ dùng khi chưa có phiên bản nào được kích hoạt
         self.model_path = os.path.join(settings.BASE_DIR, 'ai_models', 'invoice_classifier.pkl')
         self.vectorizer_path = os.path.join(settings.BASE_DIR, 'ai_models', 'vectorizer.pkl')
+        # Phiên bản trong registry đang dùng (0 = file cũ) + bản ghi AIModelTraining của lần train gần nhất
+        self.model_type = 'classifier'
+        self.version = None
+        self.last_training = None
+        self._watcher = None
+        self._swap_lock = threading.Lock()
+        # Số luồng cho RandomForest khi train / predict (-1 = mọi core)
+        self.n_jobs = getattr(settings, 'AI_CLASSIFIER_N_JOBS', -1)
         
+    def build_estimators(self):
+        """
+        🧱 TF-IDF + RandomForest chưa huấn luyện với cấu hình chuẩn
+        (dùng cho lần train đầy đủ và từng fold cross-validation)
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.ensemble import RandomForestClassifier
+
+        vectorizer = TfidfVectorizer(
+            max_features=5000,
+            stop_words=None,  # Giữ lại stop words tiếng Việt
+            ngram_range=(1, 3)
+        )
+        model = RandomForestClassifier(
+            n_estimators=100,
+            random_state=42,
+            max_depth=10,
+            n_jobs=self.n_jobs
+        )
+        return vectorizer, model
+
+    def fit_estimators(self, texts: List[str], labels: List[str]):
+        """Huấn luyện vectorizer + model trên dữ liệu, trả về (model, vectorizer)."""
+        vectorizer, model = self.build_estimators()
+        X = vectorizer.fit_transform(texts)
+        model.fit(X, labels)
+        return model, vectorizer
+
+    def publish_model(self, model, vectorizer, training_data_count: int, **fields):
+        """
+        📦 Lưu model thành phiên bản mới trong registry, kích hoạt (worker khác tự hot swap)
+        và dùng ngay trong tiến trình này. `fields` = accuracy, metrics, ... của AIModelTraining.
+        """
+        from .model_registry import publish_model_version
+        self.last_training = publish_model_version(
+            self.model_type,
+            {'model': model, 'vectorizer': vectorizer},
+            model_name=f"Invoice Classifier {timezone.now().strftime('%Y%m%d_%H%M%S')}",
+            training_data_count=training_data_count,
+            **fields
+        )
+        with self._swap_lock:
+            self.model, self.vectorizer = model, vectorizer
+            self.version = self.last_training.version
+        return self.last_training
+
     def train_model(self, training_data: List[Dict]):
         """
         🎯 Huấn luyện model phân loại hóa đơn
@@ -63,81 +109,136 @@ class InvoiceAIClassifier:
             texts = [item['text'] for item in training_data]
             labels = [item['category'] for item in training_data]
             
-            # Vectorize text
-            self.vectorizer = TfidfVectorizer(
-                max_features=5000,
-                stop_words=None,  # Giữ lại stop words tiếng Việt
-                ngram_range=(1, 3)
-            )
-            X = self.vectorizer.fit_transform(texts)
-            
-            # Train model
-            self.model = RandomForestClassifier(
-                n_estimators=100,
-                random_state=42,
-                max_depth=10
-            )
-            self.model.fit(X, labels)
+            started = time.perf_counter()
+            model, vectorizer = self.fit_estimators(texts, labels)
+            training_time_ms = int((time.perf_counter() - started) * 1000)
             
-            # Lưu model
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.vectorizer, self.vectorizer_path)
+            self.publish_model(model, vectorizer, len(training_data), training_time_ms=training_time_ms)
             
-            logger.info("✅ AI Classifier đã được huấn luyện thành công")
+            logger.info(f"✅ AI Classifier đã được huấn luyện thành công (phiên bản {self.version})")
             return True
             
         except Exception as e:
             logger.error(f"❌ Lỗi huấn luyện AI Classifier: {e}")
             return False
     
+    def train_incremental(self, chunk_size: int = 1000, full: bool = False, reporter=None) -> Dict:
+        """
+        📈 Huấn luyện tăng dần (HashingVectorizer + SGD partial_fit) trên dữ liệu gán nhãn mới
+        đọc thẳng từ DB theo từng lô, xem online_training.py. `full=True` học lại từ đầu.
+        """
+        from .online_training import train_incremental
+        stats = train_incremental(self, chunk_size=chunk_size, full=full, reporter=reporter)
+        if stats['version'] is not None:
+            self._load_version(stats['version'])
+        return stats
+    
     def load_model(self):
         """
-        📥 Load model đã huấn luyện
+        📥 Load model đã huấn luyện: phiên bản active trong registry (memory-mapped),
+        nếu chưa có thì file model cũ
         """
         try:
+            from .model_registry import read_active_version
+            version = read_active_version(self.model_type)
+            if version is not None:
+                return self._load_version(version)
+
             if os.path.exists(self.model_path) and os.path.exists(self.vectorizer_path):
-                self.model = joblib.load(self.model_path)
-                self.vectorizer = joblib.load(self.vectorizer_path)
+                import joblib
+                with self._swap_lock:
+                    self.model = joblib.load(self.model_path, mmap_mode='r')
+                    self.vectorizer = joblib.load(self.vectorizer_path, mmap_mode='r')
+                    self.version = 0
+                    self.set_n_jobs(self.n_jobs)
                 return True
             return False
         except Exception as e:
             logger.error(f"❌ Lỗi load AI model: {e}")
             return False
+
+    def _load_version(self, version: int) -> bool:
+        from .model_registry import load_model_version
+        artifacts = load_model_version(self.model_type, version, ['model', 'vectorizer'])
+        with self._swap_lock:
+            self.model = artifacts['model']
+            self.vectorizer = artifacts['vectorizer']
+            self.version = version
+            self.set_n_jobs(self.n_jobs)
+        logger.info(f"🔄 AI Classifier dùng phiên bản {version}")
+        return True
+
+    def _refresh_model(self):
+        """
+        🔄 Hot swap: chỉ `os.stat` file ACTIVE của registry; khi phiên bản active đổi
+        (train / rollback ở tiến trình khác) thì nạp phiên bản mới.
+        """
+        if self._watcher is None:
+            from .model_registry import ActiveModelWatcher
+            self._watcher = ActiveModelWatcher(self.model_type)
+        version = self._watcher.poll()
+        if version is not None and version != self.version:
+            try:
+                self._load_version(version)
+            except Exception as e:
+                logger.error(f"❌ Lỗi nạp phiên bản {version} của AI Classifier: {e}")
+    
+    def set_n_jobs(self, n_jobs: int):
+        """Đổi số luồng dùng khi predict (kể cả model cũ được lưu với n_jobs mặc định)."""
+        self.n_jobs = n_jobs
+        if self.model is not None and hasattr(self.model, 'n_jobs'):
+            self.model.n_jobs = n_jobs
     
     def classify_invoice(self, ocr_text: str) -> Dict:
         """
         🔍 Phân loại hóa đơn dựa trên OCR text
         """
+        return self.classify_batch([ocr_text])[0]
+
+    def classify_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        📚 Phân loại nhiều hóa đơn một lần: vectorize thành 1 ma trận thưa, chạy
+        `predict_proba` một lần (các cây chạy song song theo `n_jobs`), nhãn = argmax.
+        Kết quả cùng thứ tự và cùng dạng với `classify_invoice`.
+        """
+        if not texts:
+            return []
         try:
+            self._refresh_model()
             if not self.model or not self.vectorizer:
                 if not self.load_model():
-                    return {
+                    return [{
                         'category': 'Khác',
                         'confidence': 0.0,
                         'reason': 'Model chưa được huấn luyện'
-                    }
+                    } for _ in texts]
             
-            # Vectorize text
-            X = self.vectorizer.transform([ocr_text])
+            # Lấy model + vectorizer của cùng một phiên bản (có thể bị hot swap giữa chừng)
+            with self._swap_lock:
+                model, vectorizer = self.model, self.vectorizer
             
-            # Predict
-            prediction = self.model.predict(X)[0]
-            confidence = max(self.model.predict_proba(X)[0])
+            # Vectorize toàn bộ lô
+            X = vectorizer.transform(texts)
             
-            return {
-                'category': prediction,
+            # Predict: 1 lần duyệt forest cho cả nhãn và độ tin cậy (predict = argmax của predict_proba)
+            probabilities = model.predict_proba(X)
+            best = probabilities.argmax(axis=1)
+            categories = model.classes_[best]
+            confidences = probabilities[range(len(texts)), best]
+            
+            return [{
+                'category': category,
                 'confidence': float(confidence),
-                'reason': f'Phân loại dựa trên từ khóa: {self._extract_keywords(ocr_text)}'
-            }
+                'reason': f'Phân loại dựa trên từ khóa: {self._extract_keywords(text)}'
+            } for text, category, confidence in zip(texts, categories, confidences)]
             
         except Exception as e:
             logger.error(f"❌ Lỗi phân loại hóa đơn: {e}")
-            return {
+            return [{
                 'category': 'Khác',
                 'confidence': 0.0,
                 'reason': f'Lỗi AI: {str(e)}'
-            }
+            } for _ in texts]
     
     def _extract_keywords(self, text: str) -> List[str]:
         """
@@ -167,27 +268,60 @@ class InvoiceDataExtractor:
     """
     
     def __init__(self):
-        self.nlp = None
-        if TRANSFORMERS_AVAILABLE:
-            try:
-                # Load Vietnamese NLP model
-                self.nlp = spacy.load("vi_core_news_sm")
-            except OSError:
-                logger.warning("⚠️ Không tìm thấy model tiếng Việt cho spaCy")
+        self._nlp = None
+        self._nlp_loaded = False
+
+    @property
+    def nlp(self):
+        """Model spaCy tiếng Việt, chỉ nạp ở lần dùng đầu tiên."""
+        if not self._nlp_loaded:
+            self._nlp_loaded = True
+            if TRANSFORMERS_AVAILABLE:
+                try:
+                    import spacy
+                    # Load Vietnamese NLP model
+                    self._nlp = spacy.load("vi_core_news_sm")
+                except OSError:
+                    logger.warning("⚠️ Không tìm thấy model tiếng Việt cho spaCy")
+        return self._nlp
+
+    def warm_up(self):
+        """Nạp sẵn model spaCy (gọi khi worker khởi động)."""
+        return self.nlp is not None
     
+    # Regex biên dịch sẵn một lần (thứ tự = độ ưu tiên)
+    INVOICE_NUMBER_KEYWORD_PATTERNS = [
+        (re.compile(r'(?:Số|No|Number)[\s:]*(\d{4,10})', re.IGNORECASE), 'number_kw'),
+        (re.compile(r'(?:Hóa đơn|Invoice)[\s:]*(\d{4,10})', re.IGNORECASE), 'invoice_kw'),
+    ]
+    INVOICE_NUMBER_BEFORE_DATE = re.compile(r'(\d{4,10})(?=\s*(?:ngày|date|tháng))', re.IGNORECASE)
+    COMPANY_AFTER_KEYWORD = re.compile(r'(?:Công ty|Company|Corp|Ltd)[\s:]*([A-Za-zÀ-ỹ\t &]+)')
+    COMPANY_WITH_SUFFIX = re.compile(r'([A-Z][A-Za-zÀ-ỹ\s&]+(?:JSC|Ltd|Corp|Company))')
+    # MST người bán: dòng MST đầu tiên (thông tin đơn vị bán hàng đứng trước người mua)
+    SUPPLIER_TAX_ID = re.compile(r'(?:Mã số thuế|MST|Tax code)\s*[:.]?\s*(\d[\d .-]{8,16}\d)', re.IGNORECASE)
+    TOTAL_AFTER_KEYWORD = re.compile(r'(?:Tổng|Total|Tổng cộng)[\s:]*(' + AMOUNT + r')', re.IGNORECASE)
+    TAX_AFTER_KEYWORD = re.compile(r'(?:VAT|Thuế|Tax)[\s:]*(' + AMOUNT + r')', re.IGNORECASE)
+    DATE_NUMERIC = re.compile(r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})')
+    DATE_MONTH_WORD = re.compile(r'(\d{1,2}\s+(?:tháng|month)\s+\d{4})')
+    DUE_DATE_AFTER_KEYWORD = re.compile(r'(?:Hạn thanh toán|Due date|Đến hạn)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{4})', re.IGNORECASE)
+    DUE_DATE_BEFORE_KEYWORD = re.compile(r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})(?=\s*(?:hạn|due))', re.IGNORECASE)
+
     def extract_smart_data(self, ocr_text: str) -> Dict:
         """
         🧠 Trích xuất dữ liệu thông minh từ OCR text
+        Text chỉ được quét 1 lượt (InvoiceTextScan), các trường dùng chung kết quả quét.
         """
         try:
+            scan = InvoiceTextScan(ocr_text)
             extracted = {
-                'invoice_number': self._extract_invoice_number(ocr_text),
-                'supplier_name': self._extract_supplier_name(ocr_text),
-                'total_amount': self._extract_total_amount(ocr_text),
-                'tax_amount': self._extract_tax_amount(ocr_text),
-                'issue_date': self._extract_date(ocr_text),
-                'due_date': self._extract_due_date(ocr_text),
-                'items': self._extract_items(ocr_text),
+                'invoice_number': self._extract_invoice_number(ocr_text, scan),
+                'supplier_name': self._extract_supplier_name(ocr_text, scan),
+                'supplier_tax_id': self._extract_supplier_tax_id(ocr_text, scan),
+                'total_amount': self._extract_total_amount(ocr_text, scan),
+                'tax_amount': self._extract_tax_amount(ocr_text, scan),
+                'issue_date': self._extract_date(ocr_text, scan),
+                'due_date': self._extract_due_date(ocr_text, scan),
+                'items': self._extract_items(ocr_text, scan),
                 'confidence_score': 0.0
             }
             
@@ -200,147 +334,153 @@ class InvoiceDataExtractor:
             logger.error(f"❌ Lỗi trích xuất dữ liệu AI: {e}")
             return {}
     
-    def _extract_invoice_number(self, text: str) -> Optional[str]:
+    def _extract_invoice_number(self, text: str, scan: InvoiceTextScan = None) -> Optional[str]:
         """
         🔢 Trích xuất số hóa đơn thông minh
         """
-        patterns = [
-            r'(?:Số|No|Number)[\s:]*(\d{4,10})',
-            r'(?:Hóa đơn|Invoice)[\s:]*(\d{4,10})',
-            r'(\d{4,10})(?=\s*(?:ngày|date|tháng))',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        scan = scan or InvoiceTextScan(text)
+        for pattern, anchor in self.INVOICE_NUMBER_KEYWORD_PATTERNS:
+            match = scan.search(pattern, anchor)
+            if match:
+                return match.group(1)
+
+        if scan.has('date_suffix'):
+            match = self.INVOICE_NUMBER_BEFORE_DATE.search(text)
             if match:
                 return match.group(1)
         return None
     
-    def _extract_supplier_name(self, text: str) -> Optional[str]:
+    def _extract_supplier_name(self, text: str, scan: InvoiceTextScan = None) -> Optional[str]:
         """
         🏢 Trích xuất tên nhà cung cấp thông minh
         """
+        scan = scan or InvoiceTextScan(text)
+
         # Tìm tên công ty
-        company_patterns = [
-            r'(?:Công ty|Company|Corp|Ltd)[\s:]*([A-Za-zÀ-ỹ\s&]+)',
-            r'([A-Z][A-Za-zÀ-ỹ\s&]+(?:JSC|Ltd|Corp|Company))',
-        ]
-        
-        for pattern in company_patterns:
-            match = re.search(pattern, text)
+        match = scan.search(self.COMPANY_AFTER_KEYWORD, 'company_kw')
+        if match:
+            return match.group(1).strip()
+        if scan.has('company_suffix'):
+            match = self.COMPANY_WITH_SUFFIX.search(text)
             if match:
                 return match.group(1).strip()
         
         # Fallback: tìm dòng đầu tiên có thể là tên công ty
-        lines = text.split('\n')[:5]  # 5 dòng đầu
+        lines = scan.head_lines(5)  # 5 dòng đầu
         for line in lines:
             if len(line) > 10 and any(char.isupper() for char in line):
                 return line.strip()
         
         return None
     
-    def _extract_total_amount(self, text: str) -> Optional[float]:
+    def _extract_supplier_tax_id(self, text: str, scan: InvoiceTextScan = None) -> Optional[str]:
+        """
+        🧾 Trích xuất mã số thuế nhà cung cấp (chỉ giữ chữ số, 10 hoặc 13 số)
+        """
+        scan = scan or InvoiceTextScan(text)
+        match = scan.search(self.SUPPLIER_TAX_ID, 'tax_id_kw')
+        if match:
+            digits = re.sub(r'\D', '', match.group(1))
+            if len(digits) in (10, 13):
+                return digits
+        return None
+
+    def _extract_total_amount(self, text: str, scan: InvoiceTextScan = None) -> Optional[float]:
         """
         💰 Trích xuất tổng tiền thông minh
+        Ứng viên: số sau 'Tổng/Total' và số ngay trước đơn vị tiền tệ (đ/VND/₫)
         """
-        # Patterns cho tổng tiền
-        patterns = [
-            r'(?:Tổng|Total|Tổng cộng)[\s:]*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)',
-            r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*(?:đ|VND|₫)',
-            r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)(?=\s*(?:đ|VND|₫))',
-        ]
+        scan = scan or InvoiceTextScan(text)
+        matches = scan.findall(self.TOTAL_AFTER_KEYWORD, 'total_kw') + scan.amounts_before_currency()
         
         amounts = []
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                try:
-                    # Clean và convert
-                    clean_amount = match.replace('.', '').replace(',', '.')
-                    amount = float(clean_amount)
-                    if amount > 1000:  # Chỉ lấy số tiền hợp lý
-                        amounts.append(amount)
-                except:
-                    continue
+        for match in matches:
+            try:
+                # Clean và convert
+                clean_amount = match.replace('.', '').replace(',', '.')
+                amount = float(clean_amount)
+                if amount > 1000:  # Chỉ lấy số tiền hợp lý
+                    amounts.append(amount)
+            except:
+                continue
         
         # Trả về số tiền lớn nhất (thường là tổng)
         return max(amounts) if amounts else None
     
-    def _extract_tax_amount(self, text: str) -> Optional[float]:
+    def _extract_tax_amount(self, text: str, scan: InvoiceTextScan = None) -> Optional[float]:
         """
         🧾 Trích xuất thuế VAT
         """
-        patterns = [
-            r'(?:VAT|Thuế|Tax)[\s:]*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)',
-            r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*(?:đ|VND|₫)(?=\s*(?:VAT|Thuế))',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
+        scan = scan or InvoiceTextScan(text)
+        for candidate in (self._tax_after_keyword, InvoiceTextScan.first_amount_before_tax):
+            amount = candidate(scan)
+            if amount:
                 try:
-                    clean_amount = match.group(1).replace('.', '').replace(',', '.')
+                    clean_amount = amount.replace('.', '').replace(',', '.')
                     return float(clean_amount)
                 except:
                     continue
         return None
+
+    def _tax_after_keyword(self, scan: InvoiceTextScan) -> Optional[str]:
+        match = scan.search(self.TAX_AFTER_KEYWORD, 'tax_kw')
+        return match.group(1) if match else None
     
-    def _extract_date(self, text: str) -> Optional[str]:
+    def _extract_date(self, text: str, scan: InvoiceTextScan = None) -> Optional[str]:
         """
         📅 Trích xuất ngày phát hành
         """
-        date_patterns = [
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
-            r'(\d{1,2}\s+(?:tháng|month)\s+\d{4})',
-            r'(?:Ngày|Date)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
+        scan = scan or InvoiceTextScan(text)
+        match = self.DATE_NUMERIC.search(text)
+        if match:
+            return match.group(1)
+        if scan.has('month_kw'):
+            match = self.DATE_MONTH_WORD.search(text)
             if match:
                 return match.group(1)
+        # Mẫu 'Ngày: dd/mm/yyyy' chứa mẫu số ở trên nên không cần tìm lại
         return None
     
-    def _extract_due_date(self, text: str) -> Optional[str]:
+    def _extract_due_date(self, text: str, scan: InvoiceTextScan = None) -> Optional[str]:
         """
         ⏰ Trích xuất ngày đến hạn
         """
-        patterns = [
-            r'(?:Hạn thanh toán|Due date|Đến hạn)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})(?=\s*(?:hạn|due))',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        scan = scan or InvoiceTextScan(text)
+        match = scan.search(self.DUE_DATE_AFTER_KEYWORD, 'due_kw')
+        if match:
+            return match.group(1)
+        if scan.has('due_suffix'):
+            match = self.DUE_DATE_BEFORE_KEYWORD.search(text)
             if match:
                 return match.group(1)
         return None
     
-    def _extract_items(self, text: str) -> List[Dict]:
+    def _extract_items(self, text: str, scan: InvoiceTextScan = None) -> List[Dict]:
         """
         📦 Trích xuất danh sách sản phẩm/dịch vụ
         """
+        scan = scan or InvoiceTextScan(text)
         items = []
-        lines = text.split('\n')
         
-        for line in lines:
-            # Tìm dòng có số lượng, tên sản phẩm, giá
-            if re.search(r'\d+\s+[A-Za-zÀ-ỹ]+\s+\d+', line):
-                parts = line.split()
-                if len(parts) >= 3:
-                    try:
-                        quantity = int(parts[0])
-                        price = float(parts[-1].replace(',', '.'))
-                        name = ' '.join(parts[1:-1])
-                        
-                        items.append({
-                            'name': name,
-                            'quantity': quantity,
-                            'price': price,
-                            'total': quantity * price
-                        })
-                    except:
-                        continue
+        # Chỉ duyệt các dòng có số lượng, tên sản phẩm, giá
+        for line in scan.item_lines():
+            parts = line.split()
+            if len(parts) >= 3:
+                try:
+                    quantity = int(parts[0])
+                    price = float(parts[-1].replace(',', '.'))
+                    name = ' '.join(parts[1:-1])
+                    
+                    items.append({
+                        'name': name,
+                        'quantity': quantity,
+                        'price': price,
+                        'total': quantity * price
+                    })
+                except:
+                    continue
+            if len(items) >= 10:
+                break
         
         return items[:10]  # Tối đa 10 items
     
@@ -408,18 +548,10 @@ class InvoiceFraudDetector:
                 fraud_indicators.append("Chất lượng ảnh kém, có thể là giả")
                 risk_score += 0.2
             
-            # Xác định mức độ rủi ro
-            if risk_score >= 0.8:
-                risk_level = "CAO"
-            elif risk_score >= 0.5:
-                risk_level = "TRUNG BÌNH"
-            else:
-                risk_level = "THẤP"
-            
             return {
                 'is_fraud': risk_score >= self.anomaly_threshold,
                 'risk_score': round(risk_score, 2),
-                'risk_level': risk_level,
+                'risk_level': self._get_risk_level(risk_score),
                 'indicators': fraud_indicators,
                 'recommendation': self._get_recommendation(risk_score)
             }
@@ -434,6 +566,38 @@ class InvoiceFraudDetector:
                 'recommendation': 'Không thể phân tích'
             }
     
+    def add_near_duplicates(self, fraud_result: Dict, duplicates: List[Dict]) -> Dict:
+        """
+        🧬 Cộng rủi ro hóa đơn gần trùng (chỉ mục MinHash/LSH, xem duplicate_index.py) vào kết quả detect_fraud
+        """
+        from .duplicate_index import NEAR_DUPLICATE_WEIGHT
+
+        fraud_result['near_duplicates'] = duplicates
+        if not duplicates:
+            return fraud_result
+
+        for duplicate in duplicates:
+            fraud_result['indicators'].append(
+                f"Gần trùng hóa đơn #{duplicate['invoice_id']} ({duplicate['invoice_number'] or 'chưa có số'}), "
+                f"độ tương đồng {duplicate['similarity']:.0%}"
+            )
+        risk_score = min(fraud_result['risk_score'] + NEAR_DUPLICATE_WEIGHT, 1.0)
+        fraud_result.update({
+            'is_fraud': risk_score >= self.anomaly_threshold,
+            'risk_score': round(risk_score, 2),
+            'risk_level': self._get_risk_level(risk_score),
+            'recommendation': self._get_recommendation(risk_score),
+        })
+        return fraud_result
+    
+    def _get_risk_level(self, risk_score: float) -> str:
+        """Xác định mức độ rủi ro"""
+        if risk_score >= 0.8:
+            return "CAO"
+        elif risk_score >= 0.5:
+            return "TRUNG BÌNH"
+        return "THẤP"
+    
     def _validate_invoice_number(self, invoice_number: str) -> bool:
         """Kiểm tra format số hóa đơn"""
         if not invoice_number:
@@ -513,70 +677,41 @@ class InvoiceFraudDetector:
 class AIChatbot:
     """
     🤖 AI Chatbot hỗ trợ người dùng
+
+    Câu trả lời được sinh bởi backend trong chat_backends (OpenAI async / cục bộ), câu hỏi FAQ được cache.
+    API stream (SSE) dùng trực tiếp `ChatReply`; `chat()` chờ đủ câu trả lời cho code đồng bộ.
     """
     
     def __init__(self):
         self.openai_available = OPENAI_AVAILABLE
-        if self.openai_available:
-            try:
-                openai.api_key = os.getenv('OPENAI_API_KEY')
-            except:
-                self.openai_available = False
+
+    @property
+    def backend(self):
+        from .chat_backends import get_chat_backend
+        return get_chat_backend()
+
+    def reply(self, user_message: str, context: Dict = None):
+        """📨 ChatReply để stream câu trả lời (async)."""
+        from .chat_backends import ChatReply
+        return ChatReply(user_message, context, backend=self.backend)
     
     def chat(self, user_message: str, context: Dict = None) -> str:
         """
         💬 Chat với AI bot
         """
         try:
-            if not self.openai_available:
-                return self._fallback_response(user_message)
-            
-            # Tạo prompt context
-            system_prompt = """
-            Bạn là AI assistant chuyên về xử lý hóa đơn. 
-            Bạn có thể giúp:
-            - Giải thích trạng thái hóa đơn
-            - Hướng dẫn sử dụng hệ thống
-            - Phân tích dữ liệu hóa đơn
-            - Đưa ra khuyến nghị
-            """
-            
-            if context:
-                system_prompt += f"\nContext hiện tại: {json.dumps(context, ensure_ascii=False)}"
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
-            
+            from asgiref.sync import async_to_sync
+            return async_to_sync(self.reply(user_message, context).collect)()
         except Exception as e:
             logger.error(f"❌ Lỗi AI Chatbot: {e}")
             return self._fallback_response(user_message)
     
     def _fallback_response(self, user_message: str) -> str:
         """
-        🔄 Fallback response khi không có OpenAI
+        🔄 Fallback response khi không có model
         """
-        message_lower = user_message.lower()
-        
-        if any(word in message_lower for word in ['trạng thái', 'status', 'hóa đơn']):
-            return "Trạng thái hóa đơn có thể là: Đã tải lên, Đang xử lý OCR, Đã xử lý OCR, Chờ xem xét, Đã khớp, Sai lệch, Chờ phê duyệt, Lỗi tích hợp ERP, Bị từ chối, Đã phê duyệt."
-        
-        elif any(word in message_lower for word in ['hướng dẫn', 'help', 'giúp']):
-            return "Tôi có thể giúp bạn: 1) Upload hóa đơn 2) Xem trạng thái xử lý 3) Phê duyệt hóa đơn 4) Xem báo cáo. Bạn cần hỗ trợ gì cụ thể?"
-        
-        elif any(word in message_lower for word in ['lỗi', 'error', 'không hoạt động']):
-            return "Nếu gặp lỗi, hãy kiểm tra: 1) File ảnh có rõ nét không 2) Kết nối mạng 3) Thử upload lại. Nếu vẫn lỗi, liên hệ admin."
-        
-        else:
-            return "Xin chào! Tôi là AI assistant của hệ thống xử lý hóa đơn. Tôi có thể giúp bạn về trạng thái hóa đơn, hướng dẫn sử dụng, hoặc phân tích dữ liệu. Bạn cần hỗ trợ gì?"
+        from .chat_backends import fallback_answer
+        return fallback_answer(user_message)
 
 
 class AIPredictor:
@@ -711,10 +846,52 @@ class AIPredictor:
             return "🔍 Cần kiểm tra kỹ lưỡng trước khi phê duyệt"
 
 
-# Global AI Services Instances
-ai_classifier = InvoiceAIClassifier()
-ai_extractor = InvoiceDataExtractor()
-fraud_detector = InvoiceFraudDetector()
-ai_chatbot = AIChatbot()
-ai_predictor = AIPredictor()
+# --- Registry các AI service (khởi tạo lười) ---
+# `from .ai_services import ai_classifier` vẫn hoạt động như trước: instance được tạo
+# ở lần truy cập đầu tiên (PEP 562 module __getattr__) thay vì lúc import module.
+AI_SERVICE_FACTORIES = {
+    'ai_classifier': InvoiceAIClassifier,
+    'ai_extractor': InvoiceDataExtractor,
+    'fraud_detector': InvoiceFraudDetector,
+    'ai_chatbot': AIChatbot,
+    'ai_predictor': AIPredictor,
+}
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_ai_service(name):
+    """🔌 Lấy AI service theo tên, khởi tạo ở lần gọi đầu tiên (an toàn giữa các luồng)."""
+    service = _services.get(name)
+    if service is not None:
+        return service
+    if name not in AI_SERVICE_FACTORIES:
+        raise KeyError(f"AI service không tồn tại: {name}")
+    with _services_lock:
+        service = _services.get(name)
+        if service is None:
+            service = AI_SERVICE_FACTORIES[name]()
+            _services[name] = service
+    return service
+
+
+def preload_ai_services(names=None):
+    """
+    🔥 Khởi tạo trước các AI service và nạp model của chúng (vd. khi Celery worker khởi động),
+    để job đầu tiên không phải chờ import sklearn / nạp model từ đĩa.
+    """
+    names = list(AI_SERVICE_FACTORIES) if names is None else names
+    for name in names:
+        service = get_ai_service(name)
+        if hasattr(service, 'warm_up'):
+            service.warm_up()
+        elif hasattr(service, 'load_model'):
+            service.load_model()
+    return names
+
 
+def __getattr__(name):
+    if name in AI_SERVICE_FACTORIES:
+        return get_ai_service(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,293 @@
+# app_invoices/chat_backends.py
+"""
+💬 Backend sinh câu trả lời cho AI Chatbot (stream từng đoạn) + cache câu trả lời theo câu hỏi chuẩn hóa
+
+- `ChatBackend`: giao diện async, `stream(messages)` là async generator trả về từng đoạn text.
+  Chờ model không giữ luồng / web worker (ASGI), đoạn đầu tiên được gửi ngay cho người dùng.
+- `OpenAIChatBackend`: `openai.AsyncOpenAI` (API >= 1.0, chat.completions với stream=True)
+- `LocalChatBackend`: trả lời FAQ có sẵn, stream theo từng từ, không gọi mạng (offline / chưa có API key / test)
+- Chọn backend bằng settings.AI_CHAT_BACKEND: 'openai', 'local' hoặc dotted path tới class tự viết
+- Câu hỏi kiểu FAQ (các nhóm câu hỏi mà fallback nhận ra) được cache theo câu hỏi chuẩn hóa
+  (Django cache, AI_CHAT_CACHE_ALIAS): hỏi lại trả lời ngay, không gọi model.
+  Câu trả lời dùng chung giữa mọi người dùng nên được sinh KHÔNG kèm context riêng của người hỏi
+  (hóa đơn gần đây...), để câu trả lời cache không chứa dữ liệu của người khác
+"""
+
+import re
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+import unicodedata
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+OPENAI_AVAILABLE = find_spec('openai') is not None
+
+CHAT_SYSTEM_PROMPT = """
+Bạn là AI assistant chuyên về xử lý hóa đơn.
+Bạn có thể giúp:
+- Giải thích trạng thái hóa đơn
+- Hướng dẫn sử dụng hệ thống
+- Phân tích dữ liệu hóa đơn
+- Đưa ra khuyến nghị
+"""
+
+# (chủ đề, từ khóa, câu trả lời) theo thứ tự ưu tiên
+FAQ_ANSWERS = (
+    ('status', ('trạng thái', 'status', 'hóa đơn'),
+     "Trạng thái hóa đơn có thể là: Đã tải lên, Đang xử lý OCR, Đã xử lý OCR, Chờ xem xét, Đã khớp, Sai lệch, "
+     "Chờ phê duyệt, Lỗi tích hợp ERP, Bị từ chối, Đã phê duyệt."),
+    ('help', ('hướng dẫn', 'help', 'giúp'),
+     "Tôi có thể giúp bạn: 1) Upload hóa đơn 2) Xem trạng thái xử lý 3) Phê duyệt hóa đơn 4) Xem báo cáo. "
+     "Bạn cần hỗ trợ gì cụ thể?"),
+    ('error', ('lỗi', 'error', 'không hoạt động'),
+     "Nếu gặp lỗi, hãy kiểm tra: 1) File ảnh có rõ nét không 2) Kết nối mạng 3) Thử upload lại. "
+     "Nếu vẫn lỗi, liên hệ admin."),
+)
+GREETING = (
+    "Xin chào! Tôi là AI assistant của hệ thống xử lý hóa đơn. Tôi có thể giúp bạn về trạng thái hóa đơn, "
+    "hướng dẫn sử dụng, hoặc phân tích dữ liệu. Bạn cần hỗ trợ gì?"
+)
+
+# Câu hỏi nhắc tới dữ liệu riêng của người hỏi: câu trả lời phụ thuộc context nên không dùng chung cache
+PERSONAL_WORDS = frozenset(('tôi', 'mình', 'em', 'tao', 'tớ', 'my', 'mine', 'me'))
+# Tiểu từ cuối câu không đổi nghĩa câu hỏi
+FILLER_WORDS = frozenset(('ạ', 'à', 'ơi', 'nhé', 'nha', 'vậy', 'thế', 'please', 'pls'))
+CACHE_MAX_WORDS = 12
+
+
+def faq_topic(message):
+    """Chủ đề FAQ mà câu hỏi thuộc về (theo từ khóa), None nếu không nhận ra."""
+    lowered = message.lower()
+    for topic, keywords, _ in FAQ_ANSWERS:
+        if any(word in lowered for word in keywords):
+            return topic
+    return None
+
+
+def fallback_answer(message):
+    """Câu trả lời FAQ có sẵn cho câu hỏi (lời chào nếu không nhận ra chủ đề)."""
+    topic = faq_topic(message)
+    for faq, _, answer in FAQ_ANSWERS:
+        if faq == topic:
+            return answer
+    return GREETING
+
+
+def normalize_question(message):
+    """Chuẩn hóa câu hỏi làm khóa cache: NFC, chữ thường, bỏ dấu câu + tiểu từ cuối câu, gộp khoảng trắng."""
+    text = unicodedata.normalize('NFC', message).lower()
+    words = re.sub(r'[\W_]+', ' ', text).split()
+    while words and words[-1] in FILLER_WORDS:
+        words.pop()
+    return ' '.join(words)
+
+
+def is_cacheable_question(normalized):
+    """
+    Chỉ cache câu hỏi kiểu FAQ: thuộc chủ đề fallback nhận ra, ngắn, không có số (ID / số hóa đơn)
+    và không nhắc tới dữ liệu riêng của người hỏi.
+    """
+    words = normalized.split()
+    if not words or len(words) > CACHE_MAX_WORDS or any(ch.isdigit() for ch in normalized):
+        return False
+    if PERSONAL_WORDS.intersection(words):
+        return False
+    return faq_topic(normalized) is not None
+
+
+def build_chat_messages(user_message, context=None):
+    """Danh sách message (system + user) gửi cho model."""
+    system_prompt = CHAT_SYSTEM_PROMPT
+    if context:
+        system_prompt += f"\nContext hiện tại: {json.dumps(context, ensure_ascii=False, default=str)}"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message},
+    ]
+
+
+class ChatBackend:
+    """
+    🔌 Giao diện backend chatbot: `stream()` là async generator trả về từng đoạn text của câu trả lời
+    """
+    name = 'base'
+
+    def cache_namespace(self):
+        """Đổi backend / model → không dùng lại câu trả lời đã cache của backend khác."""
+        return self.name
+
+    async def stream(self, messages, max_tokens=None, temperature=None):
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+
+class OpenAIChatBackend(ChatBackend):
+    """
+    ☁️ OpenAI chat.completions (stream=True) qua client async
+    """
+    name = 'openai'
+
+    def __init__(self, model=None, timeout=None):
+        self.model = model or getattr(settings, 'AI_CHAT_MODEL', 'gpt-3.5-turbo')
+        self.timeout = timeout or getattr(settings, 'AI_CHAT_TIMEOUT', 30)
+        self._clients = {}
+
+    def cache_namespace(self):
+        return f"{self.name}:{self.model}"
+
+    def _get_client(self):
+        """Một client cho mỗi event loop (connection pool httpx gắn với loop tạo ra nó)."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(id(loop))
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), timeout=self.timeout)
+            self._clients = {id(loop): client}
+        return client
+
+    async def stream(self, messages, max_tokens=None, temperature=None):
+        response = await self._get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens or getattr(settings, 'AI_CHAT_MAX_TOKENS', 500),
+            temperature=getattr(settings, 'AI_CHAT_TEMPERATURE', 0.7) if temperature is None else temperature,
+            stream=True,
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class LocalChatBackend(ChatBackend):
+    """
+    🏠 Backend cục bộ: trả lời FAQ có sẵn, stream theo từng từ (dùng khi offline và để test)
+
+    `first_delay` / `token_delay` (giây) giả lập độ trễ của model thật khi benchmark.
+    """
+    name = 'local'
+
+    def __init__(self, first_delay=None, token_delay=None):
+        self.first_delay = getattr(settings, 'AI_CHAT_LOCAL_FIRST_DELAY', 0.0) if first_delay is None else first_delay
+        self.token_delay = getattr(settings, 'AI_CHAT_LOCAL_TOKEN_DELAY', 0.0) if token_delay is None else token_delay
+
+    async def stream(self, messages, max_tokens=None, temperature=None):
+        question = next((message['content'] for message in reversed(messages) if message['role'] == 'user'), '')
+        if self.first_delay:
+            await asyncio.sleep(self.first_delay)
+        pieces = re.findall(r'\S+\s*', fallback_answer(question))
+        for piece in pieces[:max_tokens] if max_tokens else pieces:
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield piece
+
+
+CHAT_BACKENDS = {
+    'openai': OpenAIChatBackend,
+    'local': LocalChatBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def default_backend_name():
+    """AI_CHAT_BACKEND, hoặc tự chọn: openai nếu đã cài thư viện và có OPENAI_API_KEY, ngược lại local."""
+    name = getattr(settings, 'AI_CHAT_BACKEND', '')
+    if name:
+        return name
+    return 'openai' if OPENAI_AVAILABLE and os.getenv('OPENAI_API_KEY') else 'local'
+
+
+def get_chat_backend():
+    """🔌 Backend chatbot dùng chung trong tiến trình (khởi tạo ở lần gọi đầu tiên)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = default_backend_name()
+                factory = CHAT_BACKENDS.get(name) or import_string(name)
+                _backend = factory()
+                logger.info(f"💬 Chatbot backend: {_backend.cache_namespace()}")
+    return _backend
+
+
+def reset_chat_backend():
+    """Bỏ backend đã khởi tạo (đổi settings khi test / benchmark)."""
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def get_answer_cache():
+    return caches[getattr(settings, 'AI_CHAT_CACHE_ALIAS', 'default')]
+
+
+def answer_cache_key(backend, normalized):
+    digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    return f"ai_chat:{backend.cache_namespace()}:{digest}"
+
+
+class ChatReply:
+    """
+    📨 Một câu trả lời của chatbot: stream từng đoạn, tra / ghi cache câu hỏi FAQ
+
+    Sau khi stream xong: `text` là toàn bộ câu trả lời, `cached` = lấy từ cache,
+    `fallback` = backend lỗi trước đoạn đầu tiên nên trả lời bằng FAQ có sẵn,
+    `complete` = False nếu backend lỗi giữa chừng (text chỉ là phần đã nhận).
+    Câu hỏi cache được gửi cho model không kèm `context` (câu trả lời dùng chung giữa mọi người dùng).
+    """
+
+    def __init__(self, user_message, context=None, backend=None):
+        self.user_message = user_message
+        self.context = context
+        self.backend = backend or get_chat_backend()
+        self.normalized = normalize_question(user_message)
+        self.cacheable = is_cacheable_question(self.normalized)
+        self.text = ''
+        self.cached = False
+        self.fallback = False
+        self.complete = True
+
+    async def stream(self):
+        cache = get_answer_cache() if self.cacheable else None
+        key = answer_cache_key(self.backend, self.normalized) if self.cacheable else None
+        if cache is not None:
+            answer = await cache.aget(key)
+            if answer:
+                self.text, self.cached = answer, True
+                yield answer
+                return
+
+        parts = []
+        try:
+            context = None if self.cacheable else self.context
+            async for piece in self.backend.stream(build_chat_messages(self.user_message, context)):
+                parts.append(piece)
+                yield piece
+        except Exception as e:
+            logger.error(f"❌ Lỗi AI Chatbot ({self.backend.name}): {e}")
+            if parts:
+                self.text, self.complete = ''.join(parts), False
+                return
+            self.text, self.fallback = fallback_answer(self.user_message), True
+            yield self.text
+            return
+
+        self.text = ''.join(parts)
+        if cache is not None and self.text:
+            await cache.aset(key, self.text, getattr(settings, 'AI_CHAT_CACHE_TIMEOUT', 24 * 3600))
+
+    async def collect(self):
+        """Đọc hết stream, trả về toàn bộ câu trả lời."""
+        async for _ in self.stream():
+            pass
+        return self.text
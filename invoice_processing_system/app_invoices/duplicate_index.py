@@ -0,0 +1,276 @@
+# app_invoices/duplicate_index.py
+"""
+🧬 Chỉ mục hóa đơn gần trùng: chữ ký MinHash + LSH banding trên OCR text
+
+Hóa đơn nộp hai lần (scan lại, chụp lệch, OCR sai vài ký tự) không trùng text tuyệt đối nhưng
+có tập shingle gần giống nhau. So OCR text mới với mọi hóa đơn đã lưu là O(n); thay vào đó:
+- MinHash: mỗi text → 120 giá trị min của 120 hàm băm trên tập shingle 5 byte (text đã bỏ dấu,
+  chữ thường, bỏ khoảng trắng). Tỷ lệ giá trị bằng nhau giữa hai chữ ký ≈ độ tương đồng Jaccard.
+- LSH banding: chữ ký chia thành 20 band × 6 hàng, mỗi band băm thành 1 bucket (BigInteger có index).
+  Hai hóa đơn chỉ được so khi chung ít nhất một bucket → tra cứu là vài truy vấn theo index, không quét bảng.
+Chỉ mục được cập nhật khi lưu kết quả pipeline (InvoiceTextSignature + InvoiceLSHBucket),
+backfill bằng `python manage.py build_duplicate_index`.
+"""
+
+import hashlib
+import unicodedata
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+SHINGLE_SIZE = 5
+MAX_HASH = (1 << 32) - 1
+HASH_BLOCK = 4096          # số shingle mỗi khối khi tính min (giới hạn RAM với text nhiều trang)
+MAX_CANDIDATES = 2000      # ứng viên chung nhiều band nhất; bucket quá đông (mẫu hóa đơn trống) không thành quét bảng
+NEAR_DUPLICATE_WEIGHT = 0.5
+
+_PERMUTATIONS = {}
+
+
+def num_permutations():
+    return getattr(settings, 'INVOICE_MINHASH_PERMUTATIONS', 120)
+
+
+def num_bands():
+    return getattr(settings, 'INVOICE_LSH_BANDS', 20)
+
+
+def default_threshold():
+    return getattr(settings, 'INVOICE_NEAR_DUPLICATE_THRESHOLD', 0.75)
+
+
+def _permutations(count):
+    """
+    Hệ số (a lẻ, b) 64 bit của các hàm băm multiply-shift (a*x + b) >> 32 (tràn uint64 có chủ đích);
+    seed cố định để chữ ký ổn định giữa các tiến trình.
+    """
+    import numpy as np
+
+    if count not in _PERMUTATIONS:
+        rng = np.random.RandomState(1)
+        a = rng.randint(0, 1 << 63, size=count, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        b = rng.randint(0, 1 << 63, size=count, dtype=np.uint64)
+        _PERMUTATIONS[count] = (a[:, None], b[:, None])
+    return _PERMUTATIONS[count]
+
+
+def normalize_text(text):
+    """
+    Bỏ dấu (NFD → ASCII), chữ thường, bỏ khoảng trắng: lỗi OCR ở dấu tiếng Việt / khoảng cách chữ
+    không làm lệch shingle. Trả về bytes.
+    """
+    text = unicodedata.normalize('NFD', (text or '').replace('đ', 'd').replace('Đ', 'D'))
+    return text.lower().encode('ascii', 'ignore').translate(None, b' \t\n\r\x0b\x0c')
+
+
+def shingle_hashes(text):
+    """Giá trị băm 32 bit (duy nhất) của các shingle 5 byte, tính vector bằng NumPy."""
+    import numpy as np
+
+    data = np.frombuffer(normalize_text(text), dtype=np.uint8)
+    if data.size == 0:
+        return np.empty(0, dtype=np.uint64)
+    if data.size < SHINGLE_SIZE:
+        data = np.pad(data, (0, SHINGLE_SIZE - data.size))
+
+    # Ghép SHINGLE_SIZE byte liên tiếp thành một số 40 bit rồi trộn (Fibonacci hashing) xuống 32 bit
+    count = data.size - SHINGLE_SIZE + 1
+    packed = np.zeros(count, dtype=np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        packed = (packed << np.uint64(8)) | data[offset:offset + count].astype(np.uint64)
+    mixed = (packed * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+    return np.unique(mixed)
+
+
+def compute_minhash(text):
+    """
+    🧮 Chữ ký MinHash (mảng uint32, dài INVOICE_MINHASH_PERMUTATIONS) của OCR text, None nếu text rỗng.
+    """
+    return minhash_from_hashes(shingle_hashes(text))
+
+
+def minhash_from_hashes(hashes):
+    import numpy as np
+
+    if hashes.size == 0:
+        return None
+    a, b = _permutations(num_permutations())
+    signature = np.full(a.shape[0], MAX_HASH, dtype=np.uint64)
+    for start in range(0, hashes.size, HASH_BLOCK):
+        block = hashes[start:start + HASH_BLOCK][None, :]
+        permuted = (a * block + b) >> np.uint64(32)
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+def band_keys(signature):
+    """Khóa bucket (int64 có dấu, vừa BigIntegerField) của từng band trong chữ ký."""
+    bands = num_bands()
+    rows = len(signature) // bands
+    keys = []
+    for band in range(bands):
+        digest = hashlib.blake2b(
+            signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8, person=b'lsh-band%02d' % band
+        ).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def unpack_signature(blob):
+    import numpy as np
+    return np.frombuffer(bytes(blob), dtype=np.uint32)
+
+
+def signature_similarity(signature, others):
+    """Độ tương đồng Jaccard ước lượng giữa `signature` và từng dòng của ma trận `others`."""
+    return (others == signature[None, :]).mean(axis=1)
+
+
+# --- Cập nhật chỉ mục ---
+def index_invoice_text(invoice_id, text, signature=None):
+    """
+    ➕ Ghi (hoặc thay) chữ ký + bucket LSH của hóa đơn. Text rỗng thì xóa khỏi chỉ mục.
+    Trả về chữ ký đã ghi (None nếu không có).
+    """
+    from .models import InvoiceTextSignature, InvoiceLSHBucket
+
+    hashes = shingle_hashes(text)
+    if signature is None:
+        signature = minhash_from_hashes(hashes)
+    with transaction.atomic():
+        InvoiceLSHBucket.objects.filter(invoice_id=invoice_id).delete()
+        if signature is None:
+            InvoiceTextSignature.objects.filter(invoice_id=invoice_id).delete()
+            return None
+        InvoiceTextSignature.objects.update_or_create(
+            invoice_id=invoice_id,
+            defaults={'signature': signature.tobytes(), 'shingle_count': int(hashes.size)},
+        )
+        InvoiceLSHBucket.objects.bulk_create(
+            [InvoiceLSHBucket(invoice_id=invoice_id, bucket=key) for key in band_keys(signature)]
+        )
+    return signature
+
+
+def index_invoice_texts(items):
+    """➕ Ghi chỉ mục cho nhiều hóa đơn một lần: `items` là danh sách (invoice_id, text)."""
+    from .models import InvoiceTextSignature, InvoiceLSHBucket
+
+    signatures, buckets = [], []
+    for invoice_id, text in items:
+        hashes = shingle_hashes(text)
+        signature = minhash_from_hashes(hashes)
+        if signature is None:
+            continue
+        signatures.append(InvoiceTextSignature(
+            invoice_id=invoice_id, signature=signature.tobytes(), shingle_count=int(hashes.size)
+        ))
+        buckets.extend(InvoiceLSHBucket(invoice_id=invoice_id, bucket=key) for key in band_keys(signature))
+
+    invoice_ids = [invoice_id for invoice_id, _ in items]
+    with transaction.atomic():
+        InvoiceLSHBucket.objects.filter(invoice_id__in=invoice_ids).delete()
+        InvoiceTextSignature.objects.filter(invoice_id__in=invoice_ids).delete()
+        InvoiceTextSignature.objects.bulk_create(signatures)
+        InvoiceLSHBucket.objects.bulk_create(buckets, batch_size=2000)
+    return len(signatures)
+
+
+# --- Tra cứu ---
+def find_near_duplicates(signature, exclude_invoice_id=None, earlier_than=None, threshold=None, limit=5):
+    """
+    🔎 Hóa đơn gần trùng với `signature`: ứng viên từ bucket LSH chung, lọc theo độ tương đồng ước lượng.
+    `earlier_than` = chỉ xét hóa đơn có id nhỏ hơn (bản nộp trước). Trả về danh sách
+    {'invoice_id', 'invoice_number', 'similarity'} giảm dần theo độ tương đồng.
+    """
+    import numpy as np
+    from .models import InvoiceTextSignature, InvoiceLSHBucket
+
+    if signature is None:
+        return []
+    threshold = default_threshold() if threshold is None else threshold
+
+    candidates = InvoiceLSHBucket.objects.filter(bucket__in=band_keys(signature))
+    if exclude_invoice_id is not None:
+        candidates = candidates.exclude(invoice_id=exclude_invoice_id)
+    if earlier_than is not None:
+        candidates = candidates.filter(invoice_id__lt=earlier_than)
+    candidate_ids = list(
+        candidates.values('invoice_id').annotate(shared=Count('id')).order_by('-shared')
+        .values_list('invoice_id', flat=True)[:MAX_CANDIDATES]
+    )
+    if not candidate_ids:
+        return []
+
+    rows = list(
+        InvoiceTextSignature.objects.filter(invoice_id__in=candidate_ids)
+        .values_list('invoice_id', 'invoice__invoice_number', 'signature')
+    )
+    # Bỏ qua chữ ký tạo với số hàm băm khác (cần build_duplicate_index --rebuild sau khi đổi cấu hình)
+    stored = [(invoice_id, number, unpack_signature(blob)) for invoice_id, number, blob in rows]
+    stored = [item for item in stored if len(item[2]) == len(signature)]
+    if not stored:
+        return []
+    similarities = signature_similarity(signature, np.vstack([other for _, _, other in stored]))
+
+    matches = [
+        {'invoice_id': invoice_id, 'invoice_number': number, 'similarity': round(float(similarity), 4)}
+        for (invoice_id, number, _), similarity in zip(stored, similarities)
+        if similarity >= threshold
+    ]
+    matches.sort(key=lambda match: (-match['similarity'], match['invoice_id']))
+    return matches[:limit]
+
+
+def find_invoice_near_duplicates(invoice_id, threshold=None, limit=5):
+    """Hóa đơn gần trùng với một hóa đơn đã có trong chỉ mục (cả bản nộp trước và sau)."""
+    from .models import InvoiceTextSignature
+
+    blob = InvoiceTextSignature.objects.filter(invoice_id=invoice_id).values_list('signature', flat=True).first()
+    if blob is None:
+        return None
+    return find_near_duplicates(unpack_signature(blob), exclude_invoice_id=invoice_id, threshold=threshold, limit=limit)
+
+
+def near_duplicate_similarity(threshold=None, max_bucket_size=200):
+    """
+    📚 Cho toàn bảng (chấm fraud theo lô): {invoice_id: độ tương đồng cao nhất với một hóa đơn nộp TRƯỚC nó}
+    cho các hóa đơn vượt ngưỡng. Cặp ứng viên lấy từ bucket chung, tính vector bằng NumPy.
+    """
+    import numpy as np
+    import pandas as pd
+    from .models import InvoiceTextSignature, InvoiceLSHBucket
+
+    threshold = default_threshold() if threshold is None else threshold
+    buckets = pd.DataFrame.from_records(
+        list(InvoiceLSHBucket.objects.values_list('bucket', 'invoice_id')), columns=['bucket', 'invoice_id']
+    )
+    if buckets.empty:
+        return {}
+    sizes = buckets.groupby('bucket')['invoice_id'].transform('size')
+    shared = buckets[(sizes > 1) & (sizes <= max_bucket_size)]
+    pairs = shared.merge(shared, on='bucket', suffixes=('_a', '_b'))
+    pairs = pairs[pairs['invoice_id_a'] < pairs['invoice_id_b']][['invoice_id_a', 'invoice_id_b']].drop_duplicates()
+    if pairs.empty:
+        return {}
+
+    involved = pd.unique(pairs[['invoice_id_a', 'invoice_id_b']].to_numpy().ravel())
+    rows = InvoiceTextSignature.objects.filter(invoice_id__in=[int(i) for i in involved]).values_list('invoice_id', 'signature')
+    position, matrix = {}, []
+    for invoice_id, blob in rows:
+        signature = unpack_signature(blob)
+        if len(signature) == num_permutations():
+            position[invoice_id] = len(matrix)
+            matrix.append(signature)
+    if not matrix:
+        return {}
+    matrix = np.vstack(matrix)
+
+    pairs = pairs[pairs['invoice_id_a'].isin(position) & pairs['invoice_id_b'].isin(position)]
+    left = pairs['invoice_id_a'].map(position).to_numpy()
+    right = pairs['invoice_id_b'].map(position).to_numpy()
+    similarity = (matrix[left] == matrix[right]).mean(axis=1)
+    scored = pd.Series(similarity, index=pairs['invoice_id_b'].to_numpy())
+    best = scored[scored >= threshold].groupby(level=0).max()
+    return {int(invoice_id): float(value) for invoice_id, value in best.items()}
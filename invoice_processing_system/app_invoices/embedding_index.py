@@ -0,0 +1,440 @@
+# app_invoices/embedding_index.py
+"""
+🧭 Tìm hóa đơn tương tự theo embedding OCR text (sentence-transformers + chỉ mục vector NumPy)
+
+- Nhập liệu: sau khi pipeline xong, OCR text được embedding theo lô trên CPU (model đa ngữ, vector chuẩn hóa L2)
+  và lưu vào `InvoiceEmbedding` (float32 bytes) - nguồn dữ liệu gốc, ghi an toàn từ nhiều worker.
+- Chỉ mục: `build_embedding_snapshot()` ghi toàn bộ vector thành ma trận float32 `vectors.npy` (ghi dần bằng memmap)
+  + bản đồ hàng → invoice id `invoice_ids.npy`, publish qua registry (thư mục phiên bản + file ACTIVE).
+  Tiến trình tìm kiếm map ma trận chỉ đọc từ page cache (các worker dùng chung RAM), tự nạp ảnh chụp mới.
+  Vector tạo sau ảnh chụp (id > high water) được đọc thêm từ DB theo từng phần nhỏ.
+- Tìm: cosine = tích vô hướng; nhân ma trận theo khối hàng (không tạo ma trận điểm n × m đầy đủ)
+  + `argpartition` lấy top-k từng khối rồi gộp.
+- Từ INVOICE_EMBEDDING_IVF_MIN_ROWS hàng trở lên: thêm bộ lượng tử thô (k-means cầu, ~√n cụm), hàng được sắp
+  theo cụm nên mỗi cụm là một đoạn liên tục của ma trận; truy vấn chỉ quét `nprobe` cụm gần nhất.
+"""
+
+import os
+import json
+import time
+import threading
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Invoice, InvoiceEmbedding
+from .model_registry import (
+    ActiveModelWatcher, staging_dir, publish_staged_version, prune_model_versions, version_dir,
+)
+
+EMBEDDINGS_AVAILABLE = find_spec('sentence_transformers') is not None
+
+MODEL_TYPE = 'embedding_index'
+SEARCH_BLOCK_ROWS = 32768     # hàng / khối nhân ma trận (32768 × 384 float32 = 48MB)
+READ_CHUNK_ROWS = 5000        # hàng / lần đọc InvoiceEmbedding từ DB
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+
+
+def embedding_model_name():
+    return getattr(settings, 'INVOICE_EMBEDDING_MODEL', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+
+
+# --- Encoder ---
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_text_encoder():
+    """SentenceTransformer của tiến trình (CPU), nạp ở lần dùng đầu. None nếu chưa cài sentence-transformers."""
+    global _encoder
+    if _encoder is None and EMBEDDINGS_AVAILABLE:
+        with _encoder_lock:
+            if _encoder is None:
+                from sentence_transformers import SentenceTransformer
+
+                started = time.perf_counter()
+                _encoder = SentenceTransformer(embedding_model_name(), device='cpu')
+                print(f"🧭 Đã nạp model embedding {embedding_model_name()} trong {time.perf_counter() - started:.1f}s")
+    return _encoder
+
+
+def encode_texts(texts):
+    """Embedding (float32, chuẩn hóa L2) cho danh sách OCR text, chạy theo lô INVOICE_EMBEDDING_BATCH_SIZE."""
+    import numpy as np
+
+    encoder = get_text_encoder()
+    if encoder is None:
+        raise RuntimeError("Chưa cài sentence-transformers")
+    # Phần đầu hóa đơn (nhà cung cấp, mẫu, tiêu đề bảng) đủ đặc trưng; model cũng cắt theo max_seq_length
+    max_chars = getattr(settings, 'INVOICE_EMBEDDING_MAX_CHARS', 2000)
+    vectors = encoder.encode(
+        [text[:max_chars] for text in texts],
+        batch_size=getattr(settings, 'INVOICE_EMBEDDING_BATCH_SIZE', 32),
+        normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False,
+    )
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def store_embeddings(invoice_ids, vectors, model_name=None):
+    """Ghi vector (thay bản cũ) cho các hóa đơn; dòng mới luôn có id mới để chỉ mục nhận ra."""
+    model_name = model_name or embedding_model_name()
+    with transaction.atomic():
+        InvoiceEmbedding.objects.filter(invoice_id__in=invoice_ids).delete()
+        InvoiceEmbedding.objects.bulk_create([
+            InvoiceEmbedding(invoice_id=invoice_id, vector=vector.tobytes(), model_name=model_name)
+            for invoice_id, vector in zip(invoice_ids, vectors)
+        ])
+    return len(invoice_ids)
+
+
+def embed_invoices(invoice_ids, force=True):
+    """
+    🧭 Embedding OCR text của các hóa đơn (một lần encode cho cả lô). `force=False` bỏ qua hóa đơn đã có
+    embedding của model hiện tại. Trả về số hóa đơn đã ghi.
+    """
+    from .reextraction import should_reextract
+
+    queryset = Invoice.objects.filter(id__in=invoice_ids).exclude(raw_ocr_text='')
+    if not force:
+        queryset = queryset.exclude(embedding__model_name=embedding_model_name())
+    rows = [(invoice_id, text) for invoice_id, text in queryset.values_list('id', 'raw_ocr_text') if should_reextract(text)]
+    if not rows:
+        return 0
+    vectors = encode_texts([text for _, text in rows])
+    return store_embeddings([invoice_id for invoice_id, _ in rows], vectors)
+
+
+# --- Tìm top-k ---
+def blocked_topk(matrix, queries, k, start=0, stop=None, invalid=None, block_rows=SEARCH_BLOCK_ROWS):
+    """
+    Top-k tích vô hướng của `queries` (m × d) với các hàng [start, stop) của `matrix` (có thể là memmap).
+    `invalid`: mask bool theo hàng của `matrix` (hàng bị loại). Trả về (điểm m × k', hàng m × k') giảm dần.
+    """
+    import numpy as np
+
+    stop = len(matrix) if stop is None else stop
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    for block_start in range(start, stop, block_rows):
+        block_stop = min(block_start + block_rows, stop)
+        scores = queries @ np.asarray(matrix[block_start:block_stop]).T
+        if invalid is not None:
+            scores[:, invalid[block_start:block_stop]] = -np.inf
+        rows = np.broadcast_to(np.arange(block_start, block_stop), scores.shape)
+        if scores.shape[1] > k:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores, rows = np.take_along_axis(scores, part, 1), part + block_start
+        best_scores = np.hstack([best_scores, scores])
+        best_rows = np.hstack([best_rows, rows])
+        if best_scores.shape[1] > k:
+            part = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_scores, best_rows = np.take_along_axis(best_scores, part, 1), np.take_along_axis(best_rows, part, 1)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_scores, order, 1), np.take_along_axis(best_rows, order, 1)
+
+
+def _merge_topk(parts, k):
+    """Gộp các kết quả (điểm, invoice id) theo hàng truy vấn, giữ k điểm cao nhất, bỏ hàng -inf."""
+    import numpy as np
+
+    scores = np.hstack([part[0] for part in parts])
+    ids = np.hstack([part[1] for part in parts])
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    scores, ids = np.take_along_axis(scores, order, 1), np.take_along_axis(ids, order, 1)
+    return [
+        [(int(invoice_id), float(score)) for invoice_id, score in zip(row_ids, row_scores) if np.isfinite(score)]
+        for row_ids, row_scores in zip(ids, scores)
+    ]
+
+
+# --- Bộ lượng tử thô (IVF) ---
+def assign_lists(matrix, centroids, block_rows=SEARCH_BLOCK_ROWS):
+    """Cụm gần nhất (cosine) của từng hàng, tính theo khối."""
+    import numpy as np
+
+    assign = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), block_rows):
+        assign[start:start + block_rows] = np.argmax(np.asarray(matrix[start:start + block_rows]) @ centroids.T, axis=1)
+    return assign
+
+
+def train_coarse_quantizer(matrix, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """K-means cầu (centroid chuẩn hóa L2) trên mẫu KMEANS_SAMPLE_PER_LIST hàng / cụm."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(matrix), min(len(matrix), nlist * KMEANS_SAMPLE_PER_LIST), replace=False))
+    data = np.asarray(matrix[sample], dtype=np.float32)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_lists(data, centroids)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=nlist)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[filled])[:-1]])
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[filled] = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        # Cụm rỗng: khởi tạo lại bằng hàng ngẫu nhiên
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+# --- Ảnh chụp chỉ mục ---
+def build_embedding_snapshot(ivf=None, nlist=None, progress=None):
+    """
+    📦 Ghi mọi InvoiceEmbedding của model hiện tại thành ảnh chụp chỉ mục mới và kích hoạt.
+    `ivf=None`: tự bật bộ lượng tử thô khi số hàng ≥ INVOICE_EMBEDDING_IVF_MIN_ROWS.
+    Trả về bản ghi AIModelTraining của ảnh chụp (None nếu chưa có embedding nào).
+    """
+    import shutil
+    import numpy as np
+
+    started = time.time()
+    model_name = embedding_model_name()
+    queryset = InvoiceEmbedding.objects.filter(model_name=model_name)
+    high_water = queryset.aggregate(v=Max('id'))['v']
+    if high_water is None:
+        return None
+    queryset = queryset.filter(id__lte=high_water)
+    count = queryset.count()
+    first = queryset.order_by('id').values_list('vector', flat=True).first()
+    dim = len(bytes(first)) // 4
+
+    tmp_dir = staging_dir(MODEL_TYPE)
+    try:
+        raw_path = os.path.join(tmp_dir, 'raw.npy')
+        vectors = np.lib.format.open_memmap(raw_path, mode='w+', dtype=np.float32, shape=(count, dim))
+        invoice_ids = np.empty(count, dtype=np.int64)
+        written = last_id = 0
+        # Phân trang theo id, ghi thẳng vào memmap (không giữ cả ma trận trong RAM)
+        while written < count:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', 'invoice_id', 'vector')[:READ_CHUNK_ROWS])
+            if not rows:
+                break
+            rows = rows[:count - written]
+            last_id = rows[-1][0]
+            vectors[written:written + len(rows)] = np.frombuffer(b''.join(bytes(row[2]) for row in rows), dtype=np.float32).reshape(-1, dim)
+            invoice_ids[written:written + len(rows)] = [row[1] for row in rows]
+            written += len(rows)
+            if progress:
+                progress(written, count)
+        allocated, count = count, written  # ít hơn nếu hóa đơn bị xóa trong lúc đọc
+        invoice_ids = invoice_ids[:count]
+
+        if ivf is None:
+            ivf = count >= getattr(settings, 'INVOICE_EMBEDDING_IVF_MIN_ROWS', 300000)
+        meta = {'model_name': model_name, 'dim': dim, 'count': count, 'high_water': high_water, 'nlist': 0}
+        order = None
+        if ivf and count:
+            # Sắp hàng theo cụm: mỗi cụm là một đoạn liên tục [list_offsets[c], list_offsets[c + 1])
+            nlist = min(nlist or max(1, int(np.sqrt(count))), count)
+            centroids = train_coarse_quantizer(vectors[:count], nlist)
+            assign = assign_lists(vectors[:count], centroids)
+            order = np.argsort(assign, kind='stable')
+            invoice_ids = invoice_ids[order]
+            np.save(os.path.join(tmp_dir, 'centroids.npy'), centroids)
+            np.save(os.path.join(tmp_dir, 'list_offsets.npy'),
+                    np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64))
+            meta['nlist'] = nlist
+
+        final_path = os.path.join(tmp_dir, 'vectors.npy')
+        vectors.flush()
+        if order is None and count == allocated:
+            del vectors
+            os.replace(raw_path, final_path)
+        else:
+            target = np.lib.format.open_memmap(final_path, mode='w+', dtype=np.float32, shape=(count, dim))
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                rows = order[start:start + SEARCH_BLOCK_ROWS] if order is not None else slice(start, start + SEARCH_BLOCK_ROWS)
+                target[start:start + SEARCH_BLOCK_ROWS] = vectors[rows]
+            target.flush()
+            del target, vectors
+            os.remove(raw_path)
+        np.save(os.path.join(tmp_dir, 'invoice_ids.npy'), invoice_ids)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    record = publish_staged_version(
+        MODEL_TYPE, tmp_dir, model_name, training_data_count=count,
+        training_time_ms=int((time.time() - started) * 1000), metrics=meta,
+    )
+    prune_model_versions(MODEL_TYPE, keep=getattr(settings, 'INVOICE_EMBEDDING_KEEP_SNAPSHOTS', 2))
+    return record
+
+
+class EmbeddingSnapshot:
+    """Ảnh chụp chỉ mục đã publish: ma trận vector memmap (chỉ đọc) + id map (+ cụm IVF nếu có)."""
+
+    def __init__(self, version):
+        import numpy as np
+
+        directory = version_dir(MODEL_TYPE, version)
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.version = version
+        self.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        self.invoice_ids = np.load(os.path.join(directory, 'invoice_ids.npy'))
+        self.centroids = self.list_offsets = None
+        if self.meta.get('nlist'):
+            self.centroids = np.load(os.path.join(directory, 'centroids.npy'))
+            self.list_offsets = np.load(os.path.join(directory, 'list_offsets.npy'))
+
+    def __len__(self):
+        return len(self.invoice_ids)
+
+    def search(self, queries, k, invalid=None, nprobe=None):
+        """(điểm m × k, invoice id m × k); có IVF thì chỉ quét `nprobe` cụm gần nhất của từng truy vấn."""
+        import numpy as np
+
+        if self.centroids is None:
+            scores, rows = blocked_topk(self.vectors, queries, k, invalid=invalid)
+            return scores, self.invoice_ids[rows]
+
+        nprobe = min(nprobe or getattr(settings, 'INVOICE_EMBEDDING_IVF_PROBES', 16), len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_ids = np.zeros((len(queries), k), dtype=np.int64)
+        for index, query in enumerate(queries):
+            parts = [
+                blocked_topk(self.vectors, query[None, :], k, start=self.list_offsets[cluster],
+                             stop=self.list_offsets[cluster + 1], invalid=invalid)
+                for cluster in probes[index]
+            ]
+            scores = np.hstack([part[0] for part in parts])[0]
+            rows = np.hstack([part[1] for part in parts])[0]
+            top = np.argsort(-scores, kind='stable')[:k]
+            all_scores[index, :len(top)], all_ids[index, :len(top)] = scores[top], self.invoice_ids[rows[top]]
+        return all_scores, all_ids
+
+
+class InvoiceVectorIndex:
+    """
+    🔎 Chỉ mục tìm kiếm của tiến trình: ảnh chụp active (hot swap theo file ACTIVE) + các vector mới hơn
+    ảnh chụp đọc từ DB. Hàng của ảnh chụp có hóa đơn đã được embedding lại bị loại khỏi kết quả.
+    """
+
+    def __init__(self):
+        self._watcher = ActiveModelWatcher(MODEL_TYPE)
+        self._lock = threading.Lock()
+        self.snapshot = None
+        self._reset_delta(0)
+
+    def _reset_delta(self, high_water):
+        self._last_id = high_water
+        self._delta = {}              # invoice id → vector
+        self._delta_arrays = None
+        self._stale = None
+
+    def refresh(self):
+        """Nạp ảnh chụp mới (nếu có) rồi đọc các vector mới hơn. Gọi trước mỗi lần tìm."""
+        with self._lock:
+            version = self._watcher.poll()
+            if version is not None and (self.snapshot is None or version != self.snapshot.version):
+                snapshot = EmbeddingSnapshot(version)
+                if snapshot.meta.get('model_name') == embedding_model_name():
+                    self.snapshot = snapshot
+                    self._reset_delta(snapshot.meta['high_water'])
+                    print(f"🧭 Đã nạp chỉ mục embedding phiên bản {version}: {len(snapshot)} hóa đơn")
+            self._sync_delta()
+
+    def _sync_delta(self):
+        import numpy as np
+
+        while True:
+            rows = list(
+                InvoiceEmbedding.objects.filter(model_name=embedding_model_name(), id__gt=self._last_id)
+                .order_by('id').values_list('id', 'invoice_id', 'vector')[:READ_CHUNK_ROWS]
+            )
+            if not rows:
+                return
+            self._last_id = rows[-1][0]
+            for _, invoice_id, vector in rows:
+                self._delta[invoice_id] = np.frombuffer(bytes(vector), dtype=np.float32)
+            self._delta_arrays = None
+
+    def _delta_state(self):
+        import numpy as np
+
+        if self._delta_arrays is None:
+            ids = np.fromiter(self._delta, dtype=np.int64, count=len(self._delta))
+            matrix = np.vstack(list(self._delta.values())) if self._delta else None
+            self._delta_arrays = ids, matrix
+            self._stale = (
+                np.isin(self.snapshot.invoice_ids, ids) if self.snapshot is not None and len(ids) else None
+            )
+        return self._delta_arrays + (self._stale,)
+
+    def search(self, queries, k=10, nprobe=None):
+        """Top-k hóa đơn (invoice id, cosine) cho từng vector truy vấn (m × d)."""
+        import numpy as np
+
+        self.refresh()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._lock:
+            snapshot = self.snapshot
+            delta_ids, delta_matrix, stale = self._delta_state()
+        parts = []
+        if snapshot is not None and len(snapshot):
+            parts.append(snapshot.search(queries, k, invalid=stale, nprobe=nprobe))
+        if delta_matrix is not None:
+            scores, rows = blocked_topk(delta_matrix, queries, k)
+            parts.append((scores, delta_ids[rows]))
+        if not parts:
+            return [[] for _ in queries]
+        return _merge_topk(parts, k)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = InvoiceVectorIndex()
+    return _index
+
+
+def find_similar_invoices(invoice_id, k=10, nprobe=None):
+    """
+    🧭 k hóa đơn có OCR text gần nghĩa nhất (cùng nhà cung cấp / mẫu) với hóa đơn `invoice_id`.
+    None nếu hóa đơn chưa có embedding.
+    """
+    import numpy as np
+
+    blob = InvoiceEmbedding.objects.filter(invoice_id=invoice_id, model_name=embedding_model_name()).values_list('vector', flat=True).first()
+    if blob is None:
+        return None
+    query = np.frombuffer(bytes(blob), dtype=np.float32)
+    # Lấy dư: bỏ chính hóa đơn này và hóa đơn đã bị xóa sau ảnh chụp
+    hits = [(hit_id, score) for hit_id, score in get_vector_index().search(query, k + 5, nprobe=nprobe)[0] if hit_id != invoice_id]
+    invoices = (
+        Invoice.objects.select_related('supplier').only('invoice_number', 'total_amount', 'status', 'supplier__name')
+        .in_bulk([hit_id for hit_id, _ in hits])
+    )
+    results = []
+    for hit_id, score in hits:
+        invoice = invoices.get(hit_id)
+        if invoice is None:
+            continue
+        results.append({
+            'invoice_id': hit_id,
+            'invoice_number': invoice.invoice_number,
+            'supplier_id': invoice.supplier_id,
+            'supplier_name': invoice.supplier.name if invoice.supplier else None,
+            'total_amount': invoice.total_amount,
+            'status': invoice.status,
+            'similarity': round(score, 4),
+        })
+    return results[:k]
@@ -0,0 +1,340 @@
+# app_invoices/erp_client.py
+"""
+📤 Client ghi hóa đơn lên ERP: pool kết nối theo config, gộp lô, giới hạn song song, retry + circuit breaker
+
+    result = push_invoices(Invoice.objects.filter(status=InvoiceStatus.APPROVED, erp_posted_at__isnull=True))
+
+- Mỗi ERPIntegrationConfig có một ERPPushClient dùng chung trong tiến trình: requests.Session với pool
+  keep-alive tối đa ERP_PUSH_MAX_CONCURRENCY kết nối. Nhờ vậy các lần ghi sau không phải bắt tay TCP/TLS lại.
+- Hóa đơn được gộp thành lô ERP_PUSH_BATCH_SIZE bản ghi. Mỗi lô là một `POST <endpoint>` dạng {"items": [...]}.
+  Tối đa ERP_PUSH_MAX_CONCURRENCY lô được gửi song song.
+- Lỗi tạm thời (mất kết nối, timeout, 429 / 5xx) được thử lại tối đa ERP_PUSH_MAX_RETRIES lần.
+  Khoảng chờ là backoff lũy thừa có jitter ("full jitter"), không vượt ERP_PUSH_BACKOFF_MAX giây.
+  Lỗi 4xx khác không thử lại.
+- Mỗi (config, endpoint) có một CircuitBreaker. Khi lỗi liên tiếp ≥ ERP_BREAKER_FAILURE_THRESHOLD, mạch mở
+  trong ERP_BREAKER_RESET_TIMEOUT giây. Trong thời gian đó, lô gửi tới endpoint thất bại ngay, không gọi HTTP
+  và không chờ backoff. Hóa đơn nhận erp_error ngay, worker không bị giữ chờ ERP đang sập.
+  Hết thời gian, một request thử (half-open) quyết định đóng mạch hay mở lại.
+  Breaker nằm trong bộ nhớ từng tiến trình worker.
+- Kết quả được ghi trong một transaction sau khi gửi xong. Hóa đơn ghi được nhận erp_document_id + erp_posted_at
+  (erp_error xóa), hóa đơn lỗi nhận erp_error. Trạng thái nghiệp vụ (status) của hóa đơn không bị đổi:
+  lỗi ERP không được ghi đè MATCHED / REJECTED..., và gửi lại được cũng không tự "phê duyệt" hóa đơn.
+
+Giao thức ERP: xem erp_stub.py (ERP giả lập có độ trễ và lỗi cài sẵn dùng để thử và đo benchmark).
+"""
+
+import time
+import random
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ERPIntegrationConfig, Invoice
+
+DEFAULT_ENDPOINT = 'invoices/'
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+PushResult = namedtuple('PushResult', 'posted failed circuit_open requests')
+
+
+class ERPPushError(Exception):
+    """Ghi ERP thất bại (đã hết lượt thử lại hoặc lỗi không thử lại được)."""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitOpenError(ERPPushError):
+    """Mạch của endpoint đang mở: không gọi ERP (thử lại được sau khi mạch đóng)."""
+
+    def __init__(self, message):
+        super().__init__(message, retryable=True)
+
+
+class CircuitBreaker:
+    """
+    ⚡ Circuit breaker một endpoint ERP: closed → (lỗi liên tiếp ≥ ngưỡng) → open → (hết reset_timeout)
+    → half-open (một request thử) → closed nếu thành công, open lại nếu lỗi. Dùng chung giữa các luồng.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Được gọi ERP không (half-open chỉ cho một request thử tại một thời điểm)."""
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state, self._probing = self.HALF_OPEN, False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures, self._probing = self.CLOSED, 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state, self.opened_at, self._probing = self.OPEN, self.clock(), False
+
+    @property
+    def retry_after(self):
+        """Số giây còn lại trước khi cho request thử (0 nếu mạch không mở)."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+
+_breakers = {}
+_clients = {}
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breaker(config, endpoint):
+    """Breaker dùng chung của (config, endpoint) trong tiến trình."""
+    key = (config.pk, endpoint)
+    with _registry_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(
+                failure_threshold=getattr(settings, 'ERP_BREAKER_FAILURE_THRESHOLD', 5),
+                reset_timeout=getattr(settings, 'ERP_BREAKER_RESET_TIMEOUT', 30),
+            )
+        return breaker
+
+
+def backoff_delay(attempt, base=None, cap=None, rng=random):
+    """Full jitter: ngẫu nhiên trong [0, min(cap, base * 2^attempt)]."""
+    base = getattr(settings, 'ERP_PUSH_BACKOFF_BASE', 0.2) if base is None else base
+    cap = getattr(settings, 'ERP_PUSH_BACKOFF_MAX', 5.0) if cap is None else cap
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class ERPPushClient:
+    """
+    🌐 Ghi lô bản ghi lên một ERP qua requests.Session có pool keep-alive (an toàn khi nhiều luồng dùng chung)
+    """
+
+    def __init__(self, config, max_concurrency=None, timeout=None, max_retries=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.config = config
+        self.key = (config.pk, config.api_url, config.api_key)
+        self.base_url = config.api_url.rstrip('/') + '/'
+        self.max_concurrency = max_concurrency or getattr(settings, 'ERP_PUSH_MAX_CONCURRENCY', 4)
+        self.timeout = timeout or getattr(settings, 'ERP_PUSH_TIMEOUT', 30)
+        self.max_retries = getattr(settings, 'ERP_PUSH_MAX_RETRIES', 3) if max_retries is None else max_retries
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        self.session = requests.Session()
+        # pool_block: không mở quá max_concurrency kết nối tới ERP dù có nhiều luồng hơn
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if config.api_key:
+            self.session.headers['Authorization'] = f"Bearer {config.api_key}"
+
+    def post_batch(self, endpoint, items):
+        """
+        POST một lô, thử lại lỗi tạm thời với backoff có jitter. Trả về danh sách kết quả từng bản ghi
+        ({"reference", "status": "ok" | "error", "erp_id", "error"}). Mạch mở → CircuitOpenError ngay.
+        """
+        import requests
+
+        breaker = get_circuit_breaker(self.config, endpoint)
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(
+                    f"ERP {self.config.system_name} /{endpoint} đang ngắt mạch sau {breaker.failure_threshold} lỗi liên tiếp"
+                )
+            with self._count_lock:
+                self.requests += 1
+            retry_after = None
+            try:
+                response = self.session.post(self.base_url + endpoint, json={'items': items}, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = ERPPushError(f"Lỗi kết nối ERP: {e}", retryable=True)
+            else:
+                if response.status_code < 400:
+                    breaker.record_success()
+                    return response.json()['results']
+                error = ERPPushError(
+                    f"ERP trả về HTTP {response.status_code}: {response.text[:200]}",
+                    retryable=response.status_code in RETRY_STATUSES,
+                )
+                if not error.retryable:
+                    # ERP vẫn trả lời (lỗi dữ liệu / quyền): không tính là endpoint hỏng
+                    breaker.record_success()
+                    raise error
+                retry_after = response.headers.get('Retry-After')
+            breaker.record_failure()
+            if attempt == self.max_retries:
+                raise error
+            delay = backoff_delay(attempt)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), getattr(settings, 'ERP_PUSH_BACKOFF_MAX', 5.0)))
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+def get_push_client(config):
+    """ERPPushClient dùng chung (pool kết nối) của config; đổi api_url / api_key thì tạo client mới."""
+    with _registry_lock:
+        client = _clients.get(config.pk)
+        if client is None or client.key != (config.pk, config.api_url, config.api_key):
+            if client is not None:
+                client.close()
+            client = _clients[config.pk] = ERPPushClient(config)
+        return client
+
+
+def close_push_clients():
+    with _registry_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def invoice_payload(invoice):
+    """Hóa đơn → bản ghi gửi ERP (`reference` = id hóa đơn, ERP dùng làm khóa idempotent)."""
+    data = invoice.ai_extracted_data or {}
+    return {
+        'reference': str(invoice.pk),
+        'invoice_number': invoice.invoice_number or data.get('invoice_number'),
+        'supplier_tax_id': data.get('supplier_tax_id') or (invoice.supplier.tax_id if invoice.supplier_id else None),
+        'supplier_name': data.get('supplier_name') or (invoice.supplier.name if invoice.supplier_id else None),
+        'total_amount': str(invoice.total_amount) if invoice.total_amount is not None else None,
+        'issue_date': data.get('issue_date'),
+        'purchase_order': invoice.purchase_order.erp_id if invoice.purchase_order_id else None,
+        'match_score': str(invoice.match_score) if invoice.match_score is not None else None,
+    }
+
+
+def _post_batch(client, endpoint, batch):
+    """{reference: (erp_id | None, lỗi | None)} của một lô bản ghi; lỗi cả lô gán cho mọi bản ghi trong lô."""
+    try:
+        results = client.post_batch(endpoint, batch)
+    except ERPPushError as e:
+        return {record['reference']: (None, e) for record in batch}
+    by_reference = {str(result.get('reference')): result for result in results}
+    outcomes = {}
+    for record in batch:
+        result = by_reference.get(record['reference'])
+        if result is None:
+            outcomes[record['reference']] = (None, ERPPushError("ERP không trả kết quả cho bản ghi"))
+        elif result.get('status') == 'ok':
+            outcomes[record['reference']] = (str(result.get('erp_id') or ''), None)
+        else:
+            outcomes[record['reference']] = (None, ERPPushError(result.get('error') or "ERP từ chối bản ghi"))
+    return outcomes
+
+
+def post_records(records, endpoint=DEFAULT_ENDPOINT, config=None):
+    """
+    📤 Gửi bản ghi (dict có `reference` không trùng) lên ERP theo lô, song song có giới hạn.
+    Trả về ({reference: (erp_id | None, lỗi | None)}, số request đã gửi).
+    """
+    client = get_push_client(config)
+    size = getattr(settings, 'ERP_PUSH_BATCH_SIZE', 100)
+    batches = [records[start:start + size] for start in range(0, len(records), size)]
+    requests_before = client.requests
+    outcomes = {}
+    if len(batches) == 1 or get_circuit_breaker(config, endpoint).state != CircuitBreaker.CLOSED:
+        # Mạch đang mở / half-open: lô đầu là request thử, các lô sau chỉ gửi song song khi mạch đã đóng lại
+        outcomes.update(_post_batch(client, endpoint, batches.pop(0)))
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(client.max_concurrency, len(batches))) as pool:
+            for part in pool.map(lambda batch: _post_batch(client, endpoint, batch), batches):
+                outcomes.update(part)
+    return outcomes, client.requests - requests_before
+
+
+def active_config():
+    """ERPIntegrationConfig đang bật dùng để ghi ERP (None nếu chưa cấu hình)."""
+    return ERPIntegrationConfig.objects.filter(is_active=True).order_by('pk').first()
+
+
+def set_field_per_row(model, field_name, pairs):
+    """Ghi giá trị khác nhau từng dòng [(pk, giá trị)] bằng một lệnh UPDATE có tham số chạy executemany."""
+    from django.db import connection
+
+    if not pairs:
+        return
+    quote = connection.ops.quote_name
+    column, pk_column = model._meta.get_field(field_name).column, model._meta.pk.column
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {quote(model._meta.db_table)} SET {quote(column)} = %s WHERE {quote(pk_column)} = %s",
+            [(value, pk) for pk, value in pairs],
+        )
+
+
+def save_push_outcomes(posted, failed):
+    """
+    Ghi kết quả gửi ERP vào hóa đơn trong một transaction, không đổi status của hóa đơn.
+    `posted` = [(invoice_id, erp_id)], `failed` = {lỗi: [invoice_id]}.
+    Lỗi chỉ có vài thông báo khác nhau → mỗi thông báo một UPDATE ... WHERE id IN (...).
+    erp_document_id khác nhau từng dòng → một lệnh UPDATE có tham số chạy executemany
+    (bulk_update dựng CASE WHEN cho từng dòng, chậm hơn hàng chục lần).
+    """
+    from django.db import transaction
+
+    now = timezone.now()
+    ids = [invoice_id for invoice_id, _ in posted]
+    with transaction.atomic():
+        for start in range(0, len(ids), 500):
+            Invoice.objects.filter(id__in=ids[start:start + 500]).update(erp_posted_at=now, erp_error='')
+        set_field_per_row(Invoice, 'erp_document_id', posted)
+        for error, error_ids in failed.items():
+            for start in range(0, len(error_ids), 500):
+                Invoice.objects.filter(id__in=error_ids[start:start + 500]).update(erp_error=error)
+
+
+def push_invoices(invoices, endpoint=DEFAULT_ENDPOINT, config=None):
+    """
+    📤 Ghi hóa đơn lên ERP theo lô, song song có giới hạn, rồi ghi kết quả vào DB một lần
+    (erp_document_id / erp_posted_at / erp_error, status giữ nguyên).
+    Trả về PushResult(posted, failed, circuit_open, requests).
+    """
+    config = config or active_config()
+    if config is None:
+        raise ERPPushError("Chưa có ERPIntegrationConfig nào đang bật")
+    invoices = list(invoices.select_related('supplier', 'purchase_order') if hasattr(invoices, 'select_related') else invoices)
+    if not invoices:
+        return PushResult(0, 0, 0, 0)
+
+    outcomes, requests = post_records([invoice_payload(invoice) for invoice in invoices], endpoint, config)
+    posted, failed, circuit_open = [], {}, 0
+    for invoice in invoices:
+        erp_id, error = outcomes[str(invoice.pk)]
+        if error is None:
+            posted.append((invoice.pk, erp_id))
+        else:
+            failed.setdefault(str(error)[:2000], []).append(invoice.pk)
+            circuit_open += isinstance(error, CircuitOpenError)
+    save_push_outcomes(posted, failed)
+    result = PushResult(len(posted), len(invoices) - len(posted), circuit_open, requests)
+    print(f"📤 Ghi ERP {config.system_name} /{endpoint}: {result.posted} thành công, {result.failed} lỗi "
+          f"({result.circuit_open} do ngắt mạch), {result.requests} request")
+    return result
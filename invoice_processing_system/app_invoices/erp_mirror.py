@@ -0,0 +1,229 @@
+# app_invoices/erp_mirror.py
+"""
+🪞 Bản sao cục bộ dữ liệu ERP (nhà cung cấp + đơn mua hàng) để đối chiếu hóa đơn không cần gọi ERP
+
+Gọi ERP (`ERPIntegrationConfig.api_url`) cho từng hóa đơn tốn một round trip HTTP mỗi lần đối chiếu.
+Thay vào đó, job đồng bộ delta chép dữ liệu ERP vào ERPVendor / ERPPurchaseOrder:
+- Mỗi loại dữ liệu có mốc high-water (updated_at, id) trong ERPSyncState. Mỗi lần đồng bộ chỉ lấy bản ghi
+  sửa sau mốc, theo trang (phân trang keyset `updated_since` + `after_id`, `ERP_MIRROR_PAGE_SIZE` bản ghi).
+- Mỗi trang được upsert (bulk_create update_conflicts) và ghi mốc mới trong cùng một transaction:
+  job bị dừng giữa chừng thì lần sau chạy tiếp từ trang chưa ghi.
+- Đối chiếu hóa đơn chỉ truy vấn bản sao: PO đang mở cùng MST nhà cung cấp, trong khoảng tiền
+  (± ERP_MIRROR_AMOUNT_WINDOW) và khoảng ngày (± ERP_MIRROR_DATE_WINDOW_DAYS), dùng index
+  (supplier_tax_id, total_amount) / (supplier_tax_id, order_date). Các ứng viên được chấm bằng
+  quy tắc MatchingRule (matching_rules.py), lấy PO có điểm cao nhất.
+Giao thức HTTP của ERP: xem erp_stub.py (ERP giả lập dùng để thử và đo benchmark).
+"""
+
+import time
+from decimal import Decimal
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+from .models import ERPIntegrationConfig, ERPVendor, ERPPurchaseOrder, ERPSyncState, InvoiceStatus
+from .matching_rules import invoice_facts, erp_facts, get_rule_engine
+from .supplier_resolver import normalize_supplier_name, normalize_tax_id
+
+# Thứ tự đồng bộ: nhà cung cấp trước để PO gắn được vendor
+RESOURCES = ('vendors', 'purchase_orders')
+RESOURCE_PATHS = {'vendors': 'vendors/', 'purchase_orders': 'purchase-orders/'}
+
+
+class ERPMirrorClient:
+    """
+    🌐 Đọc dữ liệu ERP theo trang qua một requests.Session (giữ kết nối keep-alive giữa các trang)
+    """
+
+    def __init__(self, config, page_size=None, timeout=None):
+        import requests
+
+        self.base_url = config.api_url.rstrip('/') + '/'
+        self.page_size = page_size or getattr(settings, 'ERP_MIRROR_PAGE_SIZE', 1000)
+        self.timeout = timeout or getattr(settings, 'ERP_MIRROR_TIMEOUT', 30)
+        self.session = requests.Session()
+        if config.api_key:
+            self.session.headers['Authorization'] = f"Bearer {config.api_key}"
+
+    def fetch_page(self, resource, updated_since=None, after_id=''):
+        """(bản ghi, còn trang sau không) có (updated_at, id) > mốc."""
+        params = {'limit': self.page_size}
+        if updated_since:
+            params.update(updated_since=updated_since.isoformat(), after_id=after_id)
+        response = self.session.get(self.base_url + RESOURCE_PATHS[resource], params=params, timeout=self.timeout)
+        response.raise_for_status()
+        payload = response.json()
+        return payload['results'], payload.get('has_more', False)
+
+    def close(self):
+        self.session.close()
+
+
+def _upsert_vendors(config, rows):
+    ERPVendor.objects.bulk_create(
+        [ERPVendor(
+            config=config, erp_id=row['id'], name=row['name'], normalized_name=normalize_supplier_name(row['name']),
+            tax_id=normalize_tax_id(row.get('tax_id')), is_active=row.get('is_active', True),
+            erp_updated_at=parse_datetime(row['updated_at']),
+        ) for row in rows],
+        update_conflicts=True, unique_fields=['config', 'erp_id'],
+        update_fields=['name', 'normalized_name', 'tax_id', 'is_active', 'erp_updated_at', 'synced_at'],
+    )
+
+
+def _upsert_purchase_orders(config, rows):
+    vendor_ids = {row.get('vendor_id') for row in rows if row.get('vendor_id')}
+    vendors = {
+        erp_id: (vendor_id, tax_id) for erp_id, vendor_id, tax_id in
+        ERPVendor.objects.filter(config=config, erp_id__in=vendor_ids).values_list('erp_id', 'id', 'tax_id')
+    } if vendor_ids else {}
+    objects = []
+    for row in rows:
+        vendor_id, vendor_tax_id = vendors.get(row.get('vendor_id'), (None, None))
+        status = row.get('status', 'open')
+        objects.append(ERPPurchaseOrder(
+            config=config, erp_id=row['id'], po_number=row.get('po_number') or row['id'], vendor_id=vendor_id,
+            supplier_tax_id=normalize_tax_id(row.get('vendor_tax_id')) or vendor_tax_id,
+            invoice_reference=row.get('invoice_reference') or '',
+            total_amount=Decimal(str(row['total_amount'])), order_date=parse_date(str(row['order_date'])[:10]),
+            status=status, is_open=status == 'open', lines=row.get('lines') or [],
+            erp_updated_at=parse_datetime(row['updated_at']),
+        ))
+    ERPPurchaseOrder.objects.bulk_create(
+        objects, update_conflicts=True, unique_fields=['config', 'erp_id'],
+        update_fields=['po_number', 'vendor', 'supplier_tax_id', 'invoice_reference', 'total_amount', 'order_date',
+                       'status', 'is_open', 'lines', 'erp_updated_at', 'synced_at'],
+    )
+
+
+UPSERTS = {'vendors': _upsert_vendors, 'purchase_orders': _upsert_purchase_orders}
+MODELS = {'vendors': ERPVendor, 'purchase_orders': ERPPurchaseOrder}
+
+
+def sync_resource(config, resource, client, full=False, progress=None):
+    """
+    🔄 Đồng bộ delta một loại dữ liệu: đọc từng trang sau mốc high-water, upsert + ghi mốc mới cùng transaction.
+    `full=True` bỏ mốc cũ, đọc lại toàn bộ và xóa bản ghi ERP không còn trả về. Trả về số bản ghi đã nhận.
+    """
+    state, _ = ERPSyncState.objects.get_or_create(config=config, resource=resource)
+    if full:
+        state.high_water_updated_at, state.high_water_id = None, ''
+    started = timezone.now()
+    received = 0
+    try:
+        while True:
+            rows, has_more = client.fetch_page(resource, state.high_water_updated_at, state.high_water_id)
+            if rows:
+                last = rows[-1]
+                with transaction.atomic():
+                    UPSERTS[resource](config, rows)
+                    state.high_water_updated_at = parse_datetime(last['updated_at'])
+                    state.high_water_id = str(last['id'])
+                    state.save(update_fields=['high_water_updated_at', 'high_water_id'])
+                received += len(rows)
+                if progress:
+                    progress(resource, received)
+            if not has_more or not rows:
+                break
+    except Exception as e:
+        ERPSyncState.objects.filter(pk=state.pk).update(last_error=str(e)[:2000])
+        raise
+    model = MODELS[resource]
+    if full:
+        model.objects.filter(config=config, synced_at__lt=started).delete()
+    ERPSyncState.objects.filter(pk=state.pk).update(
+        last_synced_at=timezone.now(), last_error='', record_count=model.objects.filter(config=config).count()
+    )
+    return received
+
+
+def sync_erp_mirror(config=None, full=False, page_size=None, progress=None):
+    """
+    🪞 Đồng bộ mọi ERPIntegrationConfig đang bật (hoặc một config): nhà cung cấp rồi PO.
+    Trả về {system_name: {resource: số bản ghi nhận được}}.
+    """
+    configs = [config] if config is not None else list(ERPIntegrationConfig.objects.filter(is_active=True))
+    summary = {}
+    for item in configs:
+        client = ERPMirrorClient(item, page_size=page_size)
+        started = time.time()
+        try:
+            summary[item.system_name] = {
+                resource: sync_resource(item, resource, client, full=full, progress=progress) for resource in RESOURCES
+            }
+        finally:
+            client.close()
+        print(f"🪞 Đồng bộ ERP {item.system_name}: {summary[item.system_name]} trong {time.time() - started:.1f}s")
+    return summary
+
+
+def mirror_ready():
+    """Đã đồng bộ PO từ ERP ít nhất một lần chưa."""
+    return ERPSyncState.objects.filter(resource='purchase_orders', last_synced_at__isnull=False).exists()
+
+
+def find_purchase_order_candidates(facts, limit=None):
+    """
+    🔎 PO đang mở có thể khớp với hóa đơn: cùng MST (tra MST theo tên lõi trong vendor master nếu hóa đơn
+    không có MST), tiền trong ± ERP_MIRROR_AMOUNT_WINDOW, ngày trong ± ERP_MIRROR_DATE_WINDOW_DAYS.
+    """
+    tax_id = facts.tax_id
+    if not tax_id and facts.supplier:
+        tax_id = (
+            ERPVendor.objects.filter(normalized_name=facts.supplier, tax_id__isnull=False)
+            .values_list('tax_id', flat=True).first()
+        )
+    if not tax_id:
+        return []
+    queryset = ERPPurchaseOrder.objects.filter(is_open=True, supplier_tax_id=tax_id)
+    if facts.amount is not None:
+        window = getattr(settings, 'ERP_MIRROR_AMOUNT_WINDOW', 0.05)
+        low, high = facts.amount * (1 - window), facts.amount * (1 + window)
+        queryset = queryset.filter(total_amount__range=(Decimal(f"{low:.2f}"), Decimal(f"{high:.2f}")))
+    if facts.day is not None:
+        days = timedelta(days=getattr(settings, 'ERP_MIRROR_DATE_WINDOW_DAYS', 60))
+        issued = date.fromordinal(facts.day)
+        queryset = queryset.filter(order_date__range=(issued - days, issued + days))
+    limit = limit or getattr(settings, 'ERP_MIRROR_MAX_CANDIDATES', 50)
+    return list(queryset.select_related('vendor')[:limit])
+
+
+def purchase_order_record(purchase_order):
+    """PO trong bản sao → bản ghi ERP (dict) cho quy tắc đối chiếu."""
+    return {
+        'invoice_number': purchase_order.invoice_reference or None,
+        'supplier_tax_id': purchase_order.supplier_tax_id,
+        'supplier_name': purchase_order.vendor.name if purchase_order.vendor else None,
+        'total_amount': purchase_order.total_amount,
+        'issue_date': purchase_order.order_date,
+    }
+
+
+def match_invoice_to_mirror(invoice, save=True):
+    """
+    🔗 Đối chiếu hóa đơn với bản sao ERP: chấm từng PO ứng viên bằng quy tắc đang bật, chọn điểm cao nhất
+    (bằng điểm thì PO lệch tiền ít nhất). Khớp → MATCHED + match_score + purchase_order, không → UNMATCHED.
+    Trả về (ERPPurchaseOrder, CompiledRule) hoặc (None, None).
+    """
+    facts = invoice_facts(invoice)
+    engine = get_rule_engine()
+    best, best_key = (None, None), None
+    for purchase_order in find_purchase_order_candidates(facts):
+        rule = engine.evaluate(facts, erp_facts(purchase_order_record(purchase_order)))
+        if rule is None:
+            continue
+        gap = abs(float(purchase_order.total_amount) - facts.amount) if facts.amount is not None else 0
+        key = (rule.score, -gap)
+        if best_key is None or key > best_key:
+            best, best_key = (purchase_order, rule), key
+
+    purchase_order, rule = best
+    invoice.purchase_order = purchase_order
+    invoice.status = InvoiceStatus.MATCHED if rule else InvoiceStatus.UNMATCHED
+    invoice.match_score = round(rule.score, 2) if rule else 0
+    if save:
+        invoice.save(update_fields=['purchase_order', 'status', 'match_score'])
+    return best
@@ -0,0 +1,190 @@
+# app_invoices/erp_outbox.py
+"""
+📮 Transactional outbox: gửi thay đổi trạng thái hóa đơn lên ERP ngoài request của người dùng
+
+- Phê duyệt / đối chiếu hóa đơn ghi thêm một ERPOutboxEvent trong CÙNG transaction với thay đổi trạng thái
+  (record_invoice_event). Request không gọi ERP, nên độ trễ không phụ thuộc ERP nhanh hay chậm.
+  Transaction rollback thì sự kiện cũng mất, commit rồi thì sự kiện chắc chắn còn đó.
+- Worker riêng (`python manage.py drain_erp_outbox --loop`, hoặc task drain_erp_outbox trên hàng đợi 'erp'
+  nếu bật ERP_OUTBOX_KICK_ON_COMMIT) gửi sự kiện theo lô:
+  1. Nhận (claim) tối đa ERP_OUTBOX_BATCH_SIZE sự kiện đến hạn bằng claim_token + lease ERP_OUTBOX_LEASE_SECONDS,
+     cùng mọi sự kiện đang chờ khác của các hóa đơn đó. Bỏ qua hóa đơn có sự kiện đang được worker khác giữ.
+  2. Khử trùng lặp theo hóa đơn: chỉ gửi sự kiện mới nhất, các sự kiện cũ hơn → SUPERSEDED
+     (payload mới nhất đã chứa trạng thái cuối).
+  3. Gửi qua erp_client.post_records() (pool, lô, retry, circuit breaker).
+     `idempotency_key` = "outbox-<id>": ERP bỏ qua bản gửi lại của sự kiện đã nhận.
+  4. Ghi kết quả trong một transaction, chỉ với dòng vẫn mang claim_token của mình:
+     - Đã gửi → DELIVERED + erp_document_id.
+     - Lỗi tạm thời (kể cả mạch đang mở) → thử lại sau backoff (ERP_OUTBOX_RETRY_BASE × 2^lần, tối đa
+       ERP_OUTBOX_RETRY_MAX giây). Số lần thử / lỗi gần nhất chỉ nằm trên dòng outbox, hóa đơn không đổi.
+     - ERP từ chối / quá ERP_OUTBOX_MAX_ATTEMPTS lần → FAILED, lúc này hóa đơn mới nhận erp_error.
+     Gửi được thì hóa đơn nhận erp_document_id (erp_error xóa). Status của hóa đơn không bao giờ bị đổi ở đây.
+  Worker chết sau khi ERP nhận nhưng trước bước 4 thì lease hết hạn và sự kiện được gửi lại cùng khóa idempotent.
+  ERP trả "duplicate", sự kiện được đánh dấu DELIVERED, nên ERP chỉ ghi mỗi sự kiện đúng một lần.
+"""
+
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ERPOutboxEvent, OutboxStatus
+from .erp_client import (
+    DEFAULT_ENDPOINT, CircuitOpenError, get_circuit_breaker, invoice_payload, post_records, active_config,
+    save_push_outcomes, set_field_per_row,
+)
+
+INVOICE_APPROVED = 'invoice.approved'
+INVOICE_MATCHED = 'invoice.matched'
+INVOICE_UNMATCHED = 'invoice.unmatched'
+EVENT_ENDPOINTS = {
+    INVOICE_APPROVED: DEFAULT_ENDPOINT,
+    INVOICE_MATCHED: DEFAULT_ENDPOINT,
+    INVOICE_UNMATCHED: DEFAULT_ENDPOINT,
+}
+
+
+def _kick_drain():
+    from .tasks import drain_erp_outbox
+
+    drain_erp_outbox.delay()
+
+
+def record_invoice_event(invoice, event_type):
+    """
+    📮 Ghi sự kiện ERP của hóa đơn vào outbox (gọi bên trong transaction.atomic() cùng với thay đổi trạng thái).
+    ERP_OUTBOX_KICK_ON_COMMIT = True thì đánh thức task drain sau commit (lỗi broker không làm hỏng request,
+    sự kiện vẫn chờ lượt drain sau).
+    """
+    event = ERPOutboxEvent.objects.create(
+        invoice=invoice, event_type=event_type,
+        payload=dict(invoice_payload(invoice), event=event_type, status=invoice.status),
+    )
+    if getattr(settings, 'ERP_OUTBOX_KICK_ON_COMMIT', False):
+        transaction.on_commit(_kick_drain, robust=True)
+    return event
+
+
+def claim_events(batch_size=None, lease=None, now=None):
+    """Nhận tối đa `batch_size` sự kiện đến hạn (theo thứ tự ghi), bỏ qua hóa đơn đang được worker khác giữ."""
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, 'ERP_OUTBOX_BATCH_SIZE', 500)
+    lease = getattr(settings, 'ERP_OUTBOX_LEASE_SECONDS', 300) if lease is None else lease
+    unleased = Q(locked_until__isnull=True) | Q(locked_until__lte=now)
+    leased_invoices = ERPOutboxEvent.objects.filter(status=OutboxStatus.PENDING, locked_until__gt=now).values('invoice_id')
+    ids = list(
+        ERPOutboxEvent.objects.filter(unleased, status=OutboxStatus.PENDING, available_at__lte=now)
+        .exclude(invoice_id__in=leased_invoices)
+        .order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return None, []
+    token = uuid.uuid4().hex
+    # Nhận luôn sự kiện mới hơn của cùng hóa đơn (kể cả ngoài lô / chưa đến hạn) để chỉ gửi trạng thái cuối
+    invoice_ids = ERPOutboxEvent.objects.filter(id__in=ids).values('invoice_id')
+    ERPOutboxEvent.objects.filter(unleased, status=OutboxStatus.PENDING).filter(
+        Q(id__in=ids) | Q(invoice_id__in=invoice_ids)
+    ).update(claim_token=token, locked_until=now + timedelta(seconds=lease))
+    return token, list(ERPOutboxEvent.objects.filter(claim_token=token).order_by('id'))
+
+
+def _supersede(token, events):
+    """Giữ sự kiện mới nhất của mỗi hóa đơn trong lô đã nhận; sự kiện cũ hơn → SUPERSEDED."""
+    latest = {}
+    for event in events:
+        latest[event.invoice_id] = event
+    stale = [event.id for event in events if latest[event.invoice_id] is not event]
+    superseded = 0
+    for start in range(0, len(stale), 500):
+        superseded += ERPOutboxEvent.objects.filter(id__in=stale[start:start + 500], claim_token=token).update(
+            status=OutboxStatus.SUPERSEDED, claim_token='', locked_until=None,
+        )
+    return list(latest.values()), superseded
+
+
+def _retry_delay(attempts):
+    base = getattr(settings, 'ERP_OUTBOX_RETRY_BASE', 5)
+    return min(getattr(settings, 'ERP_OUTBOX_RETRY_MAX', 600), base * (2 ** (attempts - 1)))
+
+
+def deliver_events(token, events, config):
+    """Gửi sự kiện đã nhận (mỗi hóa đơn một sự kiện) và ghi kết quả. Trả về Counter trạng thái."""
+    by_endpoint = {}
+    for event in events:
+        by_endpoint.setdefault(EVENT_ENDPOINTS.get(event.event_type, DEFAULT_ENDPOINT), []).append(event)
+
+    max_attempts = getattr(settings, 'ERP_OUTBOX_MAX_ATTEMPTS', 10)
+    invoice_of = {event.id: event.invoice_id for event in events}
+    delivered, retry, failed = [], {}, {}
+    for endpoint, endpoint_events in by_endpoint.items():
+        records = [dict(event.payload, reference=str(event.invoice_id), idempotency_key=f"outbox-{event.id}")
+                   for event in endpoint_events]
+        outcomes, _ = post_records(records, endpoint, config)
+        for event in endpoint_events:
+            erp_id, error = outcomes[str(event.invoice_id)]
+            if error is None:
+                delivered.append((event.id, erp_id))
+                continue
+            message = str(error)[:2000]
+            attempts = event.attempts + 1
+            if error.retryable and attempts < max_attempts:
+                if isinstance(error, CircuitOpenError):
+                    delay = int(get_circuit_breaker(config, endpoint).retry_after) + 1
+                else:
+                    delay = _retry_delay(attempts)
+                retry.setdefault((message, attempts, delay), []).append(event.id)
+            else:
+                failed.setdefault((message, attempts), []).append(event.id)
+
+    now = timezone.now()
+    released = {'claim_token': '', 'locked_until': None}
+    with transaction.atomic():
+        mine = ERPOutboxEvent.objects.filter(claim_token=token)
+        # Chỉ dòng còn giữ claim_token: lease đã hết và worker khác nhận lại thì để worker đó ghi
+        owned = set(mine.filter(id__in=list(invoice_of)).values_list('id', flat=True))
+        delivered = [pair for pair in delivered if pair[0] in owned]
+        delivered_ids = [event_id for event_id, _ in delivered]
+        set_field_per_row(ERPOutboxEvent, 'erp_document_id', delivered)
+        mine.filter(id__in=delivered_ids).update(
+            status=OutboxStatus.DELIVERED, delivered_at=now, attempts=F('attempts') + 1, last_error='', **released,
+        )
+        for (message, attempts, delay), ids in retry.items():
+            mine.filter(id__in=ids).update(
+                attempts=attempts, last_error=message, available_at=now + timedelta(seconds=delay), **released,
+            )
+        invoice_errors = {}
+        for (message, attempts), ids in failed.items():
+            mine.filter(id__in=ids).update(status=OutboxStatus.FAILED, attempts=attempts, last_error=message, **released)
+            invoice_errors.setdefault(message, []).extend(invoice_of[event_id] for event_id in ids if event_id in owned)
+        save_push_outcomes([(invoice_of[event_id], erp_id) for event_id, erp_id in delivered], invoice_errors)
+    return Counter(delivered=len(delivered), retried=sum(map(len, retry.values())), failed=sum(map(len, failed.values())))
+
+
+def drain_outbox(config=None, batch_size=None, max_batches=None):
+    """
+    📮 Gửi hết sự kiện đến hạn trong outbox theo lô (tối đa `max_batches` lô).
+    Trả về Counter(delivered, superseded, retried, failed).
+    """
+    config = config or active_config()
+    totals = Counter()
+    if config is None:
+        print("⚠️ Chưa có ERPIntegrationConfig nào đang bật, sự kiện outbox vẫn chờ gửi")
+        return totals
+    started, batches = time.time(), 0
+    while max_batches is None or batches < max_batches:
+        now = timezone.now()
+        token, events = claim_events(batch_size, now=now)
+        if not events:
+            break
+        latest, superseded = _supersede(token, events)
+        totals['superseded'] += superseded
+        totals.update(deliver_events(token, latest, config))
+        batches += 1
+    if batches:
+        print(f"📮 Outbox ERP {config.system_name}: {dict(totals)} trong {time.time() - started:.2f}s ({batches} lô)")
+    return totals
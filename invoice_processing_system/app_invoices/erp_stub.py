@@ -0,0 +1,262 @@
+# app_invoices/erp_stub.py
+"""
+🧪 ERP giả lập (HTTP, chạy trong tiến trình) để thử đồng bộ bản sao ERP, ghi hóa đơn lên ERP và đo benchmark không cần ERP thật
+
+    with ERPStubServer(ERPStubData.generate(vendors=2000, orders=100000), latency=0.02) as server:
+        config.api_url = server.url
+        ...
+
+hoặc chạy riêng: `python manage.py run_erp_stub --port 8765 --orders 100000`
+
+API (cùng giao thức erp_mirror.py dùng), phân trang keyset theo (updated_at, id):
+- GET vendors/?updated_since=<iso>&after_id=<id>&limit=N          → {"results": [...], "has_more": bool}
+- GET purchase-orders/?updated_since=<iso>&after_id=<id>&limit=N
+- GET purchase-orders/?vendor_tax_id=<mst>                          → mọi PO của nhà cung cấp (tra từng hóa đơn)
+- POST invoices/ {"items": [{"reference", ...}]}                    → {"results": [{"reference", "status", "erp_id", "error"}]}
+  (ghi hóa đơn theo lô, idempotent theo `idempotency_key` (mặc định = `reference`): gửi lại cùng khóa trả về
+  erp_id cũ với "duplicate": true; khóa mới cho cùng `reference` cập nhật chứng từ đã có)
+`latency` (giây) được cộng vào mỗi request như độ trễ mạng tới ERP (+ `item_latency` mỗi bản ghi POST);
+có `api_key` thì bắt buộc header Bearer. Lỗi cài sẵn cho POST: `failure_rate` (tỉ lệ 503 ngẫu nhiên),
+`fail_next` (N request tới trả 503), `outage = True` (ERP sập, mọi POST trả 503).
+"""
+
+import json
+import time
+import random
+import bisect
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from django.utils.dateparse import parse_datetime
+
+RESOURCE_PATHS = {'vendors': 'vendors', 'purchase-orders': 'purchase_orders'}
+POST_PATHS = {'invoices': 'post_invoices'}
+ITEMS = [
+    "Giấy in A4 Double A", "Mực in HP 12A", "Bút bi Thiên Long", "Laptop Dell Latitude 5420",
+    "Dịch vụ vận chuyển", "Nước uống đóng chai", "Bàn làm việc", "Ghế xoay văn phòng",
+    "Phí bảo trì máy lạnh", "Cáp mạng Cat6", "Chuột không dây Logitech", "Màn hình LG 24 inch",
+]
+
+
+class ERPStubData:
+    """Dữ liệu ERP trong RAM: mỗi loại là danh sách bản ghi sắp theo (updated_at, id)."""
+
+    def __init__(self):
+        self.records = {'vendors': [], 'purchase_orders': []}
+        self._keys = {'vendors': [], 'purchase_orders': []}
+        self._by_id = {'vendors': {}, 'purchase_orders': {}}
+        self.postings = {}
+        self.deliveries = {}
+        self.applied = 0
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self.clock = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+    @classmethod
+    def generate(cls, vendors=200, orders=5000, lines=(1, 6), seed=42):
+        """Nhà cung cấp + PO tổng hợp (PO có 1-6 dòng hàng, đa số đang mở)."""
+        rng = random.Random(seed)
+        data = cls()
+        vendor_rows = [{
+            'id': f"V{i:06d}", 'name': f"Công ty TNHH Nhà cung cấp {i}", 'tax_id': f"01{i:08d}",
+            'is_active': True,
+        } for i in range(1, vendors + 1)]
+        data.upsert('vendors', vendor_rows)
+        order_rows = []
+        for i in range(1, orders + 1):
+            vendor = vendor_rows[rng.randrange(vendors)]
+            po_lines, total = [], 0
+            for line_no in range(1, rng.randint(*lines) + 1):
+                quantity, unit_price = rng.randint(1, 50), rng.randint(10, 5000) * 1000
+                total += quantity * unit_price
+                po_lines.append({'line_no': line_no, 'description': rng.choice(ITEMS), 'quantity': quantity,
+                                 'unit_price': unit_price, 'amount': quantity * unit_price})
+            order_rows.append({
+                'id': f"PO{i:08d}", 'po_number': f"PO-2025-{i:06d}", 'vendor_id': vendor['id'],
+                'vendor_tax_id': vendor['tax_id'], 'invoice_reference': '',
+                'total_amount': total, 'order_date': (datetime(2025, 1, 1) + timedelta(days=rng.randint(0, 364))).date().isoformat(),
+                'status': 'open' if rng.random() < 0.8 else 'closed', 'lines': po_lines,
+            })
+        data.upsert('purchase_orders', order_rows)
+        return data
+
+    def upsert(self, resource, rows):
+        """Thêm / sửa bản ghi: updated_at mới (tăng dần) → lần đồng bộ delta sau sẽ nhận lại."""
+        with self._lock:
+            by_id = self._by_id[resource]
+            for row in rows:
+                self.clock += timedelta(microseconds=1)
+                by_id[row['id']] = dict(row, updated_at=self.clock)
+            self.records[resource] = sorted(by_id.values(), key=lambda row: (row['updated_at'], row['id']))
+            self._keys[resource] = [(row['updated_at'], row['id']) for row in self.records[resource]]
+
+    def touch(self, resource, count, seed=0, **changes):
+        """Sửa `count` bản ghi ngẫu nhiên (vd. đóng PO), trả về id đã sửa."""
+        rng = random.Random(seed)
+        rows = rng.sample(list(self._by_id[resource].values()), count)
+        self.upsert(resource, [dict(row, **changes) for row in rows])
+        return [row['id'] for row in rows]
+
+    def page(self, resource, updated_since=None, after_id='', limit=500):
+        """Các bản ghi có (updated_at, id) > (updated_since, after_id), tối đa `limit`."""
+        with self._lock:
+            rows, keys = self.records[resource], self._keys[resource]
+            start = bisect.bisect_right(keys, (updated_since, after_id)) if updated_since else 0
+            page = rows[start:start + limit]
+            return page, start + limit < len(rows)
+
+    def post_invoices(self, items):
+        """
+        Ghi hóa đơn: thiếu reference / total_amount → lỗi từng bản ghi; khóa idempotent đã nhận → trả erp_id cũ,
+        không ghi lại (`applied` đếm số lần thật sự ghi, `duplicates` số bản gửi trùng bị bỏ qua).
+        """
+        results = []
+        with self._lock:
+            for item in items:
+                reference = item.get('reference')
+                if not reference or item.get('total_amount') in (None, ''):
+                    results.append({'reference': reference, 'status': 'error', 'error': 'thiếu reference / total_amount'})
+                    continue
+                key = item.get('idempotency_key') or reference
+                duplicate = key in self.deliveries
+                self.duplicates += duplicate
+                if not duplicate:
+                    previous = self.postings.get(reference)
+                    erp_id = previous['erp_id'] if previous else f"AP{len(self.postings) + 1:08d}"
+                    self.postings[reference] = dict(item, erp_id=erp_id)
+                    self.deliveries[key] = erp_id
+                    self.applied += 1
+                results.append({'reference': reference, 'status': 'ok', 'erp_id': self.deliveries[key],
+                                'duplicate': duplicate})
+        return results
+
+    def purchase_orders_of(self, tax_id):
+        with self._lock:
+            return [row for row in self.records['purchase_orders'] if row['vendor_tax_id'] == tax_id]
+
+
+def _serialize(row):
+    return dict(row, updated_at=row['updated_at'].isoformat())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive: client dùng lại kết nối giữa các trang
+    # Header và body được ghi riêng: bật Nagle thì body chờ ACK trễ (~40ms) của client ở mỗi response
+    disable_nagle_algorithm = True
+
+    def _authorized(self):
+        stub = self.server.stub
+        if stub.api_key and self.headers.get('Authorization') != f"Bearer {stub.api_key}":
+            self._send(401, {'error': 'unauthorized'})
+            return False
+        return True
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.count_request()
+        if stub.latency:
+            time.sleep(stub.latency)
+        if not self._authorized():
+            return
+        url = urlparse(self.path)
+        resource = RESOURCE_PATHS.get(url.path.strip('/').split('/')[-1])
+        if resource is None:
+            return self._send(404, {'error': 'not found'})
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if resource == 'purchase_orders' and 'vendor_tax_id' in params:
+            rows = stub.data.purchase_orders_of(params['vendor_tax_id'])
+            return self._send(200, {'results': [_serialize(row) for row in rows], 'has_more': False})
+        since = parse_datetime(params['updated_since']) if params.get('updated_since') else None
+        rows, has_more = stub.data.page(resource, since, params.get('after_id', ''), int(params.get('limit', 500)))
+        self._send(200, {'results': [_serialize(row) for row in rows], 'has_more': has_more})
+
+    def do_POST(self):
+        stub = self.server.stub
+        stub.count_request()
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if stub.should_fail():
+            if stub.latency:
+                time.sleep(stub.latency)
+            return self._send(503, {'error': 'ERP tạm thời không phục vụ'})
+        if not self._authorized():
+            return
+        method = POST_PATHS.get(urlparse(self.path).path.strip('/').split('/')[-1])
+        if method is None:
+            return self._send(404, {'error': 'not found'})
+        try:
+            items = json.loads(body or b'{}')['items']
+        except (ValueError, KeyError, TypeError):
+            return self._send(400, {'error': 'body phải là {"items": [...]}'})
+        if stub.latency or stub.item_latency:
+            time.sleep(stub.latency + stub.item_latency * len(items))
+        self._send(200, {'results': getattr(stub.data, method)(items)})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ERPStubServer:
+    """
+    🧪 Chạy ERPStubData sau một HTTP server (luồng nền); `url` dùng làm ERPIntegrationConfig.api_url
+    """
+
+    def __init__(self, data=None, host='127.0.0.1', port=0, latency=0.0, api_key=None,
+                 item_latency=0.0, failure_rate=0.0, seed=0):
+        self.data = data or ERPStubData.generate()
+        self.latency = latency
+        self.item_latency = item_latency
+        self.api_key = api_key
+        self.failure_rate = failure_rate
+        self.fail_next = 0
+        self.outage = False
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def should_fail(self):
+        """Request POST này có bị lỗi cài sẵn (outage / fail_next / failure_rate) không."""
+        with self._lock:
+            if self.outage:
+                return True
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return self.failure_rate > 0 and self._rng.random() < self.failure_rate
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,145 @@
+# app_invoices/image_preprocessing.py
+"""
+🖼️ Tiền xử lý ảnh trước khi OCR (vector hóa bằng NumPy)
+1. Xoay ảnh theo EXIF orientation (ảnh chụp điện thoại)
+2. Decode JPEG ở draft mode, thu nhỏ về DPI mục tiêu (giả định khổ A4)
+3. Chuyển ảnh xám
+4. Nhị phân hóa adaptive threshold (trung bình cục bộ qua tổng tích lũy)
+5. Chỉnh nghiêng (deskew) bằng projection profile
+
+Thời gian Tesseract tăng theo số pixel và tệ hơn khi ảnh nghiêng, nên ảnh 12MP
+được đưa về kích thước vừa đủ và thẳng hàng trước khi OCR.
+"""
+
+import numpy as np
+from PIL import Image, ImageOps
+
+DEFAULT_TARGET_DPI = 300
+PAGE_LONG_SIDE_INCHES = 11.69  # Khổ A4
+
+ADAPTIVE_BLOCK_SIZE = 31
+ADAPTIVE_OFFSET = 10
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.25
+DESKEW_SAMPLE_SIDE = 1000
+
+
+def target_long_side(target_dpi=DEFAULT_TARGET_DPI):
+    """Cạnh dài (pixel) của trang A4 ở DPI mục tiêu."""
+    return int(round(PAGE_LONG_SIDE_INCHES * target_dpi))
+
+
+def load_grayscale(source, target_dpi=DEFAULT_TARGET_DPI):
+    """
+    📥 Mở ảnh, decode JPEG ở draft mode (giảm kích thước ngay khi giải nén),
+    xoay theo EXIF, chuyển xám và thu nhỏ để cạnh dài không vượt quá DPI mục tiêu.
+    """
+    image = source if isinstance(source, Image.Image) else Image.open(source)
+    max_side = target_long_side(target_dpi)
+
+    width, height = image.size
+    scale = max_side / float(max(width, height))
+    if scale < 1.0 and image.format == 'JPEG':
+        # Decoder JPEG chỉ giảm theo bội 1/2, 1/4, 1/8 và luôn >= kích thước yêu cầu
+        image.draft('L', (int(width * scale), int(height * scale)))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'L':
+        image = image.convert('L')
+
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def _box_sum(values, radius, axis):
+    """Tổng cửa sổ trượt [i - radius, i + radius] theo một trục (cắt ở biên)."""
+    n = values.shape[axis]
+    cumulative = np.cumsum(values, axis=axis, dtype=np.int32)
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (1, 0)
+    cumulative = np.pad(cumulative, pad)
+
+    idx = np.arange(n)
+    upper = np.minimum(idx + radius + 1, n)
+    lower = np.maximum(idx - radius, 0)
+    return np.take(cumulative, upper, axis=axis) - np.take(cumulative, lower, axis=axis), upper - lower
+
+
+def adaptive_threshold(gray, block_size=ADAPTIVE_BLOCK_SIZE, offset=ADAPTIVE_OFFSET):
+    """
+    ⚫⚪ Nhị phân hóa: pixel tối hơn trung bình cục bộ (block_size x block_size) trừ offset
+    thành chữ (0), còn lại là nền (255). Tổng cửa sổ tính tách theo hàng/cột nên O(pixel).
+    """
+    gray = np.asarray(gray, dtype=np.uint8)
+    radius = block_size // 2
+
+    col_sums, row_counts = _box_sum(gray, radius, axis=0)
+    window_sums, col_counts = _box_sum(col_sums, radius, axis=1)
+    counts = np.outer(row_counts, col_counts)
+
+    # So sánh gray * count > sum - offset * count, tránh phép chia trên toàn ảnh
+    binary = gray.astype(np.int32) * counts > window_sums - offset * counts
+    return np.where(binary, 255, 0).astype(np.uint8)
+
+
+def estimate_skew_angle(binary, max_angle=DESKEW_MAX_ANGLE, step=DESKEW_STEP):
+    """
+    📐 Ước lượng góc nghiêng (độ) bằng projection profile: với mỗi góc thử, chiếu
+    các pixel chữ lên trục dọc; góc đúng cho histogram "nhọn" nhất (tổng bình phương lớn nhất).
+    """
+    ys, xs = np.nonzero(np.asarray(binary) == 0)
+    if len(ys) < 100:
+        return 0.0
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    radians = np.deg2rad(angles)
+    ys = ys.astype(np.float32)
+    xs = xs.astype(np.float32)
+
+    best_angle, best_score = 0.0, -1.0
+    for angle, theta in zip(angles, radians):
+        rows = np.rint(ys * np.cos(theta) - xs * np.sin(theta)).astype(np.int64)
+        profile = np.bincount(rows - rows.min())
+        score = float(np.dot(profile, profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(binary_image, max_angle=DESKEW_MAX_ANGLE, step=DESKEW_STEP):
+    """Xoay ảnh nhị phân cho dòng chữ nằm ngang (góc ước lượng trên bản thu nhỏ)."""
+    sample = binary_image
+    if max(binary_image.size) > DESKEW_SAMPLE_SIDE:
+        sample = binary_image.copy()
+        sample.thumbnail((DESKEW_SAMPLE_SIDE, DESKEW_SAMPLE_SIDE), Image.NEAREST)
+
+    angle = estimate_skew_angle(np.asarray(sample), max_angle=max_angle, step=step)
+    if abs(angle) < step / 2:
+        return binary_image, 0.0
+    rotated = binary_image.rotate(angle, resample=Image.NEAREST, expand=True, fillcolor=255)
+    return rotated, angle
+
+
+def preprocess_for_ocr(source, target_dpi=DEFAULT_TARGET_DPI, binarize=True, straighten=True):
+    """
+    🧹 Toàn bộ pipeline tiền xử lý, trả về ảnh PIL (mode 'L') sẵn sàng cho Tesseract.
+    `source` là đường dẫn, file object hoặc PIL Image (vd. trang PDF đã rasterize).
+    """
+    gray = load_grayscale(source, target_dpi=target_dpi)
+    if not binarize:
+        return gray
+
+    binary = Image.fromarray(adaptive_threshold(np.asarray(gray)))
+    if straighten:
+        binary, _ = deskew(binary)
+    return binary
+
+
+def open_ocr_image(file_path):
+    """Mở ảnh cho OCR theo settings (OCR_PREPROCESSING, OCR_TARGET_DPI)."""
+    from django.conf import settings
+
+    if not getattr(settings, 'OCR_PREPROCESSING', True):
+        return Image.open(file_path)
+    return preprocess_for_ocr(file_path, target_dpi=getattr(settings, 'OCR_TARGET_DPI', DEFAULT_TARGET_DPI))
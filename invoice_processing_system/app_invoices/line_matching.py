@@ -0,0 +1,227 @@
+# app_invoices/line_matching.py
+"""
+📦 Đối chiếu 3 bên theo dòng hàng: dòng hóa đơn (ai_extracted_data['items']) ↔ dòng PO (ERPPurchaseOrder.lines)
+↔ phiếu nhập kho (số lượng đã nhận theo line_no của PO)
+
+- Ma trận chi phí n dòng hóa đơn × m dòng PO tính một lần bằng NumPy (không lặp từng cặp bằng Python):
+  - Mô tả: cosine trên vector đếm trigram ký tự của tên đã bỏ dấu (fold_text). Một phép nhân ma trận.
+  - Số lượng / đơn giá: độ lệch tương đối |a - b| / max(a, b) (broadcast), chặn ở 1.
+  - chi phí = LINE_MATCH_WEIGHTS · (1 - tương đồng mô tả, lệch số lượng, lệch đơn giá), chặn ở LINE_MATCH_MAX_COST.
+  Cặp chạm trần (hoặc tương đồng mô tả < LINE_MATCH_MIN_SIMILARITY) coi như không ghép.
+- Ghép tối ưu (tổng chi phí nhỏ nhất, mỗi dòng ghép tối đa một lần) bằng scipy.optimize.linear_sum_assignment
+  (Hungarian / LAPJV, ma trận chữ nhật được). Ghép tham lam "cặp rẻ nhất trước" không bảo đảm điều này:
+  cặp rẻ nhất có thể lấy mất dòng duy nhất khớp được với một dòng khác.
+- Mỗi dòng có chênh lệch số lượng / đơn giá / thành tiền (và số lượng hóa đơn - số lượng đã nhận nếu có phiếu nhập).
+  Vượt LINE_MATCH_QUANTITY_TOLERANCE / LINE_MATCH_PRICE_TOLERANCE → "variance".
+  Dòng hóa đơn không có trên PO → "not_on_po", dòng PO chưa lên hóa đơn → "not_invoiced".
+- match_score = Σ điểm cặp × (thành tiền hóa đơn + thành tiền PO) / (tổng thành tiền hai bên), điểm cặp = 1 - chi phí.
+  Dòng không ghép được tính điểm 0 nên hóa đơn thiếu / thừa dòng lớn bị trừ nhiều hơn dòng nhỏ.
+  Chênh lệch với phiếu nhập không trừ điểm (điểm đo mức khớp hóa đơn ↔ PO), chỉ làm dòng thành "variance".
+"""
+
+import numpy as np
+from django.conf import settings
+
+from .supplier_resolver import fold_text
+
+# (tên, số lượng, đơn giá, thành tiền) của dòng hóa đơn (ai_services._extract_items) và dòng PO (ERP)
+INVOICE_LINE_KEYS = ('name', 'quantity', 'price', 'total')
+PO_LINE_KEYS = ('description', 'quantity', 'unit_price', 'amount')
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def line_arrays(lines, keys):
+    """Danh sách dòng (dict) → (mô tả, số lượng, đơn giá, thành tiền) dạng mảng; thiếu đơn giá thì suy từ thành tiền."""
+    name_key, quantity_key, price_key, amount_key = keys
+    names = [str(line.get(name_key) or '') for line in lines]
+    quantity = np.array([_number(line.get(quantity_key)) for line in lines], dtype=np.float64)
+    price = np.array([_number(line.get(price_key)) for line in lines], dtype=np.float64)
+    amount = np.array([_number(line.get(amount_key)) for line in lines], dtype=np.float64)
+    amount = np.where(amount > 0, amount, quantity * price)
+    price = np.where(price > 0, price, np.divide(amount, quantity, out=np.zeros_like(amount), where=quantity > 0))
+    return names, quantity, price, amount
+
+
+def trigram_counts(texts):
+    """
+    Vector đếm trigram ký tự (CSR, chuẩn hóa L2) của các tên đã bỏ dấu. Sau fold_text chỉ còn [0-9a-z ] nên
+    mỗi trigram mã hóa thành một số nguyên; cả lô tách trigram bằng NumPy, không lặp từng ký tự bằng Python.
+    """
+    from scipy.sparse import csr_matrix
+
+    padded = [f" {fold_text(text)} " for text in texts]
+    lengths = np.fromiter((len(text) for text in padded), dtype=np.int64, count=len(padded))
+    codes = np.frombuffer((''.join(padded) + '  ').encode('ascii'), dtype=np.uint8).astype(np.int64)
+    trigrams = (codes[:-2] << 14) | (codes[1:-1] << 7) | codes[2:]
+    # Bỏ trigram vắt qua ranh giới hai tên (bắt đầu ở 2 ký tự cuối của mỗi tên)
+    ends = np.cumsum(lengths)
+    valid = np.ones(len(trigrams), dtype=bool)
+    valid[ends - 2] = valid[ends - 1] = False
+    rows = np.repeat(np.arange(len(padded)), lengths)[valid]
+    trigrams = trigrams[valid]
+    vocabulary, columns = np.unique(trigrams, return_inverse=True)
+    counts = csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                        shape=(len(padded), max(len(vocabulary), 1)))
+    norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel())
+    return csr_matrix(counts.multiply(1 / np.where(norms > 0, norms, 1)[:, None]))
+
+
+def description_similarity(left, right):
+    """Ma trận cosine (len(left) × len(right)) giữa vector trigram của hai danh sách tên."""
+    counts = trigram_counts(list(left) + list(right))
+    # CSR × ma trận đặc (m × số trigram) nhanh hơn CSR × CSR khi kết quả gần như đặc
+    return np.asarray(counts[:len(left)] @ counts[len(left):].toarray().T)
+
+
+def relative_gap(left, right):
+    """|a - b| / max(|a|, |b|) cho mọi cặp (broadcast, float32), chặn ở 1; hai bên cùng 0 → 0."""
+    left = left.astype(np.float32)[:, None]
+    right = right.astype(np.float32)[None, :]
+    gap = np.abs(left - right)
+    scale = np.maximum(np.abs(left), np.abs(right))
+    np.maximum(scale, np.finfo(np.float32).tiny, out=scale)
+    np.divide(gap, scale, out=gap)
+    return np.minimum(gap, 1, out=gap)
+
+
+def line_cost_matrix(invoice, purchase_order, weights=None, min_similarity=None, max_cost=None):
+    """
+    Ma trận chi phí (n × m) và ma trận tương đồng mô tả từ mảng của line_arrays().
+    Chi phí được chặn ở `max_cost` (LINE_MATCH_MAX_COST): cặp chạm trần coi như không ghép, nên khi giải
+    tổng chi phí nhỏ nhất, để hai dòng không ghép tốn max_cost. Không bao giờ phá một cặp đúng chỉ để ghép thêm
+    một dòng thừa với chi phí cao. Cặp có tương đồng mô tả < `min_similarity` nhận luôn max_cost.
+    """
+    weights = np.asarray(weights or getattr(settings, 'LINE_MATCH_WEIGHTS', (0.5, 0.25, 0.25)), dtype=np.float32)
+    weights = weights / weights.sum()
+    if min_similarity is None:
+        min_similarity = getattr(settings, 'LINE_MATCH_MIN_SIMILARITY', 0.3)
+    if max_cost is None:
+        max_cost = getattr(settings, 'LINE_MATCH_MAX_COST', 0.35)
+    similarity = description_similarity(invoice[0], purchase_order[0]).astype(np.float32)
+    cost = np.clip(similarity, 0, 1)
+    np.subtract(1, cost, out=cost)
+    cost *= weights[0]
+    cost += weights[1] * relative_gap(invoice[1], purchase_order[1])
+    cost += weights[2] * relative_gap(invoice[2], purchase_order[2])
+    cost[similarity < min_similarity] = max_cost
+    return np.minimum(cost, max_cost, out=cost), similarity
+
+
+def received_quantities(po_lines, receipts=None):
+    """
+    Số lượng đã nhận của từng dòng PO: cộng các phiếu nhập [{"line_no", "quantity"}] theo line_no, hoặc
+    `received_quantity` trên dòng PO. Không có dữ liệu nhập kho → None (đối chiếu 2 bên).
+    """
+    if receipts is None and not any('received_quantity' in line for line in po_lines):
+        return None
+    if receipts is None:
+        return np.array([_number(line.get('received_quantity')) for line in po_lines], dtype=np.float64)
+    positions = {line.get('line_no', index + 1): index for index, line in enumerate(po_lines)}
+    received = np.zeros(len(po_lines), dtype=np.float64)
+    for receipt in receipts:
+        index = positions.get(receipt.get('line_no'))
+        if index is not None:
+            received[index] += _number(receipt.get('quantity'))
+    return received
+
+
+def match_line_items(invoice_lines, po_lines, receipts=None, weights=None, min_similarity=None, max_cost=None):
+    """
+    🧮 Ghép tối ưu dòng hóa đơn ↔ dòng PO (↔ phiếu nhập). Trả về
+    {"match_score", "matched", "lines": [chênh lệch từng dòng], "not_on_po", "not_invoiced"}.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    if max_cost is None:
+        max_cost = getattr(settings, 'LINE_MATCH_MAX_COST', 0.35)
+    invoice = line_arrays(invoice_lines, INVOICE_LINE_KEYS)
+    purchase_order = line_arrays(po_lines, PO_LINE_KEYS)
+    received = received_quantities(po_lines, receipts)
+    if invoice_lines and po_lines:
+        cost, similarity = line_cost_matrix(invoice, purchase_order, weights, min_similarity, max_cost)
+        rows, cols = linear_sum_assignment(cost)
+        keep = cost[rows, cols] < np.float32(max_cost)
+        rows, cols = rows[keep], cols[keep]
+    else:
+        cost = similarity = np.zeros((len(invoice_lines), len(po_lines)))
+        rows = cols = np.zeros(0, dtype=np.intp)
+
+    quantity_tolerance = getattr(settings, 'LINE_MATCH_QUANTITY_TOLERANCE', 0)
+    price_tolerance = getattr(settings, 'LINE_MATCH_PRICE_TOLERANCE', 0.01)
+    quantity_variance = invoice[1][rows] - purchase_order[1][cols]
+    price_variance = invoice[2][rows] - purchase_order[2][cols]
+    amount_variance = invoice[3][rows] - purchase_order[3][cols]
+    within = (np.abs(quantity_variance) <= quantity_tolerance) & (
+        np.abs(price_variance) <= price_tolerance * np.abs(purchase_order[2][cols]))
+    receipt_variance = None
+    if received is not None:
+        receipt_variance = invoice[1][rows] - received[cols]
+        within &= receipt_variance <= quantity_tolerance
+    scores = 1 - cost[rows, cols]
+
+    weight_invoice = np.abs(invoice[3])
+    weight_po = np.abs(purchase_order[3])
+    total_weight = weight_invoice.sum() + weight_po.sum()
+    if total_weight > 0:
+        match_score = float((scores * (weight_invoice[rows] + weight_po[cols])).sum() / total_weight)
+    else:
+        match_score = float(2 * scores.sum() / max(len(invoice_lines) + len(po_lines), 1))
+
+    lines = []
+    for k, (i, j) in enumerate(zip(rows.tolist(), cols.tolist())):
+        line = {
+            'invoice_line': i + 1,
+            'po_line_no': po_lines[j].get('line_no', j + 1),
+            'description': invoice[0][i],
+            'po_description': purchase_order[0][j],
+            'description_similarity': round(float(similarity[i, j]), 3),
+            'quantity': float(invoice[1][i]),
+            'po_quantity': float(purchase_order[1][j]),
+            'quantity_variance': float(quantity_variance[k]),
+            'unit_price': float(invoice[2][i]),
+            'po_unit_price': float(purchase_order[2][j]),
+            'price_variance': round(float(price_variance[k]), 2),
+            'amount_variance': round(float(amount_variance[k]), 2),
+            'score': round(float(scores[k]), 3),
+            'status': 'matched' if within[k] else 'variance',
+        }
+        if received is not None:
+            line['received_quantity'] = float(received[j])
+            line['receipt_variance'] = float(receipt_variance[k])
+        lines.append(line)
+
+    matched_invoice, matched_po = set(rows.tolist()), set(cols.tolist())
+    return {
+        'match_score': round(match_score, 4),
+        'matched': int(within.sum()),
+        'lines': lines,
+        'not_on_po': [
+            {'invoice_line': i + 1, 'description': invoice[0][i], 'amount': float(invoice[3][i]), 'status': 'not_on_po'}
+            for i in range(len(invoice_lines)) if i not in matched_invoice
+        ],
+        'not_invoiced': [
+            {'po_line_no': line.get('line_no', j + 1), 'description': purchase_order[0][j],
+             'amount': float(purchase_order[3][j]), 'status': 'not_invoiced'}
+            for j, line in enumerate(po_lines) if j not in matched_po
+        ],
+    }
+
+
+def match_invoice_lines(invoice, purchase_order=None, receipts=None):
+    """
+    📦 Đối chiếu dòng hàng của hóa đơn với PO đã khớp (invoice.purchase_order, xem erp_mirror.py) và phiếu nhập.
+    Hóa đơn chưa khớp PO → None.
+    """
+    purchase_order = purchase_order or invoice.purchase_order
+    if purchase_order is None:
+        return None
+    items = (invoice.ai_extracted_data or {}).get('items') or []
+    result = match_line_items(items, purchase_order.lines or [], receipts=receipts)
+    result['purchase_order'] = purchase_order.po_number
+    return result
@@ -0,0 +1,48 @@
+# app_invoices/management/commands/ai_model_versions.py
+"""
+🗂️ Quản lý phiên bản AI model trong registry
+
+    python manage.py ai_model_versions                      # liệt kê phiên bản
+    python manage.py ai_model_versions --activate 3         # kích hoạt / rollback về phiên bản 3
+    python manage.py ai_model_versions --prune --keep 5     # xóa thư mục phiên bản cũ không active
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import AIModelTraining
+from ...model_registry import activate_model_version, prune_model_versions, read_active_version
+
+
+class Command(BaseCommand):
+    help = "Liệt kê, kích hoạt (rollback) hoặc dọn các phiên bản AI model trong registry"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-type', default='classifier', help="Loại model (classifier, ...)")
+        parser.add_argument('--activate', type=int, default=None, help="Kích hoạt phiên bản N (worker tự hot swap)")
+        parser.add_argument('--prune', action='store_true', help="Xóa thư mục của các phiên bản cũ không active")
+        parser.add_argument('--keep', type=int, default=None, help="Số phiên bản cũ giữ lại khi --prune")
+
+    def handle(self, *args, **options):
+        model_type = options['model_type']
+
+        if options['activate'] is not None:
+            try:
+                activate_model_version(model_type, options['activate'])
+            except (FileNotFoundError, ValueError) as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"✅ Đã kích hoạt {model_type} phiên bản {options['activate']}"))
+
+        if options['prune']:
+            removed = prune_model_versions(model_type, keep=options['keep'])
+            self.stdout.write(f"🧹 Đã xóa {len(removed)} phiên bản: {removed}")
+
+        active_version = read_active_version(model_type)
+        self.stdout.write(f"📌 Phiên bản active ({model_type}): {active_version if active_version is not None else 'chưa có'}")
+        for training in AIModelTraining.objects.filter(model_type=model_type, version__gt=0).order_by('-version'):
+            marker = '*' if training.is_active else ' '
+            trained = f"{training.last_trained:%Y-%m-%d %H:%M}" if training.last_trained else '-'
+            self.stdout.write(
+                f" {marker} v{training.version:04d}  {training.model_name}  "
+                f"dữ liệu={training.training_data_count}  accuracy={training.accuracy}  "
+                f"{trained}"
+            )
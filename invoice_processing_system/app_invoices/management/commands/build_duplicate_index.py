@@ -0,0 +1,49 @@
+# app_invoices/management/commands/build_duplicate_index.py
+"""
+🧬 Dựng / bổ sung chỉ mục hóa đơn gần trùng (MinHash + LSH) cho hóa đơn đã có OCR text
+
+    python manage.py build_duplicate_index                 # chỉ hóa đơn chưa có trong chỉ mục
+    python manage.py build_duplicate_index --rebuild       # tính lại toàn bộ (sau khi đổi số hàm băm / band)
+    python manage.py build_duplicate_index --batch-size 2000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Tính chữ ký MinHash + bucket LSH cho OCR text của hóa đơn (pipeline tự cập nhật hóa đơn mới)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Tính lại cả hóa đơn đã có trong chỉ mục")
+        parser.add_argument('--batch-size', type=int, default=500, help="Số hóa đơn mỗi lô đọc DB / ghi chỉ mục")
+
+    def handle(self, *args, **options):
+        from ...models import Invoice
+        from ...duplicate_index import index_invoice_texts
+        from ...reextraction import should_reextract
+
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError("--batch-size phải > 0")
+
+        queryset = Invoice.objects.exclude(raw_ocr_text='')
+        if not options['rebuild']:
+            queryset = queryset.filter(text_signature__isnull=True)
+
+        started = time.time()
+        indexed = scanned = last_id = 0
+        # Phân trang theo id (không giữ cursor mở trong lúc ghi vào bảng chỉ mục đang được lọc)
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', 'raw_ocr_text')[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            scanned += len(rows)
+            indexed += index_invoice_texts([(invoice_id, text) for invoice_id, text in rows if should_reextract(text)])
+            self.stdout.write(f"  ... {scanned} hóa đơn")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Đã ghi chỉ mục {indexed}/{scanned} hóa đơn trong {time.time() - started:.1f}s"
+        ))
@@ -0,0 +1,63 @@
+# app_invoices/management/commands/build_embedding_index.py
+"""
+🧭 Ghi ảnh chụp chỉ mục embedding hóa đơn (tìm hóa đơn tương tự)
+
+    python manage.py build_embedding_index                     # ghi ảnh chụp từ các embedding đã có
+    python manage.py build_embedding_index --embed-missing     # embedding hóa đơn cũ chưa có rồi mới ghi ảnh chụp
+    python manage.py build_embedding_index --ivf on --nlist 1024
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Embedding OCR text còn thiếu (tùy chọn) và ghi ảnh chụp chỉ mục vector memory-mapped mới"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--embed-missing', action='store_true',
+                            help="Tính embedding cho hóa đơn đã OCR nhưng chưa có embedding của model hiện tại")
+        parser.add_argument('--batch-size', type=int, default=256, help="Số hóa đơn mỗi lô đọc DB / encode")
+        parser.add_argument('--ivf', choices=['auto', 'on', 'off'], default='auto',
+                            help="Bộ lượng tử thô (auto: bật khi ≥ INVOICE_EMBEDDING_IVF_MIN_ROWS hàng)")
+        parser.add_argument('--nlist', type=int, default=None, help="Số cụm IVF (mặc định √n)")
+
+    def handle(self, *args, **options):
+        from ...models import Invoice
+        from ...embedding_index import (
+            EMBEDDINGS_AVAILABLE, build_embedding_snapshot, embed_invoices, embedding_model_name,
+        )
+
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError("--batch-size phải > 0")
+
+        started = time.time()
+        if options['embed_missing']:
+            if not EMBEDDINGS_AVAILABLE:
+                raise CommandError("Chưa cài sentence-transformers (requirements.txt)")
+            queryset = Invoice.objects.exclude(raw_ocr_text='').exclude(embedding__model_name=embedding_model_name())
+            embedded = last_id = 0
+            while True:
+                ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                embedded += embed_invoices(ids, force=False)
+                self.stdout.write(f"  ... {embedded} hóa đơn ({embedded / max(time.time() - started, 1e-9):.1f} hóa đơn/s)")
+            self.stdout.write(f"🧭 Đã embedding {embedded} hóa đơn trong {time.time() - started:.1f}s")
+
+        ivf = {'auto': None, 'on': True, 'off': False}[options['ivf']]
+        record = build_embedding_snapshot(
+            ivf=ivf, nlist=options['nlist'],
+            progress=lambda done, total: self.stdout.write(f"  ... {done}/{total} vector") if done % 100000 == 0 else None,
+        )
+        if record is None:
+            self.stdout.write("ℹ️ Chưa có embedding nào")
+            return
+        nlist = record.metrics.get('nlist')
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Chỉ mục embedding phiên bản {record.version}: {record.training_data_count} hóa đơn"
+            f"{f', {nlist} cụm IVF' if nlist else ''} trong {time.time() - started:.1f}s"
+        ))
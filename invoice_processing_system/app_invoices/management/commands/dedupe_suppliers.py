@@ -0,0 +1,56 @@
+# app_invoices/management/commands/dedupe_suppliers.py
+"""
+🧹 Gộp nhà cung cấp trùng (cùng MST hoặc tên gần giống sau khi bỏ dấu / loại hình doanh nghiệp)
+
+    python manage.py dedupe_suppliers --dry-run        # chỉ liệt kê các nhóm sẽ gộp
+    python manage.py dedupe_suppliers                  # chuyển hóa đơn sang nhà cung cấp giữ lại, xóa bản trùng
+    python manage.py dedupe_suppliers --threshold 0.8  # gộp cả tên gần giống (xem --dry-run trước)
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Gộp các nhà cung cấp bị tạo trùng từ biến thể OCR của cùng một tên (giữ bản có id nhỏ nhất)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ liệt kê, không ghi DB")
+        parser.add_argument('--threshold', type=float, default=None,
+                            help="Ngưỡng Jaccard trigram (mặc định: SUPPLIER_MATCH_THRESHOLD)")
+
+    def handle(self, *args, **options):
+        from ...models import Supplier
+        from ...supplier_resolver import find_duplicate_suppliers, merge_suppliers
+
+        threshold = options['threshold']
+        if threshold is not None and not 0 < threshold <= 1:
+            raise CommandError("--threshold phải trong khoảng (0, 1]")
+
+        started = time.time()
+        canonical = find_duplicate_suppliers(threshold)
+        if not canonical:
+            self.stdout.write("ℹ️ Không có nhà cung cấp trùng")
+            return
+
+        groups = {}
+        for duplicate_id, keep_id in canonical.items():
+            groups.setdefault(keep_id, []).append(duplicate_id)
+        names = dict(Supplier.objects.filter(id__in=[*groups, *canonical]).values_list('id', 'name'))
+        for keep_id, duplicate_ids in sorted(groups.items()):
+            self.stdout.write(f"  #{keep_id} {names[keep_id]}")
+            for duplicate_id in duplicate_ids:
+                self.stdout.write(f"      ← #{duplicate_id} {names[duplicate_id]}")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {len(canonical)} nhà cung cấp trùng sẽ được gộp vào {len(groups)} nhà cung cấp"
+            ))
+            return
+
+        moved = merge_suppliers(canonical)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Đã gộp {len(canonical)} nhà cung cấp vào {len(groups)}, chuyển {moved} hóa đơn "
+            f"trong {time.time() - started:.1f}s"
+        ))
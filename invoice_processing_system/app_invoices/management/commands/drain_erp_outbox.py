@@ -0,0 +1,46 @@
+# app_invoices/management/commands/drain_erp_outbox.py
+"""
+📮 Worker gửi sự kiện outbox (phê duyệt / đối chiếu hóa đơn) lên ERP theo lô
+
+    python manage.py drain_erp_outbox                  # gửi hết sự kiện đến hạn rồi thoát
+    python manage.py drain_erp_outbox --loop           # worker riêng: lặp lại, nghỉ --interval giây khi outbox trống
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Gửi sự kiện ERP đang chờ trong outbox (transactional outbox) theo lô"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config', default=None, help="system_name của ERPIntegrationConfig (mặc định: config đang bật)")
+        parser.add_argument('--batch-size', type=int, default=None, help="Số sự kiện mỗi lô (mặc định: ERP_OUTBOX_BATCH_SIZE)")
+        parser.add_argument('--loop', action='store_true', help="Chạy liên tục như worker riêng")
+        parser.add_argument('--interval', type=float, default=1.0, help="Số giây nghỉ khi outbox trống (--loop)")
+
+    def handle(self, *args, **options):
+        from ...models import ERPIntegrationConfig
+        from ...erp_outbox import drain_outbox
+
+        config = None
+        if options['config']:
+            try:
+                config = ERPIntegrationConfig.objects.get(system_name=options['config'])
+            except ERPIntegrationConfig.DoesNotExist:
+                raise CommandError(f"Không tìm thấy ERPIntegrationConfig '{options['config']}'")
+        if options['batch_size'] is not None and options['batch_size'] <= 0:
+            raise CommandError("--batch-size phải > 0")
+
+        if not options['loop']:
+            totals = drain_outbox(config=config, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"✅ {dict(totals) or 'Outbox trống'}"))
+            return
+        self.stdout.write(f"📮 Worker outbox ERP đang chạy (nghỉ {options['interval']}s khi trống), Ctrl+C để dừng")
+        try:
+            while True:
+                if not drain_outbox(config=config, batch_size=options['batch_size']):
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,147 @@
+# app_invoices/management/commands/reextract_invoices.py
+"""
+♻️ Trích xuất lại toàn bộ hóa đơn từ OCR text đã lưu
+
+    python manage.py reextract_invoices                 # chạy (tiếp tục từ checkpoint nếu có)
+    python manage.py reextract_invoices --dry-run       # chỉ in khác biệt, không ghi DB
+    python manage.py reextract_invoices --restart --workers 8 --batch-size 500
+"""
+
+import json
+import os
+import time
+from collections import deque, Counter
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from ...models import Invoice
+from ...reextraction import (
+    REEXTRACT_FIELDS, init_worker, reextract_batch, diff_invoice_fields, add_near_duplicate_risk,
+    should_reextract, iter_invoice_batches,
+)
+
+
+class Command(BaseCommand):
+    help = "Trích xuất lại (extraction + phân loại + fraud) cho hóa đơn đã có OCR text, chạy song song nhiều core"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help="Số hóa đơn mỗi lô (đọc DB / gửi worker / bulk_update)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Số tiến trình worker (1 = chạy tuần tự)")
+        parser.add_argument('--limit', type=int, default=None, help="Chỉ xử lý tối đa N hóa đơn")
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ in khác biệt, không ghi DB và không lưu checkpoint")
+        parser.add_argument('--restart', action='store_true', help="Bỏ checkpoint cũ, chạy lại từ đầu")
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'reextract_invoices.checkpoint.json'),
+            help="File lưu id hóa đơn cuối cùng đã xử lý",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        workers = max(1, options['workers'])
+        dry_run = options['dry_run']
+        checkpoint_path = options['checkpoint']
+        if batch_size <= 0:
+            raise CommandError("--batch-size phải > 0")
+
+        if options['restart'] and os.path.exists(checkpoint_path) and not dry_run:
+            os.remove(checkpoint_path)
+        last_id = 0 if options['restart'] else self._load_checkpoint(checkpoint_path)
+        if last_id:
+            self.stdout.write(f"⏩ Tiếp tục sau hóa đơn ID {last_id} (checkpoint {checkpoint_path})")
+
+        self.stats = Counter()
+        self.field_changes = Counter()
+        started = time.time()
+
+        batches = iter_invoice_batches(batch_size=batch_size, start_after_id=last_id, limit=options['limit'])
+
+        if workers == 1:
+            for invoices, layouts in batches:
+                results = reextract_batch(self._batch_items(invoices, layouts))
+                self._apply_results(invoices, results, dry_run, checkpoint_path)
+        else:
+            # Đóng kết nối DB trước khi fork để tiến trình con không dùng chung socket
+            connections.close_all()
+            with Pool(processes=workers, initializer=init_worker) as pool:
+                # Giới hạn số lô đang xử lý để bộ nhớ không tăng theo kích thước bảng
+                in_flight = deque()
+                for invoices, layouts in batches:
+                    in_flight.append((invoices, pool.apply_async(reextract_batch, (self._batch_items(invoices, layouts),))))
+                    if len(in_flight) >= workers * 2:
+                        done_invoices, async_result = in_flight.popleft()
+                        self._apply_results(done_invoices, async_result.get(), dry_run, checkpoint_path)
+                while in_flight:
+                    done_invoices, async_result = in_flight.popleft()
+                    self._apply_results(done_invoices, async_result.get(), dry_run, checkpoint_path)
+
+        elapsed = time.time() - started
+        rate = self.stats['processed'] / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {'[DRY-RUN] ' if dry_run else ''}Đã xử lý {self.stats['processed']} hóa đơn "
+            f"({self.stats['changed']} thay đổi, {self.stats['skipped']} bỏ qua, {self.stats['errors']} lỗi) "
+            f"trong {elapsed:.1f}s ({rate:.0f} hóa đơn/s, {workers} worker)"
+        ))
+        for field, count in self.field_changes.most_common():
+            self.stdout.write(f"   • {field}: {count} hóa đơn thay đổi")
+
+    def _batch_items(self, invoices, layouts):
+        items = []
+        for invoice in invoices:
+            if should_reextract(invoice.raw_ocr_text):
+                items.append((invoice.id, invoice.raw_ocr_text, layouts.get(invoice.id)))
+            else:
+                self.stats['skipped'] += 1
+        return items
+
+    def _apply_results(self, invoices, results, dry_run, checkpoint_path):
+        """So sánh với dữ liệu hiện tại, ghi bulk_update (hoặc in diff) rồi lưu checkpoint."""
+        by_id = {invoice.id: invoice for invoice in invoices}
+        changed = []
+        for invoice_id, values, error in add_near_duplicate_risk(results):
+            self.stats['processed'] += 1
+            if error:
+                self.stats['errors'] += 1
+                self.stderr.write(f"❌ Hóa đơn ID {invoice_id}: {error}")
+                continue
+
+            invoice = by_id[invoice_id]
+            changes = diff_invoice_fields(invoice, values)
+            if not changes:
+                continue
+
+            self.stats['changed'] += 1
+            self.field_changes.update(changes.keys())
+            if dry_run:
+                for field, (old, new) in changes.items():
+                    if field == 'ai_extracted_data':
+                        continue  # JSON dài, đã thể hiện qua các trường khác
+                    self.stdout.write(f"#{invoice_id} {field}: {old!r} → {new!r}")
+            else:
+                for field, (_, new) in changes.items():
+                    setattr(invoice, field, new)
+                changed.append(invoice)
+
+        if not dry_run:
+            if changed:
+                with transaction.atomic():
+                    Invoice.objects.bulk_update(changed, REEXTRACT_FIELDS, batch_size=500)
+            self._save_checkpoint(checkpoint_path, invoices[-1].id)
+
+    @staticmethod
+    def _load_checkpoint(path):
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding='utf-8') as f:
+            return int(json.load(f).get('last_invoice_id', 0))
+
+    @staticmethod
+    def _save_checkpoint(path, last_invoice_id):
+        """Ghi checkpoint nguyên tử (file tạm + os.replace) để không hỏng khi bị ngắt giữa chừng."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_invoice_id': last_invoice_id}, f)
+        os.replace(tmp_path, path)
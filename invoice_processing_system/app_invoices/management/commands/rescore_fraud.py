@@ -0,0 +1,49 @@
+# app_invoices/management/commands/rescore_fraud.py
+"""
+🕵️ Chấm lại điểm fraud cho toàn bộ hóa đơn (pandas / NumPy, có đặc trưng giữa các hóa đơn)
+
+    python manage.py rescore_fraud                     # chấm lại và ghi fraud_risk_score / fraud_risk_level
+    python manage.py rescore_fraud --dry-run           # chỉ thống kê, không ghi DB
+    python manage.py rescore_fraud --status PENDING_REVIEW
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Chấm lại fraud hàng loạt (z-score theo nhà cung cấp, số tiền tròn, số hóa đơn trùng) và ghi lại theo lô"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ tính điểm, không ghi DB")
+        parser.add_argument('--status', action='append', help="Chỉ ghi lại hóa đơn ở trạng thái này (lặp lại được)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Số id tối đa mỗi lệnh UPDATE")
+
+    def handle(self, *args, **options):
+        from ...fraud_batch import INDICATOR_COLUMNS, rescore_invoices
+
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size phải > 0")
+
+        started = time.time()
+        result, changed = rescore_invoices(
+            statuses=options['status'], dry_run=options['dry_run'], batch_size=options['batch_size'],
+        )
+        elapsed = time.time() - started
+
+        if result.empty:
+            self.stdout.write("ℹ️ Không có hóa đơn nào")
+            return
+
+        scored = result[result['rescored']]
+        self.stdout.write(f"📊 {len(scored)}/{len(result)} hóa đơn được chấm lại trong {elapsed:.2f}s")
+        for column, label in INDICATOR_COLUMNS.items():
+            count = int(scored[column].sum())
+            if count:
+                self.stdout.write(f"  - {label}: {count}")
+        levels = scored['risk_level'].value_counts()
+        self.stdout.write("  Mức rủi ro: " + ", ".join(f"{level}={count}" for level, count in levels.items()))
+
+        verb = "sẽ thay đổi" if options['dry_run'] else "đã cập nhật"
+        self.stdout.write(self.style.SUCCESS(f"✅ {changed} hóa đơn {verb} điểm / mức rủi ro"))
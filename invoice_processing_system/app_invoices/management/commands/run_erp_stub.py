@@ -0,0 +1,42 @@
+# app_invoices/management/commands/run_erp_stub.py
+"""
+🧪 Chạy ERP giả lập (erp_stub.py) để thử đồng bộ bản sao ERP / đối chiếu / ghi hóa đơn mà không cần ERP thật
+
+    python manage.py run_erp_stub --port 8765 --orders 100000 --latency-ms 20
+    # rồi tạo ERPIntegrationConfig với api_url = http://127.0.0.1:8765/api/ và chạy sync_erp_mirror
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Chạy ERP giả lập (nhà cung cấp + PO tổng hợp) qua HTTP"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--vendors', type=int, default=200, help="Số nhà cung cấp")
+        parser.add_argument('--orders', type=int, default=5000, help="Số đơn mua hàng")
+        parser.add_argument('--latency-ms', type=float, default=0, help="Độ trễ cộng thêm mỗi request")
+        parser.add_argument('--failure-rate', type=float, default=0, help="Tỉ lệ POST trả 503 ngẫu nhiên (0-1)")
+        parser.add_argument('--api-key', default=None, help="Bắt buộc header 'Authorization: Bearer <key>'")
+
+    def handle(self, *args, **options):
+        from ...erp_stub import ERPStubData, ERPStubServer
+
+        data = ERPStubData.generate(vendors=options['vendors'], orders=options['orders'])
+        server = ERPStubServer(
+            data, host=options['host'], port=options['port'],
+            latency=options['latency_ms'] / 1000, api_key=options['api_key'],
+            failure_rate=options['failure_rate'],
+        ).start()
+        self.stdout.write(self.style.SUCCESS(
+            f"🧪 ERP giả lập tại {server.url} ({options['vendors']} nhà cung cấp, {options['orders']} PO), Ctrl+C để dừng"
+        ))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
@@ -0,0 +1,47 @@
+# app_invoices/management/commands/sync_erp_mirror.py
+"""
+🪞 Đồng bộ bản sao cục bộ nhà cung cấp + PO từ ERP (delta theo mốc high-water)
+
+    python manage.py sync_erp_mirror                       # mọi ERPIntegrationConfig đang bật, chỉ bản ghi mới sửa
+    python manage.py sync_erp_mirror --config SAP --full   # đọc lại toàn bộ, xóa bản ghi ERP không còn trả về
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Đồng bộ delta nhà cung cấp và đơn mua hàng từ ERP vào bảng bản sao để đối chiếu hóa đơn cục bộ"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config', default=None, help="system_name của ERPIntegrationConfig (mặc định: mọi config đang bật)")
+        parser.add_argument('--full', action='store_true', help="Bỏ mốc high-water, đọc lại toàn bộ")
+        parser.add_argument('--page-size', type=int, default=None, help="Số bản ghi mỗi trang (mặc định: ERP_MIRROR_PAGE_SIZE)")
+
+    def handle(self, *args, **options):
+        from ...models import ERPIntegrationConfig
+        from ...erp_mirror import sync_erp_mirror
+
+        config = None
+        if options['config']:
+            try:
+                config = ERPIntegrationConfig.objects.get(system_name=options['config'])
+            except ERPIntegrationConfig.DoesNotExist:
+                raise CommandError(f"Không tìm thấy ERPIntegrationConfig '{options['config']}'")
+        if options['page_size'] is not None and options['page_size'] <= 0:
+            raise CommandError("--page-size phải > 0")
+
+        started = time.time()
+        summary = sync_erp_mirror(
+            config=config, full=options['full'], page_size=options['page_size'],
+            progress=lambda resource, done: self.stdout.write(f"  ... {resource}: {done} bản ghi") if done % 10000 == 0 else None,
+        )
+        if not summary:
+            self.stdout.write("ℹ️ Không có ERPIntegrationConfig nào đang bật")
+            return
+        for system_name, counts in summary.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {system_name}: {counts.get('vendors', 0)} nhà cung cấp, {counts.get('purchase_orders', 0)} PO"
+            ))
+        self.stdout.write(f"⏱️ {time.time() - started:.1f}s")
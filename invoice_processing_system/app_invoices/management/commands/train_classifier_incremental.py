@@ -0,0 +1,40 @@
+# app_invoices/management/commands/train_classifier_incremental.py
+"""
+📈 Cập nhật AI Classifier tăng dần từ hóa đơn đã gán nhãn trong DB
+
+    python manage.py train_classifier_incremental                   # chỉ học dữ liệu mới từ lần trước
+    python manage.py train_classifier_incremental --full            # học lại toàn bộ từ đầu
+    python manage.py train_classifier_incremental --chunk-size 5000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Huấn luyện tăng dần AI Classifier (HashingVectorizer + SGD partial_fit) từ dữ liệu gán nhãn mới"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Số hóa đơn mỗi lô đọc DB / partial_fit")
+        parser.add_argument('--full', action='store_true', help="Bỏ mốc cũ, học lại toàn bộ dữ liệu")
+
+    def handle(self, *args, **options):
+        from ...ai_services import ai_classifier
+
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size phải > 0")
+
+        started = time.time()
+        stats = ai_classifier.train_incremental(chunk_size=options['chunk_size'], full=options['full'])
+        elapsed = time.time() - started
+
+        if stats['version'] is None:
+            self.stdout.write(f"ℹ️ Không có dữ liệu gán nhãn mới ({elapsed:.1f}s)")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ +{stats['samples']} mẫu trong {stats['chunks']} lô ({elapsed:.1f}s), "
+            f"tổng {stats['samples_seen']} mẫu → phiên bản {stats['version']}"
+        ))
+        if stats['skipped_labels']:
+            self.stdout.write(f"⚠️ Bỏ qua {stats['skipped_labels']} mẫu có nhãn ngoài danh sách loại hóa đơn")
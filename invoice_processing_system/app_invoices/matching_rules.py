@@ -0,0 +1,291 @@
+# app_invoices/matching_rules.py
+"""
+🧮 Quy tắc đối chiếu hóa đơn ↔ bản ghi ERP (MatchingRule.rule_logic)
+
+DSL nhỏ, an toàn (không eval): mỗi dòng (hoặc ngăn bằng `;` / `and`) là một điều kiện,
+mọi điều kiện phải đúng thì quy tắc khớp và hóa đơn nhận điểm `score` của quy tắc:
+
+    invoice_number equal        # số hóa đơn sau chuẩn hóa (bỏ ký tự phân cách, số 0 đầu, O/I đọc nhầm)
+    supplier equal              # cùng MST nếu hai bên đều có, ngược lại cùng tên lõi (bỏ dấu, loại hình DN)
+    amount within 0.5%          # lệch tổng tiền ≤ 0.5% giá trị ERP (hoặc `amount within 50000` tuyệt đối)
+    date within 3 days          # lệch ngày hóa đơn ≤ 3 ngày (`date equal` = cùng ngày)
+    score 0.95                  # điểm khớp khi quy tắc đúng (mặc định 1.0)
+
+Quy tắc đang bật được biên dịch MỘT lần thành closure theo thứ tự `priority` tăng dần, và chỉ biên dịch lại
+khi bảng MatchingRule đổi (số dòng / updated_at). Mỗi cặp hóa đơn / ERP dừng ở quy tắc đầu tiên khớp,
+trong một quy tắc dừng ở điều kiện đầu tiên sai. Chưa có quy tắc nào được bật thì dùng DEFAULT_RULES.
+"""
+
+import re
+import threading
+from collections import namedtuple
+from datetime import date, datetime
+
+from django.db.models import Count, Max
+
+from .models import MatchingRule, InvoiceStatus
+from .supplier_resolver import fold_text, normalize_supplier_name, normalize_tax_id
+
+CompiledRule = namedtuple('CompiledRule', ['priority', 'score', 'predicate', 'source', 'rule_id'])
+
+# Dùng khi chưa bật quy tắc nào: (priority, rule_logic)
+DEFAULT_RULES = (
+    (1, "invoice_number equal\nsupplier equal\namount within 0.5%\ndate within 3 days\nscore 0.95"),
+    (2, "invoice_number equal\nsupplier equal\namount within 2%\nscore 0.85"),
+    (3, "supplier equal\namount within 0.5%\ndate within 7 days\nscore 0.7"),
+)
+
+_CLAUSE_SPLIT = re.compile(r';|\band\b', re.IGNORECASE)
+_CLAUSES = (
+    ('invoice_number', re.compile(r'^invoice_number\s+equal$')),
+    ('supplier', re.compile(r'^supplier\s+equal$')),
+    ('amount_equal', re.compile(r'^amount\s+equal$')),
+    ('amount_within', re.compile(r'^amount\s+within\s+(\d+(?:\.\d+)?)\s*(%?)$')),
+    ('date_equal', re.compile(r'^date\s+equal$')),
+    ('date_within', re.compile(r'^date\s+within\s+(\d+)\s*(?:days?|ngày)$')),
+    ('score', re.compile(r'^score\s+(\d+(?:\.\d+)?)$')),
+)
+_NUMBER_OCR_LETTERS = frozenset('oil')
+_NUMBER_OCR = str.maketrans('oil', '011')
+_LEADING_ZEROS = re.compile(r'(?<![0-9])0+(?=[0-9])')
+_DAY_FIRST = re.compile(r'^(\d{1,2})[/-](\d{1,2})[/-](\d{4})')
+_YEAR_FIRST = re.compile(r'^(\d{4})[/-](\d{1,2})[/-](\d{1,2})')
+
+
+class RuleSyntaxError(ValueError):
+    """rule_logic không đúng cú pháp DSL."""
+
+
+class MatchFacts:
+    """Dữ liệu một phía (hóa đơn hoặc ERP) đã chuẩn hóa sẵn để so khớp nhanh."""
+    __slots__ = ('number', 'tax_id', 'supplier', 'amount', 'day')
+
+    def __init__(self, invoice_number=None, supplier_tax_id=None, supplier_name=None, total_amount=None,
+                 issue_date=None):
+        self.number = normalize_invoice_number(invoice_number)
+        self.tax_id = normalize_tax_id(supplier_tax_id)
+        self.supplier = normalize_supplier_name(supplier_name) if supplier_name else None
+        self.amount = float(total_amount) if total_amount not in (None, '') else None
+        self.day = parse_day(issue_date)
+
+
+def normalize_invoice_number(number):
+    """
+    Số hóa đơn để so khớp: chữ thường, chỉ chữ + số, bỏ số 0 đầu của mỗi cụm số.
+    Chuỗi chỉ gồm số và chữ hay bị OCR nhầm thành số (O, I, l) được đọc lại thành số.
+    """
+    compact = fold_text(str(number) if number is not None else '').replace(' ', '')
+    if any(ch.isdigit() for ch in compact) and all(ch.isdigit() or ch in _NUMBER_OCR_LETTERS for ch in compact):
+        compact = compact.translate(_NUMBER_OCR)
+    return _LEADING_ZEROS.sub('', compact) or None
+
+
+def parse_day(value):
+    """Ngày (date / datetime / chuỗi dd/mm/yyyy, yyyy-mm-dd) → số ngày ordinal, không đọc được → None."""
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    if not value:
+        return None
+    # Regex + date() thay cho thử lần lượt strptime (chậm hơn ~5 lần)
+    text = str(value).strip()
+    match = _DAY_FIRST.match(text)
+    if match:
+        day, month, year = match.groups()
+    else:
+        match = _YEAR_FIRST.match(text)
+        if not match:
+            return None
+        year, month, day = match.groups()
+    try:
+        return date(int(year), int(month), int(day)).toordinal()
+    except ValueError:
+        return None
+
+
+def invoice_facts(invoice):
+    """MatchFacts của hóa đơn: trường đã lưu, bổ sung MST / tên / ngày từ dữ liệu AI trích xuất."""
+    extracted = invoice.ai_extracted_data or {}
+    supplier = invoice.supplier
+    return MatchFacts(
+        invoice_number=invoice.invoice_number or extracted.get('invoice_number'),
+        supplier_tax_id=(supplier.tax_id if supplier else None) or extracted.get('supplier_tax_id'),
+        supplier_name=(supplier.name if supplier else None) or extracted.get('supplier_name'),
+        total_amount=invoice.total_amount if invoice.total_amount is not None else extracted.get('total_amount'),
+        issue_date=extracted.get('issue_date'),
+    )
+
+
+def erp_facts(record):
+    """MatchFacts của bản ghi ERP (dict: invoice_number, supplier_tax_id, supplier_name, total_amount, issue_date)."""
+    return MatchFacts(
+        invoice_number=record.get('invoice_number'),
+        supplier_tax_id=record.get('supplier_tax_id'),
+        supplier_name=record.get('supplier_name'),
+        total_amount=record.get('total_amount'),
+        issue_date=record.get('issue_date'),
+    )
+
+
+# --- Điều kiện: mỗi hàm trả về closure (invoice_facts, erp_facts) -> bool ---
+
+def _invoice_number_equal():
+    def check(inv, erp):
+        return inv.number is not None and inv.number == erp.number
+    return check
+
+
+def _supplier_equal():
+    def check(inv, erp):
+        if inv.tax_id and erp.tax_id:
+            return inv.tax_id == erp.tax_id
+        return inv.supplier is not None and inv.supplier == erp.supplier
+    return check
+
+
+def _amount_within(tolerance, percent):
+    if percent:
+        ratio = tolerance / 100
+
+        def check(inv, erp):
+            a, b = inv.amount, erp.amount
+            return a is not None and b is not None and abs(a - b) <= ratio * abs(b)
+    else:
+        def check(inv, erp):
+            a, b = inv.amount, erp.amount
+            return a is not None and b is not None and abs(a - b) <= tolerance
+    return check
+
+
+def _date_within(days):
+    def check(inv, erp):
+        a, b = inv.day, erp.day
+        return a is not None and b is not None and abs(a - b) <= days
+    return check
+
+
+def _always(inv, erp):
+    return True
+
+
+def _conjunction(checks):
+    """AND ngắn mạch: lồng closure để không tốn vòng lặp Python cho mỗi cặp."""
+    if not checks:
+        return _always
+    if len(checks) == 1:
+        return checks[0]
+    first, rest = checks[0], _conjunction(checks[1:])
+    return lambda inv, erp: first(inv, erp) and rest(inv, erp)
+
+
+def compile_rule(rule_logic, priority=0, rule_id=None):
+    """🧱 Biên dịch rule_logic thành CompiledRule; sai cú pháp → RuleSyntaxError."""
+    checks, score = [], 1.0
+    clauses = [
+        ' '.join(part.lower().split())
+        for line in (rule_logic or '').splitlines()
+        for part in _CLAUSE_SPLIT.split(line.split('#', 1)[0])
+    ]
+    for clause in filter(None, clauses):
+        for kind, pattern in _CLAUSES:
+            match = pattern.match(clause)
+            if match:
+                break
+        else:
+            raise RuleSyntaxError(f"Điều kiện không hợp lệ: '{clause}'")
+        if kind == 'invoice_number':
+            checks.append(_invoice_number_equal())
+        elif kind == 'supplier':
+            checks.append(_supplier_equal())
+        elif kind == 'amount_equal':
+            checks.append(_amount_within(0.005, percent=False))
+        elif kind == 'amount_within':
+            checks.append(_amount_within(float(match.group(1)), percent=bool(match.group(2))))
+        elif kind == 'date_equal':
+            checks.append(_date_within(0))
+        elif kind == 'date_within':
+            checks.append(_date_within(int(match.group(1))))
+        else:
+            score = float(match.group(1))
+            if score > 1:
+                raise RuleSyntaxError(f"score phải trong khoảng 0..1: {score}")
+    return CompiledRule(priority, score, _conjunction(checks), rule_logic, rule_id)
+
+
+class CompiledRuleSet:
+    """
+    🧮 Các quy tắc đã biên dịch, theo thứ tự priority tăng dần
+    """
+
+    def __init__(self, rules):
+        self.rules = sorted(rules, key=lambda rule: rule.priority)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows: (id, priority, rule_logic); quy tắc sai cú pháp bị bỏ qua (báo lỗi) để không chặn đối chiếu."""
+        rules = []
+        for rule_id, priority, rule_logic in rows:
+            try:
+                rules.append(compile_rule(rule_logic, priority, rule_id))
+            except RuleSyntaxError as e:
+                print(f"⚠️ Bỏ qua quy tắc đối chiếu #{priority}: {e}")
+        return cls(rules)
+
+    def evaluate(self, inv, erp):
+        """Quy tắc đầu tiên khớp (CompiledRule) hoặc None."""
+        for rule in self.rules:
+            if rule.predicate(inv, erp):
+                return rule
+        return None
+
+    def evaluate_many(self, pairs):
+        """Danh sách CompiledRule / None cho các cặp (invoice_facts, erp_facts)."""
+        evaluate = self.evaluate
+        return [evaluate(inv, erp) for inv, erp in pairs]
+
+    def __len__(self):
+        return len(self.rules)
+
+
+_engine = None
+_engine_key = None
+_engine_lock = threading.Lock()
+
+
+def rules_fingerprint():
+    """(số quy tắc, updated_at mới nhất): đổi khi quy tắc được thêm / sửa / bật tắt / xóa ở bất kỳ tiến trình nào."""
+    stats = MatchingRule.objects.aggregate(count=Count('id'), changed=Max('updated_at'))
+    return stats['count'], stats['changed']
+
+
+def get_rule_engine():
+    """Quy tắc đang bật đã biên dịch; một truy vấn nhỏ mỗi lần gọi để biết có cần biên dịch lại không."""
+    global _engine, _engine_key
+    key = rules_fingerprint()
+    if _engine is not None and key == _engine_key:
+        return _engine
+    with _engine_lock:
+        if _engine is None or key != _engine_key:
+            rows = list(
+                MatchingRule.objects.filter(is_active=True).order_by('priority')
+                .values_list('id', 'priority', 'rule_logic')
+            )
+            if not rows:
+                rows = [(None, priority, rule_logic) for priority, rule_logic in DEFAULT_RULES]
+            _engine, _engine_key = CompiledRuleSet.from_rows(rows), key
+    return _engine
+
+
+def match_invoice_to_erp(invoice, erp_record, save=True):
+    """
+    🔗 Đối chiếu hóa đơn với bản ghi ERP theo quy tắc đang bật:
+    khớp → MATCHED + match_score của quy tắc, không quy tắc nào khớp → UNMATCHED + 0.
+    Trả về CompiledRule đã khớp hoặc None.
+    """
+    rule = get_rule_engine().evaluate(invoice_facts(invoice), erp_facts(erp_record))
+    invoice.status = InvoiceStatus.MATCHED if rule else InvoiceStatus.UNMATCHED
+    invoice.match_score = round(rule.score, 2) if rule else 0
+    if save:
+        invoice.save(update_fields=['status', 'match_score'])
+    return rule
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0006_aimodeltraining_invoice_ai_category_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='ocr_job_id',
+            field=models.CharField(blank=True, db_index=True, help_text='Job id hàng đợi OCR', max_length=64, null=True),
+        ),
+    ]
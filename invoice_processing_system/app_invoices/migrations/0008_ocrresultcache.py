@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 10:05
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0007_invoice_ocr_job_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRResultCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('engine', models.CharField(max_length=100)),
+                ('raw_text', models.TextField(blank=True)),
+                ('parsed_data', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('size_bytes', models.IntegerField(default=0)),
+                ('hit_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('content_hash', 'engine')},
+            },
+        ),
+    ]
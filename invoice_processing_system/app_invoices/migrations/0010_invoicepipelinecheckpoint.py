@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0009_invoicebatch_invoice_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoicePipelineCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_stages', models.CharField(blank=True, max_length=255)),
+                ('data', models.BinaryField(blank=True, null=True)),
+                ('failed_stage', models.CharField(blank=True, max_length=50)),
+                ('last_error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pipeline_checkpoint', to='app_invoices.invoice')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0010_invoicepipelinecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrresultcache',
+            name='layout',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='InvoiceOCRLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('engine', models.CharField(blank=True, max_length=100)),
+                ('data', models.BinaryField()),
+                ('word_count', models.IntegerField(default=0)),
+                ('page_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ocr_layout', to='app_invoices.invoice')),
+            ],
+        ),
+    ]
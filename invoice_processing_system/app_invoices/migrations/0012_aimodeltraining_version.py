@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0011_invoiceocrlayout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aimodeltraining',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Phiên bản trong registry (0 = file model cũ)'),
+        ),
+        migrations.AddIndex(
+            model_name='aimodeltraining',
+            index=models.Index(fields=['model_type', 'version'], name='app_invoice_model_t_0f130d_idx'),
+        ),
+    ]
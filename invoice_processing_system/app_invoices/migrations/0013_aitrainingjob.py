@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0012_aimodeltraining_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aimodeltraining',
+            name='inference_latency_ms',
+            field=models.FloatField(blank=True, help_text='Độ trễ phân loại 1 hóa đơn (ms)', null=True),
+        ),
+        migrations.AddField(
+            model_name='aimodeltraining',
+            name='metrics',
+            field=models.JSONField(blank=True, help_text='Cross-validation, báo cáo theo từng loại, độ trễ theo lô', null=True),
+        ),
+        migrations.AddField(
+            model_name='aimodeltraining',
+            name='training_time_ms',
+            field=models.IntegerField(blank=True, help_text='Thời gian huấn luyện (ms, wall time)', null=True),
+        ),
+        migrations.CreateModel(
+            name='AITrainingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_id', models.CharField(max_length=64, unique=True)),
+                ('model_type', models.CharField(default='classifier', max_length=50)),
+                ('mode', models.CharField(default='full', help_text='full | incremental', max_length=20)),
+                ('params', models.JSONField(blank=True, default=dict, help_text='cv_folds, n_jobs, chunk_size...')),
+                ('training_data', models.BinaryField(blank=True, help_text='Dữ liệu huấn luyện (JSON nén zlib)', null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Chờ chạy'), ('RUNNING', 'Đang chạy'), ('SUCCEEDED', 'Thành công'), ('FAILED', 'Thất bại'), ('CANCELLED', 'Đã hủy')], default='PENDING', max_length=20)),
+                ('progress', models.IntegerField(default=0, help_text='Tiến độ (%)')),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('log', models.TextField(blank=True)),
+                ('cancel_requested', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('training', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='app_invoices.aimodeltraining')),
+            ],
+        ),
+    ]
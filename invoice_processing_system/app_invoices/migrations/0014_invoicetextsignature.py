@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0013_aitrainingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceLSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(db_index=True)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='app_invoices.invoice')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InvoiceTextSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.BinaryField()),
+                ('shingle_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='text_signature', to='app_invoices.invoice')),
+            ],
+        ),
+    ]
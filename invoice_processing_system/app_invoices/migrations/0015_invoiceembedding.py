@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0014_invoicetextsignature'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aimodeltraining',
+            name='model_type',
+            field=models.CharField(choices=[('classifier', 'Phân loại'), ('extractor', 'Trích xuất'), ('fraud_detector', 'Phát hiện fraud'), ('predictor', 'Dự đoán'), ('embedding_index', 'Chỉ mục embedding hóa đơn')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='InvoiceEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vector', models.BinaryField()),
+                ('model_name', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='embedding', to='app_invoices.invoice')),
+            ],
+        ),
+    ]
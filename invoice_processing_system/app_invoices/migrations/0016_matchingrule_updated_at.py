@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0015_invoiceembedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchingrule',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
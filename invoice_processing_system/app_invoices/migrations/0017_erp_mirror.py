@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:24
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0016_matchingrule_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ERPPurchaseOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('erp_id', models.CharField(max_length=100)),
+                ('po_number', models.CharField(max_length=100)),
+                ('supplier_tax_id', models.CharField(blank=True, max_length=20, null=True)),
+                ('invoice_reference', models.CharField(blank=True, help_text='Số hóa đơn nhà cung cấp ERP đã ghi nhận', max_length=100)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('order_date', models.DateField()),
+                ('status', models.CharField(default='open', max_length=20)),
+                ('is_open', models.BooleanField(default=True)),
+                ('lines', models.JSONField(blank=True, default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('erp_updated_at', models.DateTimeField()),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_orders', to='app_invoices.erpintegrationconfig')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='purchase_order',
+            field=models.ForeignKey(blank=True, help_text='PO khớp trong bản sao ERP', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='app_invoices.erppurchaseorder'),
+        ),
+        migrations.CreateModel(
+            name='ERPVendor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('erp_id', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=255)),
+                ('normalized_name', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('tax_id', models.CharField(blank=True, db_index=True, max_length=20, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('erp_updated_at', models.DateTimeField()),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendors', to='app_invoices.erpintegrationconfig')),
+            ],
+            options={
+                'unique_together': {('config', 'erp_id')},
+            },
+        ),
+        migrations.AddField(
+            model_name='erppurchaseorder',
+            name='vendor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchase_orders', to='app_invoices.erpvendor'),
+        ),
+        migrations.CreateModel(
+            name='ERPSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=50)),
+                ('high_water_updated_at', models.DateTimeField(blank=True, null=True)),
+                ('high_water_id', models.CharField(blank=True, max_length=100)),
+                ('record_count', models.IntegerField(default=0)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_states', to='app_invoices.erpintegrationconfig')),
+            ],
+            options={
+                'unique_together': {('config', 'resource')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='erppurchaseorder',
+            index=models.Index(condition=models.Q(('is_open', True)), fields=['supplier_tax_id', 'total_amount'], name='erp_po_tax_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erppurchaseorder',
+            index=models.Index(condition=models.Q(('is_open', True)), fields=['supplier_tax_id', 'order_date'], name='erp_po_tax_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='erppurchaseorder',
+            unique_together={('config', 'erp_id')},
+        ),
+    ]
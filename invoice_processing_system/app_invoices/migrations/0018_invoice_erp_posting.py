@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0017_erp_mirror'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='erp_document_id',
+            field=models.CharField(blank=True, help_text='Mã chứng từ ERP trả về khi ghi hóa đơn', max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='erp_error',
+            field=models.TextField(blank=True, help_text='Lỗi ghi ERP gần nhất (xem erp_client.py)'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='erp_posted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
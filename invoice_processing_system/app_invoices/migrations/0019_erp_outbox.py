@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:37
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0018_invoice_erp_posting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ERPOutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=50)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('status', models.CharField(choices=[('PENDING', 'Chờ gửi'), ('DELIVERED', 'Đã gửi'), ('SUPERSEDED', 'Bỏ qua (có sự kiện mới hơn)'), ('FAILED', 'Gửi lỗi')], default='PENDING', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claim_token', models.CharField(blank=True, db_index=True, max_length=32)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('erp_document_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='erp_events', to='app_invoices.invoice')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['available_at', 'id'], name='erp_outbox_pending_idx')],
+            },
+        ),
+    ]
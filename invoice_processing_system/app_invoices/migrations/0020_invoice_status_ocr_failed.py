@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_invoices', '0019_erp_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoice',
+            name='status',
+            field=models.CharField(choices=[('UPLOADED', 'Đã tải lên'), ('OCR_PROCESSING', 'Đang xử lý OCR'), ('OCR_PROCESSED', 'Đã xử lý OCR'), ('OCR_FAILED', 'Lỗi xử lý OCR'), ('PENDING_REVIEW', 'Chờ xem xét'), ('MATCHED', 'Đã khớp'), ('UNMATCHED', 'Sai lệch'), ('PENDING_APPROVAL', 'Chờ phê duyệt'), ('INTEGRATION_ERROR', 'Lỗi tích hợp ERP'), ('REJECTED', 'Bị từ chối'), ('APPROVED', 'Đã phê duyệt')], default='UPLOADED', max_length=50),
+        ),
+    ]
@@ -0,0 +1,138 @@
+# app_invoices/model_evaluation.py
+"""
+📏 Đánh giá AI Classifier khi huấn luyện
+- Cross-validation k-fold (phân tầng theo loại): vectorizer được fit lại trong từng fold nên
+  không rò rỉ từ vựng của tập kiểm tra; dự đoán ngoài fold dùng cho báo cáo theo từng loại
+- Báo cáo precision / recall / F1 theo loại từ ma trận nhầm lẫn (cộng dồn được theo lô,
+  dùng chung cho huấn luyện tăng dần)
+- Độ trễ phân loại: 1 hóa đơn / hóa đơn trong lô, đo trên model vừa huấn luyện
+"""
+
+import time
+import statistics
+from collections import Counter
+
+
+class TrainingCancelled(Exception):
+    """Job huấn luyện bị người dùng hủy."""
+
+
+class TrainingReporter:
+    """Báo tiến độ / log / kiểm tra hủy trong lúc huấn luyện (mặc định không làm gì)."""
+
+    def log(self, message):
+        pass
+
+    def progress(self, percent, message=''):
+        pass
+
+    def check_cancelled(self):
+        pass
+
+
+def report_from_confusion(confusion, labels=None):
+    """
+    📊 Accuracy + precision / recall / F1 / support theo loại từ Counter{(thật, dự đoán): số lượng}.
+    """
+    total = sum(confusion.values())
+    if not total:
+        return {'accuracy': None, 'macro_f1': None, 'per_class': {}}
+
+    labels = labels or sorted({label for pair in confusion for label in pair})
+    true_counts, pred_counts, correct = Counter(), Counter(), Counter()
+    for (true_label, pred_label), count in confusion.items():
+        true_counts[true_label] += count
+        pred_counts[pred_label] += count
+        if true_label == pred_label:
+            correct[true_label] += count
+
+    per_class = {}
+    for label in labels:
+        support = true_counts[label]
+        if not support and not pred_counts[label]:
+            continue
+        precision = correct[label] / pred_counts[label] if pred_counts[label] else 0.0
+        recall = correct[label] / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        per_class[label] = {
+            'precision': round(precision, 4),
+            'recall': round(recall, 4),
+            'f1': round(f1, 4),
+            'support': support,
+        }
+
+    scored = [values['f1'] for label, values in per_class.items() if true_counts[label]]
+    return {
+        'accuracy': round(sum(correct.values()) / total, 4),
+        'macro_f1': round(sum(scored) / len(scored), 4) if scored else None,
+        'per_class': per_class,
+    }
+
+
+def predict_labels(model, vectorizer, texts):
+    """Nhãn dự đoán = argmax của predict_proba (như classify_batch)."""
+    probabilities = model.predict_proba(vectorizer.transform(texts))
+    return model.classes_[probabilities.argmax(axis=1)]
+
+
+def cross_validate_classifier(classifier, texts, labels, folds=5, reporter=None, progress_range=(5, 75)):
+    """
+    🔁 Cross-validation k-fold phân tầng với cấu hình của `classifier.build_estimators()`.
+    Số fold bị giảm theo loại ít mẫu nhất; < 2 mẫu ở mọi fold thì bỏ qua (trả về None).
+    """
+    from sklearn.model_selection import StratifiedKFold
+
+    reporter = reporter or TrainingReporter()
+    smallest_class = min(Counter(labels).values())
+    folds = min(folds, smallest_class)
+    if folds < 2:
+        reporter.log(f"⚠️ Bỏ qua cross-validation: loại ít nhất chỉ có {smallest_class} mẫu")
+        return None
+
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    confusion = Counter()
+    fold_scores = []
+    start, end = progress_range
+    for index, (train_idx, test_idx) in enumerate(splitter.split(texts, labels), start=1):
+        reporter.check_cancelled()
+        started = time.perf_counter()
+        model, vectorizer = classifier.fit_estimators([texts[i] for i in train_idx], [labels[i] for i in train_idx])
+        predicted = predict_labels(model, vectorizer, [texts[i] for i in test_idx])
+
+        fold_confusion = Counter(zip((labels[i] for i in test_idx), predicted))
+        confusion.update(fold_confusion)
+        fold_accuracy = sum(c for (t, p), c in fold_confusion.items() if t == p) / len(test_idx)
+        fold_scores.append(round(fold_accuracy, 4))
+        reporter.log(f"📐 Fold {index}/{folds}: accuracy={fold_accuracy:.4f} ({time.perf_counter() - started:.1f}s)")
+        reporter.progress(start + (end - start) * index // folds, f"Cross-validation fold {index}/{folds}")
+
+    report = report_from_confusion(confusion, labels=sorted(set(labels)))
+    report['folds'] = folds
+    report['fold_accuracy'] = fold_scores
+    report['fold_accuracy_std'] = round(statistics.pstdev(fold_scores), 4)
+    return report
+
+
+def measure_inference_latency(model, vectorizer, texts, single_samples=50, batch_size=500):
+    """
+    ⏱️ Độ trễ phân loại (ms): trung vị 1 hóa đơn / lần và trung bình mỗi hóa đơn khi chạy theo lô.
+    """
+    if not texts:
+        return {'single_ms': None, 'batch_per_invoice_ms': None, 'batch_size': 0}
+
+    timings = []
+    for text in texts[:single_samples]:
+        started = time.perf_counter()
+        predict_labels(model, vectorizer, [text])
+        timings.append((time.perf_counter() - started) * 1000)
+
+    batch = texts[:batch_size]
+    started = time.perf_counter()
+    predict_labels(model, vectorizer, batch)
+    batch_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        'single_ms': round(statistics.median(timings), 3),
+        'batch_per_invoice_ms': round(batch_ms / len(batch), 4),
+        'batch_size': len(batch),
+    }
@@ -0,0 +1,215 @@
+# app_invoices/model_registry.py
+"""
+🗂️ Registry phiên bản AI model (ghi nguyên tử, nạp memory-mapped, hot swap)
+
+Mỗi lần huấn luyện tạo một thư mục phiên bản bất biến:
+
+    ai_models/<model_type>/v0003/model.joblib
+                                /vectorizer.joblib
+    ai_models/<model_type>/ACTIVE        ← {"version": 3} (file con trỏ)
+
+- Ghi: dump vào thư mục tạm rồi `os.rename` thành `vNNNN` → tiến trình khác không bao giờ
+  thấy file ghi dở. Phiên bản được ghi nhận trong `AIModelTraining` (version, is_active).
+- Kích hoạt: cập nhật `is_active` trong DB rồi thay file ACTIVE bằng `os.replace`.
+- Nạp: `joblib.load(mmap_mode='r')` → mảng numpy của model được map từ page cache,
+  các worker (fork hay không) dùng chung một bản trong RAM.
+- Hot swap: tiến trình chỉ `os.stat` file ACTIVE (vài µs) trước mỗi lần dùng model;
+  khi inode/mtime đổi thì đọc phiên bản mới và nạp lại, không cần restart worker.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+ACTIVE_FILE = 'ACTIVE'
+
+
+def model_root():
+    return getattr(settings, 'AI_MODEL_ROOT', os.path.join(settings.BASE_DIR, 'ai_models'))
+
+
+def model_type_dir(model_type):
+    return os.path.join(model_root(), model_type)
+
+
+def version_dir(model_type, version):
+    return os.path.join(model_type_dir(model_type), f"v{version:04d}")
+
+
+def active_pointer_path(model_type):
+    return os.path.join(model_type_dir(model_type), ACTIVE_FILE)
+
+
+def _write_active_pointer(model_type, version):
+    """Ghi file ACTIVE nguyên tử (file tạm + os.replace)."""
+    path = active_pointer_path(model_type)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version}, f)
+    os.replace(tmp_path, path)
+
+
+def read_active_version(model_type):
+    """Phiên bản đang active theo file ACTIVE (None nếu chưa có phiên bản nào)."""
+    try:
+        with open(active_pointer_path(model_type), encoding='utf-8') as f:
+            return int(json.load(f)['version'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def staging_dir(model_type):
+    """Thư mục tạm (cùng filesystem với các phiên bản) để ghi artifact trước khi publish."""
+    type_dir = model_type_dir(model_type)
+    os.makedirs(type_dir, exist_ok=True)
+    tmp_dir = os.path.join(type_dir, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def publish_model_version(model_type, artifacts, model_name, training_data_count=0,
+                          accuracy=None, activate=True, **fields):
+    """
+    📦 Lưu một phiên bản mới: `artifacts` là {tên: object} (vd. {'model': ..., 'vectorizer': ...}).
+    `fields` = các trường khác của AIModelTraining (metrics, training_time_ms, ...).
+    Trả về bản ghi AIModelTraining của phiên bản.
+    """
+    import joblib
+
+    # Dump vào thư mục tạm (cùng filesystem) để đổi tên nguyên tử
+    tmp_dir = staging_dir(model_type)
+    try:
+        for name, obj in artifacts.items():
+            # Không nén: file nén không thể memory-map khi nạp
+            joblib.dump(obj, os.path.join(tmp_dir, f"{name}.joblib"))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return publish_staged_version(
+        model_type, tmp_dir, model_name, training_data_count=training_data_count,
+        accuracy=accuracy, activate=activate, **fields
+    )
+
+
+def publish_staged_version(model_type, tmp_dir, model_name, training_data_count=0,
+                           accuracy=None, activate=True, **fields):
+    """
+    Đổi tên thư mục tạm đã ghi xong (xem staging_dir) thành phiên bản mới và đăng ký vào AIModelTraining.
+    Dùng trực tiếp khi artifact không phải object joblib (vd. ma trận .npy ghi dần bằng memmap).
+    """
+    from django.utils import timezone
+    from .models import AIModelTraining
+
+    try:
+        with transaction.atomic():
+            latest = AIModelTraining.objects.filter(model_type=model_type).aggregate(v=Max('version'))['v'] or 0
+            version = latest + 1
+            while os.path.exists(version_dir(model_type, version)):
+                version += 1
+            target_dir = version_dir(model_type, version)
+            os.rename(tmp_dir, target_dir)
+
+            record = AIModelTraining.objects.create(
+                model_name=model_name,
+                model_type=model_type,
+                training_data_count=training_data_count,
+                accuracy=accuracy,
+                last_trained=timezone.now(),
+                is_active=False,
+                model_file_path=target_dir,
+                version=version,
+                **fields
+            )
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if activate:
+        activate_model_version(model_type, version)
+        record.is_active = True
+    return record
+
+
+def activate_model_version(model_type, version):
+    """
+    ✅ Chuyển phiên bản active (cũng dùng để rollback). Các tiến trình đang chạy
+    nhận phiên bản mới ở lần dùng model kế tiếp.
+    """
+    from .models import AIModelTraining
+
+    if not os.path.isdir(version_dir(model_type, version)):
+        raise FileNotFoundError(f"Không tìm thấy phiên bản {version} của model {model_type}")
+
+    with transaction.atomic():
+        AIModelTraining.objects.filter(model_type=model_type, version__gt=0).exclude(version=version).update(is_active=False)
+        updated = AIModelTraining.objects.filter(model_type=model_type, version=version).update(is_active=True)
+        if not updated:
+            raise ValueError(f"Phiên bản {version} của model {model_type} chưa được đăng ký")
+        transaction.on_commit(lambda: _write_active_pointer(model_type, version))
+
+
+def load_model_version(model_type, version, names, mmap_mode='r'):
+    """
+    📥 Nạp các artifact của một phiên bản, mặc định bằng memory-map (chỉ đọc).
+    `mmap_mode=None` khi cần sửa model (vd. huấn luyện tiếp bằng partial_fit).
+    """
+    import joblib
+
+    directory = version_dir(model_type, version)
+    return {name: joblib.load(os.path.join(directory, f"{name}.joblib"), mmap_mode=mmap_mode) for name in names}
+
+
+def has_model_artifact(model_type, version, name):
+    return os.path.exists(os.path.join(version_dir(model_type, version), f"{name}.joblib"))
+
+
+def prune_model_versions(model_type, keep=None):
+    """
+    🧹 Xóa thư mục của các phiên bản cũ không active, giữ lại `keep` phiên bản mới nhất.
+    Tiến trình còn map file cũ vẫn đọc được (file chỉ thực sự mất khi được unmap).
+    """
+    from .models import AIModelTraining
+
+    keep = keep if keep is not None else getattr(settings, 'AI_MODEL_KEEP_VERSIONS', 5)
+    versions = list(
+        AIModelTraining.objects.filter(model_type=model_type, version__gt=0, is_active=False)
+        .order_by('-version').values_list('version', flat=True)
+    )
+    removed = []
+    for version in versions[keep:]:
+        shutil.rmtree(version_dir(model_type, version), ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+class ActiveModelWatcher:
+    """
+    👀 Theo dõi file ACTIVE của một loại model trong tiến trình hiện tại.
+    `poll()` chỉ tốn một `os.stat`; trả về phiên bản mới khi file con trỏ đổi, ngược lại None.
+    """
+
+    def __init__(self, model_type):
+        self.model_type = model_type
+        self.path = active_pointer_path(model_type)
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def poll(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return None
+        with self._lock:
+            if signature == self._signature:
+                return None
+            self._signature = signature
+        return read_active_version(self.model_type)
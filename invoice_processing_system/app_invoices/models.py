@@ -1,5 +1,6 @@
 # app_invoices/models.py
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
@@ -19,6 +20,7 @@ class InvoiceStatus(models.TextChoices):
     UPLOADED = 'UPLOADED', _('Đã tải lên')
     OCR_PROCESSING = 'OCR_PROCESSING', _('Đang xử lý OCR')
     OCR_PROCESSED = 'OCR_PROCESSED', _('Đã xử lý OCR')
+    OCR_FAILED = 'OCR_FAILED', _('Lỗi xử lý OCR')
     PENDING_REVIEW = 'PENDING_REVIEW', _('Chờ xem xét')
     MATCHED = 'MATCHED', _('Đã khớp')
     UNMATCHED = 'UNMATCHED', _('Sai lệch')
@@ -27,6 +29,16 @@ class InvoiceStatus(models.TextChoices):
     REJECTED = 'REJECTED', _('Bị từ chối')
     APPROVED = 'APPROVED', _('Đã phê duyệt')
 
+class InvoiceBatch(models.Model):
+    """Lô hóa đơn tải lên hàng loạt (zip hoặc nhiều file trong 1 request)"""
+    batch_id = models.CharField(max_length=64, unique=True)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    total_files = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Batch {self.batch_id} ({self.total_files} file)"
+
 class Invoice(models.Model):
     file = models.FileField(upload_to='invoices/')
     invoice_number = models.CharField(max_length=100, blank=True, null=True)
@@ -41,6 +53,12 @@ class Invoice(models.Model):
     ocr_start_time = models.DateTimeField(null=True, blank=True)
     ocr_end_time = models.DateTimeField(null=True, blank=True)
     match_score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    ocr_job_id = models.CharField(max_length=64, blank=True, null=True, db_index=True, help_text="Job id hàng đợi OCR")
+    batch = models.ForeignKey(InvoiceBatch, related_name='invoices', on_delete=models.SET_NULL, null=True, blank=True)
+    purchase_order = models.ForeignKey('ERPPurchaseOrder', related_name='invoices', on_delete=models.SET_NULL, null=True, blank=True, help_text="PO khớp trong bản sao ERP")
+    erp_document_id = models.CharField(max_length=100, blank=True, null=True, help_text="Mã chứng từ ERP trả về khi ghi hóa đơn")
+    erp_posted_at = models.DateTimeField(null=True, blank=True)
+    erp_error = models.TextField(blank=True, help_text="Lỗi ghi ERP gần nhất (xem erp_client.py)")
 
     is_invoice = models.BooleanField(default=False)
     
@@ -56,6 +74,62 @@ class Invoice(models.Model):
     def __str__(self):
         return self.invoice_number or f"Invoice {self.id}"
 
+class InvoicePipelineCheckpoint(models.Model):
+    """Checkpoint từng bước pipeline OCR/AI của hóa đơn (kết quả nén zlib + JSON)"""
+    invoice = models.OneToOneField(Invoice, related_name='pipeline_checkpoint', on_delete=models.CASCADE)
+    completed_stages = models.CharField(max_length=255, blank=True)
+    data = models.BinaryField(blank=True, null=True)
+    failed_stage = models.CharField(max_length=50, blank=True)
+    last_error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Checkpoint {self.invoice_id}: {self.completed_stages or '-'}"
+
+class InvoiceOCRLayout(models.Model):
+    """Bố cục OCR cấp từ của hóa đơn (hộp bao, dòng, độ tin cậy) - blob nhị phân nén, xem ocr_layout.py"""
+    invoice = models.OneToOneField(Invoice, related_name='ocr_layout', on_delete=models.CASCADE)
+    engine = models.CharField(max_length=100, blank=True)
+    data = models.BinaryField()
+    word_count = models.IntegerField(default=0)
+    page_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_layout(self):
+        from .ocr_layout import WordLayout
+        return WordLayout.unpack(self.data)
+
+    def __str__(self):
+        return f"OCR layout {self.invoice_id}: {self.word_count} từ"
+
+class InvoiceTextSignature(models.Model):
+    """Chữ ký MinHash của OCR text (mảng uint32), dùng tìm hóa đơn gần trùng - xem duplicate_index.py"""
+    invoice = models.OneToOneField(Invoice, related_name='text_signature', on_delete=models.CASCADE)
+    signature = models.BinaryField()
+    shingle_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"MinHash {self.invoice_id}: {self.shingle_count} shingle"
+
+class InvoiceLSHBucket(models.Model):
+    """Bucket LSH (1 dòng / band) của chữ ký MinHash: hóa đơn chung bucket là ứng viên gần trùng"""
+    invoice = models.ForeignKey(Invoice, related_name='lsh_buckets', on_delete=models.CASCADE)
+    bucket = models.BigIntegerField(db_index=True)
+
+class InvoiceEmbedding(models.Model):
+    """
+    Embedding OCR text (float32, chuẩn hóa L2) dùng tìm hóa đơn tương tự - xem embedding_index.py.
+    Tính lại thì xóa rồi tạo dòng mới: id tăng dần cho biết dòng nào mới hơn ảnh chụp chỉ mục.
+    """
+    invoice = models.OneToOneField(Invoice, related_name='embedding', on_delete=models.CASCADE)
+    vector = models.BinaryField()
+    model_name = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Embedding {self.invoice_id} ({self.model_name})"
+
 class ExtractedField(models.Model):
     invoice = models.ForeignKey(Invoice, related_name='extracted_fields', on_delete=models.CASCADE)
     field_name = models.CharField(max_length=100)
@@ -76,10 +150,95 @@ class ERPIntegrationConfig(models.Model):
     api_key = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
 
+class ERPVendor(models.Model):
+    """Bản sao cục bộ nhà cung cấp (vendor master) của ERP - đồng bộ delta bởi erp_mirror.py"""
+    config = models.ForeignKey(ERPIntegrationConfig, related_name='vendors', on_delete=models.CASCADE)
+    erp_id = models.CharField(max_length=100)
+    name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255, blank=True, db_index=True)
+    tax_id = models.CharField(max_length=20, blank=True, null=True, db_index=True)
+    is_active = models.BooleanField(default=True)
+    erp_updated_at = models.DateTimeField()
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('config', 'erp_id')
+
+    def __str__(self):
+        return f"{self.name} ({self.tax_id or self.erp_id})"
+
+class ERPPurchaseOrder(models.Model):
+    """
+    Bản sao cục bộ đơn mua hàng (PO) của ERP - đồng bộ delta bởi erp_mirror.py.
+    Đối chiếu hóa đơn tra theo (MST nhà cung cấp, khoảng tiền) / (MST, khoảng ngày) của PO đang mở.
+    """
+    config = models.ForeignKey(ERPIntegrationConfig, related_name='purchase_orders', on_delete=models.CASCADE)
+    erp_id = models.CharField(max_length=100)
+    po_number = models.CharField(max_length=100)
+    vendor = models.ForeignKey(ERPVendor, related_name='purchase_orders', on_delete=models.SET_NULL, null=True, blank=True)
+    supplier_tax_id = models.CharField(max_length=20, blank=True, null=True)
+    invoice_reference = models.CharField(max_length=100, blank=True, help_text="Số hóa đơn nhà cung cấp ERP đã ghi nhận")
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    order_date = models.DateField()
+    status = models.CharField(max_length=20, default='open')
+    is_open = models.BooleanField(default=True)
+    lines = models.JSONField(default=list, blank=True, encoder=DjangoJSONEncoder)
+    erp_updated_at = models.DateTimeField()
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('config', 'erp_id')
+        indexes = [
+            models.Index(fields=['supplier_tax_id', 'total_amount'], name='erp_po_tax_amount_idx', condition=models.Q(is_open=True)),
+            models.Index(fields=['supplier_tax_id', 'order_date'], name='erp_po_tax_date_idx', condition=models.Q(is_open=True)),
+        ]
+
+    def __str__(self):
+        return f"PO {self.po_number}"
+
+class ERPSyncState(models.Model):
+    """Mốc đồng bộ (high-water mark) của từng loại dữ liệu ERP: (updated_at, id) của bản ghi cuối đã nhận"""
+    config = models.ForeignKey(ERPIntegrationConfig, related_name='sync_states', on_delete=models.CASCADE)
+    resource = models.CharField(max_length=50)
+    high_water_updated_at = models.DateTimeField(null=True, blank=True)
+    high_water_id = models.CharField(max_length=100, blank=True)
+    record_count = models.IntegerField(default=0)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('config', 'resource')
+
+    def __str__(self):
+        return f"{self.config.system_name} / {self.resource}: {self.high_water_updated_at or '-'}"
+
 class MatchingRule(models.Model):
+    """Quy tắc đối chiếu hóa đơn ↔ ERP, rule_logic viết bằng DSL trong matching_rules.py"""
     priority = models.IntegerField(unique=True)
     rule_logic = models.TextField() 
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Quy tắc #{self.priority}"
+
+class OCRResultCache(models.Model):
+    """Cache kết quả OCR theo nội dung file (SHA-256) + phiên bản engine OCR"""
+    content_hash = models.CharField(max_length=64)
+    engine = models.CharField(max_length=100)
+    raw_text = models.TextField(blank=True)
+    parsed_data = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    layout = models.BinaryField(blank=True, null=True)
+    size_bytes = models.IntegerField(default=0)
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ('content_hash', 'engine')
+
+    def __str__(self):
+        return f"OCR cache {self.content_hash[:12]} ({self.engine})"
 
 class ActivityLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
@@ -88,6 +247,38 @@ class ActivityLog(models.Model):
     details = models.TextField(blank=True)
     timestamp = models.DateTimeField(default=timezone.now)
 
+class OutboxStatus(models.TextChoices):
+    PENDING = 'PENDING', _('Chờ gửi')
+    DELIVERED = 'DELIVERED', _('Đã gửi')
+    SUPERSEDED = 'SUPERSEDED', _('Bỏ qua (có sự kiện mới hơn)')
+    FAILED = 'FAILED', _('Gửi lỗi')
+
+class ERPOutboxEvent(models.Model):
+    """
+    Sự kiện chờ gửi ERP (transactional outbox): ghi cùng transaction với thay đổi trạng thái hóa đơn,
+    worker gửi theo lô - xem erp_outbox.py. `payload` là ảnh chụp hóa đơn lúc ghi sự kiện.
+    """
+    invoice = models.ForeignKey(Invoice, related_name='erp_events', on_delete=models.CASCADE)
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=OutboxStatus.choices, default=OutboxStatus.PENDING)
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    erp_document_id = models.CharField(max_length=100, blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='erp_outbox_pending_idx', condition=models.Q(status='PENDING')),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.invoice_id} ({self.status})"
+
 # 🤖 AI Models
 class AIChatSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -119,17 +310,54 @@ class AIModelTraining(models.Model):
         ('classifier', 'Phân loại'),
         ('extractor', 'Trích xuất'),
         ('fraud_detector', 'Phát hiện fraud'),
-        ('predictor', 'Dự đoán')
+        ('predictor', 'Dự đoán'),
+        ('embedding_index', 'Chỉ mục embedding hóa đơn'),
     ])
     training_data_count = models.IntegerField(default=0)
     accuracy = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     last_trained = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     model_file_path = models.CharField(max_length=500, blank=True)
+    version = models.PositiveIntegerField(default=0, help_text="Phiên bản trong registry (0 = file model cũ)")
+    training_time_ms = models.IntegerField(null=True, blank=True, help_text="Thời gian huấn luyện (ms, wall time)")
+    inference_latency_ms = models.FloatField(null=True, blank=True, help_text="Độ trễ phân loại 1 hóa đơn (ms)")
+    metrics = models.JSONField(blank=True, null=True, help_text="Cross-validation, báo cáo theo từng loại, độ trễ theo lô")
+
+    class Meta:
+        indexes = [models.Index(fields=['model_type', 'version'])]
     
     def __str__(self):
         return f"{self.model_name} ({self.model_type})"
 
+class AITrainingJob(models.Model):
+    """Job huấn luyện AI model chạy nền (Celery): tiến độ, log, yêu cầu hủy"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Chờ chạy'),
+        ('RUNNING', 'Đang chạy'),
+        ('SUCCEEDED', 'Thành công'),
+        ('FAILED', 'Thất bại'),
+        ('CANCELLED', 'Đã hủy'),
+    ]
+    job_id = models.CharField(max_length=64, unique=True)
+    model_type = models.CharField(max_length=50, default='classifier')
+    mode = models.CharField(max_length=20, default='full', help_text="full | incremental")
+    params = models.JSONField(default=dict, blank=True, help_text="cv_folds, n_jobs, chunk_size...")
+    training_data = models.BinaryField(blank=True, null=True, help_text="Dữ liệu huấn luyện (JSON nén zlib)")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    progress = models.IntegerField(default=0, help_text="Tiến độ (%)")
+    message = models.CharField(max_length=255, blank=True)
+    log = models.TextField(blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    training = models.ForeignKey(AIModelTraining, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Training job {self.job_id} ({self.status} {self.progress}%)"
+
 class AIRecommendation(models.Model):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, null=True, blank=True)
     recommendation_type = models.CharField(max_length=50, choices=[
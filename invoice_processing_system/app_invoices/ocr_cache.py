@@ -0,0 +1,100 @@
+# app_invoices/ocr_cache.py
+"""
+🗃️ Cache kết quả OCR theo nội dung file
+Key = SHA-256 của file + engine/cấu hình OCR, nên cùng một ảnh/PDF được tải lên
+nhiều lần (hoặc chạy lại OCR) sẽ không phải OCR lại từ đầu.
+Dung lượng cache bị giới hạn, bản ghi ít dùng nhất bị xóa trước (LRU).
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import OCRResultCache
+
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_MAX_BYTES = getattr(settings, 'OCR_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+OCR_CACHE_VERSION = getattr(settings, 'OCR_CACHE_VERSION', 1)
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path):
+    """Tính SHA-256 của file theo từng khối 1MB (không đọc cả file vào RAM)."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def engine_key(engine, lang='vie+eng'):
+    """Định danh engine + cấu hình OCR, đổi OCR_CACHE_VERSION để vô hiệu toàn bộ cache."""
+    return f"{engine}:{lang}:v{OCR_CACHE_VERSION}"
+
+
+def get_cached_ocr(content_hash, engine):
+    """Trả về OCRResultCache nếu đã có, đồng thời cập nhật thời điểm dùng gần nhất."""
+    entry = OCRResultCache.objects.filter(content_hash=content_hash, engine=engine).first()
+    if entry is None:
+        return None
+
+    OCRResultCache.objects.filter(pk=entry.pk).update(
+        hit_count=F('hit_count') + 1,
+        last_used_at=timezone.now()
+    )
+    return entry
+
+
+def store_ocr_result(content_hash, engine, raw_text, parsed_data=None, layout=None):
+    """
+    Lưu kết quả OCR vào cache rồi dọn bớt nếu vượt quá dung lượng cho phép.
+    `layout` là WordLayout (bố cục cấp từ), được lưu dạng blob nén.
+    """
+    layout_blob = layout.pack() if layout is not None else None
+    size_bytes = (
+        len((raw_text or '').encode('utf-8'))
+        + len(str(parsed_data or '').encode('utf-8'))
+        + len(layout_blob or b'')
+    )
+    try:
+        OCRResultCache.objects.update_or_create(
+            content_hash=content_hash,
+            engine=engine,
+            defaults={
+                'raw_text': raw_text or '',
+                'parsed_data': parsed_data,
+                'layout': layout_blob,
+                'size_bytes': size_bytes,
+                'last_used_at': timezone.now(),
+            }
+        )
+        evict_ocr_cache()
+    except Exception as e:
+        # Cache chỉ là tối ưu, lỗi cache không được làm hỏng luồng OCR
+        logger.warning(f"⚠️ Không thể lưu OCR cache: {e}")
+
+
+def evict_ocr_cache(max_bytes=None):
+    """Xóa các bản ghi ít được dùng gần đây nhất cho đến khi tổng dung lượng <= max_bytes."""
+    max_bytes = OCR_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    total = OCRResultCache.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    if total <= max_bytes:
+        return 0
+
+    excess = total - max_bytes
+    to_delete = []
+    for pk, size in OCRResultCache.objects.order_by('last_used_at').values_list('pk', 'size_bytes').iterator():
+        to_delete.append(pk)
+        excess -= size
+        if excess <= 0:
+            break
+
+    deleted = 0
+    for start in range(0, len(to_delete), 500):
+        deleted += OCRResultCache.objects.filter(pk__in=to_delete[start:start + 500]).delete()[0]
+    return deleted
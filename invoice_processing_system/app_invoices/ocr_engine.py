@@ -0,0 +1,106 @@
+# app_invoices/ocr_engine.py
+"""
+🔤 Backend OCR Tesseract chạy trong tiến trình
+pytesseract gọi binary `tesseract` cho mỗi ảnh: fork tiến trình, ghi ảnh ra file tạm
+và nạp lại traineddata `vie+eng` mỗi lần. Ở đây mỗi luồng/tiến trình giữ một engine
+libtesseract (tesserocr) đã nạp sẵn ngôn ngữ và truyền ảnh trực tiếp trong bộ nhớ.
+Nếu chưa cài tesserocr thì tự động dùng lại pytesseract.
+
+Module không import Django model để tiến trình con OCR PDF có thể import nhẹ nhàng.
+"""
+
+import logging
+import threading
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANG = 'vie+eng'
+
+# Mỗi luồng một engine cho mỗi ngôn ngữ (TessBaseAPI không an toàn khi dùng chung giữa các luồng)
+_engines = threading.local()
+
+
+def _tessdata_path():
+    """Thư mục tessdata cấu hình trong settings (TESSDATA_PREFIX), None = mặc định của libtesseract."""
+    try:
+        from django.conf import settings
+        return getattr(settings, 'TESSDATA_PREFIX', None)
+    except Exception:
+        return None
+
+
+def get_tesseract_engine(lang=DEFAULT_LANG):
+    """Lấy (hoặc khởi tạo lần đầu) engine Tesseract của luồng hiện tại cho `lang`."""
+    pool = getattr(_engines, 'pool', None)
+    if pool is None:
+        pool = _engines.pool = {}
+
+    engine = pool.get(lang)
+    if engine is None:
+        kwargs = {'lang': lang}
+        tessdata = _tessdata_path()
+        if tessdata:
+            kwargs['path'] = tessdata
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        pool[lang] = engine
+        logger.info(f"🔤 Đã nạp engine Tesseract ({lang}) cho luồng {threading.current_thread().name}")
+    return engine
+
+
+def preload_tesseract_engines(langs=(DEFAULT_LANG,)):
+    """Nạp sẵn engine khi worker khởi động để job OCR đầu tiên không phải chờ nạp traineddata."""
+    if not TESSEROCR_AVAILABLE:
+        return False
+    for lang in langs:
+        get_tesseract_engine(lang)
+    return True
+
+
+def ocr_image_to_string(image, lang=DEFAULT_LANG):
+    """
+    🔍 OCR một ảnh PIL và trả về text.
+    Dùng engine giữ sẵn trong tiến trình nếu có tesserocr, ngược lại gọi pytesseract.
+    """
+    if not TESSEROCR_AVAILABLE:
+        # pytesseract import pandas khi nạp, nên chỉ import khi thật sự cần
+        import pytesseract
+        return pytesseract.image_to_string(image, lang=lang)
+
+    engine = get_tesseract_engine(lang)
+    try:
+        engine.SetImage(image)
+        return engine.GetUTF8Text()
+    finally:
+        # Giải phóng ảnh và kết quả nhận dạng, giữ lại model đã nạp
+        engine.Clear()
+
+
+def ocr_image_with_layout(image, lang=DEFAULT_LANG, page=1):
+    """
+    📐 OCR một ảnh PIL, trả về (text, WordLayout) với hộp bao + độ tin cậy từng từ.
+    Với tesserocr, text và bố cục lấy từ cùng một lần nhận dạng; với pytesseract,
+    text được dựng lại từ `image_to_data` để không phải OCR 2 lần.
+    """
+    from .ocr_layout import layout_from_tesseract_data, layout_from_tesserocr
+
+    if not TESSEROCR_AVAILABLE:
+        import pytesseract
+        data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+        layout = layout_from_tesseract_data(data, page=page)
+        return layout.text(), layout
+
+    engine = get_tesseract_engine(lang)
+    try:
+        engine.SetImage(image)
+        engine.Recognize()
+        text = engine.GetUTF8Text()
+        layout = layout_from_tesserocr(engine, page=page)
+        return text, layout
+    finally:
+        engine.Clear()
@@ -0,0 +1,273 @@
+# app_invoices/ocr_layout.py
+"""
+📐 Bố cục OCR cấp từ (word-level geometry)
+Lưu hộp bao, số dòng, số block và độ tin cậy của từng từ (Tesseract `image_to_data`
+hoặc bounding poly của Google Vision) dưới dạng các mảng NumPy theo cột, đóng gói
+thành 1 blob nhị phân nén (vài KB cho mỗi trang hóa đơn).
+
+Nhờ đó bộ trích xuất có thể dùng vị trí (vd. "số tiền bên phải 'Tổng cộng'") và
+chạy lại trích xuất chỉ tốn CPU trên dữ liệu đã lưu, không cần OCR lại ảnh.
+
+Module không import Django model để tiến trình con OCR PDF có thể dùng.
+"""
+
+import re
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+LAYOUT_MAGIC = b'WLY1'
+_HEADER = struct.Struct('<4sI')
+
+# Thứ tự cột cố định trong blob
+LAYOUT_COLUMNS = (
+    ('page', np.uint16),
+    ('block', np.uint16),
+    ('line', np.uint32),     # Số dòng toàn cục (tăng dần theo thứ tự đọc, duy nhất trong tài liệu)
+    ('left', np.int32),
+    ('top', np.int32),
+    ('width', np.int32),
+    ('height', np.int32),
+    ('conf', np.float32),    # 0-100, -1 = không có
+)
+
+Word = namedtuple('Word', ['text', 'page', 'block', 'line', 'left', 'top', 'width', 'height', 'conf'])
+
+AMOUNT_PATTERN = re.compile(r'^\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?$|^\d{4,}(?:[.,]\d{1,2})?$')
+
+
+def _fold(token):
+    """Chuẩn hóa từ để so khớp (bỏ dấu câu ở hai đầu, không phân biệt hoa thường)."""
+    return token.strip(':;,.()[]').casefold()
+
+
+class WordLayout:
+    """Tập từ OCR kèm vị trí, lưu theo cột (mảng NumPy) để lọc theo vùng bằng vector hóa."""
+
+    def __init__(self, words=None, **columns):
+        self.words = list(words or [])
+        n = len(self.words)
+        for name, dtype in LAYOUT_COLUMNS:
+            values = columns.get(name)
+            if values is None:
+                values = np.full(n, -1 if name == 'conf' else 0, dtype=dtype)
+            setattr(self, name, np.asarray(values, dtype=dtype))
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, index):
+        return Word(self.words[index], *(getattr(self, name)[index].item() for name, _ in LAYOUT_COLUMNS))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def right(self):
+        return self.left + self.width
+
+    @property
+    def bottom(self):
+        return self.top + self.height
+
+    @property
+    def page_count(self):
+        return int(self.page.max()) if len(self) else 0
+
+    # --- Ghép / đóng gói ---
+    @classmethod
+    def concat(cls, layouts):
+        """Ghép bố cục nhiều trang, đánh lại số dòng để vẫn duy nhất trong toàn tài liệu."""
+        layouts = [layout for layout in layouts if layout is not None and len(layout)]
+        if not layouts:
+            return cls()
+
+        words, columns = [], {name: [] for name, _ in LAYOUT_COLUMNS}
+        line_offset = 0
+        for layout in layouts:
+            words.extend(layout.words)
+            for name, _ in LAYOUT_COLUMNS:
+                values = getattr(layout, name)
+                columns[name].append(values + line_offset if name == 'line' else values)
+            line_offset += int(layout.line.max()) + 1
+        return cls(words, **{name: np.concatenate(parts) for name, parts in columns.items()})
+
+    def pack(self):
+        """Đóng gói thành blob nhị phân: header + các cột + text các từ (UTF-8), nén zlib."""
+        parts = [_HEADER.pack(LAYOUT_MAGIC, len(self))]
+        for name, dtype in LAYOUT_COLUMNS:
+            parts.append(np.ascontiguousarray(getattr(self, name), dtype=np.dtype(dtype).newbyteorder('<')).tobytes())
+        parts.append('\n'.join(self.words).encode('utf-8'))
+        return zlib.compress(b''.join(parts))
+
+    @classmethod
+    def unpack(cls, blob):
+        """Đọc lại blob do `pack()` tạo ra."""
+        raw = zlib.decompress(bytes(blob))
+        magic, n = _HEADER.unpack_from(raw)
+        if magic != LAYOUT_MAGIC:
+            raise ValueError("Blob bố cục OCR không hợp lệ")
+
+        offset = _HEADER.size
+        columns = {}
+        for name, dtype in LAYOUT_COLUMNS:
+            dtype = np.dtype(dtype).newbyteorder('<')
+            columns[name] = np.frombuffer(raw, dtype=dtype, count=n, offset=offset)
+            offset += dtype.itemsize * n
+        text = raw[offset:].decode('utf-8')
+        words = text.split('\n') if n else []
+        return cls(words, **columns)
+
+    # --- Truy vấn ---
+    def words_in_region(self, left, top, right, bottom, page=None):
+        """🔲 Các từ có tâm nằm trong vùng [left, right) x [top, bottom) (tọa độ pixel của trang)."""
+        cx = self.left + self.width / 2.0
+        cy = self.top + self.height / 2.0
+        mask = (cx >= left) & (cx < right) & (cy >= top) & (cy < bottom)
+        if page is not None:
+            mask &= self.page == page
+        return [self[i] for i in np.flatnonzero(mask)]
+
+    def line_words(self, line):
+        """Các từ của một dòng, theo thứ tự từ trái sang phải."""
+        indexes = np.flatnonzero(self.line == line)
+        return [self[i] for i in indexes[np.argsort(self.left[indexes], kind='stable')]]
+
+    def find_phrase(self, phrase):
+        """
+        🔎 Tìm cụm từ (vd. 'Tổng cộng') nằm liền nhau trên cùng một dòng.
+        Trả về danh sách (chỉ số từ đầu, chỉ số từ cuối).
+        """
+        tokens = [_fold(t) for t in phrase.split() if _fold(t)]
+        if not tokens:
+            return []
+
+        folded = [_fold(w) for w in self.words]
+        matches = []
+        for start in np.flatnonzero(np.fromiter((w == tokens[0] for w in folded), dtype=bool, count=len(folded))):
+            end = start + len(tokens) - 1
+            if end >= len(folded) or self.line[end] != self.line[start]:
+                continue
+            if folded[start:end + 1] == tokens:
+                matches.append((int(start), int(end)))
+        return matches
+
+    def words_right_of(self, phrase):
+        """Các từ bên phải cụm từ `phrase` trên cùng dòng (theo lần xuất hiện đầu tiên)."""
+        for start, end in self.find_phrase(phrase):
+            anchor_right = self.right[end]
+            return [w for w in self.line_words(int(self.line[end])) if w.left >= anchor_right]
+        return []
+
+    def value_right_of(self, phrases, pattern=AMOUNT_PATTERN):
+        """
+        💡 Giá trị đầu tiên khớp `pattern` bên phải một trong các nhãn `phrases`
+        (vd. số tiền bên phải 'Tổng cộng'). Trả về text của từ hoặc None.
+        """
+        if isinstance(phrases, str):
+            phrases = [phrases]
+        for phrase in phrases:
+            for word in self.words_right_of(phrase):
+                token = word.text.strip(':;()')
+                if pattern.search(token):
+                    return token
+        return None
+
+    def text(self):
+        """Dựng lại text từ bố cục: từ cách nhau bởi dấu cách, dòng bởi xuống dòng, block bởi dòng trống."""
+        if not len(self):
+            return ''
+        lines, current, prev_line, prev_block = [], [], None, None
+        for index, word in enumerate(self.words):
+            line, block = int(self.line[index]), (int(self.page[index]), int(self.block[index]))
+            if prev_line is not None and line != prev_line:
+                lines.append(' '.join(current))
+                current = []
+                if block != prev_block:
+                    lines.append('')
+            current.append(word)
+            prev_line, prev_block = line, block
+        lines.append(' '.join(current))
+        return '\n'.join(lines)
+
+
+# --- Tạo bố cục từ kết quả OCR ---
+def layout_from_tesseract_data(data, page=1):
+    """
+    Tạo WordLayout từ `pytesseract.image_to_data(..., output_type=Output.DICT)`.
+    Chỉ giữ các dòng cấp từ (level 5) có text.
+    """
+    words, rows = [], []
+    line_ids = {}
+    for i, text in enumerate(data.get('text', [])):
+        text = (text or '').strip()
+        if int(data['level'][i]) != 5 or not text:
+            continue
+        key = (int(data['block_num'][i]), int(data['par_num'][i]), int(data['line_num'][i]))
+        line = line_ids.setdefault(key, len(line_ids))
+        words.append(text)
+        rows.append((page, key[0], line, data['left'][i], data['top'][i],
+                     data['width'][i], data['height'][i], float(data['conf'][i])))
+    return _layout_from_rows(words, rows)
+
+
+def layout_from_tesserocr(api, page=1):
+    """Tạo WordLayout từ engine tesserocr đã Recognize() (duyệt ResultIterator cấp từ)."""
+    from tesserocr import RIL, iterate_level
+
+    words, rows = [], []
+    block, line = -1, -1
+    iterator = api.GetIterator()
+    if iterator is None:
+        return WordLayout()
+    for item in iterate_level(iterator, RIL.WORD):
+        if item.IsAtBeginningOf(RIL.BLOCK):
+            block += 1
+        if item.IsAtBeginningOf(RIL.TEXTLINE):
+            line += 1
+        text = (item.GetUTF8Text(RIL.WORD) or '').strip()
+        box = item.BoundingBox(RIL.WORD)
+        if not text or box is None:
+            continue
+        x1, y1, x2, y2 = box
+        words.append(text)
+        rows.append((page, max(block, 0), max(line, 0), x1, y1, x2 - x1, y2 - y1, item.Confidence(RIL.WORD)))
+    return _layout_from_rows(words, rows)
+
+
+def layout_from_vision(annotation):
+    """
+    Tạo WordLayout từ `full_text_annotation` của Google Vision (document_text_detection).
+    Vision không trả số dòng nên dòng được tách theo dấu ngắt dòng trong `detected_break`.
+    """
+    words, rows = [], []
+    line = 0
+    for page_no, page in enumerate(annotation.pages, start=1):
+        for block_no, block in enumerate(page.blocks):
+            for paragraph in block.paragraphs:
+                for word in paragraph.words:
+                    text = ''.join(symbol.text for symbol in word.symbols)
+                    xs = [v.x for v in word.bounding_box.vertices]
+                    ys = [v.y for v in word.bounding_box.vertices]
+                    if text.strip() and xs:
+                        words.append(text)
+                        rows.append((page_no, block_no, line, min(xs), min(ys),
+                                     max(xs) - min(xs), max(ys) - min(ys), word.confidence * 100))
+                    last_break = word.symbols[-1].property.detected_break.type_ if word.symbols else 0
+                    # 3 = EOL_SURE_SPACE, 5 = LINE_BREAK
+                    if last_break in (3, 5):
+                        line += 1
+                line += 1
+    return _layout_from_rows(words, rows)
+
+
+def _layout_from_rows(words, rows):
+    if not rows:
+        return WordLayout()
+    columns = list(zip(*rows))
+    return WordLayout(words, **{
+        name: np.asarray(values, dtype=dtype) for (name, dtype), values in zip(LAYOUT_COLUMNS, columns)
+    })
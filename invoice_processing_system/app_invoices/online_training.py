@@ -0,0 +1,233 @@
+# app_invoices/online_training.py
+"""
+📈 Huấn luyện tăng dần AI Classifier từ dữ liệu đã gán nhãn trong DB
+
+Thay vì dựng lại TF-IDF + RandomForest trên toàn bộ dữ liệu, chế độ tăng dần dùng:
+- `HashingVectorizer`: không có trạng thái (không cần vocabulary) nên vectorize từng lô độc lập
+- `SGDClassifier(loss='log_loss')`: cập nhật bằng `partial_fit`, vẫn có `predict_proba` cho `classify_batch`
+
+Dữ liệu được đọc thẳng từ DB theo từng lô (`iterator`), không nạp cả bảng vào RAM:
+- hóa đơn mới có `ai_category` (nhãn bị ghi đè bởi ExtractedField 'category' đã xác minh nếu có)
+- ExtractedField 'category' đã xác minh mới trên hóa đơn đã học trước đó (sửa nhãn của người duyệt)
+
+Mốc (id hóa đơn / id ExtractedField cuối cùng đã học) được lưu cùng model trong registry,
+nên mỗi lần cập nhật chỉ tốn thời gian cho dữ liệu mới.
+
+Độ chính xác được đo kiểu "dự đoán trước, học sau" (progressive validation): mỗi lô được
+phân loại bằng model hiện tại trước khi partial_fit, nên là độ chính xác trên dữ liệu chưa thấy.
+"""
+
+import time
+import logging
+from collections import Counter
+
+from django.utils import timezone
+
+from .model_registry import (
+    read_active_version, load_model_version, has_model_artifact, publish_model_version,
+)
+from .model_evaluation import TrainingReporter, report_from_confusion, predict_labels, measure_inference_latency
+from .reextraction import should_reextract
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_MODE = 'incremental'
+# Tên ExtractedField chứa loại hóa đơn do người duyệt xác minh
+CATEGORY_FIELD_NAMES = ('category', 'ai_category')
+
+
+def new_training_state():
+    return {'mode': INCREMENTAL_MODE, 'last_invoice_id': 0, 'last_field_id': 0, 'samples_seen': 0}
+
+
+def build_incremental_model():
+    """Vectorizer + model mới cho chế độ tăng dần."""
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+
+    vectorizer = HashingVectorizer(
+        n_features=2 ** 18,  # 9 lớp × 262k đặc trưng float64 ≈ 19MB, nạp mmap dùng chung giữa worker
+        ngram_range=(1, 3),
+        alternate_sign=False,  # giữ đặc trưng không âm như TF-IDF
+        norm='l2',
+    )
+    model = SGDClassifier(loss='log_loss', alpha=1e-5, random_state=42)
+    return model, vectorizer
+
+
+def load_incremental_base(model_type):
+    """
+    Model tăng dần đang active (nạp có thể ghi để partial_fit) kèm mốc đã học,
+    None nếu phiên bản active không phải model tăng dần (vd. RandomForest train đầy đủ).
+    """
+    version = read_active_version(model_type)
+    if version is None or not has_model_artifact(model_type, version, 'state'):
+        return None
+    artifacts = load_model_version(model_type, version, ['model', 'vectorizer', 'state'], mmap_mode=None)
+    if artifacts['state'].get('mode') != INCREMENTAL_MODE:
+        return None
+    return artifacts['model'], artifacts['vectorizer'], dict(artifacts['state'])
+
+
+def _verified_categories(invoice_ids):
+    """{invoice_id: loại đã xác minh} (ExtractedField mới nhất của mỗi hóa đơn)."""
+    from .models import ExtractedField
+
+    rows = (
+        ExtractedField.objects.filter(invoice_id__in=invoice_ids, field_name__in=CATEGORY_FIELD_NAMES, is_verified=True)
+        .order_by('id').values_list('invoice_id', 'extracted_value')
+    )
+    return {invoice_id: value.strip() for invoice_id, value in rows}
+
+
+def count_labelled(state):
+    """Số dòng (hóa đơn + nhãn sửa) chưa học kể từ `state`, dùng để báo tiến độ."""
+    from .models import Invoice, ExtractedField
+
+    invoices = Invoice.objects.filter(id__gt=state['last_invoice_id'], ai_category__isnull=False).exclude(ai_category='')
+    fields = ExtractedField.objects.filter(
+        id__gt=state['last_field_id'], field_name__in=CATEGORY_FIELD_NAMES,
+        is_verified=True, invoice_id__lte=state['last_invoice_id'],
+    )
+    return invoices.count() + fields.count()
+
+
+def iter_labelled_chunks(state, chunk_size=1000):
+    """
+    📥 Yield từng lô (texts, labels, mốc mới, số dòng đã đọc) từ dữ liệu chưa học kể từ `state`.
+    Mốc chỉ được áp dụng vào `state` sau khi lô đã được học (xem `train_incremental`).
+    """
+    from .models import Invoice, ExtractedField
+
+    last_invoice_id = state['last_invoice_id']
+
+    # 1. Hóa đơn mới đã có nhãn
+    rows = (
+        Invoice.objects.filter(id__gt=last_invoice_id, ai_category__isnull=False)
+        .exclude(ai_category='')
+        .order_by('id')
+        .values_list('id', 'raw_ocr_text', 'ai_category')
+    )
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield _invoice_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield _invoice_chunk(chunk)
+
+    # 2. Nhãn được xác minh / sửa sau đó trên các hóa đơn đã học ở lần trước
+    fields = (
+        ExtractedField.objects.filter(
+            id__gt=state['last_field_id'], field_name__in=CATEGORY_FIELD_NAMES,
+            is_verified=True, invoice_id__lte=last_invoice_id,
+        )
+        .order_by('id')
+        .values_list('id', 'invoice__raw_ocr_text', 'extracted_value')
+    )
+    chunk = []
+    for row in fields.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield _field_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield _field_chunk(chunk)
+
+
+def _invoice_chunk(rows):
+    verified = _verified_categories([invoice_id for invoice_id, _, _ in rows])
+    texts, labels = [], []
+    for invoice_id, text, category in rows:
+        if should_reextract(text):
+            texts.append(text)
+            labels.append(verified.get(invoice_id, category))
+    return texts, labels, {'last_invoice_id': rows[-1][0]}, len(rows)
+
+
+def _field_chunk(rows):
+    texts, labels = [], []
+    for _, text, category in rows:
+        if should_reextract(text):
+            texts.append(text)
+            labels.append(category.strip())
+    return texts, labels, {'last_field_id': rows[-1][0]}, len(rows)
+
+
+def train_incremental(classifier, chunk_size=1000, full=False, reporter=None):
+    """
+    🎯 Cập nhật AI Classifier bằng partial_fit trên dữ liệu mới (hoặc toàn bộ nếu `full`),
+    lưu thành phiên bản mới trong registry và kích hoạt. Trả về thống kê lần huấn luyện.
+    """
+    reporter = reporter or TrainingReporter()
+    started = time.perf_counter()
+
+    base = None if full else load_incremental_base(classifier.model_type)
+    if base is None:
+        model, vectorizer = build_incremental_model()
+        state = new_training_state()
+        reporter.log("🆕 Học từ đầu (chưa có model tăng dần đang active)")
+    else:
+        model, vectorizer, state = base
+        reporter.log(f"➕ Học tiếp từ hóa đơn ID > {state['last_invoice_id']}, nhãn sửa ID > {state['last_field_id']}")
+
+    categories = list(classifier.categories)
+    known = set(categories)
+    total_rows = count_labelled(state)
+    stats = {'samples': 0, 'skipped_labels': 0, 'chunks': 0}
+    confusion = Counter()
+    latency_texts = []
+    rows_done = 0
+
+    for texts, labels, marks, row_count in iter_labelled_chunks(state, chunk_size=chunk_size):
+        reporter.check_cancelled()
+        pairs = [(text, label) for text, label in zip(texts, labels) if label in known]
+        stats['skipped_labels'] += len(labels) - len(pairs)
+        if pairs:
+            chunk_texts = [text for text, _ in pairs]
+            y = [label for _, label in pairs]
+            if hasattr(model, 'classes_'):
+                # Dự đoán trước khi học lô này → độ chính xác trên dữ liệu chưa thấy
+                confusion.update(zip(y, predict_labels(model, vectorizer, chunk_texts)))
+            X = vectorizer.transform(chunk_texts)
+            # Lần partial_fit đầu tiên phải biết toàn bộ các lớp
+            model.partial_fit(X, y, classes=categories if not hasattr(model, 'classes_') else None)
+            stats['samples'] += len(pairs)
+            latency_texts = (latency_texts + chunk_texts)[-500:]
+        state.update(marks)
+        stats['chunks'] += 1
+        rows_done += row_count
+        reporter.progress(5 + 85 * rows_done // max(total_rows, 1), f"Đã học {rows_done}/{total_rows} dòng")
+
+    stats['version'] = None
+    if stats['samples'] == 0:
+        logger.info("ℹ️ Không có dữ liệu gán nhãn mới, giữ nguyên AI Classifier")
+        reporter.log("ℹ️ Không có dữ liệu gán nhãn mới, giữ nguyên model")
+        return stats
+
+    training_time_ms = int((time.perf_counter() - started) * 1000)
+    latency = measure_inference_latency(model, vectorizer, latency_texts)
+    evaluation = report_from_confusion(confusion, labels=categories)
+    evaluation['method'] = 'progressive_validation'
+    evaluation['evaluated_samples'] = sum(confusion.values())
+
+    reporter.check_cancelled()
+    state['samples_seen'] += stats['samples']
+    record = publish_model_version(
+        classifier.model_type,
+        {'model': model, 'vectorizer': vectorizer, 'state': state},
+        model_name=f"Invoice Classifier (tăng dần) {timezone.now().strftime('%Y%m%d_%H%M%S')}",
+        training_data_count=state['samples_seen'],
+        accuracy=evaluation['accuracy'],
+        training_time_ms=training_time_ms,
+        inference_latency_ms=latency['single_ms'],
+        metrics={'mode': INCREMENTAL_MODE, 'new_samples': stats['samples'], 'evaluation': evaluation, 'latency': latency},
+    )
+    classifier.last_training = record
+    stats['version'] = record.version
+    stats['samples_seen'] = state['samples_seen']
+    stats['accuracy'] = evaluation['accuracy']
+    logger.info(f"✅ AI Classifier cập nhật tăng dần: +{stats['samples']} mẫu (phiên bản {record.version})")
+    reporter.log(f"✅ +{stats['samples']} mẫu, accuracy (dự đoán trước khi học) = {evaluation['accuracy']} → phiên bản {record.version}")
+    return stats
@@ -0,0 +1,150 @@
+# app_invoices/pdf_ocr.py
+"""
+📑 OCR file PDF nhiều trang
+Mỗi trang được rasterize riêng ở DPI cấu hình được rồi OCR song song trên nhiều core.
+Mỗi tiến trình con chỉ giữ ảnh của đúng 1 trang nên bộ nhớ không tăng theo số trang.
+
+Module này cố ý không import Django model để tiến trình con (spawn trên Windows)
+có thể import nhẹ nhàng.
+"""
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .image_preprocessing import preprocess_for_ocr
+from .ocr_engine import ocr_image_with_layout
+from .ocr_layout import WordLayout
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+    print("⚠️ pdf2image không được cài đặt. Không thể OCR file PDF.")
+
+DEFAULT_PDF_DPI = 300
+
+# Pool OCR dùng chung của tiến trình, theo (pid, số worker): tiến trình fork ra không dùng lại pool của cha
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def pdf_page_count(file_path, poppler_path=None):
+    """Số trang của file PDF (đọc metadata, không rasterize)."""
+    info = pdfinfo_from_path(file_path, poppler_path=poppler_path)
+    return int(info.get('Pages', 0))
+
+
+def _ocr_pdf_page(job):
+    """Rasterize + OCR 1 trang PDF (chạy trong tiến trình/luồng con), trả về (trang, text, bố cục)."""
+    file_path, page_no, dpi, lang, tesseract_cmd, poppler_path, preprocess = job
+    if tesseract_cmd:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    images = convert_from_path(
+        file_path,
+        dpi=dpi,
+        first_page=page_no,
+        last_page=page_no,
+        grayscale=True,
+        poppler_path=poppler_path,
+    )
+    texts, layouts = [], []
+    for page in images:
+        try:
+            image = preprocess_for_ocr(page, target_dpi=dpi) if preprocess else page
+            text, layout = ocr_image_with_layout(image, lang=lang, page=page_no)
+            texts.append(text)
+            layouts.append(layout)
+        finally:
+            page.close()
+    return page_no, "\n".join(texts), WordLayout.concat(layouts)
+
+
+def _get_executor(max_workers):
+    """
+    Pool được tạo ở file PDF đầu tiên rồi dùng lại cho mọi file sau của tiến trình: luồng OCR giữ engine
+    tesserocr đã nạp (ocr_engine.py) thay vì tạo pool + engine mới cho từng file.
+    Dùng process pool khi có thể. Trong Celery prefork worker (tiến trình daemon)
+    không được tạo tiến trình con nên chuyển sang thread pool: pdftoppm và
+    tesseract đều chạy ở subprocess riêng, nên thread vẫn tận dụng được nhiều core.
+    """
+    key = (os.getpid(), max_workers)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            if multiprocessing.current_process().daemon:
+                executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pdf-ocr')
+            else:
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+            _executors[key] = executor
+    return executor
+
+
+def iter_pdf_pages(file_path, dpi=DEFAULT_PDF_DPI, lang='vie+eng', max_workers=None,
+                   max_pages=None, poppler_path=None, preprocess=True):
+    """
+    🔄 OCR song song từng trang PDF, yield (số trang, text, bố cục từ) theo đúng thứ tự
+    trang ngay khi trang đó xong (các trang sau vẫn đang được OCR).
+    """
+    if not PDF2IMAGE_AVAILABLE:
+        raise RuntimeError("pdf2image chưa được cài đặt, không thể OCR file PDF")
+
+    page_count = pdf_page_count(file_path, poppler_path=poppler_path)
+    if max_pages:
+        page_count = min(page_count, max_pages)
+    if page_count <= 0:
+        return
+
+    import pytesseract
+    tesseract_cmd = pytesseract.pytesseract.tesseract_cmd
+    jobs = [
+        (file_path, page_no, dpi, lang, tesseract_cmd, poppler_path, preprocess)
+        for page_no in range(1, page_count + 1)
+    ]
+
+    # 1 trang thì không cần pool
+    if page_count == 1:
+        yield _ocr_pdf_page(jobs[0])
+        return
+
+    # Kích thước pool không phụ thuộc số trang để mọi file dùng chung một pool
+    executor = _get_executor(max(1, max_workers or os.cpu_count() or 1))
+    yield from executor.map(_ocr_pdf_page, jobs)
+
+
+def pdf_ocr_options():
+    """Đọc cấu hình OCR PDF từ settings (PDF_OCR_DPI, PDF_OCR_WORKERS, ...)."""
+    from django.conf import settings
+
+    return {
+        'dpi': getattr(settings, 'PDF_OCR_DPI', DEFAULT_PDF_DPI),
+        'max_workers': getattr(settings, 'PDF_OCR_WORKERS', None),
+        'max_pages': getattr(settings, 'PDF_OCR_MAX_PAGES', None),
+        'poppler_path': getattr(settings, 'POPPLER_PATH', None),
+        'preprocess': getattr(settings, 'OCR_PREPROCESSING', True),
+    }
+
+
+def ocr_pdf_with_layout(file_path, **kwargs):
+    """
+    OCR toàn bộ file PDF (mặc định theo settings), trả về (text các trang nối theo thứ tự, bố cục từ).
+    Chỉ gom text + bố cục (ảnh trang đã giải phóng trong worker). Bộ trích xuất chạy một lần trên toàn văn bản
+    sau checkpoint OCR (pipeline.py), vì regex trường chọn theo độ ưu tiên trên cả tài liệu.
+    """
+    options = pdf_ocr_options()
+    options.update(kwargs)
+
+    page_texts, page_layouts = [], []
+    for page_no, text, layout in iter_pdf_pages(file_path, **options):
+        page_texts.append(text.strip())
+        page_layouts.append(layout)
+    return "\n\n".join(t for t in page_texts if t), WordLayout.concat(page_layouts)
+
+
+def ocr_pdf(file_path, **kwargs):
+    """OCR toàn bộ file PDF (mặc định theo settings), các trang được nối theo thứ tự."""
+    return ocr_pdf_with_layout(file_path, **kwargs)[0]
@@ -0,0 +1,432 @@
+# app_invoices/pipeline.py
+"""
+🔁 Pipeline xử lý hóa đơn theo từng bước có checkpoint
+OCR → trích xuất → phân loại → fraud → dự đoán → lưu kết quả
+
+Kết quả mỗi bước được lưu (nén zlib + JSON) vào InvoicePipelineCheckpoint ngay khi
+bước đó xong. Khi Celery retry hoặc người dùng chạy lại, pipeline tiếp tục từ bước
+đầu tiên chưa hoàn thành: lỗi ở bước AI hay lưu dữ liệu không bao giờ làm OCR chạy lại.
+"""
+
+import os
+import json
+import time
+import zlib
+import traceback
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Invoice, InvoiceStatus, AIRecommendation, InvoicePipelineCheckpoint, InvoiceOCRLayout, Supplier
+)
+from .ocr_cache import file_sha256, engine_key, get_cached_ocr, store_ocr_result
+from .pdf_ocr import ocr_pdf_with_layout
+from .image_preprocessing import open_ocr_image
+from .ocr_engine import ocr_image_with_layout
+from .ocr_layout import WordLayout
+from .duplicate_index import index_invoice_text
+from .supplier_resolver import resolve_supplier
+
+PIPELINE_STAGES = ['ocr', 'extraction', 'classification', 'fraud', 'prediction', 'persistence']
+AI_STAGES = ['extraction', 'classification', 'fraud', 'prediction']
+
+
+class PipelineStageError(Exception):
+    """Lỗi tại một bước của pipeline (đã được ghi vào checkpoint)."""
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+        super().__init__(f"Bước '{stage}' thất bại: {error}")
+
+
+# --- Lưu / đọc checkpoint ---
+def pack_stage_data(data):
+    """Nén kết quả các bước thành blob nhỏ gọn (JSON + zlib)."""
+    raw = json.dumps(data, ensure_ascii=False, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return zlib.compress(raw.encode('utf-8'))
+
+
+def unpack_stage_data(blob):
+    if not blob:
+        return {}
+    return json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+
+
+def get_completed_stages(checkpoint):
+    return [s for s in checkpoint.completed_stages.split(',') if s]
+
+
+def get_stage_output(invoice_id, stage):
+    """Kết quả đã lưu trong checkpoint của một bước (None nếu bước đó chưa xong hoặc đã bị reset)."""
+    blob = InvoicePipelineCheckpoint.objects.filter(invoice_id=invoice_id).values_list('data', flat=True).first()
+    return unpack_stage_data(blob).get(stage)
+
+
+def reset_checkpoint(checkpoint, from_stage):
+    """Bỏ kết quả của `from_stage` và các bước sau nó để chạy lại."""
+    keep = PIPELINE_STAGES[:PIPELINE_STAGES.index(from_stage)]
+    state = unpack_stage_data(checkpoint.data)
+    state = {stage: output for stage, output in state.items() if stage in keep or stage == 'timings'}
+    state['timings'] = {k: v for k, v in state.get('timings', {}).items() if k in keep}
+
+    checkpoint.completed_stages = ','.join(s for s in get_completed_stages(checkpoint) if s in keep)
+    checkpoint.data = pack_stage_data(state)
+    checkpoint.save(update_fields=['completed_stages', 'data', 'updated_at'])
+
+
+def pending_stages(checkpoint):
+    """Các bước cần chạy: từ bước đầu tiên chưa hoàn thành đến cuối pipeline."""
+    completed = set(get_completed_stages(checkpoint))
+    for index, stage in enumerate(PIPELINE_STAGES):
+        if stage not in completed:
+            return PIPELINE_STAGES[index:]
+    return []
+
+
+def resolve_rerun_stage(invoice, from_stage=None):
+    """
+    Bước bắt đầu khi người dùng yêu cầu chạy lại: nếu pipeline còn dở (lỗi AI, ERP...)
+    thì tiếp tục từ bước chưa xong (None); nếu đã hoàn tất thì chạy lại từ OCR.
+    """
+    if from_stage:
+        return from_stage
+    checkpoint = InvoicePipelineCheckpoint.objects.filter(invoice=invoice).first()
+    if checkpoint is None or pending_stages(checkpoint):
+        return None
+    return 'ocr'
+
+
+# --- Các bước của pipeline ---
+def stage_ocr(invoice, state):
+    """1️⃣ OCR ảnh / PDF (dùng lại kết quả nếu file có cùng nội dung đã được OCR)."""
+    invoice.ocr_start_time = timezone.now()
+    invoice.save(update_fields=['ocr_start_time'])
+
+    file_path = os.path.join(settings.MEDIA_ROOT, str(invoice.file))
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Không tìm thấy file: {file_path}")
+
+    # ✅ Cấu hình Tesseract (Windows)
+    tesseract_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    if os.path.exists(tesseract_path):
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = tesseract_path
+
+    content_hash = file_sha256(file_path)
+    engine = engine_key('tesseract')
+    cached = get_cached_ocr(content_hash, engine)
+    if cached is not None:
+        text = cached.raw_text
+        layout = WordLayout.unpack(cached.layout) if cached.layout else None
+    else:
+        if file_path.lower().endswith(".pdf"):
+            # PDF nhiều trang: rasterize + OCR song song từng trang
+            text, layout = ocr_pdf_with_layout(file_path)
+        else:
+            image = open_ocr_image(file_path)
+            text, layout = ocr_image_with_layout(image, lang="vie+eng")
+        store_ocr_result(content_hash, engine, text, layout=layout)
+
+    # Lưu bố cục cấp từ để trích xuất lại theo vị trí mà không cần OCR lại
+    if layout is not None:
+        save_invoice_layout(invoice, layout, engine)
+
+    if not text.strip():
+        text = "[⚠️ Không nhận diện được nội dung từ ảnh]"
+    return {'text': text}
+
+
+def stage_extraction(invoice, state):
+    """2️⃣ AI trích xuất dữ liệu thông minh (bổ sung bằng vị trí từ nếu có bố cục OCR)."""
+    from .ai_services import ai_extractor
+    extracted_data = ai_extractor.extract_smart_data(state['ocr']['text'])
+
+    if extracted_data and not extracted_data.get('total_amount'):
+        apply_layout_fallbacks(extracted_data, get_invoice_layout(invoice))
+    return extracted_data
+
+
+def stage_classification(invoice, state):
+    """3️⃣ AI phân loại hóa đơn."""
+    from .ai_services import ai_classifier
+    return ai_classifier.classify_invoice(state['ocr']['text'])
+
+
+def stage_fraud(invoice, state):
+    """4️⃣ AI phát hiện fraud + tra chỉ mục MinHash/LSH tìm bản nộp trước gần trùng."""
+    from .ai_services import fraud_detector
+    from .duplicate_index import compute_minhash, find_near_duplicates
+
+    text = state['ocr']['text']
+    fraud_result = fraud_detector.detect_fraud(state['extraction'], text)
+    duplicates = find_near_duplicates(compute_minhash(text), exclude_invoice_id=invoice.id, earlier_than=invoice.id)
+    return fraud_detector.add_near_duplicates(fraud_result, duplicates)
+
+
+def stage_prediction(invoice, state):
+    """5️⃣ AI dự đoán khả năng phê duyệt và thời gian xử lý."""
+    from .ai_services import ai_predictor
+    extracted_data = state['extraction']
+    return {
+        'approval': ai_predictor.predict_invoice_approval_probability(extracted_data),
+        'processing_time': ai_predictor.predict_invoice_processing_time(extracted_data),
+    }
+
+
+def stage_persistence(invoice, state):
+    """6️⃣ Ghi toàn bộ kết quả vào Invoice trong 1 transaction."""
+    text = state['ocr']['text']
+    extracted_data = state['extraction']
+    classification_result = state['classification']
+    fraud_result = state['fraud']
+    prediction_result = state['prediction']['approval']
+
+    invoice.ai_category = classification_result['category']
+    invoice.ai_confidence = classification_result['confidence']
+    invoice.ai_extracted_data = extracted_data
+
+    # Cập nhật các trường từ AI extraction
+    if extracted_data.get('invoice_number'):
+        invoice.invoice_number = extracted_data['invoice_number']
+    if extracted_data.get('total_amount'):
+        invoice.total_amount = extracted_data['total_amount']
+
+    invoice.fraud_risk_score = fraud_result['risk_score']
+    invoice.fraud_risk_level = fraud_result['risk_level']
+
+    # Thời gian xử lý AI (milliseconds) = tổng thời gian các bước AI
+    timings = state.get('timings', {})
+    invoice.ai_processing_time = int(sum(timings.get(stage, 0) for stage in AI_STAGES))
+
+    # Tạo khuyến nghị AI
+    recommendations = []
+    if fraud_result['risk_score'] >= 0.7:
+        recommendations.append("🚨 CẢNH BÁO: Rủi ro fraud cao - cần kiểm tra thủ công")
+    for duplicate in fraud_result.get('near_duplicates', [])[:1]:
+        recommendations.append(
+            f"🧬 Nghi nộp trùng: gần giống hóa đơn #{duplicate['invoice_id']} ({duplicate['similarity']:.0%})"
+        )
+    if classification_result['confidence'] < 0.6:
+        recommendations.append("⚠️ Phân loại không chắc chắn - cần xem xét")
+    if prediction_result['approval_probability'] < 0.5:
+        recommendations.append("📋 Khả năng phê duyệt thấp - cần kiểm tra kỹ")
+
+    invoice.ai_recommendations = "\n".join(recommendations) if recommendations else "✅ Hóa đơn có thể xử lý tự động"
+
+    # ✅ Kiểm tra xem có phải hóa đơn thật không (cải tiến với AI)
+    keywords = ["HÓA ĐƠN", "INVOICE", "GTGT", "BILL", "RECEIPT"]
+    invoice.is_invoice = any(k in text.upper() for k in keywords) or classification_result['confidence'] > 0.7
+
+    with transaction.atomic():
+        if extracted_data.get('supplier_name'):
+            # Khớp MST / tên (mờ) với nhà cung cấp đã có thay vì tạo mới cho mỗi biến thể OCR của tên
+            supplier, created, match = resolve_supplier(
+                extracted_data['supplier_name'], extracted_data.get('supplier_tax_id')
+            )
+            if match and match.method == 'fuzzy':
+                print(f"🏢 '{extracted_data['supplier_name']}' → {supplier.name} (khớp {match.score:.0%})")
+            elif match and match.method == 'review':
+                # Gần giống nhưng chưa đủ chắc để gộp: giữ nhà cung cấp mới, để người duyệt quyết định
+                similar = Supplier.objects.filter(id=match.supplier_id).values_list('name', flat=True).first()
+                recommendations.append(
+                    f"🏢 Nhà cung cấp mới '{supplier.name}' gần giống '{similar}' ({match.score:.0%}) - "
+                    f"cần xem xét gộp (dedupe_suppliers)"
+                )
+                invoice.ai_recommendations = "\n".join(recommendations)
+            invoice.supplier = supplier
+
+        invoice.raw_ocr_text = text
+        invoice.status = InvoiceStatus.OCR_PROCESSED
+        invoice.ocr_end_time = timezone.now()
+        invoice.save()
+        # Hóa đơn nộp sau sẽ tìm thấy hóa đơn này qua chỉ mục gần trùng
+        index_invoice_text(invoice.id, text)
+
+        if recommendations:
+            AIRecommendation.objects.create(
+                invoice=invoice,
+                recommendation_type='manual_check' if fraud_result['risk_score'] >= 0.7 else 'review',
+                confidence=1.0 - fraud_result['risk_score'],
+                reason=invoice.ai_recommendations
+            )
+    return {'saved_at': timezone.now()}
+
+
+# --- Bố cục OCR cấp từ ---
+TOTAL_AMOUNT_LABELS = ['Tổng cộng tiền thanh toán', 'Tổng cộng', 'Tổng tiền', 'Total']
+
+
+def save_invoice_layout(invoice, layout, engine=''):
+    """Ghi (hoặc thay) bố cục OCR cấp từ của hóa đơn."""
+    InvoiceOCRLayout.objects.update_or_create(
+        invoice=invoice,
+        defaults={
+            'engine': engine,
+            'data': layout.pack(),
+            'word_count': len(layout),
+            'page_count': layout.page_count,
+        }
+    )
+
+
+def get_invoice_layout(invoice):
+    """WordLayout đã lưu của hóa đơn, None nếu chưa có."""
+    blob = InvoiceOCRLayout.objects.filter(invoice=invoice).values_list('data', flat=True).first()
+    return WordLayout.unpack(blob) if blob else None
+
+
+def total_amount_from_layout(layout):
+    """Số tiền nằm bên phải nhãn 'Tổng cộng' / 'Tổng tiền' / 'Total' trên cùng dòng."""
+    value = layout.value_right_of(TOTAL_AMOUNT_LABELS)
+    if not value:
+        return None
+    try:
+        return float(value.replace('.', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def apply_layout_fallbacks(extracted_data, layout):
+    """Bổ sung các trường regex không tìm được bằng vị trí từ trong bố cục OCR."""
+    if layout is not None and extracted_data and not extracted_data.get('total_amount'):
+        extracted_data['total_amount'] = total_amount_from_layout(layout)
+    return extracted_data
+
+
+STAGE_HANDLERS = {
+    'ocr': stage_ocr,
+    'extraction': stage_extraction,
+    'classification': stage_classification,
+    'fraud': stage_fraud,
+    'prediction': stage_prediction,
+    'persistence': stage_persistence,
+}
+
+
+# --- Chạy pipeline ---
+def run_invoice_pipeline(invoice_id, from_stage=None, stop_before=None):
+    """
+    🚀 Chạy pipeline cho hóa đơn, tiếp tục từ bước đầu tiên chưa hoàn thành.
+    `from_stage` buộc chạy lại từ bước đó (vd. 'extraction' sau khi sửa regex, 'ocr' để OCR lại).
+    `stop_before` dừng (giữ checkpoint) khi tới bước đó, vd. để phân loại cả lô một lần.
+    Lỗi ở một bước được ghi vào checkpoint rồi ném PipelineStageError để Celery retry; hóa đơn vẫn
+    ở OCR_PROCESSING cho tới khi nơi gọi hết lượt thử và gọi `mark_pipeline_failed`.
+    """
+    invoice = Invoice.objects.get(id=invoice_id)
+    checkpoint, _ = InvoicePipelineCheckpoint.objects.get_or_create(invoice=invoice)
+
+    if from_stage:
+        if from_stage not in PIPELINE_STAGES:
+            raise ValueError(f"Bước pipeline không hợp lệ: {from_stage}")
+        reset_checkpoint(checkpoint, from_stage)
+
+    stages = pending_stages(checkpoint)
+    if not stages:
+        return invoice
+
+    state = unpack_stage_data(checkpoint.data)
+    state.setdefault('timings', {})
+
+    invoice.status = InvoiceStatus.OCR_PROCESSING
+    invoice.save(update_fields=['status'])
+
+    for stage in stages:
+        if stage == stop_before:
+            return invoice
+        started = time.time()
+        try:
+            output = STAGE_HANDLERS[stage](invoice, state)
+        except Exception as e:
+            print(f"❌ Lỗi pipeline hóa đơn ID {invoice.id} tại bước '{stage}':", e)
+            print(traceback.format_exc())
+            _record_failure(checkpoint, stage, e)
+            raise PipelineStageError(stage, e) from e
+
+        _complete_stage(checkpoint, state, stage, output, int((time.time() - started) * 1000))
+
+    print(f"🤖 AI OCR hoàn tất cho hóa đơn ID {invoice.id}")
+    print(f"📊 Phân loại: {invoice.ai_category} (độ tin cậy: {invoice.ai_confidence})")
+    print(f"🧾 Số hóa đơn: {invoice.invoice_number}")
+    print(f"🏢 Nhà cung cấp: {invoice.supplier}")
+    print(f"💰 Tổng tiền: {invoice.total_amount}")
+    print(f"🕵️ Rủi ro fraud: {invoice.fraud_risk_level} ({invoice.fraud_risk_score})")
+    print(f"⏱️ Thời gian AI: {invoice.ai_processing_time}ms")
+    return invoice
+
+
+def run_invoice_pipeline_batch(invoice_ids):
+    """
+    📚 Chạy pipeline cho một nhóm hóa đơn, bước phân loại chạy theo lô:
+    1. OCR + trích xuất từng hóa đơn (dừng trước bước phân loại)
+    2. Phân loại mọi hóa đơn đang chờ bằng một lần `classify_batch` và ghi checkpoint
+    3. Chạy tiếp các bước còn lại của từng hóa đơn từ checkpoint
+    Lỗi 1 hóa đơn không làm dừng cả nhóm; trả về {invoice_id: lỗi} của các hóa đơn thất bại.
+    """
+    from .ai_services import ai_classifier
+
+    errors = {}
+    for invoice_id in invoice_ids:
+        try:
+            run_invoice_pipeline(invoice_id, stop_before='classification')
+        except Exception as exc:
+            errors[invoice_id] = exc
+
+    waiting = []
+    for checkpoint in InvoicePipelineCheckpoint.objects.filter(invoice_id__in=invoice_ids):
+        if checkpoint.invoice_id not in errors and pending_stages(checkpoint)[:1] == ['classification']:
+            waiting.append((checkpoint, unpack_stage_data(checkpoint.data)))
+
+    if waiting:
+        started = time.time()
+        results = ai_classifier.classify_batch([state['ocr']['text'] for _, state in waiting])
+        # Thời gian phân loại của mỗi hóa đơn = phần chia đều của cả lô
+        elapsed_ms = int((time.time() - started) * 1000 / len(waiting))
+        for (checkpoint, state), result in zip(waiting, results):
+            state.setdefault('timings', {})
+            _complete_stage(checkpoint, state, 'classification', result, elapsed_ms)
+
+    for invoice_id in invoice_ids:
+        if invoice_id in errors:
+            continue
+        try:
+            run_invoice_pipeline(invoice_id)
+        except Exception as exc:
+            errors[invoice_id] = exc
+    return errors
+
+
+def _complete_stage(checkpoint, state, stage, output, elapsed_ms):
+    """Ghi kết quả một bước vào checkpoint (đánh dấu mọi bước tới `stage` đã xong)."""
+    state[stage] = output
+    state['timings'][stage] = elapsed_ms
+    checkpoint.completed_stages = ','.join(PIPELINE_STAGES[:PIPELINE_STAGES.index(stage) + 1])
+    checkpoint.data = pack_stage_data(state)
+    checkpoint.failed_stage = ''
+    checkpoint.last_error = ''
+    checkpoint.save(update_fields=['completed_stages', 'data', 'failed_stage', 'last_error', 'updated_at'])
+
+
+def _record_failure(checkpoint, stage, error):
+    """Ghi lỗi của một lần chạy vào checkpoint; trạng thái hóa đơn giữ nguyên vì Celery còn retry."""
+    try:
+        checkpoint.failed_stage = stage
+        checkpoint.last_error = str(error)
+        checkpoint.save(update_fields=['failed_stage', 'last_error', 'updated_at'])
+    except Exception as save_error:
+        print("⚠️ Không thể lưu lỗi vào checkpoint:", save_error)
+
+
+def mark_pipeline_failed(invoice_id):
+    """
+    ❌ Chuyển hóa đơn sang OCR_FAILED khi đã hết lượt thử (gọi từ lần thất bại cuối của task).
+    Lỗi lấy từ checkpoint; OCR text đã có không bị ghi đè, chỉ khi chính bước OCR lỗi mới ghi thông báo lỗi.
+    """
+    checkpoint = InvoicePipelineCheckpoint.objects.filter(invoice_id=invoice_id).first()
+    changes = {'status': InvoiceStatus.OCR_FAILED}
+    if checkpoint and checkpoint.failed_stage == 'ocr':
+        changes['raw_ocr_text'] = f"Lỗi AI OCR: {checkpoint.last_error}"
+    Invoice.objects.filter(id=invoice_id).update(**changes)
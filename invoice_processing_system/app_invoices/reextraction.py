@@ -0,0 +1,182 @@
+# app_invoices/reextraction.py
+"""
+♻️ Trích xuất lại hàng loạt từ OCR text đã lưu (không OCR lại)
+Dùng bởi lệnh `python manage.py reextract_invoices`: đọc hóa đơn theo từng lô,
+chạy trích xuất + phân loại + fraud trong process pool rồi ghi lại bằng bulk_update.
+
+Hàm chạy trong tiến trình con chỉ nhận dữ liệu thuần (id, text, blob bố cục) và
+không truy cập DB, nên có thể chạy song song trên mọi core.
+"""
+
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Các trường được ghi lại (cùng ý nghĩa với bước persistence của pipeline)
+REEXTRACT_FIELDS = [
+    'invoice_number', 'total_amount', 'ai_category', 'ai_confidence',
+    'fraud_risk_score', 'fraud_risk_level', 'ai_extracted_data',
+]
+
+# OCR text là thông báo lỗi / placeholder thì bỏ qua
+SKIP_TEXT_PREFIXES = ('Lỗi AI OCR', '[⚠️', '[Không hỗ trợ')
+
+_CENT = Decimal('0.01')
+
+
+def init_worker():
+    """Khởi tạo Django trong tiến trình con (cần khi start method là spawn, vd. Windows)."""
+    import os
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+        django.setup()
+
+    # Mỗi core đã có 1 tiến trình: forest chạy 1 luồng để không tranh CPU lẫn nhau
+    from .ai_services import ai_classifier
+    ai_classifier.set_n_jobs(1)
+
+
+def _to_decimal(value):
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value)).quantize(_CENT)
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _json_roundtrip(data):
+    """Chuẩn hóa dữ liệu về dạng JSON thuần (date → chuỗi ISO) như khi lưu vào JSONField."""
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def compute_invoice_fields(text, layout_blob=None, classification_result=None):
+    """
+    🧠 Chạy trích xuất, phân loại và fraud trên OCR text, trả về {trường: giá trị mới}.
+    Số hóa đơn / tổng tiền chỉ có mặt khi trích xuất được (giữ nguyên giá trị cũ nếu không).
+    `classification_result` là kết quả đã phân loại theo lô (bỏ qua bước phân loại riêng lẻ).
+    """
+    from .ai_services import ai_extractor, ai_classifier, fraud_detector
+    from .ocr_layout import WordLayout
+    from .pipeline import apply_layout_fallbacks
+
+    extracted_data = ai_extractor.extract_smart_data(text)
+    if layout_blob:
+        apply_layout_fallbacks(extracted_data, WordLayout.unpack(layout_blob))
+    extracted_data = _json_roundtrip(extracted_data)
+
+    if classification_result is None:
+        classification_result = ai_classifier.classify_invoice(text)
+    fraud_result = fraud_detector.detect_fraud(extracted_data, text)
+
+    values = {
+        'ai_category': classification_result['category'],
+        'ai_confidence': _to_decimal(classification_result['confidence']),
+        'fraud_risk_score': _to_decimal(fraud_result['risk_score']),
+        'fraud_risk_level': fraud_result['risk_level'],
+        'ai_extracted_data': extracted_data,
+    }
+    if extracted_data.get('invoice_number'):
+        values['invoice_number'] = extracted_data['invoice_number']
+    if extracted_data.get('total_amount'):
+        values['total_amount'] = _to_decimal(extracted_data['total_amount'])
+    return values
+
+
+def reextract_batch(items):
+    """
+    Chạy trong tiến trình con: `items` là danh sách (invoice_id, raw_ocr_text, layout_blob).
+    Trả về danh sách (invoice_id, values, error) - lỗi 1 hóa đơn không làm hỏng cả lô.
+    Cả lô được phân loại bằng một lần `classify_batch`.
+    """
+    from .ai_services import ai_classifier
+
+    classifications = ai_classifier.classify_batch([text for _, text, _ in items])
+    results = []
+    for (invoice_id, text, layout_blob), classification_result in zip(items, classifications):
+        try:
+            results.append((invoice_id, compute_invoice_fields(text, layout_blob, classification_result), None))
+        except Exception as e:
+            results.append((invoice_id, None, str(e)))
+    return results
+
+
+def add_near_duplicate_risk(results):
+    """
+    🧬 Chạy ở tiến trình chính (cần DB): cộng rủi ro gần trùng (chỉ mục MinHash/LSH, bản nộp trước)
+    vào điểm fraud vừa tính lại của lô, để chạy lại trích xuất không xóa mất cảnh báo nộp trùng.
+    """
+    from .ai_services import fraud_detector
+    from .duplicate_index import find_near_duplicates, unpack_signature
+    from .models import InvoiceTextSignature
+
+    invoice_ids = [invoice_id for invoice_id, values, _ in results if values]
+    signatures = dict(
+        InvoiceTextSignature.objects.filter(invoice_id__in=invoice_ids).values_list('invoice_id', 'signature')
+    )
+    for invoice_id, values, _ in results:
+        if not values or invoice_id not in signatures:
+            continue
+        duplicates = find_near_duplicates(
+            unpack_signature(signatures[invoice_id]), exclude_invoice_id=invoice_id, earlier_than=invoice_id
+        )
+        if duplicates:
+            fraud_result = {'risk_score': float(values['fraud_risk_score']), 'indicators': []}
+            fraud_result = fraud_detector.add_near_duplicates(fraud_result, duplicates)
+            values['fraud_risk_score'] = _to_decimal(fraud_result['risk_score'])
+            values['fraud_risk_level'] = fraud_result['risk_level']
+    return results
+
+
+def diff_invoice_fields(invoice, values):
+    """So sánh giá trị mới với Invoice hiện tại, trả về {trường: (cũ, mới)} cho các trường thay đổi."""
+    changes = {}
+    for field, new_value in values.items():
+        old_value = getattr(invoice, field)
+        if field in ('total_amount', 'ai_confidence', 'fraud_risk_score'):
+            old_value = _to_decimal(old_value)
+        if old_value != new_value:
+            changes[field] = (old_value, new_value)
+    return changes
+
+
+def should_reextract(text):
+    text = (text or '').strip()
+    return bool(text) and not text.startswith(SKIP_TEXT_PREFIXES)
+
+
+def iter_invoice_batches(batch_size=200, start_after_id=0, limit=None):
+    """
+    📥 Đọc hóa đơn theo thứ tự id bằng `iterator()` (không nạp cả bảng vào RAM),
+    yield từng lô Invoice (chỉ các cột cần thiết) kèm blob bố cục OCR của lô.
+    """
+    from .models import Invoice, InvoiceOCRLayout
+
+    queryset = (
+        Invoice.objects.filter(id__gt=start_after_id)
+        .exclude(raw_ocr_text='')
+        .only('id', 'raw_ocr_text', *REEXTRACT_FIELDS)
+        .order_by('id')
+    )
+    if limit:
+        queryset = queryset[:limit]
+
+    def with_layouts(batch):
+        layouts = dict(
+            InvoiceOCRLayout.objects.filter(invoice_id__in=[inv.id for inv in batch])
+            .values_list('invoice_id', 'data')
+        )
+        return batch, {invoice_id: bytes(blob) for invoice_id, blob in layouts.items()}
+
+    batch = []
+    for invoice in queryset.iterator(chunk_size=batch_size):
+        batch.append(invoice)
+        if len(batch) >= batch_size:
+            yield with_layouts(batch)
+            batch = []
+    if batch:
+        yield with_layouts(batch)
@@ -0,0 +1,23 @@
+# app_invoices/renderers.py
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def format_sse_event(event, data):
+    """📡 Một server-sent event: `event: <tên>` + `data: <json>` + dòng trống."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n".encode('utf-8')
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    📡 text/event-stream cho API stream: response thường (vd. lỗi 400) được gửi thành một event `error`
+    để client SSE vẫn đọc được
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse_event('error', data)
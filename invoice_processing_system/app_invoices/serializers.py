@@ -47,6 +47,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'ocr_start_time',
             'ocr_end_time',
             'match_score',
+            'ocr_job_id',
             'extracted_fields',
         ]
 
@@ -56,7 +57,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'file', 'invoice_number', 'supplier', 'status', 'status_display',
             'total_amount', 'uploaded_at', 'uploaded_by', 'raw_ocr_text', 
-            'ocr_start_time', 'ocr_end_time', 'match_score', 'extracted_fields'
+            'ocr_start_time', 'ocr_end_time', 'match_score', 'ocr_job_id', 'extracted_fields'
         ]
 
 class TaskAssignmentSerializer(serializers.ModelSerializer):
@@ -76,6 +77,14 @@ class MatchingRuleSerializer(serializers.ModelSerializer):
         model = MatchingRule
         fields = '__all__'
 
+    def validate_rule_logic(self, value):
+        from .matching_rules import compile_rule, RuleSyntaxError
+        try:
+            compile_rule(value)
+        except RuleSyntaxError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
 class ActivityLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = ActivityLog
@@ -0,0 +1,406 @@
+# app_invoices/supplier_resolver.py
+"""
+🏢 Nhận diện nhà cung cấp từ tên OCR (mờ) + mã số thuế (chính xác)
+
+`Supplier.objects.get_or_create(name=...)` tạo nhà cung cấp mới cho mỗi biến thể OCR của cùng
+một tên ("CÔNG TY TNHH ABC", "Cong ty ABC", "ABC Ltd", "Cty TNHH A8C"). Bộ nhận diện giữ trong RAM
+của mỗi tiến trình:
+- MST (chỉ giữ chữ số) → id: khớp chính xác, ưu tiên trước tên
+- tên lõi (bỏ dấu tiếng Việt, chữ thường, bỏ loại hình doanh nghiệp / ngành nghề chung) → id: khớp chính xác
+- chỉ mục đảo trigram ký tự của tên lõi: đếm số trigram chung với mọi nhà cung cấp bằng numpy,
+  lấy nhà cung cấp có Jaccard trigram cao nhất nếu ≥ SUPPLIER_MATCH_THRESHOLD (tự gộp). Tên chỉ gần giống
+  (SUPPLIER_REVIEW_THRESHOLD ≤ Jaccard < SUPPLIER_MATCH_THRESHOLD) thì tạo nhà cung cấp mới và gắn cờ cần xem xét
+Bộ nhận diện được dựng lười một lần / tiến trình, cập nhật theo signal khi Supplier được lưu / xóa
+trong tiến trình đó và bắt kịp nhà cung cấp do tiến trình khác tạo (id mới) khi tra cứu trượt.
+"""
+
+import re
+import math
+import time
+import threading
+import unicodedata
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Supplier
+
+SupplierMatch = namedtuple('SupplierMatch', ['supplier_id', 'score', 'method'])
+
+# Loại hình doanh nghiệp + ngành nghề chung: giống nhau giữa rất nhiều nhà cung cấp nên không phân biệt được
+_GENERIC_TERMS = (
+    'cong ty', 'cty', 'ct', 'trach nhiem huu han', 'tnhh', 'co phan', 'cp', 'mot thanh vien', 'mtv',
+    'hop danh', 'doanh nghiep tu nhan', 'dntn', 'chi nhanh', 'tap doan', 'tong cong ty',
+    'thuong mai', 'tm', 'dich vu', 'dv', 'san xuat', 'sx', 'xuat nhap khau', 'xnk',
+    'dau tu', 'phat trien', 'xay dung', 'ky thuat',
+    'company', 'co', 'corp', 'corporation', 'jsc', 'joint stock', 'ltd', 'limited', 'llc', 'inc',
+)
+_GENERIC_PATTERN = re.compile(
+    r'\b(?:' + '|'.join(re.escape(term) for term in sorted(_GENERIC_TERMS, key=len, reverse=True)) + r')\b'
+)
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_TAX_DIGITS = re.compile(r'\D+')
+_MIXED_TOKEN = re.compile(r'\b(?=[a-z]*\d)(?=\d*[a-z])[0-9a-z]+\b')
+_OCR_DIGITS = str.maketrans('0158', 'oisb')
+
+
+def fold_text(text):
+    """Bỏ dấu tiếng Việt, chữ thường, chỉ giữ chữ + số (các ký tự khác thành khoảng trắng)."""
+    text = unicodedata.normalize('NFD', (text or '').replace('đ', 'd').replace('Đ', 'D'))
+    text = text.encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(_NON_ALNUM.sub(' ', text).split())
+
+
+def normalize_supplier_name(name):
+    """Tên lõi dùng để so khớp; nếu bỏ hết từ chung thì giữ tên đã bỏ dấu."""
+    folded = fold_text(name)
+    # Chữ số lẫn trong một từ có chữ cái gần như luôn là lỗi OCR ("A8C", "H0ANG")
+    folded = _MIXED_TOKEN.sub(lambda match: match.group(0).translate(_OCR_DIGITS), folded)
+    core = ' '.join(_GENERIC_PATTERN.sub(' ', folded).split())
+    return core or folded
+
+
+def normalize_tax_id(tax_id):
+    """MST chỉ gồm chữ số (10 số, hoặc 13 số với mã chi nhánh); không hợp lệ → None."""
+    digits = _TAX_DIGITS.sub('', tax_id or '')
+    return digits if len(digits) in (10, 13) else None
+
+
+def name_trigrams(core_name):
+    padded = f" {core_name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SupplierResolver:
+    """
+    🔎 Chỉ mục nhà cung cấp trong RAM. `match()` không truy vấn DB.
+
+    Phần chính là chỉ mục đảo dạng CSR (numpy): trigram → các dòng chứa trigram đó. Số trigram chung
+    của tên cần tìm với MỌI nhà cung cấp được đếm bằng một lần `np.bincount` nên không phải duyệt
+    ứng viên bằng Python. Nhà cung cấp thêm / sửa sau khi dựng nằm ở phần "delta" (dict tập trigram),
+    bị xóa thì chỉ đánh dấu dòng; delta đủ lớn thì dựng lại phần chính.
+    """
+
+    DELTA_COMPACT_SIZE = 2000
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold if threshold is not None else getattr(settings, 'SUPPLIER_MATCH_THRESHOLD', 0.9)
+        self.review_threshold = min(self.threshold, getattr(settings, 'SUPPLIER_REVIEW_THRESHOLD', 0.8))
+        self._lock = threading.RLock()
+        self._names = {}          # supplier_id → tên lõi
+        self._by_name = {}        # tên lõi → supplier_id (nhỏ nhất)
+        self._tax_ids = {}        # supplier_id → MST
+        self._by_tax_id = {}      # MST → supplier_id
+        self._delta = {}          # supplier_id → tập trigram (chưa vào phần chính)
+        self._row_of = {}         # supplier_id → dòng trong phần chính
+        self._vocab = {}          # trigram → id trigram
+        self._indptr = self._rows = self._row_ids = self._row_sizes = self._row_grams = self._row_starts = self._alive = None
+        self.max_id = 0
+
+    def __len__(self):
+        return len(self._names)
+
+    # --- Cập nhật chỉ mục ---
+    def _index(self, supplier_id, name, tax_id, delta=True):
+        if supplier_id in self._names or supplier_id in self._tax_ids:
+            self.remove(supplier_id)
+        core = normalize_supplier_name(name)
+        if core:
+            self._names[supplier_id] = core
+            if supplier_id < self._by_name.get(core, supplier_id + 1):
+                self._by_name[core] = supplier_id
+            if delta:
+                self._delta[supplier_id] = frozenset(name_trigrams(core))
+        tax = normalize_tax_id(tax_id)
+        if tax:
+            self._tax_ids[supplier_id] = tax
+            if supplier_id < self._by_tax_id.get(tax, supplier_id + 1):
+                self._by_tax_id[tax] = supplier_id
+        self.max_id = max(self.max_id, supplier_id)
+
+    def add(self, supplier_id, name, tax_id=None):
+        """Thêm / cập nhật một nhà cung cấp."""
+        with self._lock:
+            self._index(supplier_id, name, tax_id)
+            if len(self._delta) >= self.DELTA_COMPACT_SIZE:
+                self._compact()
+
+    def remove(self, supplier_id):
+        with self._lock:
+            row = self._row_of.pop(supplier_id, None)
+            if row is not None:
+                self._alive[row] = False
+            self._delta.pop(supplier_id, None)
+            core = self._names.pop(supplier_id, None)
+            if core is not None and self._by_name.get(core) == supplier_id:
+                del self._by_name[core]
+                # Nhà cung cấp khác cùng tên lõi (nếu có) thay chỗ
+                others = [other for other, other_core in self._names.items() if other_core == core]
+                if others:
+                    self._by_name[core] = min(others)
+            tax = self._tax_ids.pop(supplier_id, None)
+            if tax and self._by_tax_id.get(tax) == supplier_id:
+                del self._by_tax_id[tax]
+                # Nhà cung cấp khác cùng MST (dữ liệu cũ trước khi có ràng buộc) thay chỗ
+                others = [other for other, other_tax in self._tax_ids.items() if other_tax == tax]
+                if others:
+                    self._by_tax_id[tax] = min(others)
+
+    def load(self, rows):
+        """Nạp từ các dòng (id, name, tax_id) rồi dựng phần chính một lần."""
+        with self._lock:
+            for supplier_id, name, tax_id in rows:
+                self._index(supplier_id, name, tax_id, delta=False)
+            self._compact()
+        return self
+
+    def _compact(self):
+        """Dựng lại chỉ mục CSR từ mọi tên lõi hiện có (gộp delta, bỏ dòng đã xóa)."""
+        import numpy as np
+
+        ids = list(self._names)
+        vocab, flat, sizes = {}, [], []
+        for supplier_id in ids:
+            grams = [vocab.setdefault(gram, len(vocab)) for gram in name_trigrams(self._names[supplier_id])]
+            flat.extend(grams)
+            sizes.append(len(grams))
+
+        gram_ids = np.array(flat, dtype=np.int32)
+        row_sizes = np.array(sizes, dtype=np.int32)
+        rows = np.repeat(np.arange(len(ids), dtype=np.int32), row_sizes)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(gram_ids, minlength=len(vocab)), out=indptr[1:])
+
+        self._vocab = vocab
+        self._indptr = indptr
+        self._rows = rows[np.argsort(gram_ids, kind='stable')]
+        self._row_ids = np.array(ids, dtype=np.int64)
+        self._row_sizes = row_sizes
+        self._row_grams = gram_ids
+        self._row_starts = np.cumsum(row_sizes) - row_sizes
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._row_of = {supplier_id: row for row, supplier_id in enumerate(ids)}
+        self._delta = {}
+
+    def sync_new(self):
+        """Bắt kịp nhà cung cấp do tiến trình khác tạo (id > id lớn nhất đã nạp). Trả về số dòng mới."""
+        rows = list(Supplier.objects.filter(id__gt=self.max_id).order_by('id').values_list('id', 'name', 'tax_id'))
+        for supplier_id, name, tax_id in rows:
+            self.add(supplier_id, name, tax_id)
+        return len(rows)
+
+    # --- Tra cứu ---
+    def match(self, name, tax_id=None, threshold=None):
+        """
+        Nhà cung cấp khớp nhất: MST → tên lõi chính xác → Jaccard trigram ≥ ngưỡng.
+        Có MST thì không khớp theo tên với nhà cung cấp mang MST khác. Trả về SupplierMatch hoặc None.
+        """
+        tax = normalize_tax_id(tax_id)
+        if tax and tax in self._by_tax_id:
+            return SupplierMatch(self._by_tax_id[tax], 1.0, 'tax_id')
+
+        core = normalize_supplier_name(name)
+        if not core:
+            return None
+        if core in self._by_name and self._tax_compatible(self._by_name[core], tax):
+            return SupplierMatch(self._by_name[core], 1.0, 'name')
+
+        for candidate in self.candidates(core, threshold):
+            if self._tax_compatible(candidate.supplier_id, tax):
+                return candidate
+        return None
+
+    def near_match(self, name, tax_id=None):
+        """
+        Nhà cung cấp gần giống nhất chưa đủ ngưỡng tự gộp (review_threshold ≤ Jaccard < threshold),
+        method 'review'. Dùng sau khi match() trượt để gắn cờ cho người duyệt thay vì gộp.
+        """
+        tax = normalize_tax_id(tax_id)
+        core = normalize_supplier_name(name)
+        if not core or self.review_threshold >= self.threshold:
+            return None
+        for candidate in self.candidates(core, self.review_threshold):
+            if candidate.score < self.threshold and self._tax_compatible(candidate.supplier_id, tax):
+                return candidate._replace(method='review')
+        return None
+
+    def _tax_compatible(self, supplier_id, tax):
+        return not tax or self._tax_ids.get(supplier_id) in (None, tax)
+
+    def candidates(self, core, threshold=None, limit=5):
+        """Nhà cung cấp có Jaccard trigram với tên lõi `core` ≥ ngưỡng, giảm dần."""
+        threshold = self.threshold if threshold is None else threshold
+        grams = name_trigrams(core)
+        query_size = len(grams)
+        # Jaccard ≥ t ⇒ số trigram chung ≥ t·|Q| (hợp ≥ |Q|)
+        required = max(1, math.ceil(threshold * query_size - 1e-9))
+        matches = []
+        with self._lock:
+            gram_ids = [self._vocab[gram] for gram in grams if gram in self._vocab]
+            if len(gram_ids) >= required:
+                matches = self._base_candidates(gram_ids, query_size, required, threshold, limit)
+            for supplier_id, candidate in self._delta.items():
+                overlap = len(grams & candidate)
+                score = overlap / (query_size + len(candidate) - overlap)
+                if score >= threshold:
+                    matches.append(SupplierMatch(supplier_id, round(score, 4), 'fuzzy'))
+
+        matches.sort(key=lambda match: (-match.score, match.supplier_id))
+        return matches[:limit]
+
+    def _base_candidates(self, gram_ids, query_size, required, threshold, limit):
+        """
+        Ứng viên trong phần chính. Chỉ đếm postings của các trigram hiếm: bỏ qua `skipped` trigram phổ biến
+        nhất (vd. "ng ", " th") thì nhà cung cấp đạt ngưỡng vẫn phải có ≥ required - skipped trigram hiếm chung.
+        Số ứng viên còn lại nhỏ nên đếm chính xác số trigram chung qua chỉ mục xuôi (dòng → trigram).
+        """
+        import numpy as np
+
+        indptr = self._indptr
+        gram_ids.sort(key=lambda gram_id: indptr[gram_id + 1] - indptr[gram_id])
+        skipped = min(len(gram_ids) - 1, max(0, required - 2))
+        rare = gram_ids[:len(gram_ids) - skipped]
+        partial = np.bincount(
+            np.concatenate([self._rows[indptr[g]:indptr[g + 1]] for g in rare]), minlength=len(self._row_ids)
+        )
+        rows = np.flatnonzero(partial >= required - skipped)
+        rows = rows[self._alive[rows]]
+        if not len(rows):
+            return []
+
+        in_query = np.zeros(len(self._vocab), dtype=bool)
+        in_query[gram_ids] = True
+        sizes = self._row_sizes[rows]
+        offsets = np.cumsum(sizes) - sizes
+        positions = np.arange(sizes.sum()) + np.repeat(self._row_starts[rows] - offsets, sizes)
+        overlap = np.add.reduceat(in_query[self._row_grams[positions]].astype(np.int32), offsets)
+        scores = overlap / (query_size + sizes - overlap)
+
+        keep = np.flatnonzero(scores >= threshold)
+        if len(keep) > limit:
+            keep = keep[np.argpartition(-scores[keep], limit)[:limit]]
+        return [SupplierMatch(int(self._row_ids[rows[i]]), round(float(scores[i]), 4), 'fuzzy') for i in keep]
+
+
+# --- Bộ nhận diện dùng chung trong tiến trình ---
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_supplier_resolver():
+    """Bộ nhận diện của tiến trình (dựng từ bảng Supplier ở lần gọi đầu)."""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                started = time.perf_counter()
+                resolver = SupplierResolver().load(Supplier.objects.order_by('id').values_list('id', 'name', 'tax_id').iterator(chunk_size=5000))
+                print(f"🏢 Đã dựng chỉ mục {len(resolver)} nhà cung cấp trong {(time.perf_counter() - started) * 1000:.0f}ms")
+                _resolver = resolver
+    return _resolver
+
+
+def reset_supplier_resolver():
+    """Bỏ chỉ mục của tiến trình (dựng lại ở lần tra cứu kế tiếp), vd. sau khi gộp nhà cung cấp."""
+    global _resolver
+    with _resolver_lock:
+        _resolver = None
+
+
+def resolve_supplier(name, tax_id=None):
+    """
+    🏷️ Nhà cung cấp cho tên / MST trích xuất từ hóa đơn: khớp MST hoặc tên (mờ) với nhà cung cấp đã có,
+    không có thì tạo mới. Trả về (Supplier, created, SupplierMatch | None).
+    Tạo mới mà tên gần giống một nhà cung cấp đã có (dưới ngưỡng tự gộp) thì match có method 'review'
+    trỏ tới nhà cung cấp đó để người duyệt quyết định gộp (dedupe_suppliers) hay giữ riêng.
+    """
+    resolver = get_supplier_resolver()
+    tax = normalize_tax_id(tax_id)
+
+    for attempt in range(3):
+        match = resolver.match(name, tax)
+        if match:
+            supplier = Supplier.objects.filter(id=match.supplier_id).first()
+            if supplier:
+                return supplier, False, match
+            resolver.remove(match.supplier_id)  # đã bị xóa ở tiến trình khác
+        elif attempt or not resolver.sync_new():
+            # Trượt cả sau khi nạp nhà cung cấp do tiến trình khác vừa tạo → tạo mới
+            break
+
+    review = resolver.near_match(name, tax)
+    try:
+        with transaction.atomic():
+            supplier = Supplier.objects.create(name=name.strip()[:255], tax_id=tax)
+    except IntegrityError:
+        # MST đã có trong DB (tạo đồng thời ở tiến trình khác)
+        supplier = Supplier.objects.get(tax_id=tax)
+        resolver.add(supplier.id, supplier.name, supplier.tax_id)
+        return supplier, False, SupplierMatch(supplier.id, 1.0, 'tax_id')
+    return supplier, True, review
+
+
+def find_duplicate_suppliers(threshold=None):
+    """
+    🧹 Nhà cung cấp trùng đã có trong bảng (tạo bởi get_or_create theo tên OCR trước đây).
+    Mỗi nhà cung cấp được gộp vào nhà cung cấp có id nhỏ hơn khớp MST / tên, không gộp hai MST khác nhau.
+    Trả về {id trùng: id giữ lại}.
+    """
+    rows = list(Supplier.objects.order_by('id').values_list('id', 'name', 'tax_id'))
+    resolver = SupplierResolver(threshold).load(rows)
+    canonical, group_tax = {}, {}
+    for supplier_id, name, tax_id in rows:
+        tax = normalize_tax_id(tax_id)
+        target = resolver._by_tax_id.get(tax) if tax else None
+        if target is None or target >= supplier_id:
+            target = None
+            for candidate in resolver.candidates(normalize_supplier_name(name), limit=10):
+                if candidate.supplier_id < supplier_id:
+                    root = canonical.get(candidate.supplier_id, candidate.supplier_id)
+                    if not tax or group_tax.get(root) in (None, tax):
+                        target = candidate.supplier_id
+                        break
+        if target is None:
+            group_tax[supplier_id] = tax
+            continue
+        root = canonical.get(target, target)
+        canonical[supplier_id] = root
+        group_tax[root] = group_tax.get(root) or tax
+    return canonical
+
+
+def merge_suppliers(canonical):
+    """Chuyển hóa đơn của nhà cung cấp trùng sang nhà cung cấp giữ lại rồi xóa bản trùng. Trả về số hóa đơn chuyển."""
+    from .models import Invoice
+
+    groups = {}
+    for duplicate_id, keep_id in canonical.items():
+        groups.setdefault(keep_id, []).append(duplicate_id)
+
+    moved = 0
+    with transaction.atomic():
+        for keep_id, duplicate_ids in groups.items():
+            keep = Supplier.objects.select_for_update().get(id=keep_id)
+            moved += Invoice.objects.filter(supplier_id__in=duplicate_ids).update(supplier_id=keep_id)
+            duplicates = list(Supplier.objects.filter(id__in=duplicate_ids).order_by('id'))
+            tax = keep.tax_id or next((supplier.tax_id for supplier in duplicates if supplier.tax_id), None)
+            Supplier.objects.filter(id__in=duplicate_ids).delete()
+            if tax != keep.tax_id:
+                keep.tax_id = tax
+                keep.save(update_fields=['tax_id'])
+    return moved
+
+
+@receiver(post_save, sender=Supplier, dispatch_uid='supplier_resolver_save')
+def _supplier_saved(sender, instance, **kwargs):
+    if _resolver is not None:
+        _resolver.add(instance.id, instance.name, instance.tax_id)
+
+
+@receiver(post_delete, sender=Supplier, dispatch_uid='supplier_resolver_delete')
+def _supplier_deleted(sender, instance, **kwargs):
+    if _resolver is not None:
+        _resolver.remove(instance.id)
@@ -1,87 +1,148 @@
 # app_invoices/tasks.py
 
 from celery import shared_task
-from django.utils import timezone
-from django.db import transaction
-import os
-from .models import Invoice, InvoiceStatus, ActivityLog
-from .utils import extract_invoice_data
+from celery.signals import worker_process_init
+from django.conf import settings
+from .models import Invoice
+from .ocr_engine import preload_tesseract_engines
+from .pipeline import mark_pipeline_failed, run_invoice_pipeline, run_invoice_pipeline_batch
 
 
-@shared_task(bind=True, max_retries=3)
-def process_invoice_ocr(self, invoice_id):
-    """Task xử lý OCR cho hóa đơn, có retry và logging."""
+@worker_process_init.connect
+def preload_ocr_engine(**kwargs):
+    """Mỗi tiến trình worker nạp sẵn engine Tesseract (vie+eng) một lần khi khởi động."""
+    preload_tesseract_engines()
+
+
+@worker_process_init.connect
+def preload_ai_models(**kwargs):
+    """
+    Worker nạp sẵn các AI service trong AI_PRELOAD_SERVICES (import sklearn + load model),
+    web process thì không: service chỉ được khởi tạo ở lần dùng đầu tiên.
+    """
+    from .ai_services import preload_ai_services
+
+    names = getattr(settings, 'AI_PRELOAD_SERVICES', None)
+    if names:
+        preload_ai_services(names)
+
+
+@worker_process_init.connect
+def preload_supplier_resolver(**kwargs):
+    """Worker dựng sẵn chỉ mục nhà cung cấp để hóa đơn đầu tiên không phải chờ đọc cả bảng Supplier."""
+    from .supplier_resolver import get_supplier_resolver
+
+    get_supplier_resolver()
+
+
+def embed_processed_invoices(invoice_ids):
+    """
+    Embedding OCR text của hóa đơn vừa xử lý (một lần encode cho cả nhóm) cho tìm hóa đơn tương tự.
+    Lỗi embedding không làm hỏng kết quả OCR: hóa đơn được bổ sung sau bằng build_embedding_index --embed-missing.
+    """
+    from .embedding_index import EMBEDDINGS_AVAILABLE, embed_invoices
+
+    if not EMBEDDINGS_AVAILABLE or not invoice_ids:
+        return
     try:
-        # 1️⃣ Lấy hóa đơn từ DB (có kiểm tra tồn tại)
-        invoice = Invoice.objects.filter(id=invoice_id).first()
-        if not invoice:
-            print(f"[OCR] ❌ Không tìm thấy Invoice ID={invoice_id}")
-            return {"status": "error", "message": f"Invoice {invoice_id} not found"}
-
-        # 2️⃣ Cập nhật trạng thái bắt đầu OCR
-        invoice.status = InvoiceStatus.PROCESSING
-        invoice.ocr_start_time = timezone.now()
-        invoice.original_filename = os.path.basename(invoice.file.name or "")
-        invoice.save(update_fields=['status', 'ocr_start_time', 'original_filename'])
-
-        # Ghi nhật ký hoạt động
-        ActivityLog.objects.create(
-            invoice=invoice,
-            action="OCR_STARTED",
-            details={"filename": invoice.original_filename}
-        )
-
-        # 3️⃣ Thực hiện OCR & trích xuất dữ liệu
-        extracted_data = extract_invoice_data(invoice.file.path)
-
-        # 4️⃣ Cập nhật dữ liệu vào DB trong transaction
-        with transaction.atomic():
-            invoice.invoice_number = extracted_data.get('number')
-            invoice.issue_date = extracted_data.get('date')
-            invoice.total_amount = extracted_data.get('total')
-            invoice.tax_amount = extracted_data.get('tax')
-            invoice.raw_ocr_text = extracted_data.get('raw_text')
-
-            # ✅ Nếu OCR thành công
-            if invoice.invoice_number and invoice.total_amount:
-                invoice.status = InvoiceStatus.OCR_PROCESSED
-                ActivityLog.objects.create(
-                    invoice=invoice,
-                    action="OCR_COMPLETED",
-                    details={
-                        "number": invoice.invoice_number,
-                        "total": str(invoice.total_amount)
-                    }
-                )
-                result_msg = f"OCR success for {invoice.invoice_number}"
-
-            # ❌ Nếu thiếu dữ liệu chính
-            else:
-                invoice.status = InvoiceStatus.REJECTED
-                ActivityLog.objects.create(
-                    invoice=invoice,
-                    action="OCR_FAILED",
-                    details={"error": "Missing key fields after parsing."}
-                )
-                result_msg = "Missing key fields after OCR"
-
-            invoice.ocr_end_time = timezone.now()
-            invoice.save()
-
-        print(f"[OCR] ✅ Hoàn tất: {result_msg}")
-        return {"status": "success", "message": result_msg}
+        embed_invoices(invoice_ids)
+    except Exception as exc:
+        print(f"[EMBED] ⚠️ Không tính được embedding cho {len(invoice_ids)} hóa đơn: {exc}")
+
 
+@shared_task(bind=True, max_retries=3, ignore_result=True)
+def process_invoice_ocr(self, invoice_id, from_stage=None):
+    """
+    Task Celery chạy pipeline OCR + AI cho hóa đơn.
+    Được đưa vào hàng đợi từ API upload / rerun_ocr / ocr-async nên request web
+    trả về ngay (202) thay vì giữ worker trong suốt thời gian OCR.
+    Trạng thái job được đọc từ Invoice (ocr_job_id) nên không cần lưu result.
+    Khi retry, pipeline tiếp tục từ bước bị lỗi (checkpoint) nên không OCR lại.
+    Hóa đơn giữ OCR_PROCESSING qua các lần retry, chỉ chuyển OCR_FAILED khi lần thử cuối cũng lỗi.
+    """
+    if not Invoice.objects.filter(id=invoice_id).exists():
+        print(f"[OCR] ❌ Không tìm thấy Invoice ID={invoice_id}")
+        return {"status": "error", "message": f"Invoice {invoice_id} not found"}
+
+    try:
+        run_invoice_pipeline(invoice_id, from_stage=from_stage)
     except Exception as exc:
-        # 5️⃣ Xử lý lỗi chung và retry nếu có thể
-        if 'invoice' in locals() and invoice:
-            invoice.status = InvoiceStatus.INTEGRATION_ERROR
-            invoice.ocr_end_time = timezone.now()
-            invoice.save(update_fields=['status', 'ocr_end_time'])
-            ActivityLog.objects.create(
-                invoice=invoice,
-                action="SYSTEM_ERROR",
-                details={"error": str(exc), "attempt": self.request.retries + 1}
-            )
-
-        # Cho phép retry nếu lỗi là tạm thời
-        raise self.retry(exc=exc, countdown=60)
+        if self.request.retries >= self.max_retries:
+            mark_pipeline_failed(invoice_id)
+            print(f"[OCR] ❌ Hóa đơn ID={invoice_id} lỗi sau {self.request.retries + 1} lần thử: {exc}")
+            raise
+        # Cho phép retry nếu lỗi là tạm thời (DB lock, AI service, file chưa sẵn sàng...)
+        # Retry không truyền lại from_stage để tiếp tục từ checkpoint thay vì chạy lại từ đầu
+        raise self.retry(args=[invoice_id], kwargs={}, exc=exc, countdown=60)
+
+    embed_processed_invoices([invoice_id])
+    invoice_status = Invoice.objects.filter(id=invoice_id).values_list('status', flat=True).first()
+    print(f"[OCR] ✅ Hoàn tất hóa đơn ID={invoice_id}: {invoice_status}")
+    return {"status": "success", "invoice_id": invoice_id, "invoice_status": invoice_status}
+
+
+@shared_task(ignore_result=True)
+def process_invoice_ocr_batch(invoice_ids):
+    """
+    Task Celery xử lý OCR cho một nhóm hóa đơn của lô upload hàng loạt.
+    Mỗi nhóm là 1 message trên broker thay vì 1 message cho mỗi hóa đơn.
+    """
+    # Bước phân loại của cả nhóm chạy 1 lần (classify_batch) thay vì từng hóa đơn
+    errors = run_invoice_pipeline_batch(invoice_ids)
+    for invoice_id, exc in errors.items():
+        # Lỗi 1 hóa đơn không được làm dừng cả nhóm; task lô không retry nên lỗi là kết quả cuối
+        mark_pipeline_failed(invoice_id)
+        print(f"[OCR] ❌ Lỗi hóa đơn ID={invoice_id} trong lô: {exc}")
+    embed_processed_invoices([invoice_id for invoice_id in invoice_ids if invoice_id not in errors])
+    print(f"[OCR] ✅ Hoàn tất nhóm {len(invoice_ids)} hóa đơn")
+
+
+@shared_task(ignore_result=True, acks_late=False)
+def train_ai_model(job_id):
+    """
+    Task Celery huấn luyện AI model (hàng đợi 'training').
+    Tiến độ, log và kết quả được ghi vào AITrainingJob; không retry vì job dài
+    và có thể đã bị hủy - người dùng tạo job mới nếu cần.
+    """
+    from .training_jobs import run_training_job
+
+    job = run_training_job(job_id)
+    job.refresh_from_db(fields=['status'])
+    print(f"[TRAIN] Job {job_id} kết thúc: {job.status}")
+
+
+@shared_task(ignore_result=True)
+def rebuild_embedding_index():
+    """
+    Task Celery (hàng đợi 'training', beat chạy mỗi giờ - CELERY_BEAT_SCHEDULE) ghi ảnh chụp chỉ mục embedding mới:
+    vector tạo sau ảnh chụp cũ đang được đọc thêm từ DB ở mỗi tiến trình tìm kiếm.
+    """
+    from .embedding_index import build_embedding_snapshot
+
+    record = build_embedding_snapshot()
+    if record:
+        print(f"[EMBED] ✅ Chỉ mục embedding phiên bản {record.version}: {record.training_data_count} hóa đơn")
+
+
+@shared_task(ignore_result=True)
+def sync_erp_mirror(full=False):
+    """
+    Task Celery (beat chạy mỗi 5 phút - CELERY_BEAT_SCHEDULE) đồng bộ delta nhà cung cấp + PO đang mở từ ERP vào
+    bản sao cục bộ mà đối chiếu hóa đơn truy vấn; mỗi lần chỉ lấy bản ghi sửa sau mốc high-water.
+    `full=True` (lịch hằng ngày) đọc lại toàn bộ và xóa bản ghi ERP không còn trả về.
+    """
+    from .erp_mirror import sync_erp_mirror as run_sync
+
+    summary = run_sync(full=full)
+    print(f"[ERP] ✅ Đồng bộ bản sao ERP: {summary}")
+
+
+@shared_task(ignore_result=True)
+def drain_erp_outbox():
+    """
+    Task Celery (hàng đợi 'erp', 1 worker) gửi sự kiện outbox ERP theo lô. Được gọi sau khi transaction
+    phê duyệt / đối chiếu commit; sự kiện của lần gọi lỗi vẫn nằm trong outbox chờ lần drain sau.
+    """
+    from .erp_outbox import drain_outbox
+
+    drain_outbox()
@@ -0,0 +1,1179 @@
+# app_invoices/tests.py
+"""
+🧪 Unit test app_invoices
+
+    python manage.py test invoice_processing_system.app_invoices
+"""
+
+import os
+import json
+import random
+import shutil
+import asyncio
+import tempfile
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import chat_backends, erp_client, model_registry, pipeline, utils
+from .models import (
+    AIChatMessage, AIModelTraining, ERPIntegrationConfig, ERPOutboxEvent, ERPPurchaseOrder, ERPSyncState, ERPVendor, Invoice,
+    InvoicePipelineCheckpoint, InvoiceStatus, MatchingRule, OCRResultCache, OutboxStatus, Supplier,
+)
+from .ocr_cache import engine_key, evict_ocr_cache, get_cached_ocr, store_ocr_result
+from .matching_rules import (
+    DEFAULT_RULES, CompiledRuleSet, MatchFacts, RuleSyntaxError, compile_rule, get_rule_engine,
+    normalize_invoice_number,
+)
+from .line_matching import (
+    INVOICE_LINE_KEYS, PO_LINE_KEYS, line_arrays, line_cost_matrix, match_line_items, received_quantities,
+)
+from .erp_client import CircuitBreaker, CircuitOpenError, backoff_delay, post_records, push_invoices
+from .erp_stub import ERPStubData, ERPStubServer
+from .erp_mirror import (
+    ERPMirrorClient, find_purchase_order_candidates, mirror_ready, sync_erp_mirror, sync_resource,
+)
+from .erp_outbox import (
+    INVOICE_APPROVED, INVOICE_MATCHED, _supersede, claim_events, deliver_events, drain_outbox, record_invoice_event,
+)
+from .fraud_batch import INDICATOR_COLUMNS, indicators_for, score_fraud_frame
+from .supplier_resolver import (
+    SupplierResolver, normalize_supplier_name, normalize_tax_id, reset_supplier_resolver, resolve_supplier,
+)
+from .duplicate_index import compute_minhash, find_near_duplicates, index_invoice_texts, signature_similarity
+from .chat_backends import ChatReply, LocalChatBackend, is_cacheable_question, normalize_question
+
+
+def facts(**values):
+    """MatchFacts mặc định khớp nhau giữa hai phía, ghi đè từng trường theo test."""
+    fields = dict(invoice_number='HD-00123', supplier_tax_id='0101234567', supplier_name='Công ty TNHH ABC',
+                  total_amount=1_000_000, issue_date='2025-03-10')
+    fields.update(values)
+    return MatchFacts(**fields)
+
+
+class MatchingRuleDSLTests(SimpleTestCase):
+    """🧮 matching_rules: cú pháp DSL, quy tắc đầu tiên khớp, biên dung sai"""
+
+    def test_parse_clauses_comments_and_separators(self):
+        rule = compile_rule(
+            "Invoice_Number   EQUAL   # số hóa đơn\n"
+            "supplier equal; amount within 0.5%\n"
+            "date within 3 days and score 0.9",
+            priority=2, rule_id=7,
+        )
+        self.assertEqual((rule.priority, rule.score, rule.rule_id), (2, 0.9, 7))
+        self.assertTrue(rule.predicate(facts(), facts()))
+        self.assertFalse(rule.predicate(facts(invoice_number='HD-124'), facts()))
+
+    def test_default_score_and_empty_rule(self):
+        rule = compile_rule("# chỉ có chú thích\n\n")
+        self.assertEqual(rule.score, 1.0)
+        self.assertTrue(rule.predicate(facts(), facts(total_amount=None)))
+
+    def test_syntax_errors(self):
+        for logic in ("amount roughly equal", "date within 3 weeks", "amount within -1%", "score 1.5", "drop table"):
+            with self.subTest(logic=logic), self.assertRaises(RuleSyntaxError):
+                compile_rule(logic)
+        self.assertTrue(issubclass(RuleSyntaxError, ValueError))
+
+    def test_invalid_rule_skipped_in_rule_set(self):
+        rules = CompiledRuleSet.from_rows([(1, 1, "amount sort of equal"), (2, 2, "supplier equal\nscore 0.6")])
+        self.assertEqual(len(rules), 1)
+        self.assertEqual(rules.rules[0].rule_id, 2)
+
+    def test_first_matching_rule_by_priority(self):
+        rules = CompiledRuleSet([
+            compile_rule("supplier equal\nscore 0.7", priority=3),
+            compile_rule("invoice_number equal\nsupplier equal\nscore 0.95", priority=1),
+            compile_rule("supplier equal\nscore 0.8", priority=2),
+        ])
+        self.assertEqual([rule.priority for rule in rules.rules], [1, 2, 3])
+        self.assertEqual(rules.evaluate(facts(), facts()).score, 0.95)
+        # Quy tắc 1 sai → dừng ở quy tắc 2 (cũng khớp quy tắc 3 nhưng không xét tới)
+        self.assertEqual(rules.evaluate(facts(invoice_number='X1'), facts()).score, 0.8)
+        self.assertIsNone(rules.evaluate(facts(supplier_tax_id='0109999999'), facts()))
+        pairs = [(facts(), facts()), (facts(supplier_tax_id='0109999999'), facts())]
+        self.assertEqual([rule and rule.priority for rule in rules.evaluate_many(pairs)], [1, None])
+
+    def test_amount_tolerance_edges(self):
+        percent = compile_rule("amount within 0.5%").predicate
+        self.assertTrue(percent(facts(total_amount=1_005_000), facts()))
+        self.assertTrue(percent(facts(total_amount=995_000), facts()))
+        self.assertFalse(percent(facts(total_amount=1_005_001), facts()))
+        self.assertFalse(percent(facts(total_amount=None), facts()))
+
+        absolute = compile_rule("amount within 50000").predicate
+        self.assertTrue(absolute(facts(total_amount=1_050_000), facts()))
+        self.assertFalse(absolute(facts(total_amount=1_050_001), facts()))
+
+        exact = compile_rule("amount equal").predicate
+        self.assertTrue(exact(facts(total_amount='1000000.00'), facts()))
+        self.assertFalse(exact(facts(total_amount=1_000_001), facts()))
+
+    def test_date_tolerance_edges(self):
+        within = compile_rule("date within 3 ngày").predicate
+        self.assertTrue(within(facts(issue_date='13/03/2025'), facts()))
+        self.assertTrue(within(facts(issue_date='2025-03-07'), facts()))
+        self.assertFalse(within(facts(issue_date='14/03/2025'), facts()))
+        self.assertFalse(within(facts(issue_date='31/02/2025'), facts()))
+
+        same_day = compile_rule("date equal").predicate
+        self.assertTrue(same_day(facts(issue_date='10/03/2025'), facts()))
+        self.assertFalse(same_day(facts(issue_date='11/03/2025'), facts()))
+
+    def test_supplier_tax_id_before_name(self):
+        supplier = compile_rule("supplier equal").predicate
+        self.assertTrue(supplier(facts(supplier_name='Cty ABC'), facts()))
+        self.assertFalse(supplier(facts(supplier_tax_id='0109999999'), facts()))
+        # Một phía thiếu MST → so tên lõi (bỏ dấu, loại hình doanh nghiệp)
+        self.assertTrue(supplier(facts(supplier_tax_id=None, supplier_name='CONG TY CP ABC'), facts()))
+        self.assertFalse(supplier(facts(supplier_tax_id=None, supplier_name='Công ty XYZ'), facts()))
+
+    def test_normalize_invoice_number(self):
+        self.assertEqual(normalize_invoice_number('HD-00123'), normalize_invoice_number('hd 123'))
+        self.assertEqual(normalize_invoice_number('0O12l'), '121')
+        self.assertIsNone(normalize_invoice_number(None))
+
+
+class RuleEngineTests(TestCase):
+    """🧮 get_rule_engine: quy tắc mặc định, biên dịch lại khi bảng MatchingRule đổi"""
+
+    def test_defaults_then_recompile_on_change(self):
+        engine = get_rule_engine()
+        self.assertEqual([rule.priority for rule in engine.rules], [priority for priority, _ in DEFAULT_RULES])
+        self.assertIs(get_rule_engine(), engine)
+
+        rule = MatchingRule.objects.create(priority=10, rule_logic="supplier equal\nscore 0.5")
+        engine = get_rule_engine()
+        self.assertEqual([(r.rule_id, r.score) for r in engine.rules], [(rule.id, 0.5)])
+
+        rule.is_active = False
+        rule.save()
+        self.assertEqual(len(get_rule_engine()), len(DEFAULT_RULES))
+
+
+def po_line(line_no, description, quantity, unit_price, **extra):
+    return dict(line_no=line_no, description=description, quantity=quantity, unit_price=unit_price,
+                amount=quantity * unit_price, **extra)
+
+
+def invoice_line(name, quantity, price):
+    return {'name': name, 'quantity': quantity, 'price': price, 'total': quantity * price}
+
+
+class LineMatchingTests(SimpleTestCase):
+    """📦 line_matching: ghép tối ưu (Hungarian) vs tham lam, dòng thừa / thiếu, phiếu nhập"""
+
+    def test_optimal_assignment_beats_greedy(self):
+        # A khớp hoàn hảo P nhưng vẫn ghép được Q; B chỉ ghép được P (tên quá khác Q).
+        # Tham lam lấy (A, P) rẻ nhất trước → B và Q mồ côi; ghép tối ưu chọn (A, Q) + (B, P).
+        po_lines = [po_line(1, "Giấy in A4 Double A", 10, 100_000), po_line(2, "Double A", 10, 100_000)]
+        invoice_lines = [invoice_line("Giấy in A4 Double A", 10, 100_000), invoice_line("Giấy in A4", 10, 100_000)]
+
+        max_cost = np.float32(0.35)
+        invoice, purchase_order = line_arrays(invoice_lines, INVOICE_LINE_KEYS), line_arrays(po_lines, PO_LINE_KEYS)
+        cost, _ = line_cost_matrix(invoice, purchase_order, max_cost=max_cost)
+        self.assertLess(cost[0, 0], cost[1, 0])
+        self.assertLess(cost[0, 1], max_cost)
+        self.assertEqual(cost[1, 1], max_cost)
+        greedy, used_invoice, used_po = {}, set(), set()
+        for _, i, j in sorted((cost[i, j], i, j) for i in range(2) for j in range(2) if cost[i, j] < max_cost):
+            if i not in used_invoice and j not in used_po:
+                used_invoice.add(i), used_po.add(j)
+                greedy[i] = j
+        self.assertEqual(greedy, {0: 0})
+
+        result = match_line_items(invoice_lines, po_lines, max_cost=max_cost)
+        self.assertEqual({line['invoice_line']: line['po_line_no'] for line in result['lines']}, {1: 2, 2: 1})
+        self.assertEqual((result['not_on_po'], result['not_invoiced']), ([], []))
+        self.assertEqual(result['matched'], 2)
+        self.assertGreater(result['match_score'], 1 - 0.35)
+
+    def test_not_on_po_and_not_invoiced(self):
+        po_lines = [po_line(1, "Mực in HP 12A", 2, 1_500_000), po_line(2, "Ghế xoay văn phòng", 4, 900_000)]
+        invoice_lines = [invoice_line("MUC IN HP 12A", 2, 1_500_000), invoice_line("Laptop Dell Latitude", 1, 20_000_000)]
+        result = match_line_items(invoice_lines, po_lines)
+
+        [line] = result['lines']
+        self.assertEqual((line['invoice_line'], line['po_line_no'], line['status']), (1, 1, 'matched'))
+        self.assertEqual(line['score'], 1.0)
+        self.assertEqual(result['not_on_po'], [
+            {'invoice_line': 2, 'description': "Laptop Dell Latitude", 'amount': 20_000_000.0, 'status': 'not_on_po'}
+        ])
+        self.assertEqual(result['not_invoiced'], [
+            {'po_line_no': 2, 'description': "Ghế xoay văn phòng", 'amount': 3_600_000.0, 'status': 'not_invoiced'}
+        ])
+        # Điểm theo thành tiền: chỉ 2 × 3.000.000 trên tổng 3.000.000 + 20.000.000 + 3.000.000 + 3.600.000 khớp
+        self.assertAlmostEqual(result['match_score'], 6_000_000 / 29_600_000, places=4)
+
+    def test_quantity_and_price_tolerance(self):
+        po_lines = [po_line(1, "Cáp mạng Cat6", 10, 50_000), po_line(2, "Chuột không dây Logitech", 5, 300_000)]
+        invoice_lines = [invoice_line("Cáp mạng Cat6", 10, 50_500), invoice_line("Chuột không dây Logitech", 6, 300_000)]
+        lines = {line['po_line_no']: line for line in match_line_items(invoice_lines, po_lines)['lines']}
+        # Lệch đơn giá 1% = LINE_MATCH_PRICE_TOLERANCE vẫn khớp; lệch 1 đơn vị số lượng (dung sai 0) → variance
+        self.assertEqual((lines[1]['status'], lines[1]['price_variance']), ('matched', 500.0))
+        self.assertEqual((lines[2]['status'], lines[2]['quantity_variance']), ('variance', 1.0))
+        self.assertEqual(lines[2]['amount_variance'], 300_000.0)
+
+    def test_three_way_with_receipts(self):
+        po_lines = [po_line(1, "Bàn làm việc", 4, 2_000_000), po_line(2, "Ghế xoay văn phòng", 4, 900_000)]
+        invoice_lines = [invoice_line("Bàn làm việc", 4, 2_000_000), invoice_line("Ghế xoay văn phòng", 4, 900_000)]
+        receipts = [{'line_no': 1, 'quantity': 2}, {'line_no': 1, 'quantity': 2}, {'line_no': 2, 'quantity': 3},
+                    {'line_no': 99, 'quantity': 5}]
+        result = match_line_items(invoice_lines, po_lines, receipts=receipts)
+        lines = {line['po_line_no']: line for line in result['lines']}
+        self.assertEqual((lines[1]['received_quantity'], lines[1]['status']), (4.0, 'matched'))
+        self.assertEqual((lines[2]['receipt_variance'], lines[2]['status']), (1.0, 'variance'))
+        # Chênh lệch phiếu nhập không trừ điểm khớp hóa đơn ↔ PO
+        self.assertEqual(result['match_score'], 1.0)
+
+        self.assertIsNone(received_quantities(po_lines))
+        self.assertEqual(received_quantities([dict(po_lines[0], received_quantity=3)]).tolist(), [3.0])
+
+    def test_empty_sides(self):
+        po_lines = [po_line(1, "Nước uống đóng chai", 10, 5_000)]
+        result = match_line_items([], po_lines)
+        self.assertEqual((result['lines'], result['match_score'], len(result['not_invoiced'])), ([], 0.0, 1))
+        result = match_line_items([invoice_line("Nước uống đóng chai", 10, 5_000)], [])
+        self.assertEqual((result['matched'], len(result['not_on_po'])), (0, 1))
+
+
+class FakeClock:
+    """Đồng hồ điều khiển bằng tay cho CircuitBreaker."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """⚡ erp_client.CircuitBreaker: closed → open → half-open → closed / open; backoff có jitter"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = self.breaker
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()  # thành công xen giữa → đếm lại từ đầu
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.allow()), (CircuitBreaker.CLOSED, True))
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.retry_after, 30)
+        self.clock.now += 12
+        self.assertEqual(breaker.retry_after, 18)
+
+    def test_half_open_allows_single_probe(self):
+        breaker = self.breaker
+        for _ in range(3):
+            breaker.record_failure()
+        self.clock.now += 29.9
+        self.assertFalse(breaker.allow())
+        self.clock.now += 0.1
+        self.assertTrue(breaker.allow())
+        self.assertEqual((breaker.state, breaker.retry_after), (CircuitBreaker.HALF_OPEN, 0.0))
+        self.assertFalse(breaker.allow())  # request thử đang chạy
+
+        breaker.record_success()
+        self.assertEqual((breaker.state, breaker.failures), (CircuitBreaker.CLOSED, 0))
+        self.assertTrue(breaker.allow() and breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = self.breaker
+        for _ in range(3):
+            breaker.record_failure()
+        self.clock.now += 30
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()  # một lỗi ở half-open là mở lại, không chờ đủ ngưỡng
+        self.assertEqual((breaker.state, breaker.opened_at), (CircuitBreaker.OPEN, self.clock.now))
+        self.assertEqual(breaker.retry_after, 30)
+        self.assertFalse(breaker.allow())
+        self.clock.now += 30
+        self.assertTrue(breaker.allow())
+
+    def test_backoff_delay_full_jitter(self):
+        rng = random.Random(7)
+        for attempt in range(8):
+            ceiling = min(5.0, 0.2 * 2 ** attempt)
+            delays = [backoff_delay(attempt, base=0.2, cap=5.0, rng=rng) for _ in range(200)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays), attempt)
+            self.assertGreater(max(delays), ceiling * 0.9)
+            self.assertLess(min(delays), ceiling * 0.1)
+
+        class Upper:
+            @staticmethod
+            def uniform(low, high):
+                return high
+
+        with override_settings(ERP_PUSH_BACKOFF_BASE=0.5, ERP_PUSH_BACKOFF_MAX=3.0):
+            self.assertEqual([backoff_delay(attempt, rng=Upper) for attempt in range(4)], [0.5, 1.0, 2.0, 3.0])
+
+
+@override_settings(ERP_PUSH_MAX_RETRIES=0, ERP_BREAKER_FAILURE_THRESHOLD=2, ERP_BREAKER_RESET_TIMEOUT=60)
+class CircuitBreakerPushTests(TestCase):
+    """⚡ Mạch mở thì lô gửi ERP thất bại ngay, không gọi HTTP"""
+
+    def setUp(self):
+        erp_client._breakers.clear()
+        self.server = ERPStubServer(ERPStubData()).start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(erp_client.close_push_clients)
+        self.config = ERPIntegrationConfig.objects.create(system_name="ERP test", api_url=self.server.url, api_key='')
+
+    def test_open_circuit_skips_http(self):
+        records = [{'reference': '1', 'total_amount': '100'}]
+        self.server.outage = True
+        for _ in range(2):
+            outcomes, requests = post_records(records, config=self.config)
+            self.assertEqual(requests, 1)
+            self.assertTrue(outcomes['1'][1].retryable)
+        outcomes, requests = post_records(records, config=self.config)
+        self.assertEqual((requests, self.server.requests), (0, 2))
+        self.assertIsInstance(outcomes['1'][1], CircuitOpenError)
+
+        # ERP sống lại + hết reset_timeout → request thử thành công đóng mạch
+        self.server.outage = False
+        breaker = erp_client.get_circuit_breaker(self.config, erp_client.DEFAULT_ENDPOINT)
+        breaker.opened_at -= 60
+        outcomes, requests = post_records(records, config=self.config)
+        self.assertEqual((requests, outcomes['1']), (1, ('AP00000001', None)))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_push_outcome_keeps_invoice_status(self):
+        invoices = [Invoice.objects.create(invoice_number=f"HD-{status}", total_amount=100, status=status)
+                    for status in (InvoiceStatus.MATCHED, InvoiceStatus.REJECTED)]
+        queryset = Invoice.objects.filter(id__in=[invoice.id for invoice in invoices])
+
+        self.server.outage = True
+        self.assertEqual(push_invoices(queryset, config=self.config).failed, 2)
+        for invoice, status in zip(queryset.order_by('id'), (InvoiceStatus.MATCHED, InvoiceStatus.REJECTED)):
+            self.assertEqual(invoice.status, status)
+            self.assertIn("503", invoice.erp_error)
+            self.assertIsNone(invoice.erp_posted_at)
+
+        # Gửi lại được: ghi mã chứng từ, xóa lỗi, KHÔNG tự chuyển sang APPROVED
+        self.server.outage = False
+        self.assertEqual(push_invoices(queryset, config=self.config).posted, 2)
+        for invoice, status in zip(queryset.order_by('id'), (InvoiceStatus.MATCHED, InvoiceStatus.REJECTED)):
+            self.assertEqual((invoice.status, invoice.erp_error), (status, ''))
+            self.assertTrue(invoice.erp_document_id and invoice.erp_posted_at)
+
+
+class ERPOutboxTests(TestCase):
+    """📮 erp_outbox: nhận sự kiện có lease, bỏ sự kiện cũ, gửi lại idempotent sau khi worker chết"""
+
+    def setUp(self):
+        erp_client._breakers.clear()
+        self.server = ERPStubServer(ERPStubData()).start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(erp_client.close_push_clients)
+        self.config = ERPIntegrationConfig.objects.create(system_name="ERP test", api_url=self.server.url, api_key='')
+        self.first, self.second = [
+            Invoice.objects.create(invoice_number=f"HD-{i}", total_amount=1_000_000 * i, status=InvoiceStatus.MATCHED)
+            for i in (1, 2)
+        ]
+
+    def event(self, invoice, event_type=INVOICE_MATCHED, status=None):
+        if status:
+            invoice.status = status
+            invoice.save(update_fields=['status'])
+        return record_invoice_event(invoice, event_type)
+
+    def test_claim_takes_newer_events_of_invoice_and_skips_leased(self):
+        old = self.event(self.first)
+        newer = self.event(self.first, INVOICE_APPROVED, InvoiceStatus.APPROVED)
+        other = self.event(self.second)
+        newer.available_at = timezone.now() + timedelta(hours=1)  # chưa đến hạn vẫn được nhận cùng hóa đơn
+        newer.save(update_fields=['available_at'])
+
+        token, events = claim_events(batch_size=1)
+        self.assertEqual([event.id for event in events], [old.id, newer.id])
+        self.assertTrue(all(event.locked_until > timezone.now() for event in events))
+
+        # Worker khác: hóa đơn 1 đang bị giữ → bỏ qua cả sự kiện mới ghi sau khi nhận
+        late = self.event(self.first)
+        other_token, other_events = claim_events()
+        self.assertNotEqual(other_token, token)
+        self.assertEqual([event.id for event in other_events], [other.id])
+        self.assertEqual(claim_events(), (None, []))
+        self.assertEqual(ERPOutboxEvent.objects.get(id=late.id).claim_token, '')
+
+    def test_expired_lease_is_claimed_again(self):
+        event = self.event(self.first)
+        now = timezone.now()
+        token, _ = claim_events(lease=60, now=now)
+        self.assertEqual(claim_events(now=now + timedelta(seconds=59)), (None, []))
+        new_token, events = claim_events(now=now + timedelta(seconds=60))
+        self.assertNotEqual(new_token, token)
+        self.assertEqual([claimed.id for claimed in events], [event.id])
+
+    def test_supersede_keeps_latest_event_per_invoice(self):
+        old = self.event(self.first)
+        latest = self.event(self.first, INVOICE_APPROVED, InvoiceStatus.APPROVED)
+        other = self.event(self.second)
+        token, events = claim_events()
+
+        kept, superseded = _supersede(token, events)
+        self.assertEqual(([event.id for event in kept], superseded), ([latest.id, other.id], 1))
+        old.refresh_from_db()
+        self.assertEqual((old.status, old.claim_token, old.locked_until), (OutboxStatus.SUPERSEDED, '', None))
+        # Token cũ (lease đã bị worker khác lấy) không đổi được dòng nào
+        self.assertEqual(_supersede('other-token', events)[1], 0)
+
+    def test_redelivery_after_worker_crash_is_idempotent(self):
+        event = self.event(self.first, INVOICE_APPROVED, InvoiceStatus.APPROVED)
+
+        # Worker A gửi xong nhưng chết trước khi ghi kết quả; lease hết hạn ngay (lease=0)
+        token, events = claim_events(lease=0)
+        kept, _ = _supersede(token, events)
+        records = [dict(e.payload, reference=str(e.invoice_id), idempotency_key=f"outbox-{e.id}") for e in kept]
+        outcomes, _ = post_records(records, config=self.config)
+        erp_id = outcomes[str(self.first.id)][0]
+        self.assertEqual(self.server.data.applied, 1)
+
+        # Worker B nhận lại cùng sự kiện và gửi lại cùng khóa idempotent → ERP không ghi lần hai
+        totals = drain_outbox(self.config)
+        self.assertEqual((totals['delivered'], self.server.data.applied, self.server.data.duplicates), (1, 1, 1))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.erp_document_id, event.claim_token), (OutboxStatus.DELIVERED, erp_id, ''))
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.erp_document_id, self.first.status), (erp_id, InvoiceStatus.APPROVED))
+
+        # Kết quả đến muộn của worker A (token đã mất) không ghi đè
+        self.assertEqual(deliver_events(token, kept, self.config)['delivered'], 0)
+        self.assertEqual(ERPOutboxEvent.objects.get(id=event.id).attempts, 1)
+        self.assertEqual(drain_outbox(self.config), {})
+
+
+    @override_settings(ERP_PUSH_MAX_RETRIES=0, ERP_OUTBOX_MAX_ATTEMPTS=2)
+    def test_transient_failures_stay_on_outbox_row(self):
+        event = self.event(self.first)
+        self.server.outage = True
+        self.assertEqual(drain_outbox(self.config)['retried'], 1)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxStatus.PENDING, 1))
+        self.assertIn("503", event.last_error)
+        self.assertGreater(event.available_at, timezone.now())
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.status, self.first.erp_error), (InvoiceStatus.MATCHED, ''))
+
+        # Người dùng đổi trạng thái trong lúc chờ; lần thử cuối thất bại → FAILED, hóa đơn nhận erp_error
+        Invoice.objects.filter(id=self.first.id).update(status=InvoiceStatus.REJECTED)
+        ERPOutboxEvent.objects.filter(id=event.id).update(available_at=timezone.now())
+        self.assertEqual(drain_outbox(self.config)['failed'], 1)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxStatus.FAILED, 2))
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, InvoiceStatus.REJECTED)
+        self.assertIn("503", self.first.erp_error)
+
+    @override_settings(ERP_PUSH_MAX_RETRIES=0, ERP_BREAKER_FAILURE_THRESHOLD=1, ERP_BREAKER_RESET_TIMEOUT=60)
+    def test_open_circuit_retries_later_without_touching_invoice(self):
+        self.server.outage = True
+        post_records([{'reference': 'x', 'total_amount': '1'}], config=self.config)  # mở mạch
+        requests = self.server.requests
+        event = self.event(self.second)
+        self.assertEqual(drain_outbox(self.config)['retried'], 1)
+        self.assertEqual(self.server.requests, requests)
+        event.refresh_from_db()
+        self.assertIn("ngắt mạch", event.last_error)
+        self.assertGreater(event.available_at, timezone.now() + timedelta(seconds=50))
+        self.second.refresh_from_db()
+        self.assertEqual((self.second.status, self.second.erp_error), (InvoiceStatus.MATCHED, ''))
+
+class ERPMirrorSyncTests(TestCase):
+    """🪞 erp_mirror ↔ erp_stub: phân trang + chạy tiếp từ mốc high-water, upsert, full sync xóa bản ghi đã bỏ"""
+
+    def setUp(self):
+        self.data = ERPStubData.generate(vendors=30, orders=50, lines=(1, 2), seed=1)
+        self.server = ERPStubServer(self.data).start()
+        self.addCleanup(self.server.stop)
+        self.config = ERPIntegrationConfig.objects.create(system_name="ERP mirror", api_url=self.server.url, api_key='')
+        self.mirror_client = ERPMirrorClient(self.config, page_size=10)
+        self.addCleanup(self.mirror_client.close)
+
+    def test_interrupted_sync_resumes_from_high_water(self):
+        def stop_after_two_pages(resource, received):
+            if received >= 20:
+                raise RuntimeError("worker bị dừng")
+
+        with self.assertRaises(RuntimeError):
+            sync_resource(self.config, 'vendors', self.mirror_client, progress=stop_after_two_pages)
+        state = ERPSyncState.objects.get(config=self.config, resource='vendors')
+        self.assertEqual((state.high_water_id, state.last_error), ('V000020', 'worker bị dừng'))
+        self.assertIsNone(state.last_synced_at)
+        self.assertEqual(ERPVendor.objects.count(), 20)
+
+        # Lần sau chỉ nhận trang chưa ghi, rồi chỉ nhận bản ghi sửa sau mốc
+        self.assertEqual(sync_resource(self.config, 'vendors', self.mirror_client), 10)
+        self.data.touch('vendors', 3, seed=2, name="Công ty Cổ phần Đổi Tên")
+        self.assertEqual(sync_resource(self.config, 'vendors', self.mirror_client), 3)
+        self.assertEqual(sync_resource(self.config, 'vendors', self.mirror_client), 0)
+
+        state.refresh_from_db()
+        self.assertEqual((state.record_count, state.last_error), (30, ''))
+        self.assertEqual(ERPVendor.objects.filter(name="Công ty Cổ phần Đổi Tên").count(), 3)
+
+    def test_upsert_and_full_sync_delete(self):
+        self.assertFalse(mirror_ready())
+        summary = sync_erp_mirror(self.config, page_size=20)
+        self.assertEqual(summary["ERP mirror"], {'vendors': 30, 'purchase_orders': 50})
+        self.assertTrue(mirror_ready())
+        some_po = ERPPurchaseOrder.objects.select_related('vendor').first()
+        self.assertEqual(some_po.supplier_tax_id, some_po.vendor.tax_id)
+
+        closed = self.data.touch('purchase_orders', 5, seed=3, status='closed')
+        ERPPurchaseOrder.objects.create(
+            config=self.config, erp_id='PO-DA-XOA', po_number='PO-DA-XOA', total_amount=1000,
+            order_date=timezone.now().date(), erp_updated_at=timezone.now(),
+        )
+        self.assertEqual(sync_erp_mirror(self.config)["ERP mirror"], {'vendors': 0, 'purchase_orders': 5})
+        self.assertFalse(ERPPurchaseOrder.objects.filter(erp_id__in=closed, is_open=True).exists())
+        self.assertEqual(ERPPurchaseOrder.objects.count(), 51)
+
+        self.assertEqual(sync_erp_mirror(self.config, full=True)["ERP mirror"], {'vendors': 30, 'purchase_orders': 50})
+        self.assertFalse(ERPPurchaseOrder.objects.filter(erp_id='PO-DA-XOA').exists())
+        self.assertEqual(ERPPurchaseOrder.objects.count(), 50)
+
+    @override_settings(ERP_MIRROR_AMOUNT_WINDOW=0.05, ERP_MIRROR_DATE_WINDOW_DAYS=60)
+    def test_candidates_filter_by_amount_and_date_window(self):
+        vendor = ERPVendor.objects.create(config=self.config, erp_id='V1', name="Công ty TNHH ABC",
+                                          normalized_name=facts(supplier_name="Công ty TNHH ABC").supplier,
+                                          tax_id='0101234567', erp_updated_at=timezone.now())
+
+        def purchase_order(erp_id, amount, day, **fields):
+            return ERPPurchaseOrder.objects.create(
+                config=self.config, erp_id=erp_id, po_number=erp_id, vendor=vendor, supplier_tax_id='0101234567',
+                total_amount=amount, order_date=day, erp_updated_at=timezone.now(), **fields)
+
+        issued = date(2025, 3, 10)
+        purchase_order('TRONG', 1_040_000, issued - timedelta(days=60))
+        purchase_order('BIEN-TIEN', 950_000, issued)
+        purchase_order('LECH-TIEN', 1_060_000, issued)
+        purchase_order('LECH-NGAY', 1_000_000, issued + timedelta(days=61))
+        purchase_order('DA-DONG', 1_000_000, issued, status='closed', is_open=False)
+        ERPPurchaseOrder.objects.create(config=self.config, erp_id='KHAC-MST', po_number='KHAC-MST',
+                                        supplier_tax_id='0109999999', total_amount=1_000_000, order_date=issued,
+                                        erp_updated_at=timezone.now())
+
+        found = {po.erp_id for po in find_purchase_order_candidates(facts())}
+        self.assertEqual(found, {'TRONG', 'BIEN-TIEN'})
+        # Hóa đơn không có MST: tra MST theo tên lõi trong vendor master
+        self.assertEqual({po.erp_id for po in find_purchase_order_candidates(facts(supplier_tax_id=None))}, found)
+        self.assertEqual(find_purchase_order_candidates(facts(supplier_tax_id=None, supplier_name="Công ty XYZ")), [])
+        self.assertEqual(len(find_purchase_order_candidates(facts(), limit=1)), 1)
+
+
+class PipelineCheckpointTests(TestCase):
+    """🔁 pipeline: tiếp tục từ checkpoint, from_stage, trạng thái lỗi chỉ đặt khi hết lượt retry"""
+
+    def setUp(self):
+        self.invoice = Invoice.objects.create(invoice_number="HD-PIPE", total_amount=100)
+        self.calls = []
+        self.failing = {}
+        handlers = {stage: self._handler(stage) for stage in pipeline.PIPELINE_STAGES}
+        patcher = mock.patch.dict(pipeline.STAGE_HANDLERS, handlers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _handler(self, stage):
+        def handler(invoice, state):
+            self.calls.append(stage)
+            if self.failing.get(stage, 0) > 0:
+                self.failing[stage] -= 1
+                raise RuntimeError(f"{stage} lỗi")
+            return {'stage': stage, 'run': self.calls.count(stage)}
+        return handler
+
+    def checkpoint(self):
+        return InvoicePipelineCheckpoint.objects.get(invoice=self.invoice)
+
+    def test_failure_resumes_from_failed_stage(self):
+        self.failing['fraud'] = 1
+        with self.assertRaises(pipeline.PipelineStageError):
+            pipeline.run_invoice_pipeline(self.invoice.id)
+
+        checkpoint = self.checkpoint()
+        self.assertEqual((checkpoint.failed_stage, checkpoint.last_error), ('fraud', 'fraud lỗi'))
+        self.assertEqual(pipeline.pending_stages(checkpoint), ['fraud', 'prediction', 'persistence'])
+        # Lỗi một lần chạy không đổi trạng thái: task còn retry
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, InvoiceStatus.OCR_PROCESSING)
+
+        self.calls.clear()
+        pipeline.run_invoice_pipeline(self.invoice.id)
+        self.assertEqual(self.calls, ['fraud', 'prediction', 'persistence'])
+        checkpoint = self.checkpoint()
+        self.assertEqual((checkpoint.failed_stage, checkpoint.last_error), ('', ''))
+        self.assertEqual(pipeline.pending_stages(checkpoint), [])
+
+    def test_from_stage_drops_later_results(self):
+        pipeline.run_invoice_pipeline(self.invoice.id)
+
+        pipeline.run_invoice_pipeline(self.invoice.id, from_stage='classification')
+        self.assertEqual(self.calls[len(pipeline.PIPELINE_STAGES):], pipeline.PIPELINE_STAGES[2:])
+        state = pipeline.unpack_stage_data(self.checkpoint().data)
+        self.assertEqual(state['extraction']['run'], 1)
+        self.assertEqual(state['classification']['run'], 2)
+        self.assertEqual(pipeline.resolve_rerun_stage(self.invoice), 'ocr')
+
+        with self.assertRaises(ValueError):
+            pipeline.run_invoice_pipeline(self.invoice.id, from_stage='khong-co')
+
+    def test_stop_before_keeps_checkpoint(self):
+        pipeline.run_invoice_pipeline(self.invoice.id, stop_before='classification')
+        self.assertEqual(self.calls, ['ocr', 'extraction'])
+        self.assertIsNone(pipeline.resolve_rerun_stage(self.invoice))
+
+    def test_task_marks_failed_only_after_last_retry(self):
+        from .tasks import process_invoice_ocr
+
+        self.failing['extraction'] = process_invoice_ocr.max_retries
+        process_invoice_ocr.apply(args=[self.invoice.id])
+        self.invoice.refresh_from_db()
+        self.assertNotEqual(self.invoice.status, InvoiceStatus.OCR_FAILED)
+        self.assertEqual(self.calls.count('ocr'), 1)
+
+        self.failing['ocr'] = process_invoice_ocr.max_retries + 1
+        process_invoice_ocr.apply(args=[self.invoice.id], kwargs={'from_stage': 'ocr'})
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, InvoiceStatus.OCR_FAILED)
+        self.assertEqual(self.invoice.raw_ocr_text, "Lỗi AI OCR: ocr lỗi")
+
+
+class FailingVisionClient:
+    """Vision client luôn lỗi: buộc extract_invoice_data dùng Tesseract dự phòng."""
+
+    def document_text_detection(self, image):
+        raise RuntimeError("Vision quota")
+
+
+class OCRCacheTests(TestCase):
+    """🗃️ ocr_cache + extract_invoice_data: hit/miss theo engine, LRU, key theo engine thực sự chạy"""
+
+    def test_hit_and_miss_by_engine(self):
+        store_ocr_result('a' * 64, engine_key('tesseract'), "HĐ 001", {'number': '001'})
+
+        self.assertIsNone(get_cached_ocr('a' * 64, engine_key('vision')))
+        self.assertIsNone(get_cached_ocr('b' * 64, engine_key('tesseract')))
+        entry = get_cached_ocr('a' * 64, engine_key('tesseract'))
+        self.assertEqual((entry.raw_text, entry.parsed_data), ("HĐ 001", {'number': '001'}))
+        get_cached_ocr('a' * 64, engine_key('tesseract'))
+        self.assertEqual(OCRResultCache.objects.get().hit_count, 2)
+
+    def test_eviction_drops_least_recently_used(self):
+        now = timezone.now()
+        for i, key in enumerate('abc'):
+            store_ocr_result(key * 64, engine_key('tesseract'), 'x' * 100)
+            OCRResultCache.objects.filter(content_hash=key * 64).update(last_used_at=now + timedelta(minutes=i))
+        # 'a' vừa được đọc lại nên 'b' là bản ghi cũ nhất
+        OCRResultCache.objects.filter(content_hash='a' * 64).update(last_used_at=now + timedelta(minutes=5))
+
+        self.assertEqual(evict_ocr_cache(max_bytes=250), 1)
+        self.assertEqual(sorted(OCRResultCache.objects.values_list('content_hash', flat=True)),
+                         ['a' * 64, 'c' * 64])
+        self.assertEqual(evict_ocr_cache(max_bytes=250), 0)
+
+    def test_tesseract_fallback_is_cached_under_tesseract_key(self):
+        handle, file_path = tempfile.mkstemp(suffix='.png')
+        os.write(handle, b'anh hoa don')
+        os.close(handle)
+        self.addCleanup(os.remove, file_path)
+
+        tesseract = mock.Mock(return_value=("Số hóa đơn: 0000123", None))
+        with mock.patch.object(utils, 'vision_client', FailingVisionClient()), \
+                mock.patch.object(utils, 'open_ocr_image'), \
+                mock.patch.object(utils, 'ocr_image_with_layout', tesseract):
+            first = utils.extract_invoice_data(file_path)
+            second = utils.extract_invoice_data(file_path)
+
+        self.assertEqual(list(OCRResultCache.objects.values_list('engine', flat=True)), [engine_key('tesseract')])
+        self.assertEqual(tesseract.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(second['raw_text'], "Số hóa đơn: 0000123")
+
+
+def synthetic_invoice_text(rng, number):
+    """OCR text hóa đơn tổng hợp: cùng mẫu, khác nhà cung cấp / dòng hàng / số tiền."""
+    lines = [f"HÓA ĐƠN GIÁ TRỊ GIA TĂNG Số: {number:07d}", f"Đơn vị bán: Công ty TNHH {rng.randrange(10**6)}",
+             f"Mã số thuế: 01{rng.randrange(10**8):08d}"]
+    for line_no in range(1, 9):
+        lines.append(f"{line_no} Mặt hàng {rng.randrange(10**5)} SL {rng.randint(1, 99)} "
+                     f"đơn giá {rng.randrange(10**7):,} thành tiền {rng.randrange(10**8):,}")
+    lines.append(f"Tổng cộng tiền thanh toán: {rng.randrange(10**9):,}")
+    return "\n".join(lines)
+
+
+def rescan(rng, text, noise):
+    """Bản scan lại: thay ngẫu nhiên `noise` tỉ lệ ký tự (lỗi OCR)."""
+    chars = list(text)
+    for index in rng.sample(range(len(chars)), int(len(chars) * noise)):
+        chars[index] = rng.choice('abcdefghik0123456789')
+    return "".join(chars)
+
+
+class NearDuplicateIndexTests(TestCase):
+    """🧬 duplicate_index: MinHash ≈ Jaccard, LSH tìm lại bản scan lại, không báo nhầm hóa đơn khác cùng mẫu"""
+
+    def setUp(self):
+        self.rng = random.Random(17)
+        self.texts = {}
+        for number in range(1, 41):
+            invoice = Invoice.objects.create(invoice_number=f"HD-{number:07d}", total_amount=number)
+            self.texts[invoice.id] = synthetic_invoice_text(self.rng, number)
+        self.assertEqual(index_invoice_texts(list(self.texts.items())), 40)
+
+    def test_minhash_similarity(self):
+        text = next(iter(self.texts.values()))
+        signature = compute_minhash(text)
+        self.assertIsNone(compute_minhash("   "))
+        self.assertEqual(signature_similarity(signature, signature[None, :])[0], 1.0)
+        # Khác dấu / hoa thường / khoảng trắng vẫn là cùng một text
+        self.assertEqual(signature_similarity(signature, compute_minhash(text.upper().replace(" ", "  "))[None, :])[0], 1.0)
+        others = np.vstack([compute_minhash(other) for other in list(self.texts.values())[1:]])
+        self.assertLess(signature_similarity(signature, others).max(), 0.6)
+
+    def test_lsh_recall_for_rescans(self):
+        found = 0
+        for invoice_id, text in self.texts.items():
+            matches = find_near_duplicates(compute_minhash(rescan(self.rng, text, 0.01)))
+            self.assertLessEqual(len(matches), 1, matches)
+            found += bool(matches) and matches[0]['invoice_id'] == invoice_id
+        self.assertEqual(found, len(self.texts))
+
+    def test_earlier_than_and_exclude(self):
+        invoice_id, text = list(self.texts.items())[5]
+        signature = compute_minhash(text)
+        self.assertEqual(find_near_duplicates(signature)[0]['similarity'], 1.0)
+        self.assertEqual(find_near_duplicates(signature, exclude_invoice_id=invoice_id), [])
+        self.assertEqual(find_near_duplicates(signature, earlier_than=invoice_id), [])
+        self.assertEqual(find_near_duplicates(signature, earlier_than=invoice_id + 1)[0]['invoice_id'], invoice_id)
+
+
+class OCRJobStatusTests(TestCase):
+    """⏳ GET /api/ocr-jobs/<job_id>/: hóa đơn gần trùng lấy từ kết quả bước fraud đã lưu"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('ketoan', password='x'))
+        self.invoice = Invoice.objects.create(invoice_number="HD-1", total_amount=100, ocr_job_id='job-1',
+                                              status=InvoiceStatus.OCR_PROCESSING)
+        self.duplicates = [{'invoice_id': 7, 'invoice_number': 'HD-7', 'similarity': 0.91}]
+        InvoicePipelineCheckpoint.objects.create(
+            invoice=self.invoice, completed_stages='ocr,extraction,classification,fraud',
+            data=pipeline.pack_stage_data({'fraud': {'risk_score': 0.5, 'near_duplicates': self.duplicates}}),
+        )
+
+    def poll(self):
+        with mock.patch('invoice_processing_system.app_invoices.duplicate_index.find_near_duplicates') as lookup:
+            response = self.client.get(reverse('app_api:api-ocr-job-status', args=['job-1']))
+        lookup.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_running_job_has_no_duplicates(self):
+        data = self.poll()
+        self.assertEqual((data['done'], data['failed'], data['near_duplicates']), (False, False, []))
+
+    def test_done_job_returns_persisted_duplicates(self):
+        Invoice.objects.filter(id=self.invoice.id).update(status=InvoiceStatus.OCR_PROCESSED)
+        data = self.poll()
+        self.assertEqual((data['done'], data['near_duplicates']), (True, self.duplicates))
+
+        Invoice.objects.filter(id=self.invoice.id).update(status=InvoiceStatus.OCR_FAILED)
+        self.assertTrue(self.poll()['failed'])
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get(reverse('app_api:api-ocr-job-status', args=['khong-co'])).status_code, 404)
+
+
+SUPPLIERS = [
+    (1, "Công ty TNHH Thiết Bị Văn Phòng Hoàng Long Phát", "0101234567"),
+    (2, "Công ty CP Minh Anh", None),
+    (3, "Công ty TNHH Nội Thất Sao Việt", None),
+]
+
+
+@override_settings(SUPPLIER_MATCH_THRESHOLD=0.9, SUPPLIER_REVIEW_THRESHOLD=0.8)
+class SupplierResolverTests(SimpleTestCase):
+    """🏢 supplier_resolver: MST → tên lõi → Jaccard trigram, vùng cần xem xét, phần delta"""
+
+    def setUp(self):
+        self.resolver = SupplierResolver().load(SUPPLIERS)
+
+    def test_normalize(self):
+        self.assertEqual(normalize_supplier_name("CÔNG TY TNHH A8C"), "abc")
+        self.assertEqual(normalize_supplier_name("Cty CP Minh Anh."), "minh anh")
+        self.assertEqual(normalize_tax_id("0101-234-567"), "0101234567")
+        self.assertEqual(normalize_tax_id("0101234567-001"), "0101234567001")
+        self.assertIsNone(normalize_tax_id("123456789"))
+
+    def test_match_by_tax_id_name_and_trigrams(self):
+        match = self.resolver.match("Tên OCR sai hoàn toàn", "0101 234 567")
+        self.assertEqual(match, (1, 1.0, 'tax_id'))
+        self.assertEqual(self.resolver.match("Cty TNHH Thiet Bi Van Phong Hoang Long Phat"), (1, 1.0, 'name'))
+        match = self.resolver.match("Thiết Bị Văn Phòng Hoàng Long Phát Đạt")
+        self.assertEqual((match.supplier_id, match.method), (1, 'fuzzy'))
+        self.assertGreaterEqual(match.score, 0.9)
+        # Cùng tên nhưng MST khác: không gộp
+        self.assertIsNone(self.resolver.match("Thiết Bị Văn Phòng Hoàng Long Phát", "0109999999"))
+        self.assertIsNone(self.resolver.match("Công ty TNHH"))
+
+    def test_near_match_flags_review_band_only(self):
+        self.assertIsNone(self.resolver.match("Thiết Bị Văn Phòng Hoàng Lonq Phát"))
+        review = self.resolver.near_match("Thiết Bị Văn Phòng Hoàng Lonq Phát")
+        self.assertEqual((review.supplier_id, review.method), (1, 'review'))
+        self.assertTrue(0.8 <= review.score < 0.9)
+        self.assertIsNone(self.resolver.near_match("Noi That Sao Vet"))
+        self.assertIsNone(self.resolver.near_match("Cty TNHH Thiet Bi Van Phong Hoang Long Phat Dat"))
+
+    def test_delta_add_remove_and_compact(self):
+        self.resolver.add(4, "Công ty TNHH Điện Máy Trường Thịnh Hưng", "0312345678")
+        self.assertEqual(self.resolver.match("Dien May Truong Thinh Hung").supplier_id, 4)
+        self.assertEqual(self.resolver.match("Điện Máy Trường Thịnh Hưngg").method, 'fuzzy')
+        self.resolver.remove(1)
+        self.assertIsNone(self.resolver.match("Hoàng Long Phát", "0101234567"))
+        self.assertEqual(self.resolver.candidates("thiet bi van phong hoang long phat"), [])
+
+        self.resolver._compact()
+        self.assertEqual(len(self.resolver), 3)
+        self.assertEqual(self.resolver.match("Điện Máy Trường Thịnh Hưngg").supplier_id, 4)
+        self.assertEqual(self.resolver.match("Nội Thất Sao Việt").supplier_id, 3)
+
+
+@override_settings(SUPPLIER_MATCH_THRESHOLD=0.9, SUPPLIER_REVIEW_THRESHOLD=0.8)
+class SupplierResolveTests(TestCase):
+    """🏢 resolve_supplier / sync_new: dùng lại nhà cung cấp đã có, bắt kịp nhà cung cấp tiến trình khác tạo"""
+
+    def setUp(self):
+        reset_supplier_resolver()
+        self.addCleanup(reset_supplier_resolver)
+
+    def test_sync_new_picks_up_other_process_rows(self):
+        resolver = SupplierResolver().load([])
+        supplier = Supplier.objects.create(name="Công ty CP Minh Anh", tax_id="0107654321")
+        self.assertIsNone(resolver.match("Minh Anh"))
+        self.assertEqual(resolver.sync_new(), 1)
+        self.assertEqual(resolver.match("Cty Minh Anh").supplier_id, supplier.id)
+        self.assertEqual(resolver.sync_new(), 0)
+
+    def test_resolve_reuses_creates_and_flags_review(self):
+        first, created, match = resolve_supplier("Công ty TNHH Thiết Bị Văn Phòng Hoàng Long Phát", "0101234567")
+        self.assertTrue(created)
+        self.assertIsNone(match)
+
+        same, created, match = resolve_supplier("CTY TNHH THIET BI VAN PHONG HOANG LONG PHAT")
+        self.assertEqual((same.id, created, match.method), (first.id, False, 'name'))
+
+        other, created, match = resolve_supplier("Thiết Bị Văn Phòng Hoàng Lonq Phát")
+        self.assertTrue(created)
+        self.assertNotEqual(other.id, first.id)
+        self.assertEqual((match.supplier_id, match.method), (first.id, 'review'))
+        self.assertEqual(Supplier.objects.count(), 2)
+
+
+def fraud_row(invoice_id, supplier_id, amount, number, issue_date='15/05/2025', supplier_name="Công ty TNHH ABC",
+              ocr_length=800, ocr_special_chars=10):
+    """Một dòng đặc trưng fraud như load_fraud_frame() trả về."""
+    return {'id': invoice_id, 'supplier_id': supplier_id, 'supplier_name': supplier_name, 'total_amount': amount,
+            'invoice_number': number, 'issue_date': issue_date, 'ocr_length': ocr_length,
+            'ocr_special_chars': ocr_special_chars}
+
+
+class FraudBatchScoringTests(SimpleTestCase):
+    """🕵️ fraud_batch.score_fraud_frame: kiểm tra riêng lẻ, thống kê theo nhà cung cấp, trùng số, gần trùng"""
+
+    NOW = datetime(2025, 6, 1)
+
+    def score(self, rows, near_duplicates=None):
+        import pandas as pd
+
+        frame = pd.DataFrame(rows)
+        frame['supplier_id'] = frame['supplier_id'].astype('Int64')
+        frame['total_amount'] = pd.to_numeric(frame['total_amount'])
+        scores = score_fraud_frame(frame, now=self.NOW, near_duplicates=near_duplicates)
+        scores.index = frame['id']
+        return scores
+
+    def flagged(self, scores, invoice_id):
+        return {column for column in INDICATOR_COLUMNS if scores.loc[invoice_id, column]}
+
+    def test_single_invoice_checks(self):
+        scores = self.score([
+            fraud_row(1, 1, 1_234_567, '0000123'),
+            fraud_row(2, 1, 500, 'HD-1', issue_date='31/02/2025'),
+            fraud_row(3, 1, 2_000_000_000, '12', issue_date='01/01/2023', supplier_name="AB"),
+            fraud_row(4, None, 1_234_567, '0000456', issue_date='2025-05-15', supplier_name="ABC <script>",
+                      ocr_length=30),
+            fraud_row(5, 1, None, '0000789', issue_date='02/06/2025', ocr_special_chars=400),
+        ])
+        self.assertEqual(self.flagged(scores, 1), set())
+        self.assertEqual(self.flagged(scores, 2), {'invalid_number', 'invalid_amount', 'invalid_date'})
+        self.assertEqual(self.flagged(scores, 3), {'invalid_number', 'invalid_amount', 'invalid_date', 'invalid_supplier'})
+        # Ngày không theo dd/mm/yyyy thì không kiểm tra (như detect_fraud)
+        self.assertEqual(self.flagged(scores, 4), {'invalid_supplier', 'poor_ocr'})
+        self.assertEqual(self.flagged(scores, 5), {'invalid_amount', 'invalid_date', 'poor_ocr'})
+
+        self.assertEqual((scores.loc[1, 'risk_score'], scores.loc[1, 'risk_level']), (0.0, 'THẤP'))
+        self.assertEqual((scores.loc[2, 'risk_score'], scores.loc[2, 'risk_level']), (0.7, 'TRUNG BÌNH'))
+        self.assertEqual((scores.loc[3, 'risk_score'], scores.loc[3, 'risk_level']), (0.8, 'CAO'))
+        self.assertEqual(indicators_for(scores, 4), [INDICATOR_COLUMNS['invalid_supplier'], INDICATOR_COLUMNS['poor_ocr']])
+
+    def test_supplier_statistics(self):
+        rows = [fraud_row(i, 1, 1_000_000 + i * 12_345, f"{1000 + i}") for i in range(1, 21)]
+        rows.append(fraud_row(21, 1, 90_000_000, '2000'))
+        # 5 hóa đơn số tiền tròn của một nhà cung cấp; 4 hóa đơn của nhà cung cấp chưa đủ lịch sử
+        rows += [fraud_row(30 + i, 2, 5_000_000 * i, f"{3000 + i}") for i in range(1, 6)]
+        rows += [fraud_row(40 + i, 3, 5_000_000 * i, f"{4000 + i}") for i in range(1, 5)]
+        rows.append(fraud_row(50, 3, 900_000_000, '4005'))
+        scores = self.score(rows)
+
+        self.assertEqual(self.flagged(scores, 21), {'supplier_amount_outlier'})
+        self.assertFalse(scores.loc[1:20, 'supplier_amount_outlier'].any())
+        self.assertTrue(scores.loc[31:35, 'round_amount'].all())
+        self.assertFalse(scores.loc[1:21, 'round_amount'].any())
+        self.assertFalse(scores.loc[41:50, 'supplier_amount_outlier'].any())
+        self.assertEqual(scores.loc[31, 'risk_score'], 0.1)
+
+    def test_duplicate_numbers_and_near_duplicates(self):
+        scores = self.score([
+            fraud_row(1, 1, 1_234_567, '0000123'),
+            fraud_row(2, 2, 2_345_678, '0000123'),
+            fraud_row(3, 2, 3_456_789, '0000456'),
+            fraud_row(4, 2, 4_567_891, '0000456'),
+            fraud_row(5, None, 5_678_912, '0000456'),
+            fraud_row(6, 3, 6_789_123, '0000789'),
+        ], near_duplicates={6: 0.92})
+
+        self.assertEqual(self.flagged(scores, 1), {'duplicate_across_suppliers'})
+        self.assertEqual(self.flagged(scores, 3), {'duplicate_same_supplier'})
+        # Hóa đơn chưa có nhà cung cấp không tính là trùng trong cùng nhà cung cấp
+        self.assertEqual(self.flagged(scores, 5), set())
+        self.assertEqual(self.flagged(scores, 6), {'near_duplicate'})
+        self.assertEqual(scores.loc[6, 'near_duplicate_similarity'], 0.92)
+        self.assertEqual((scores.loc[6, 'risk_score'], scores.loc[6, 'risk_level']), (0.5, 'TRUNG BÌNH'))
+
+
+class ModelRegistryTests(TestCase):
+    """🗂️ model_registry: publish nguyên tử, con trỏ ACTIVE, rollback, hot swap, dọn phiên bản cũ"""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(AI_MODEL_ROOT=root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def publish(self, values, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return model_registry.publish_model_version(
+                'classifier', {'model': np.array(values, dtype=np.float64)}, "RandomForest", **kwargs
+            )
+
+    def active_versions(self):
+        return list(AIModelTraining.objects.filter(model_type='classifier', is_active=True).values_list('version', flat=True))
+
+    def test_publish_activates_and_loads_memory_mapped(self):
+        watcher = model_registry.ActiveModelWatcher('classifier')
+        self.assertIsNone(watcher.poll())
+
+        first = self.publish([1, 2, 3], training_data_count=3)
+        self.assertEqual((first.version, first.is_active), (1, True))
+        self.assertEqual(model_registry.read_active_version('classifier'), 1)
+        self.assertEqual(watcher.poll(), 1)
+        self.assertIsNone(watcher.poll())
+
+        second = self.publish([4, 5, 6])
+        self.assertEqual(second.version, 2)
+        self.assertEqual(self.active_versions(), [2])
+        self.assertEqual(watcher.poll(), 2)
+
+        loaded = model_registry.load_model_version('classifier', 2, ['model'])['model']
+        self.assertIsInstance(loaded, np.memmap)
+        np.testing.assert_array_equal(loaded, [4, 5, 6])
+        self.assertTrue(model_registry.has_model_artifact('classifier', 1, 'model'))
+        self.assertFalse(model_registry.has_model_artifact('classifier', 1, 'vectorizer'))
+
+    def test_rollback_and_unknown_versions(self):
+        self.publish([1])
+        self.publish([2], activate=False)
+        self.assertEqual((model_registry.read_active_version('classifier'), self.active_versions()), (1, [1]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            model_registry.activate_model_version('classifier', 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            model_registry.activate_model_version('classifier', 1)
+        self.assertEqual((model_registry.read_active_version('classifier'), self.active_versions()), (1, [1]))
+
+        with self.assertRaises(FileNotFoundError):
+            model_registry.activate_model_version('classifier', 7)
+        # Thư mục có nhưng chưa đăng ký trong DB: không đổi phiên bản active
+        os.makedirs(model_registry.version_dir('classifier', 9))
+        with self.assertRaises(ValueError):
+            model_registry.activate_model_version('classifier', 9)
+        self.assertEqual(self.active_versions(), [1])
+
+    def test_failed_dump_leaves_no_version(self):
+        with self.assertRaises(Exception):
+            model_registry.publish_model_version('classifier', {'model': lambda: None}, "RandomForest")
+        self.assertFalse(AIModelTraining.objects.exists())
+        self.assertEqual(os.listdir(model_registry.model_type_dir('classifier')), [])
+
+    def test_prune_keeps_active_and_newest(self):
+        for value in range(4):
+            self.publish([value])
+        with self.captureOnCommitCallbacks(execute=True):
+            model_registry.activate_model_version('classifier', 1)
+
+        self.assertEqual(model_registry.prune_model_versions('classifier', keep=1), [3, 2])
+        remaining = sorted(name for name in os.listdir(model_registry.model_type_dir('classifier')) if name != 'ACTIVE')
+        self.assertEqual(remaining, ['v0001', 'v0004'])
+
+
+class RecordingChatBackend(LocalChatBackend):
+    """Backend FAQ cục bộ, ghi lại message gửi cho model và có thể báo lỗi."""
+    name = 'recording'
+
+    def __init__(self, fail=False):
+        super().__init__(first_delay=0, token_delay=0)
+        self.calls, self.fail = [], fail
+
+    async def stream(self, messages, max_tokens=None, temperature=None):
+        self.calls.append(messages)
+        if self.fail:
+            raise RuntimeError("model sập")
+        async for piece in super().stream(messages, max_tokens, temperature):
+            yield piece
+
+
+class ChatAnswerCacheTests(SimpleTestCase):
+    """💬 chat_backends: cache câu hỏi FAQ dùng chung, không lộ context của người hỏi"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def reply(self, message, context=None, backend=None):
+        reply = ChatReply(message, context, backend=backend or self.backend)
+        asyncio.run(reply.collect())
+        return reply
+
+    def test_cacheable_questions(self):
+        self.assertEqual(normalize_question("  Trạng thái   hóa đơn?? ạ"), "trạng thái hóa đơn")
+        self.assertTrue(is_cacheable_question("trạng thái hóa đơn"))
+        for question in ("trạng thái hóa đơn 123", "hóa đơn của tôi", "thời tiết hôm nay", ""):
+            with self.subTest(question=question):
+                self.assertFalse(is_cacheable_question(normalize_question(question)))
+
+    def test_cached_answer_built_without_user_context(self):
+        self.backend = RecordingChatBackend()
+        user_a = {'user_id': 1, 'recent_invoices': [{'id': 41, 'invoice_number': 'HD-SECRET', 'status': 'APPROVED'}]}
+        first = self.reply("Trạng thái hóa đơn?", user_a)
+        self.assertFalse(first.cached)
+        [messages] = self.backend.calls
+        self.assertNotIn('HD-SECRET', messages[0]['content'])
+
+        second = self.reply("trạng thái hóa đơn ạ", {'user_id': 2, 'recent_invoices': []})
+        self.assertEqual((second.cached, second.text), (True, first.text))
+        self.assertEqual(len(self.backend.calls), 1)
+
+    def test_personal_question_keeps_context_and_skips_cache(self):
+        self.backend = RecordingChatBackend()
+        context = {'user_id': 1, 'recent_invoices': [{'id': 41, 'invoice_number': 'HD-SECRET'}]}
+        for _ in range(2):
+            self.assertFalse(self.reply("Trạng thái hóa đơn của tôi?", context).cached)
+        self.assertEqual(len(self.backend.calls), 2)
+        self.assertIn('HD-SECRET', self.backend.calls[0][0]['content'])
+
+    def test_backend_error_falls_back_and_is_not_cached(self):
+        self.backend = RecordingChatBackend(fail=True)
+        reply = self.reply("hướng dẫn sử dụng")
+        self.assertTrue(reply.fallback)
+        self.assertIn("Upload hóa đơn", reply.text)
+        self.assertFalse(self.reply("hướng dẫn sử dụng").cached)
+
+
+def read_stream(response):
+    """Body của StreamingHttpResponse có iterator async (ORM trong generator chạy lại ở luồng test)."""
+    async def collect():
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return async_to_sync(collect)()
+
+
+def parse_sse(body):
+    """[(event, data)] từ body text/event-stream."""
+    events = []
+    for block in body.decode('utf-8').split('\n\n'):
+        if block.strip():
+            fields = dict(line.split(': ', 1) for line in block.split('\n'))
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class AIChatStreamTests(TestCase):
+    """📡 POST /api/ai/chat/stream/: start → delta → done, lưu câu trả lời, lỗi dạng event SSE"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('ketoan', password='x')
+        self.client.force_login(self.user)
+        self.backend = RecordingChatBackend()
+        patcher = mock.patch.object(chat_backends, '_backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data):
+        return self.client.post(reverse('app_api:api-ai-chat-stream'), data, content_type='application/json',
+                                HTTP_ACCEPT='text/event-stream')
+
+    def test_stream_events_and_saved_answer(self):
+        response = self.post({'message': "Làm sao để upload hóa đơn?"})
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        events = parse_sse(read_stream(response))
+
+        names = [name for name, _ in events]
+        self.assertEqual((names[0], names[-1]), ('start', 'done'))
+        self.assertGreater(names.count('delta'), 1)
+        session_id = events[0][1]['session_id']
+        done = events[-1][1]
+        self.assertEqual(done['response'], ''.join(data['text'] for name, data in events if name == 'delta'))
+        self.assertEqual((done['session_id'], done['cached'], done['complete']), (session_id, False, True))
+
+        saved = list(AIChatMessage.objects.filter(session__session_id=session_id)
+                     .order_by('id').values_list('message_type', 'content'))
+        self.assertEqual(saved, [('user', "Làm sao để upload hóa đơn?"), ('ai', done['response'])])
+
+        # Câu hỏi FAQ lặp lại: một delta từ cache, cùng session
+        again = parse_sse(read_stream(self.post({'message': "làm sao để upload hóa đơn", 'session_id': session_id})))
+        self.assertEqual([name for name, _ in again], ['start', 'delta', 'done'])
+        self.assertEqual((again[-1][1]['cached'], again[-1][1]['response']), (True, done['response']))
+        self.assertEqual(len(self.backend.calls), 1)
+
+    def test_empty_message_is_sse_error(self):
+        response = self.post({'message': ''})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(parse_sse(response.content), [('error', {'error': "Tin nhắn không được để trống"})])
+        self.assertFalse(AIChatMessage.objects.exists())
+
+    def test_backend_failure_falls_back_to_faq(self):
+        self.backend.fail = True
+        events = parse_sse(read_stream(self.post({'message': "Hóa đơn HD-9 của tôi sao rồi?"})))
+        self.assertEqual([name for name, _ in events], ['start', 'delta', 'done'])
+        self.assertTrue(events[-1][1]['complete'])
+        self.assertEqual(AIChatMessage.objects.filter(message_type='ai').count(), 1)
@@ -0,0 +1,136 @@
+# app_invoices/text_scanner.py
+"""
+🔎 Bộ quét OCR text cho trích xuất trường hóa đơn
+Toàn bộ regex được biên dịch một lần khi import. Mỗi hóa đơn tạo một `InvoiceTextScan`
+dùng chung cho mọi trường:
+- vị trí đầu tiên của từng loại từ khóa neo (Số, Tổng, VAT, Công ty, đ/VND/₫, ...),
+  tính lười khi trường đầu tiên cần đến rồi ghi nhớ
+- các cụm số `[\\d.,]+` đứng ngay trước đơn vị tiền tệ (ứng viên số tiền), quét một lượt
+
+Regex của từng trường chỉ chạy khi từ khóa neo của nó có mặt và bắt đầu tìm từ vị trí
+từ khóa đầu tiên, nên kết quả giống hệt `re.search`/`re.findall` trên toàn bộ text.
+"""
+
+import re
+
+# Cụm số tiền: 1.500.000 / 1,500,000.00 / 1500
+AMOUNT = r'\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?'
+AMOUNT_FULL = re.compile(AMOUNT)
+
+# Loại từ khóa neo -> (các từ khóa, không phân biệt hoa thường?)
+ANCHOR_KINDS = {
+    'number_kw': (('Số', 'No', 'Number'), True),
+    'invoice_kw': (('Hóa đơn', 'Invoice'), True),
+    'date_suffix': (('ngày', 'date', 'tháng'), True),
+    'date_kw': (('Ngày', 'Date'), True),
+    'month_kw': (('tháng', 'month'), False),
+    'due_kw': (('Hạn thanh toán', 'Due date', 'Đến hạn'), True),
+    'due_suffix': (('hạn', 'due'), True),
+    'company_kw': (('Công ty', 'Company', 'Corp', 'Ltd'), False),
+    'company_suffix': (('JSC', 'Ltd', 'Corp', 'Company'), False),
+    'tax_id_kw': (('Mã số thuế', 'MST', 'Tax code'), True),
+    'total_kw': (('Tổng', 'Total'), True),
+    'tax_kw': (('VAT', 'Thuế', 'Tax'), True),
+    'currency': (('đ', 'VND', '₫'), True),
+}
+
+
+def _alternation(words, ignore_case):
+    pattern = '|'.join(re.escape(w) for w in words)
+    return re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+
+
+_ANCHOR_PATTERNS = {kind: _alternation(words, ci) for kind, (words, ci) in ANCHOR_KINDS.items()}
+# Cụm số đứng ngay trước đơn vị tiền tệ: mọi vị trí trong một cụm số có chung điểm kết thúc,
+# nên lookahead chỉ đúng khi xét cả cụm
+_CURRENCY_RUN = re.compile(r'[\d.,]+(?=\s*(?:đ|VND|₫))', re.IGNORECASE)
+_TAX_AFTER = re.compile(r'\s*(?:đ|VND|₫)(?=\s*(?:VAT|Thuế))', re.IGNORECASE)
+_ITEM_LINE = re.compile(r'\d+[^\S\n]+[A-Za-zÀ-ỹ]+[^\S\n]+\d+')
+
+
+class InvoiceTextScan:
+    """Vị trí từ khóa neo (tính lười, ghi nhớ) + các cụm số trước đơn vị tiền tệ của OCR text."""
+
+    __slots__ = ('text', '_first', '_currency_runs')
+
+    def __init__(self, text):
+        self.text = text
+        self._first = {}
+        self._currency_runs = None
+
+    def first(self, kind):
+        """Vị trí đầu tiên của loại từ khóa, None nếu không có."""
+        if kind not in self._first:
+            match = _ANCHOR_PATTERNS[kind].search(self.text)
+            self._first[kind] = match.start() if match else None
+        return self._first[kind]
+
+    def has(self, kind):
+        return self.first(kind) is not None
+
+    def search(self, pattern, kind):
+        """
+        `pattern.search(text)` cho regex bắt đầu bằng từ khóa loại `kind`:
+        không có từ khóa thì chắc chắn không khớp, có thì tìm từ vị trí từ khóa đầu tiên.
+        """
+        start = self.first(kind)
+        return None if start is None else pattern.search(self.text, start)
+
+    def findall(self, pattern, kind):
+        start = self.first(kind)
+        return [] if start is None else pattern.findall(self.text, start)
+
+    def _amount_in_run(self, start, end):
+        """Cụm số tiền bắt đầu sớm nhất trong run và kết thúc đúng cuối run (như regex tìm từ trái sang)."""
+        for pos in range(start, end):
+            if AMOUNT_FULL.fullmatch(self.text, pos, end):
+                return self.text[pos:end]
+        return None
+
+    def currency_runs(self):
+        """Các cụm số (start, end) đứng ngay trước đ/VND/₫, theo thứ tự trong text."""
+        if self._currency_runs is None:
+            self._currency_runs = (
+                [match.span() for match in _CURRENCY_RUN.finditer(self.text)]
+                if self.has('currency') else []
+            )
+        return self._currency_runs
+
+    def amounts_before_currency(self):
+        """
+        Tương đương `re.findall(AMOUNT + r'\\s*(?:đ|VND|₫)', text, re.I)`: số tiền ngay trước
+        đơn vị tiền tệ. Số tiền chỉ có thể kết thúc ở cuối một cụm số, nên chỉ cần xét các cụm số.
+        """
+        amounts = []
+        for start, end in self.currency_runs():
+            amount = self._amount_in_run(start, end)
+            if amount is not None:
+                amounts.append(amount)
+        return amounts
+
+    def first_amount_before_tax(self):
+        """Tương đương `re.search(AMOUNT + r'\\s*(?:đ|VND|₫)(?=\\s*(?:VAT|Thuế))', text, re.I)`."""
+        if not self.has('tax_kw'):
+            return None
+        for start, end in self.currency_runs():
+            if _TAX_AFTER.match(self.text, end):
+                amount = self._amount_in_run(start, end)
+                if amount is not None:
+                    return amount
+        return None
+
+    def head_lines(self, count):
+        """`text.split('\\n')[:count]` mà không tách toàn bộ text."""
+        return self.text.split('\n', count)[:count]
+
+    def item_lines(self):
+        """Các dòng có dạng 'số lượng + tên + số' theo thứ tự (1 lượt finditer thay vì search từng dòng)."""
+        text = self.text
+        last_line_start = -1
+        for match in _ITEM_LINE.finditer(text):
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            if line_start == last_line_start:
+                continue
+            last_line_start = line_start
+            line_end = text.find('\n', match.end())
+            yield text[line_start:] if line_end == -1 else text[line_start:line_end]
@@ -0,0 +1,227 @@
+# app_invoices/training_jobs.py
+"""
+🏋️ Job huấn luyện AI model chạy nền (Celery, hàng đợi 'training')
+
+API chỉ tạo AITrainingJob (dữ liệu huấn luyện nén zlib trong job) rồi trả về 202.
+Worker chạy `run_training_job`:
+- tiến độ (%), thông điệp và log từng bước được ghi vào job → client poll trạng thái
+- yêu cầu hủy (`cancel_requested`) được kiểm tra giữa các fold / lô; job dừng với trạng thái CANCELLED
+- chế độ `full`: cross-validation k-fold + huấn luyện lại trên toàn bộ dữ liệu (RandomForest `n_jobs`)
+- chế độ `incremental`: partial_fit trên dữ liệu gán nhãn mới trong DB (online_training.py)
+Accuracy thật, báo cáo theo loại, wall time và độ trễ phân loại được ghi vào AIModelTraining.
+"""
+
+import json
+import time
+import uuid
+import zlib
+import traceback
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .models import AITrainingJob
+from .model_evaluation import (
+    TrainingCancelled, TrainingReporter, cross_validate_classifier, measure_inference_latency,
+)
+
+TRAINING_MODES = ('full', 'incremental')
+FINISHED_STATUSES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+
+
+class JobReporter(TrainingReporter):
+    """Ghi tiến độ / log vào AITrainingJob và đọc cờ hủy từ DB."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def log(self, message):
+        line = f"[{timezone.now():%H:%M:%S}] {message}\n"
+        print(f"[TRAIN {self.job.job_id}] {message}")
+        # Nối log bằng SQL để không ghi đè thay đổi của request hủy
+        AITrainingJob.objects.filter(pk=self.job.pk).update(log=Concat(F('log'), Value(line), output_field=models.TextField()))
+
+    def progress(self, percent, message=''):
+        self.job.progress = max(0, min(100, int(percent)))
+        self.job.message = message[:255]
+        AITrainingJob.objects.filter(pk=self.job.pk).update(progress=self.job.progress, message=self.job.message)
+
+    def check_cancelled(self):
+        if AITrainingJob.objects.filter(pk=self.job.pk, cancel_requested=True).exists():
+            raise TrainingCancelled()
+
+
+# --- Tạo / hủy job ---
+def create_training_job(model_type='classifier', mode='full', training_data=None, params=None, user=None):
+    """
+    📨 Tạo job và đưa vào hàng đợi sau khi transaction commit (worker luôn đọc được bản ghi).
+    """
+    from .tasks import train_ai_model
+
+    if mode not in TRAINING_MODES:
+        raise ValueError(f"Chế độ huấn luyện không hợp lệ: {mode}")
+
+    job = AITrainingJob.objects.create(
+        job_id=str(uuid.uuid4()),
+        model_type=model_type,
+        mode=mode,
+        params=params or {},
+        training_data=zlib.compress(json.dumps(training_data or [], ensure_ascii=False).encode('utf-8')),
+        created_by=user if user and user.is_authenticated else None,
+    )
+    job_id = job.job_id
+    transaction.on_commit(lambda: train_ai_model.apply_async(args=[job_id]))
+    return job
+
+
+def request_cancel(job):
+    """
+    🛑 Yêu cầu hủy: job chưa chạy thì hủy ngay, đang chạy thì worker dừng ở điểm kiểm tra kế tiếp.
+    """
+    if job.status in FINISHED_STATUSES:
+        return job
+    AITrainingJob.objects.filter(pk=job.pk).update(cancel_requested=True)
+    AITrainingJob.objects.filter(pk=job.pk, status='PENDING').update(
+        status='CANCELLED', finished_at=timezone.now(), message='Đã hủy trước khi chạy'
+    )
+    job.refresh_from_db()
+    return job
+
+
+def load_training_data(job):
+    if not job.training_data:
+        return []
+    return json.loads(zlib.decompress(bytes(job.training_data)).decode('utf-8'))
+
+
+# --- Chạy job (trong Celery worker) ---
+def run_training_job(job_id):
+    job = AITrainingJob.objects.get(job_id=job_id)
+    # Chỉ một worker được chuyển job từ PENDING sang RUNNING (job đã hủy / đã chạy thì bỏ qua)
+    claimed = AITrainingJob.objects.filter(pk=job.pk, status='PENDING', cancel_requested=False).update(
+        status='RUNNING', started_at=timezone.now(), progress=0
+    )
+    if not claimed:
+        return job
+
+    reporter = JobReporter(job)
+    reporter.log(f"🚀 Bắt đầu huấn luyện {job.model_type} ({job.mode}), tham số: {job.params}")
+    try:
+        if job.model_type != 'classifier':
+            raise ValueError(f"Loại model không được hỗ trợ: {job.model_type}")
+        if job.mode == 'incremental':
+            training = _train_incremental(job, reporter)
+        else:
+            training = _train_full(job, reporter)
+    except TrainingCancelled:
+        reporter.log("🛑 Đã hủy theo yêu cầu")
+        _finish(job, 'CANCELLED', message='Đã hủy')
+        return job
+    except Exception as e:
+        reporter.log(f"❌ Lỗi: {e}")
+        print(traceback.format_exc())
+        _finish(job, 'FAILED', message='Thất bại', error=str(e))
+        return job
+
+    _finish(job, 'SUCCEEDED', message='Hoàn tất', training=training, progress=100)
+    return job
+
+
+def _finish(job, status, message='', error='', training=None, progress=None):
+    fields = {'status': status, 'finished_at': timezone.now(), 'message': message, 'error': error}
+    if training is not None:
+        fields['training'] = training
+    if progress is not None:
+        fields['progress'] = progress
+    AITrainingJob.objects.filter(pk=job.pk).update(**fields)
+
+
+def _new_classifier(job):
+    """Classifier riêng cho job: n_jobs theo tham số job, không đụng instance đang phục vụ."""
+    from .ai_services import InvoiceAIClassifier
+
+    classifier = InvoiceAIClassifier()
+    classifier.n_jobs = int(job.params.get('n_jobs', getattr(settings, 'AI_CLASSIFIER_N_JOBS', -1)))
+    return classifier
+
+
+def _train_full(job, reporter):
+    """Cross-validation k-fold → huấn luyện trên toàn bộ dữ liệu → đo độ trễ → xuất bản phiên bản mới."""
+    training_data = load_training_data(job)
+    texts = [item['text'] for item in training_data]
+    labels = [item['category'] for item in training_data]
+    if not texts:
+        raise ValueError("Dữ liệu huấn luyện không được để trống")
+
+    classifier = _new_classifier(job)
+    folds = int(job.params.get('cv_folds', getattr(settings, 'AI_TRAINING_CV_FOLDS', 5)))
+    reporter.log(f"📚 {len(texts)} mẫu, {len(set(labels))} loại, n_jobs={classifier.n_jobs}")
+    reporter.progress(5, "Cross-validation")
+
+    evaluation = cross_validate_classifier(classifier, texts, labels, folds=folds, reporter=reporter) if folds >= 2 else None
+
+    reporter.check_cancelled()
+    reporter.progress(75, "Huấn luyện trên toàn bộ dữ liệu")
+    started = time.perf_counter()
+    model, vectorizer = classifier.fit_estimators(texts, labels)
+    training_time_ms = int((time.perf_counter() - started) * 1000)
+    reporter.log(f"🎯 Huấn luyện xong trong {training_time_ms}ms")
+
+    reporter.check_cancelled()
+    reporter.progress(90, "Đo độ trễ phân loại")
+    latency = measure_inference_latency(model, vectorizer, texts)
+    reporter.log(f"⏱️ Độ trễ: {latency['single_ms']}ms / hóa đơn, {latency['batch_per_invoice_ms']}ms / hóa đơn theo lô {latency['batch_size']}")
+
+    reporter.check_cancelled()
+    training = classifier.publish_model(
+        model, vectorizer, len(training_data),
+        accuracy=evaluation['accuracy'] if evaluation else None,
+        training_time_ms=training_time_ms,
+        inference_latency_ms=latency['single_ms'],
+        metrics={'mode': 'full', 'n_jobs': classifier.n_jobs, 'evaluation': evaluation, 'latency': latency},
+    )
+    if evaluation:
+        reporter.log(f"📊 Accuracy cross-validation {evaluation['folds']} fold: {evaluation['accuracy']} (±{evaluation['fold_accuracy_std']})")
+    reporter.log(f"✅ Xuất bản phiên bản {training.version}")
+    return training
+
+
+def _train_incremental(job, reporter):
+    classifier = _new_classifier(job)
+    stats = classifier.train_incremental(
+        chunk_size=int(job.params.get('chunk_size', 1000)),
+        full=bool(job.params.get('full', False)),
+        reporter=reporter,
+    )
+    return classifier.last_training if stats['version'] is not None else None
+
+
+def job_payload(job):
+    """Trạng thái job trả về cho API."""
+    training = job.training
+    return {
+        'job_id': job.job_id,
+        'model_type': job.model_type,
+        'mode': job.mode,
+        'params': job.params,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'cancel_requested': job.cancel_requested,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'log': job.log.splitlines(),
+        'result': {
+            'version': training.version,
+            'accuracy': float(training.accuracy) if training.accuracy is not None else None,
+            'training_data_count': training.training_data_count,
+            'training_time_ms': training.training_time_ms,
+            'inference_latency_ms': training.inference_latency_ms,
+            'metrics': training.metrics,
+        } if training else None,
+    }
@@ -10,11 +10,15 @@ from .views import (
     MatchRateReportAPIView,
     SupplierPerformanceAPIView,
     InvoiceMatchAPIView,
+    InvoiceLineMatchAPIView,
     InvoiceApproveAPIView,
     # AI Views
     AIChatAPIView,
+    AIChatStreamAPIView,
     AIAnalysisAPIView,
     AITrainingAPIView,
+    AITrainingJobAPIView,
+    AITrainingJobCancelAPIView,
     AIPredictionAPIView,
     AIDashboardAPIView,
 )
@@ -46,10 +50,19 @@ urlpatterns = [
     path('invoices/<int:pk>/match_erp/', views.match_invoice_erp, name='api-invoice-match-erp'),
     path('invoices/<int:pk>/rerun_ocr/', views.rerun_ocr, name='api-invoice-rerun-ocr'),
     path('invoices/<int:pk>/match/', InvoiceMatchAPIView.as_view(), name='api-invoice-match'),
+    path('invoices/<int:pk>/line-match/', InvoiceLineMatchAPIView.as_view(), name='api-invoice-line-match'),
+    path('invoices/<int:pk>/ocr-words/', views.InvoiceOCRWordsAPIView.as_view(), name='api-invoice-ocr-words'),
+    path('invoices/<int:pk>/near-duplicates/', views.InvoiceNearDuplicatesAPIView.as_view(), name='api-invoice-near-duplicates'),
+    path('invoices/<int:pk>/similar/', views.InvoiceSimilarAPIView.as_view(), name='api-invoice-similar'),
     
     # OCR Processing
     path('ocr-sync/', views.AsyncInvoiceOCRAPIView.as_view(), name='api-ocr-sync'),
     path('ocr-async/', views.AsyncInvoiceOCRAPIView.as_view(), name='api-ocr-async'),
+    path('ocr-jobs/<str:job_id>/', views.OCRJobStatusAPIView.as_view(), name='api-ocr-job-status'),
+
+    # Upload hàng loạt
+    path('invoice-batches/', views.InvoiceBatchUploadAPIView.as_view(), name='api-invoice-batch-upload'),
+    path('invoice-batches/<str:batch_id>/', views.InvoiceBatchStatusAPIView.as_view(), name='api-invoice-batch-status'),
     
     # Reports
     path('reports/summary/', ReportSummaryAPIView.as_view(), name='api-reports-summary'),
@@ -58,8 +71,11 @@ urlpatterns = [
     
     # 🤖 AI API Endpoints
     path('ai/chat/', AIChatAPIView.as_view(), name='api-ai-chat'),
+    path('ai/chat/stream/', AIChatStreamAPIView.as_view(), name='api-ai-chat-stream'),
     path('ai/analysis/<int:pk>/', AIAnalysisAPIView.as_view(), name='api-ai-analysis'),
     path('ai/training/', AITrainingAPIView.as_view(), name='api-ai-training'),
+    path('ai/training/jobs/<str:job_id>/', AITrainingJobAPIView.as_view(), name='api-ai-training-job'),
+    path('ai/training/jobs/<str:job_id>/cancel/', AITrainingJobCancelAPIView.as_view(), name='api-ai-training-job-cancel'),
     path('ai/prediction/<int:pk>/', AIPredictionAPIView.as_view(), name='api-ai-prediction'),
     path('ai/dashboard/', AIDashboardAPIView.as_view(), name='api-ai-dashboard'),
 ]
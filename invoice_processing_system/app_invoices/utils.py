@@ -3,14 +3,20 @@
 import io
 import os 
 import re
-from datetime import datetime
-from PIL import Image
+from datetime import date, datetime
 import pytesseract
 
 from django.conf import settings
 from google.cloud import vision
 from google.oauth2 import service_account
 
+from .ocr_cache import file_sha256, engine_key, get_cached_ocr, store_ocr_result
+from .pdf_ocr import ocr_pdf_with_layout
+from .image_preprocessing import open_ocr_image
+from .ocr_engine import ocr_image_with_layout
+from .ocr_layout import layout_from_vision
+from .text_scanner import InvoiceTextScan
+
 # Khởi tạo Tesseract (Chỉ cần thiết cho Tesseract fallback)
 pytesseract.pytesseract.tesseract_cmd = getattr(settings, 'TESSERACT_CMD', '/usr/bin/tesseract')
 
@@ -32,15 +38,24 @@ vision_client = initialize_vision_client()
 
 
 # --- HÀM PARSING ---
-def parse_invoice_text(text):
+# Regex biên dịch sẵn; chỉ chạy khi từ khóa neo có mặt (quét 1 lượt bằng InvoiceTextScan)
+NUMBER_PATTERN = re.compile(r'(?:SỐ|SỐ HÓA ĐƠN|NO|INVOICE\s*NO)\s*:?\s*([A-Z0-9/-]{3,})', re.IGNORECASE)
+DATE_PATTERN = re.compile(r'(?:Ngày|Date)\s*(?:(\d{1,2})[/-](\d{1,2})[/-](\d{4})|(\d{1,2})\s*tháng\s*(\d{1,2})\s*năm\s*(\d{4}))', re.IGNORECASE)
+TOTAL_PATTERN = re.compile(r'(?:TỔNG CỘNG TIỀN THANH TOÁN|TỔNG CỘNG|TOTAL):\s*([\d\.,]+)', re.IGNORECASE)
+TAX_PATTERN = re.compile(r'(?:THUẾ GTGT|VAT):\s*([\d\.,]+)', re.IGNORECASE)
+
+
+def parse_invoice_text(text, scan=None):
     data = {'number': None, 'date': None, 'total': None, 'tax': None}
+    scan = scan or InvoiceTextScan(text)
 
-    # 1. Số hóa đơn
-    num_match = re.search(r'(?:SỐ|SỐ HÓA ĐƠN|NO|INVOICE\s*NO)\s*:?\s*([A-Z0-9/-]{3,})', text, re.IGNORECASE)
+    # 1. Số hóa đơn ('INVOICE NO' chứa 'NO' nên neo theo cả 2 loại từ khóa)
+    starts = [p for p in (scan.first('number_kw'), scan.first('invoice_kw')) if p is not None]
+    num_match = NUMBER_PATTERN.search(text, min(starts)) if starts else None
     if num_match: data['number'] = num_match.group(1).strip()
 
     # 2. Ngày phát hành
-    date_match = re.search(r'(?:Ngày|Date)\s*(?:(\d{1,2})[/-](\d{1,2})[/-](\d{4})|(\d{1,2})\s*tháng\s*(\d{1,2})\s*năm\s*(\d{4}))', text, re.IGNORECASE)
+    date_match = scan.search(DATE_PATTERN, 'date_kw')
     if date_match:
         try:
             if date_match.group(3): 
@@ -51,14 +66,14 @@ def parse_invoice_text(text):
         except (ValueError, TypeError): pass
 
     # 3. Tổng tiền
-    total_match = re.search(r'(?:TỔNG CỘNG TIỀN THANH TOÁN|TỔNG CỘNG|TOTAL):\s*([\d\.,]+)', text, re.IGNORECASE)
+    total_match = scan.search(TOTAL_PATTERN, 'total_kw')
     if total_match:
         amount_str = total_match.group(1).replace('.', '').replace(',', '.')
         try: data['total'] = float(amount_str)
         except ValueError: pass
 
     # 4. Thuế
-    tax_match = re.search(r'(?:THUẾ GTGT|VAT):\s*([\d\.,]+)', text, re.IGNORECASE)
+    tax_match = scan.search(TAX_PATTERN, 'tax_kw')
     if tax_match:
         amount_str = tax_match.group(1).replace('.', '').replace(',', '.')
         try: data['tax'] = float(amount_str)
@@ -66,13 +81,39 @@ def parse_invoice_text(text):
         
     return data
 
+def cached_invoice_data(content_hash, engine):
+    """Kết quả parse đã cache của file theo `engine` (bản ghi chỉ có text thì parse lại), None nếu chưa có."""
+    cached = get_cached_ocr(content_hash, engine)
+    if cached is None:
+        return None
+    if cached.parsed_data is None:
+        parsed_data = parse_invoice_text(cached.raw_text)
+    else:
+        parsed_data = dict(cached.parsed_data)
+        if parsed_data.get('date'):
+            parsed_data['date'] = date.fromisoformat(parsed_data['date'])
+    parsed_data['raw_text'] = cached.raw_text
+    return parsed_data
+
+
 # --- HÀM CHÍNH EXTRACT ---
 def extract_invoice_data(file_path):
-    """Thực hiện OCR kép (Google Vision -> Tesseract) và Parsing."""
+    """
+    Thực hiện OCR kép (Google Vision -> Tesseract) và Parsing.
+    Cache theo nội dung file + engine thực sự cho ra text: kết quả Tesseract dự phòng
+    (Vision lỗi) được lưu dưới key Tesseract, không bị trả lại như kết quả Vision.
+    """
     full_text = ""
-    
-    # 1. Google Vision (Ưu tiên)
-    if vision_client: 
+    layout = None
+    content_hash = file_sha256(file_path)
+    is_pdf = file_path.lower().endswith('.pdf')
+
+    # 1. Google Vision (Ưu tiên) - chỉ cho ảnh, PDF đi thẳng sang OCR từng trang
+    if vision_client and not is_pdf:
+        engine = engine_key('vision')
+        cached = cached_invoice_data(content_hash, engine)
+        if cached is not None:
+            return cached
         try:
             with io.open(file_path, 'rb') as image_file:
                 content = image_file.read()
@@ -80,17 +121,26 @@ def extract_invoice_data(file_path):
             response = vision_client.document_text_detection(image=image)
             if response.full_text_annotation:
                 full_text = response.full_text_annotation.text
+                layout = layout_from_vision(response.full_text_annotation)
         except Exception:
             pass # Bỏ qua lỗi Vision, chuyển sang Tesseract
             
     # 2. Tesseract (Fallback)
     if not full_text:
+        engine = engine_key('tesseract')
+        cached = cached_invoice_data(content_hash, engine)
+        if cached is not None:
+            return cached
         try:
-            full_text = pytesseract.image_to_string(Image.open(file_path), lang='vie+eng')
+            if is_pdf:
+                full_text, layout = ocr_pdf_with_layout(file_path)
+            else:
+                full_text, layout = ocr_image_with_layout(open_ocr_image(file_path), lang='vie+eng')
         except Exception:
             return {'number': None, 'date': None, 'total': None, 'tax': None, 'raw_text': ""}
 
     # 3. Phân tích
     parsed_data = parse_invoice_text(full_text)
+    store_ocr_result(content_hash, engine, full_text, parsed_data, layout=layout)
     parsed_data['raw_text'] = full_text
     return parsed_data
\ No newline at end of file
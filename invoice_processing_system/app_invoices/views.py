@@ -5,23 +5,38 @@ from django.contrib.auth.views import LoginView, LogoutView
 from django.db.models import Sum
 from django.utils import timezone
 from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
 from datetime import timedelta
 from django.db.models import F, ExpressionWrapper, DurationField, Avg, Count, Q
 from rest_framework import viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from rest_framework.decorators import action
+from django.http import StreamingHttpResponse
 
 
 import os
-from PIL import Image
-import pytesseract
+import uuid
+import zipfile
 
 from .models import (
     Invoice, TaskAssignment, Supplier, ERPIntegrationConfig, 
     MatchingRule, ActivityLog, InvoiceStatus, AIChatSession, 
-    AIChatMessage, AIModelTraining, AIRecommendation
+    AIChatMessage, AIModelTraining, AITrainingJob, AIRecommendation, InvoiceBatch, InvoiceOCRLayout
 )
+from .ocr_layout import WordLayout
+from .duplicate_index import find_invoice_near_duplicates
+from .embedding_index import find_similar_invoices
+from .renderers import EventStreamRenderer, format_sse_event
+from .matching_rules import match_invoice_to_erp
+from .erp_mirror import mirror_ready, match_invoice_to_mirror
+from .line_matching import match_invoice_lines
+from .erp_outbox import record_invoice_event, INVOICE_APPROVED, INVOICE_MATCHED, INVOICE_UNMATCHED
+from .pipeline import PIPELINE_STAGES, get_stage_output, resolve_rerun_stage
 from .serializers import (
     InvoiceSerializer, InvoiceCreateSerializer, TaskAssignmentSerializer, 
     SupplierSerializer, ERPIntegrationConfigSerializer, 
@@ -136,132 +151,50 @@ def task_assignment_view(request):
 
 
 # ---------------------------------------------------------
-# 2. OCR PROCESSING FUNCTION (đã chỉnh hoàn chỉnh)
+# 2. HÀNG ĐỢI OCR (pipeline chạy trong tasks.process_invoice_ocr)
 # ---------------------------------------------------------
-def process_invoice_ocr(invoice_id):
+def enqueue_invoice_ocr(invoice, from_stage=None):
     """
-    🤖 Hàm xử lý OCR + AI, đọc text từ ảnh hóa đơn và áp dụng AI để phân tích thông minh
+    📨 Đưa hóa đơn vào hàng đợi OCR (Celery) và trả về job id.
+    Task chỉ được gửi sau khi transaction commit để worker luôn đọc được bản ghi.
+    `from_stage` = bước pipeline cần chạy lại (None = tiếp tục từ bước chưa hoàn thành).
     """
-    from django.utils import timezone
-    import traceback
-    import re
-    import time
+    from .tasks import process_invoice_ocr as process_invoice_ocr_task
 
-    try:
-        # Import AI services
-        from .ai_services import ai_classifier, ai_extractor, fraud_detector, ai_predictor
-        
-        invoice = Invoice.objects.get(id=invoice_id)
-        invoice.status = InvoiceStatus.OCR_PROCESSING
-        invoice.ocr_start_time = timezone.now()
-        invoice.save()
-
-        file_path = os.path.join(settings.MEDIA_ROOT, str(invoice.file))
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Không tìm thấy file: {file_path}")
-
-        # ✅ Cấu hình Tesseract (Windows)
-        tesseract_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-        if os.path.exists(tesseract_path):
-            pytesseract.pytesseract.tesseract_cmd = tesseract_path
-
-        # ✅ Bỏ qua OCR PDF
-        if file_path.lower().endswith(".pdf"):
-            invoice.raw_ocr_text = "[Không hỗ trợ OCR file PDF trực tiếp]"
-            invoice.status = InvoiceStatus.OCR_PROCESSED
-            invoice.ocr_end_time = timezone.now()
-            invoice.save()
-            return
+    job_id = str(uuid.uuid4())
+    invoice.ocr_job_id = job_id
+    invoice.status = InvoiceStatus.UPLOADED
+    invoice.save(update_fields=['ocr_job_id', 'status'])
 
-        # ✅ Thực hiện OCR
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image, lang="vie+eng")
+    invoice_id = invoice.id
+    transaction.on_commit(
+        lambda: process_invoice_ocr_task.apply_async(
+            args=[invoice_id], kwargs={'from_stage': from_stage}, task_id=job_id
+        )
+    )
+    return job_id
 
-        if not text.strip():
-            text = "[⚠️ Không nhận diện được nội dung từ ảnh]"
 
-        # 🤖 --- BẮT ĐẦU XỬ LÝ AI ---
-        ai_start_time = time.time()
-        
-        # 1️⃣ AI Phân loại hóa đơn
-        classification_result = ai_classifier.classify_invoice(text)
-        invoice.ai_category = classification_result['category']
-        invoice.ai_confidence = classification_result['confidence']
-        
-        # 2️⃣ AI Trích xuất dữ liệu thông minh
-        extracted_data = ai_extractor.extract_smart_data(text)
-        invoice.ai_extracted_data = extracted_data
-        
-        # Cập nhật các trường từ AI extraction
-        if extracted_data.get('invoice_number'):
-            invoice.invoice_number = extracted_data['invoice_number']
-        if extracted_data.get('total_amount'):
-            invoice.total_amount = extracted_data['total_amount']
-        if extracted_data.get('supplier_name'):
-            supplier, _ = Supplier.objects.get_or_create(name=extracted_data['supplier_name'])
-            invoice.supplier = supplier
-        
-        # 3️⃣ AI Phát hiện fraud
-        fraud_result = fraud_detector.detect_fraud(extracted_data, text)
-        invoice.fraud_risk_score = fraud_result['risk_score']
-        invoice.fraud_risk_level = fraud_result['risk_level']
-        
-        # 4️⃣ AI Dự đoán
-        prediction_result = ai_predictor.predict_invoice_approval_probability(extracted_data)
-        processing_time_result = ai_predictor.predict_invoice_processing_time(extracted_data)
-        
-        # Tính thời gian xử lý AI
-        ai_processing_time = int((time.time() - ai_start_time) * 1000)  # milliseconds
-        invoice.ai_processing_time = ai_processing_time
-        
-        # Tạo khuyến nghị AI
-        recommendations = []
-        if fraud_result['risk_score'] >= 0.7:
-            recommendations.append("🚨 CẢNH BÁO: Rủi ro fraud cao - cần kiểm tra thủ công")
-        if classification_result['confidence'] < 0.6:
-            recommendations.append("⚠️ Phân loại không chắc chắn - cần xem xét")
-        if prediction_result['approval_probability'] < 0.5:
-            recommendations.append("📋 Khả năng phê duyệt thấp - cần kiểm tra kỹ")
-        
-        invoice.ai_recommendations = "\n".join(recommendations) if recommendations else "✅ Hóa đơn có thể xử lý tự động"
-        
-        # ✅ Kiểm tra xem có phải hóa đơn thật không (cải tiến với AI)
-        keywords = ["HÓA ĐƠN", "INVOICE", "GTGT", "BILL", "RECEIPT"]
-        invoice.is_invoice = any(k in text.upper() for k in keywords) or classification_result['confidence'] > 0.7
-
-        # Lưu tất cả thay đổi
-        invoice.raw_ocr_text = text
-        invoice.status = InvoiceStatus.OCR_PROCESSED
-        invoice.ocr_end_time = timezone.now()
-        invoice.save()
-
-        # Tạo AI Recommendation record
-        if recommendations:
-            AIRecommendation.objects.create(
-                invoice=invoice,
-                recommendation_type='manual_check' if fraud_result['risk_score'] >= 0.7 else 'review',
-                confidence=1.0 - fraud_result['risk_score'],
-                reason=invoice.ai_recommendations
-            )
+def enqueue_invoice_ocr_batch(invoice_ids, chunk_size=None):
+    """📦 Đưa hóa đơn của lô upload vào hàng đợi OCR theo từng nhóm (1 task / nhóm)."""
+    from .tasks import process_invoice_ocr_batch
 
-        print(f"🤖 AI OCR hoàn tất cho hóa đơn ID {invoice.id}")
-        print(f"📊 Phân loại: {invoice.ai_category} (độ tin cậy: {invoice.ai_confidence})")
-        print(f"🧾 Số hóa đơn: {invoice.invoice_number}")
-        print(f"🏢 Nhà cung cấp: {invoice.supplier}")
-        print(f"💰 Tổng tiền: {invoice.total_amount}")
-        print(f"🕵️ Rủi ro fraud: {invoice.fraud_risk_level} ({invoice.fraud_risk_score})")
-        print(f"⏱️ Thời gian AI: {ai_processing_time}ms")
+    chunk_size = chunk_size or getattr(settings, 'BULK_UPLOAD_OCR_CHUNK_SIZE', 20)
+    for start in range(0, len(invoice_ids), chunk_size):
+        process_invoice_ocr_batch.delay(invoice_ids[start:start + chunk_size])
 
-    except Exception as e:
-        print("❌ Lỗi AI OCR:", e)
-        print(traceback.format_exc())
 
-        try:
-            invoice.status = InvoiceStatus.INTEGRATION_ERROR
-            invoice.raw_ocr_text = f"Lỗi AI OCR: {e}"
-            invoice.save()
-        except Exception as save_error:
-            print("⚠️ Không thể lưu trạng thái lỗi:", save_error)
+def ocr_job_payload(request, invoice, job_id):
+    """Thông tin job OCR trả về cùng response 202."""
+    return {
+        "job_id": job_id,
+        "invoice_id": invoice.id,
+        "status": invoice.status,
+        "status_url": request.build_absolute_uri(
+            reverse('app_api:api-ocr-job-status', args=[job_id])
+        ),
+    }
+
 
 # ---------------------------------------------------------
 # 3. API ViewSets (Django REST Framework)
@@ -280,13 +213,15 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 
         invoice = serializer.save(
             uploaded_by=request.user, 
-            status=InvoiceStatus.OCR_PROCESSING
+            status=InvoiceStatus.UPLOADED
         )
 
-        # Gọi OCR thực tế
-        process_invoice_ocr(invoice.id)
+        # OCR chạy nền trên Celery worker, client theo dõi qua status_url
+        job_id = enqueue_invoice_ocr(invoice)
 
-        return Response(InvoiceSerializer(invoice).data, status=status.HTTP_201_CREATED)
+        data = InvoiceSerializer(invoice).data
+        data.update(ocr_job_payload(request, invoice, job_id))
+        return Response(data, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=True, methods=['patch'])
     def update_field(self, request, pk=None):
@@ -394,8 +329,251 @@ class DashboardStatsAPIView(APIView):
 class AsyncInvoiceOCRAPIView(APIView):
     def post(self, request, format=None):
         invoice_id = request.data.get('invoice_id')
-        process_invoice_ocr(invoice_id)
-        return Response({"message": "OCR đã hoàn tất (đồng bộ)."})
+        invoice = Invoice.objects.filter(id=invoice_id).first() if invoice_id else None
+        if not invoice:
+            return Response({"error": "Không tìm thấy hóa đơn."}, status=status.HTTP_404_NOT_FOUND)
+
+        from_stage = request.data.get('from_stage') or None
+        if from_stage and from_stage not in PIPELINE_STAGES:
+            return Response({"error": f"from_stage phải là một trong: {', '.join(PIPELINE_STAGES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        job_id = enqueue_invoice_ocr(invoice, from_stage=resolve_rerun_stage(invoice, from_stage))
+        data = ocr_job_payload(request, invoice, job_id)
+        data["message"] = "📨 Yêu cầu OCR đã được đưa vào hàng đợi."
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+class OCRJobStatusAPIView(APIView):
+    """
+    ⏳ API tra cứu trạng thái job OCR (chỉ đọc vài cột của Invoice, không cần result backend)
+    """
+    def get(self, request, job_id, format=None):
+        job = (
+            Invoice.objects.filter(ocr_job_id=job_id)
+            .values('id', 'status', 'invoice_number', 'ocr_start_time', 'ocr_end_time')
+            .first()
+        )
+        if not job:
+            return Response({"error": "Không tìm thấy job OCR."}, status=status.HTTP_404_NOT_FOUND)
+
+        done = job['status'] not in (InvoiceStatus.UPLOADED, InvoiceStatus.OCR_PROCESSING)
+        fraud_result = (get_stage_output(job['id'], 'fraud') or {}) if done else {}
+        return Response({
+            "job_id": job_id,
+            "invoice_id": job['id'],
+            "status": job['status'],
+            "done": done,
+            "failed": job['status'] == InvoiceStatus.OCR_FAILED,
+            "invoice_number": job['invoice_number'],
+            "ocr_start_time": job['ocr_start_time'],
+            "ocr_end_time": job['ocr_end_time'],
+            # Hóa đơn gần trùng bước fraud đã tìm (lưu trong checkpoint), poll không tra lại chỉ mục LSH
+            "near_duplicates": fraud_result.get('near_duplicates', []),
+        })
+
+
+class InvoiceOCRWordsAPIView(APIView):
+    """
+    📐 API truy vấn từ OCR theo vị trí (bố cục cấp từ đã lưu, không cần OCR lại)
+    - ?left=&top=&right=&bottom=[&page=]: các từ nằm trong vùng (pixel)
+    - ?right_of=Tổng cộng: các từ bên phải nhãn trên cùng dòng
+    - không tham số: toàn bộ từ
+    """
+    def get(self, request, pk, format=None):
+        blob = InvoiceOCRLayout.objects.filter(invoice_id=pk).values_list('data', flat=True).first()
+        if not blob:
+            return Response({"error": "Hóa đơn chưa có bố cục OCR."}, status=status.HTTP_404_NOT_FOUND)
+        layout = WordLayout.unpack(blob)
+
+        params = request.query_params
+        try:
+            if params.get('right_of'):
+                words = layout.words_right_of(params['right_of'])
+            elif any(k in params for k in ('left', 'top', 'right', 'bottom')):
+                words = layout.words_in_region(
+                    float(params.get('left', 0)),
+                    float(params.get('top', 0)),
+                    float(params.get('right', float('inf'))),
+                    float(params.get('bottom', float('inf'))),
+                    page=int(params['page']) if params.get('page') else None,
+                )
+            else:
+                words = list(layout)
+        except ValueError:
+            return Response({"error": "Tham số vùng không hợp lệ."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "invoice_id": pk,
+            "page_count": layout.page_count,
+            "count": len(words),
+            "words": [word._asdict() for word in words],
+        })
+
+
+class InvoiceNearDuplicatesAPIView(APIView):
+    """
+    🧬 API hóa đơn gần trùng (OCR text) theo chỉ mục MinHash/LSH
+    - ?threshold=0.75: ngưỡng độ tương đồng (mặc định INVOICE_NEAR_DUPLICATE_THRESHOLD)
+    - ?limit=5: số hóa đơn trả về tối đa
+    """
+    def get(self, request, pk, format=None):
+        try:
+            threshold = float(request.query_params['threshold']) if request.query_params.get('threshold') else None
+            limit = int(request.query_params.get('limit', 5))
+        except ValueError:
+            return Response({"error": "threshold / limit không hợp lệ."}, status=status.HTTP_400_BAD_REQUEST)
+
+        duplicates = find_invoice_near_duplicates(pk, threshold=threshold, limit=max(1, min(limit, 50)))
+        if duplicates is None:
+            return Response({"error": "Hóa đơn chưa có trong chỉ mục gần trùng."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "invoice_id": pk,
+            "count": len(duplicates),
+            "near_duplicates": duplicates,
+        })
+
+
+class InvoiceSimilarAPIView(APIView):
+    """
+    🧭 API hóa đơn tương tự (embedding OCR text): hóa đơn cũ cùng nhà cung cấp / mẫu để đối chiếu
+    - ?k=10: số hóa đơn trả về (tối đa 50)
+    - ?nprobe=16: số cụm IVF quét (khi chỉ mục có bộ lượng tử thô), lớn hơn = chính xác hơn, chậm hơn
+    """
+    def get(self, request, pk, format=None):
+        try:
+            k = int(request.query_params.get('k', 10))
+            nprobe = int(request.query_params['nprobe']) if request.query_params.get('nprobe') else None
+        except ValueError:
+            return Response({"error": "k / nprobe không hợp lệ."}, status=status.HTTP_400_BAD_REQUEST)
+
+        similar = find_similar_invoices(pk, k=max(1, min(k, 50)), nprobe=nprobe)
+        if similar is None:
+            return Response({"error": "Hóa đơn chưa có embedding."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "invoice_id": pk,
+            "count": len(similar),
+            "similar_invoices": similar,
+        })
+
+
+BULK_UPLOAD_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
+
+
+def iter_bulk_upload_files(uploaded_files):
+    """
+    Duyệt các file hóa đơn trong request upload hàng loạt, yield (tên file, nội dung).
+    File .zip được đọc lần lượt từng file bên trong (không giải nén toàn bộ vào RAM).
+    File không đúng định dạng được yield với nội dung None để đếm số file bị bỏ qua.
+    """
+    for uploaded in uploaded_files:
+        name = os.path.basename(uploaded.name or '')
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(uploaded) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    member_name = os.path.basename(info.filename)
+                    if not member_name.lower().endswith(BULK_UPLOAD_EXTENSIONS):
+                        yield member_name, None
+                        continue
+                    with archive.open(info) as member:
+                        yield member_name, File(member, name=member_name)
+        elif name.lower().endswith(BULK_UPLOAD_EXTENSIONS):
+            yield name, uploaded
+        else:
+            yield name, None
+
+
+class InvoiceBatchUploadAPIView(APIView):
+    """
+    📦 API upload hóa đơn hàng loạt (file zip hoặc nhiều file trong trường `files`)
+    Ghi file vào storage, tạo Invoice bằng bulk_create trong 1 transaction
+    và đưa OCR vào hàng đợi theo từng nhóm.
+    """
+    def post(self, request, format=None):
+        uploaded_files = request.FILES.getlist('files') + request.FILES.getlist('file')
+        if not uploaded_files:
+            return Response({"error": "Chưa chọn file hóa đơn nào."}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_files = getattr(settings, 'BULK_UPLOAD_MAX_FILES', 1000)
+        upload_field = Invoice._meta.get_field('file')
+        stored_paths, skipped = [], []
+
+        try:
+            for name, content in iter_bulk_upload_files(uploaded_files):
+                if content is None:
+                    skipped.append(name)
+                    continue
+                if len(stored_paths) >= max_files:
+                    raise ValueError(f"Mỗi lô tối đa {max_files} file.")
+                stored_paths.append(default_storage.save(upload_field.generate_filename(None, name), content))
+        except (zipfile.BadZipFile, ValueError) as e:
+            for path in stored_paths:
+                default_storage.delete(path)
+            return Response({"error": f"Không thể xử lý lô upload: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not stored_paths:
+            return Response({"error": "Không có file hóa đơn hợp lệ.", "skipped": skipped},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            batch = InvoiceBatch.objects.create(
+                batch_id=str(uuid.uuid4()),
+                uploaded_by=request.user,
+                total_files=len(stored_paths)
+            )
+            Invoice.objects.bulk_create([
+                Invoice(
+                    file=path,
+                    uploaded_by=request.user,
+                    status=InvoiceStatus.UPLOADED,
+                    batch=batch,
+                    ocr_job_id=str(uuid.uuid4()),
+                )
+                for path in stored_paths
+            ], batch_size=500)
+            invoice_ids = list(batch.invoices.order_by('id').values_list('id', flat=True))
+            transaction.on_commit(lambda: enqueue_invoice_ocr_batch(invoice_ids))
+
+        return Response({
+            "batch_id": batch.batch_id,
+            "total_files": batch.total_files,
+            "skipped": skipped,
+            "status_url": request.build_absolute_uri(
+                reverse('app_api:api-invoice-batch-status', args=[batch.batch_id])
+            ),
+            "message": f"📦 Đã nhận {batch.total_files} hóa đơn, OCR đang chạy nền.",
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class InvoiceBatchStatusAPIView(APIView):
+    """
+    📊 API tiến độ xử lý của lô upload hàng loạt (1 truy vấn GROUP BY trạng thái)
+    """
+    def get(self, request, batch_id, format=None):
+        batch = InvoiceBatch.objects.filter(batch_id=batch_id).first()
+        if not batch:
+            return Response({"error": "Không tìm thấy lô upload."}, status=status.HTTP_404_NOT_FOUND)
+
+        counts = {
+            item['status']: item['total']
+            for item in Invoice.objects.filter(batch=batch).values('status').annotate(total=Count('id'))
+        }
+        total = sum(counts.values())
+        pending = counts.get(InvoiceStatus.UPLOADED, 0) + counts.get(InvoiceStatus.OCR_PROCESSING, 0)
+        processed = total - pending
+
+        return Response({
+            "batch_id": batch.batch_id,
+            "total_files": total,
+            "processed": processed,
+            "failed": counts.get(InvoiceStatus.OCR_FAILED, 0),
+            "progress": round(processed / total * 100, 2) if total else 100.0,
+            "done": pending == 0,
+            "status_counts": counts,
+            "created_at": batch.created_at,
+        })
 
 
 # ---------------------------------------------------------
@@ -434,18 +612,21 @@ def get_invoice_detail(request, pk):
 def approve_invoice(request, pk):
     """
     ✅ Phê duyệt hóa đơn
+    Trạng thái, nhật ký và sự kiện gửi ERP (outbox, xem erp_outbox.py) được ghi trong cùng một transaction.
     """
     try:
-        invoice = Invoice.objects.get(pk=pk)
-        invoice.status = InvoiceStatus.APPROVED
-        invoice.save()
+        with transaction.atomic():
+            invoice = Invoice.objects.select_related('supplier').get(pk=pk)
+            invoice.status = InvoiceStatus.APPROVED
+            invoice.save()
 
-        ActivityLog.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            invoice=invoice,
-            action="Phê duyệt hóa đơn",
-            details=f"Hóa đơn {invoice.invoice_number or invoice.id} đã được phê duyệt."
-        )
+            ActivityLog.objects.create(
+                user=request.user if request.user.is_authenticated else None,
+                invoice=invoice,
+                action="Phê duyệt hóa đơn",
+                details=f"Hóa đơn {invoice.invoice_number or invoice.id} đã được phê duyệt."
+            )
+            record_invoice_event(invoice, INVOICE_APPROVED)
 
         return Response({"message": "✅ Hóa đơn đã được phê duyệt thành công!"}, status=200)
 
@@ -455,26 +636,61 @@ def approve_invoice(request, pk):
         return Response({"error": str(e)}, status=500)
 
 
+def erp_mirror_not_synced_response():
+    """
+    Khớp ERP không kèm `erp_record` (nút "Khớp ERP" ở trang chi tiết hóa đơn) cần bản sao ERP cục bộ.
+    Chưa đồng bộ lần nào thì trả 400 với `code` để giao diện hiện hướng dẫn thay vì lỗi chung.
+    """
+    return Response({
+        "error": "Chưa có dữ liệu ERP để đối chiếu. Quản trị viên cần cấu hình kết nối ERP và chạy đồng bộ "
+                 "(python manage.py sync_erp_mirror) trước, hoặc gửi kèm erp_record.",
+        "code": "erp_mirror_not_synced",
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['POST'])
 def match_invoice_erp(request, pk):
     """
     🔗 Khớp / Tạo ERP cho hóa đơn
+    Đối chiếu theo các MatchingRule đang bật với PO trong bản sao ERP cục bộ (erp_mirror.py), hoặc với
+    bản ghi ERP `erp_record` gửi kèm (invoice_number, supplier_tax_id, supplier_name, total_amount, issue_date).
+    Kết quả đối chiếu, nhật ký và sự kiện gửi ERP (outbox) được ghi trong cùng một transaction.
     """
     try:
-        invoice = Invoice.objects.get(pk=pk)
-        # Giả lập khớp ERP thành công (thực tế có thể gọi API ERP)
-        invoice.status = InvoiceStatus.MATCHED
-        invoice.match_score = 0.95  # ví dụ: khớp 95%
-        invoice.save()
+        erp_record = request.data.get('erp_record')
+        if erp_record is None and not mirror_ready():
+            return erp_mirror_not_synced_response()
+        if erp_record is not None and not isinstance(erp_record, dict):
+            return Response({"error": "erp_record phải là object."}, status=400)
+
+        with transaction.atomic():
+            invoice = Invoice.objects.select_related('supplier').get(pk=pk)
+            purchase_order = None
+            if erp_record is None:
+                purchase_order, rule = match_invoice_to_mirror(invoice)
+            else:
+                rule = match_invoice_to_erp(invoice, erp_record)
 
-        ActivityLog.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            invoice=invoice,
-            action="Khớp ERP thành công",
-            details=f"Hóa đơn {invoice.invoice_number or invoice.id} đã khớp ERP với độ chính xác 95%."
-        )
+            ActivityLog.objects.create(
+                user=request.user if request.user.is_authenticated else None,
+                invoice=invoice,
+                action="Khớp ERP thành công" if rule else "Khớp ERP thất bại",
+                details=(
+                    f"Hóa đơn {invoice.invoice_number or invoice.id} đã khớp ERP theo quy tắc #{rule.priority} "
+                    f"với độ chính xác {rule.score:.0%}." if rule else
+                    f"Hóa đơn {invoice.invoice_number or invoice.id} không khớp quy tắc đối chiếu nào."
+                )
+            )
+            record_invoice_event(invoice, INVOICE_MATCHED if rule else INVOICE_UNMATCHED)
 
-        return Response({"message": "🔗 Hóa đơn đã được khớp ERP!"}, status=200)
+        if not rule:
+            return Response({"message": "⚠️ Hóa đơn không khớp với bản ghi ERP.", "match_score": 0}, status=200)
+        return Response({
+            "message": "🔗 Hóa đơn đã được khớp ERP!",
+            "match_score": rule.score,
+            "rule_priority": rule.priority,
+            "purchase_order": purchase_order.po_number if purchase_order else None,
+        }, status=200)
 
     except Invoice.DoesNotExist:
         return Response({"error": "Không tìm thấy hóa đơn."}, status=404)
@@ -486,19 +702,28 @@ def match_invoice_erp(request, pk):
 def rerun_ocr(request, pk):
     """
     🔄 Chạy lại OCR cho hóa đơn
+    Mặc định tiếp tục từ bước pipeline bị lỗi (không OCR lại nếu OCR đã xong);
+    truyền `from_stage` (vd. 'extraction', 'ocr') để buộc chạy lại từ bước đó.
     """
     try:
         invoice = Invoice.objects.get(pk=pk)
-        process_invoice_ocr(invoice.id)
+        from_stage = request.data.get('from_stage') or None
+        if from_stage and from_stage not in PIPELINE_STAGES:
+            return Response({"error": f"from_stage phải là một trong: {', '.join(PIPELINE_STAGES)}"}, status=400)
+
+        from_stage = resolve_rerun_stage(invoice, from_stage)
+        job_id = enqueue_invoice_ocr(invoice, from_stage=from_stage)
 
         ActivityLog.objects.create(
             user=request.user if request.user.is_authenticated else None,
             invoice=invoice,
             action="Chạy lại OCR",
-            details=f"Hóa đơn {invoice.invoice_number or invoice.id} được OCR lại vào {timezone.now()}."
+            details=f"Hóa đơn {invoice.invoice_number or invoice.id} được đưa vào hàng đợi OCR lại vào {timezone.now()} (job {job_id}, từ bước {from_stage or 'chưa hoàn thành'})."
         )
 
-        return Response({"message": "🔄 OCR đã được chạy lại thành công!"}, status=200)
+        data = ocr_job_payload(request, invoice, job_id)
+        data["message"] = "🔄 OCR đã được đưa vào hàng đợi chạy lại!"
+        return Response(data, status=202)
 
     except Invoice.DoesNotExist:
         return Response({"error": "Không tìm thấy hóa đơn."}, status=404)
@@ -608,33 +833,68 @@ class SupplierPerformanceAPIView(APIView):
 # ---------------------------------------------------------
 class InvoiceMatchAPIView(APIView):
     """
-    🔗 API mô phỏng đối chiếu OCR và ERP cho hóa đơn
+    🔗 API đối chiếu OCR và ERP cho hóa đơn (bản sao ERP hoặc `erp_record`, xem match_invoice_erp)
     """
     def post(self, request, pk, *args, **kwargs):
         try:
-            invoice = Invoice.objects.get(pk=pk)
-            # Tạm thời giả lập match tự động
-            invoice.status = InvoiceStatus.MATCHED
-            invoice.match_score = 0.92
-            invoice.save()
+            erp_record = request.data.get('erp_record')
+            if erp_record is None and not mirror_ready():
+                return erp_mirror_not_synced_response()
+            if erp_record is not None and not isinstance(erp_record, dict):
+                return Response({"error": "erp_record phải là object."}, status=status.HTTP_400_BAD_REQUEST)
+
+            with transaction.atomic():
+                invoice = Invoice.objects.select_related('supplier').get(pk=pk)
+                purchase_order = None
+                if erp_record is None:
+                    purchase_order, rule = match_invoice_to_mirror(invoice)
+                else:
+                    rule = match_invoice_to_erp(invoice, erp_record)
+                record_invoice_event(invoice, INVOICE_MATCHED if rule else INVOICE_UNMATCHED)
+            if not rule:
+                return Response({
+                    "message": f"Hóa đơn ID={invoice.id} không khớp với bản ghi ERP.",
+                    "match_score": 0
+                }, status=status.HTTP_200_OK)
 
             return Response({
-                "message": f"Hóa đơn ID={invoice.id} đã khớp thành công với ERP (độ chính xác 92%)."
+                "message": f"Hóa đơn ID={invoice.id} đã khớp thành công với ERP (độ chính xác {rule.score:.0%}).",
+                "match_score": rule.score,
+                "rule_priority": rule.priority,
+                "purchase_order": purchase_order.po_number if purchase_order else None
             }, status=status.HTTP_200_OK)
 
         except Invoice.DoesNotExist:
             return Response({"error": "Không tìm thấy hóa đơn."}, status=status.HTTP_404_NOT_FOUND)
 
 
+class InvoiceLineMatchAPIView(APIView):
+    """
+    📦 API đối chiếu dòng hàng hóa đơn ↔ PO đã khớp (↔ phiếu nhập kho), xem line_matching.py
+    - Body (tùy chọn): {"receipts": [{"line_no": 1, "quantity": 10}, ...]} số lượng đã nhận theo dòng PO
+    """
+    def post(self, request, pk, *args, **kwargs):
+        receipts = request.data.get('receipts')
+        if receipts is not None and not (isinstance(receipts, list) and all(isinstance(row, dict) for row in receipts)):
+            return Response({"error": "receipts phải là danh sách object."}, status=status.HTTP_400_BAD_REQUEST)
+        invoice = get_object_or_404(Invoice.objects.select_related('purchase_order'), pk=pk)
+        result = match_invoice_lines(invoice, receipts=receipts)
+        if result is None:
+            return Response({"error": "Hóa đơn chưa khớp PO (gọi /match/ trước)."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(dict(result, invoice_id=invoice.id))
+
+
 class InvoiceApproveAPIView(APIView):
     """
     ✅ API phê duyệt hóa đơn
     """
     def post(self, request, pk, *args, **kwargs):
         try:
-            invoice = Invoice.objects.get(pk=pk)
-            invoice.status = InvoiceStatus.APPROVED
-            invoice.save()
+            with transaction.atomic():
+                invoice = Invoice.objects.select_related('supplier').get(pk=pk)
+                invoice.status = InvoiceStatus.APPROVED
+                invoice.save()
+                record_invoice_event(invoice, INVOICE_APPROVED)
 
             return Response({
                 "message": f"Hóa đơn ID={invoice.id} đã được phê duyệt thành công!"
@@ -649,46 +909,58 @@ class AIChatAPIView(APIView):
     """
     💬 API Chat với AI Bot
     """
-    def post(self, request):
-        try:
-            from .ai_services import ai_chatbot
-            
-            user_message = request.data.get('message', '')
-            session_id = request.data.get('session_id', '')
-            
-            if not user_message:
-                return Response({"error": "Tin nhắn không được để trống"}, status=400)
-            
-            # Tạo hoặc lấy session
-            if session_id:
-                try:
-                    session = AIChatSession.objects.get(session_id=session_id, user=request.user)
-                except AIChatSession.DoesNotExist:
-                    session = AIChatSession.objects.create(
-                        user=request.user,
-                        session_id=session_id
-                    )
-            else:
-                import uuid
-                session_id = str(uuid.uuid4())
+    def get_chat_session(self, request, session_id):
+        """Lấy hoặc tạo session chat, trả về (session, session_id)."""
+        if session_id:
+            try:
+                session = AIChatSession.objects.get(session_id=session_id, user=request.user)
+            except AIChatSession.DoesNotExist:
                 session = AIChatSession.objects.create(
                     user=request.user,
                     session_id=session_id
                 )
-            
-            # Lưu tin nhắn người dùng
-            AIChatMessage.objects.create(
-                session=session,
-                message_type='user',
-                content=user_message
+        else:
+            session_id = str(uuid.uuid4())
+            session = AIChatSession.objects.create(
+                user=request.user,
+                session_id=session_id
             )
+        return session, session_id
+
+    def start_chat(self, request):
+        """
+        Kiểm tra tin nhắn, lấy session, lưu tin nhắn người dùng và tạo context.
+        Trả về (user_message, session, session_id, context) hoặc Response lỗi.
+        """
+        user_message = request.data.get('message', '')
+        if not user_message:
+            return Response({"error": "Tin nhắn không được để trống"}, status=400)
+
+        session, session_id = self.get_chat_session(request, request.data.get('session_id', ''))
+        
+        # Lưu tin nhắn người dùng
+        AIChatMessage.objects.create(
+            session=session,
+            message_type='user',
+            content=user_message
+        )
+        
+        # Tạo context từ dữ liệu hiện tại
+        context = {
+            'user_id': request.user.id,
+            'session_id': session_id,
+            'recent_invoices': list(Invoice.objects.filter(uploaded_by=request.user)[:5].values('id', 'invoice_number', 'status'))
+        }
+        return user_message, session, session_id, context
+
+    def post(self, request):
+        try:
+            from .ai_services import ai_chatbot
             
-            # Tạo context từ dữ liệu hiện tại
-            context = {
-                'user_id': request.user.id,
-                'session_id': session_id,
-                'recent_invoices': list(Invoice.objects.filter(uploaded_by=request.user)[:5].values('id', 'invoice_number', 'status'))
-            }
+            started = self.start_chat(request)
+            if isinstance(started, Response):
+                return started
+            user_message, session, session_id, context = started
             
             # Chat với AI
             ai_response = ai_chatbot.chat(user_message, context)
@@ -715,6 +987,60 @@ class AIChatAPIView(APIView):
             return Response({"error": str(e)}, status=500)
 
 
+class AIChatStreamAPIView(AIChatAPIView):
+    """
+    📡 API Chat với AI Bot, trả lời stream bằng server-sent events
+
+    Event: `start` (session_id) → nhiều `delta` (text) → `done` (toàn bộ câu trả lời) hoặc `error`.
+    Body của response là async generator: chạy dưới ASGI (asgi.py), chờ model không giữ worker và
+    client nhận đoạn đầu tiên ngay khi model sinh ra. Dưới WSGI Django gom đủ rồi mới gửi.
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        from .ai_services import ai_chatbot
+
+        started = self.start_chat(request)
+        if isinstance(started, Response):
+            return started
+        user_message, session, session_id, context = started
+
+        reply = ai_chatbot.reply(user_message, context)
+        response = StreamingHttpResponse(
+            self.event_stream(reply, session, session_id, context),
+            content_type='text/event-stream; charset=utf-8',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx: không buffer response stream
+        return response
+
+    async def event_stream(self, reply, session, session_id, context):
+        yield format_sse_event('start', {'session_id': session_id})
+        try:
+            async for piece in reply.stream():
+                yield format_sse_event('delta', {'text': piece})
+
+            await AIChatMessage.objects.acreate(
+                session=session,
+                message_type='ai',
+                content=reply.text,
+                context=context
+            )
+            session.last_activity = timezone.now()
+            await session.asave(update_fields=['last_activity'])
+        except Exception as e:
+            yield format_sse_event('error', {'error': str(e), 'session_id': session_id})
+            return
+
+        yield format_sse_event('done', {
+            'response': reply.text,
+            'session_id': session_id,
+            'cached': reply.cached,
+            'complete': reply.complete,
+            'timestamp': timezone.now().isoformat()
+        })
+
+
 class AIAnalysisAPIView(APIView):
     """
     🔍 API Phân tích AI cho hóa đơn
@@ -732,6 +1058,7 @@ class AIAnalysisAPIView(APIView):
                 'ai_extracted_data': invoice.ai_extracted_data,
                 'ai_processing_time': invoice.ai_processing_time,
                 'ai_recommendations': invoice.ai_recommendations,
+                'near_duplicates': find_invoice_near_duplicates(invoice.id) or [],
                 'recommendations': []
             }
             
@@ -757,46 +1084,81 @@ class AIAnalysisAPIView(APIView):
 class AITrainingAPIView(APIView):
     """
     🎯 API Huấn luyện AI Model
+    Tạo job huấn luyện chạy nền (Celery, hàng đợi 'training') và trả về 202 ngay;
+    theo dõi tiến độ / log qua status_url, hủy qua cancel_url.
+    Tham số: training_data, model_type, mode ('full' | 'incremental'), cv_folds, n_jobs, chunk_size, full
     """
     def post(self, request):
         try:
-            from .ai_services import ai_classifier
+            from .training_jobs import create_training_job, TRAINING_MODES
             
             training_data = request.data.get('training_data', [])
             model_type = request.data.get('model_type', 'classifier')
+            mode = request.data.get('mode', 'full')
             
-            if not training_data:
+            if model_type != 'classifier':
+                return Response({"error": "Loại model không được hỗ trợ"}, status=400)
+            if mode not in TRAINING_MODES:
+                return Response({"error": f"Chế độ huấn luyện không hợp lệ: {mode}"}, status=400)
+            # Chế độ tăng dần học dữ liệu gán nhãn mới trong DB, không cần training_data
+            if mode == 'full' and not training_data:
                 return Response({"error": "Dữ liệu huấn luyện không được để trống"}, status=400)
             
-            # Huấn luyện model
-            if model_type == 'classifier':
-                success = ai_classifier.train_model(training_data)
-                
-                if success:
-                    # Lưu thông tin training
-                    AIModelTraining.objects.create(
-                        model_name=f"Invoice Classifier {timezone.now().strftime('%Y%m%d_%H%M%S')}",
-                        model_type='classifier',
-                        training_data_count=len(training_data),
-                        accuracy=0.85,  # Giả sử accuracy
-                        last_trained=timezone.now(),
-                        model_file_path=ai_classifier.model_path
-                    )
-                    
-                    return Response({
-                        "message": "✅ AI Model đã được huấn luyện thành công",
-                        "training_data_count": len(training_data),
-                        "model_type": model_type
-                    })
-                else:
-                    return Response({"error": "Lỗi huấn luyện AI model"}, status=500)
-            else:
-                return Response({"error": "Loại model không được hỗ trợ"}, status=400)
+            params = {}
+            for name in ('cv_folds', 'n_jobs', 'chunk_size'):
+                if request.data.get(name) is not None:
+                    params[name] = int(request.data[name])
+            if mode == 'incremental':
+                params['full'] = bool(request.data.get('full', False))
+            
+            job = create_training_job(
+                model_type=model_type, mode=mode, training_data=training_data if mode == 'full' else [],
+                params=params, user=request.user
+            )
+            return Response({
+                "message": "⏳ Đã đưa job huấn luyện vào hàng đợi",
+                "job_id": job.job_id,
+                "status": job.status,
+                "training_data_count": len(training_data),
+                "model_type": model_type,
+                "mode": mode,
+                "status_url": request.build_absolute_uri(reverse('app_api:api-ai-training-job', args=[job.job_id])),
+                "cancel_url": request.build_absolute_uri(reverse('app_api:api-ai-training-job-cancel', args=[job.job_id])),
+            }, status=status.HTTP_202_ACCEPTED)
                 
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=400)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
 
+class AITrainingJobAPIView(APIView):
+    """
+    📊 API trạng thái job huấn luyện: tiến độ, log, kết quả (accuracy, báo cáo theo loại, độ trễ)
+    """
+    def get(self, request, job_id):
+        from .training_jobs import job_payload
+        
+        job = AITrainingJob.objects.select_related('training').filter(job_id=job_id).first()
+        if not job:
+            return Response({"error": "Không tìm thấy job huấn luyện"}, status=404)
+        return Response(job_payload(job))
+
+
+class AITrainingJobCancelAPIView(APIView):
+    """
+    🛑 API hủy job huấn luyện (job đang chạy dừng ở fold / lô kế tiếp)
+    """
+    def post(self, request, job_id):
+        from .training_jobs import request_cancel, job_payload
+        
+        job = AITrainingJob.objects.filter(job_id=job_id).first()
+        if not job:
+            return Response({"error": "Không tìm thấy job huấn luyện"}, status=404)
+        job = request_cancel(job)
+        return Response(job_payload(job))
+
+
 class AIPredictionAPIView(APIView):
     """
     🔮 API Dự đoán AI
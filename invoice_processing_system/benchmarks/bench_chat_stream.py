@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark AI Chatbot: chờ đủ câu trả lời vs stream + cache câu hỏi FAQ
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_chat_stream.py --concurrency 50
+
+- Model giả lập bằng LocalChatBackend: `--first-delay` giây trước đoạn đầu tiên, `--token-delay` giây mỗi từ
+  (độ trễ kiểu API chat thật), nên không cần mạng / API key
+- "blocking": như `chat()` cũ, người dùng chờ đủ câu trả lời, worker bị giữ suốt thời gian đó
+- "stream": thời gian tới đoạn đầu tiên (người dùng bắt đầu đọc) và tới đoạn cuối
+- "cache": hỏi lại câu hỏi FAQ (viết khác: hoa / thường, dấu câu, tiểu từ cuối câu) → không gọi model
+- "đồng thời": `--concurrency` cuộc chat trên MỘT event loop (như một worker ASGI) vs lần lượt trên một worker đồng bộ
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from invoice_processing_system.app_invoices.chat_backends import (
+    ChatReply, LocalChatBackend, get_answer_cache,
+)
+
+QUESTIONS = [
+    "Trạng thái hóa đơn là gì?", "Hướng dẫn sử dụng hệ thống", "Lỗi OCR không hoạt động",
+    "Các status của hóa đơn", "Giúp tôi với", "Hệ thống bị lỗi khi upload",
+]
+REPHRASED = [
+    "trạng thái hóa đơn là gì ạ", "HƯỚNG DẪN SỬ DỤNG HỆ THỐNG!", "lỗi ocr không hoạt động...",
+    "các status của hóa đơn nhé", "Hệ thống bị lỗi khi upload?",
+]
+
+
+async def timed_reply(message, backend):
+    """(giây tới đoạn đầu tiên, giây tới khi xong, ChatReply)"""
+    reply = ChatReply(message, backend=backend)
+    start = time.perf_counter()
+    first = None
+    async for _ in reply.stream():
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start, reply
+
+
+async def run(args):
+    backend = LocalChatBackend(first_delay=args.first_delay, token_delay=args.token_delay)
+    get_answer_cache().clear()
+
+    print("⏱️ Benchmark AI Chatbot (stream + cache)")
+    print("=" * 50)
+    print(f"  model giả lập: {args.first_delay * 1000:.0f}ms tới từ đầu tiên, {args.token_delay * 1000:.0f}ms / từ")
+
+    results = [await timed_reply(question, backend) for question in QUESTIONS]
+    first = statistics.median(r[0] for r in results) * 1000
+    total = statistics.median(r[1] for r in results) * 1000
+    print(f"  blocking: trung vị {total:.0f}ms tới khi thấy câu trả lời")
+    print(f"  stream  : trung vị {first:.0f}ms tới đoạn đầu tiên ({total:.0f}ms tới đoạn cuối)")
+
+    cached = [await timed_reply(question, backend) for question in REPHRASED]
+    hits = sum(r[2].cached for r in cached)
+    cached_ms = statistics.median(r[1] for r in cached) * 1000
+    print(f"  cache   : trung vị {cached_ms:.3f}ms, trúng cache {hits}/{len(REPHRASED)} câu hỏi viết khác")
+
+    # Câu hỏi có số / dữ liệu riêng không dùng cache → mọi cuộc chat đều gọi model
+    messages = [f"Hóa đơn {i} bị lỗi gì vậy" for i in range(args.concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(timed_reply(message, backend) for message in messages))
+    concurrent = time.perf_counter() - start
+    sequential = total / 1000 * args.concurrency
+    print(f"  đồng thời: {args.concurrency} cuộc chat trên 1 event loop {concurrent:.2f}s "
+          f"vs lần lượt trên 1 worker đồng bộ ~{sequential:.1f}s")
+    print(f"\n🚀 Đoạn đầu tiên sớm hơn x{total / first:.1f}, câu hỏi FAQ lặp lại nhanh hơn x{total / cached_ms:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--first-delay', type=float, default=0.8, help='Giây tới đoạn đầu tiên của model giả lập')
+    parser.add_argument('--token-delay', type=float, default=0.03, help='Giây mỗi từ của model giả lập')
+    parser.add_argument('--concurrency', type=int, default=50, help='Số cuộc chat đồng thời')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
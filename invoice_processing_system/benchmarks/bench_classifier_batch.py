@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark phân loại hóa đơn theo lô (InvoiceAIClassifier.classify_batch)
+So sánh cách cũ (mỗi hóa đơn: transform 1 text, `predict` rồi `predict_proba` → duyệt forest
+2 lần) với `classify_batch` (1 ma trận thưa, 1 lần `predict_proba`, nhãn = argmax):
+1. Kiểm tra nhãn + độ tin cậy giống hệt cách cũ
+2. Đo thời gian trung bình mỗi hóa đơn theo kích thước lô
+
+Model được huấn luyện trực tiếp trên dữ liệu tổng hợp (không ghi vào registry / ai_models/).
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_classifier_batch.py --invoices 2000 --batch-sizes 1 50 500
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from invoice_processing_system.app_invoices.ai_services import InvoiceAIClassifier
+
+CATEGORY_WORDS = {
+    'Điện': ['điện', 'EVN', 'kWh', 'công tơ'],
+    'Nước': ['nước', 'cấp nước', 'm3', 'Sawaco'],
+    'Internet': ['internet', 'FPT', 'cáp quang', 'wifi'],
+    'Điện thoại': ['Viettel', 'di động', 'cước gọi', 'sim'],
+    'Xăng dầu': ['xăng', 'Petrolimex', 'RON95', 'lít'],
+    'Văn phòng phẩm': ['giấy A4', 'bút bi', 'mực in', 'kẹp giấy'],
+    'Thiết bị': ['máy tính', 'màn hình', 'máy in', 'bàn phím'],
+    'Dịch vụ': ['bảo trì', 'tư vấn', 'vệ sinh', 'bảo vệ'],
+    'Khác': ['quà tặng', 'hoa', 'tiếp khách', 'phí khác'],
+}
+FILLER = ['HÓA ĐƠN GIÁ TRỊ GIA TĂNG', 'Số:', 'Ngày', 'Tổng cộng', 'VND', 'Thuế GTGT', 'MST', 'Công ty']
+
+
+def make_text(rng, category):
+    words = rng.choices(CATEGORY_WORDS[category], k=6) + rng.choices(FILLER, k=20)
+    rng.shuffle(words)
+    return ' '.join(words) + f" {rng.randint(100000, 9999999)}"
+
+
+def legacy_classify(classifier, text):
+    """Cách cũ: transform từng text, duyệt forest 2 lần (predict + predict_proba)."""
+    X = classifier.vectorizer.transform([text])
+    prediction = classifier.model.predict(X)[0]
+    confidence = max(classifier.model.predict_proba(X)[0])
+    return prediction, float(confidence)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--invoices', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 50, 500])
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    categories = list(CATEGORY_WORDS)
+    training_data = [{'text': make_text(rng, c), 'category': c} for c in categories for _ in range(60)]
+    texts = [make_text(rng, rng.choice(categories)) for _ in range(args.invoices)]
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.ensemble import RandomForestClassifier
+
+    # Cùng cấu hình với InvoiceAIClassifier.train_model
+    classifier = InvoiceAIClassifier()
+    classifier.n_jobs = args.n_jobs
+    classifier._refresh_model = lambda: None  # không hot swap sang model trong registry
+    classifier.vectorizer = TfidfVectorizer(max_features=5000, stop_words=None, ngram_range=(1, 3))
+    X = classifier.vectorizer.fit_transform([item['text'] for item in training_data])
+    classifier.model = RandomForestClassifier(n_estimators=100, random_state=42, max_depth=10, n_jobs=args.n_jobs)
+    classifier.model.fit(X, [item['category'] for item in training_data])
+
+    # 1. Kết quả giống hệt
+    expected = [legacy_classify(classifier, text) for text in texts[:500]]
+    actual = [(r['category'], r['confidence']) for r in classifier.classify_batch(texts[:500])]
+    mismatches = sum(1 for e, a in zip(expected, actual) if e[0] != a[0] or abs(e[1] - a[1]) > 1e-12)
+    if mismatches:
+        print(f"❌ {mismatches} kết quả khác cách cũ")
+        sys.exit(1)
+    print(f"✅ Nhãn + độ tin cậy giống hệt cách cũ trên {len(expected)} hóa đơn")
+
+    # 2. Thời gian mỗi hóa đơn
+    print(f"\n⏱️ Thời gian mỗi hóa đơn ({args.invoices} hóa đơn, n_jobs={args.n_jobs})")
+    print("=" * 64)
+    classifier.set_n_jobs(1)
+    started = time.perf_counter()
+    for text in texts:
+        legacy_classify(classifier, text)
+    legacy_ms = (time.perf_counter() - started) * 1000 / len(texts)
+    print(f"  cũ (từng hóa đơn, 1 luồng)  : {legacy_ms:7.3f}ms")
+
+    classifier.set_n_jobs(args.n_jobs)
+    for batch_size in args.batch_sizes:
+        started = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            classifier.classify_batch(texts[i:i + batch_size])
+        batch_ms = (time.perf_counter() - started) * 1000 / len(texts)
+        print(f"  classify_batch lô {batch_size:5d}     : {batch_ms:7.3f}ms  (nhanh hơn x{legacy_ms / batch_ms:.1f})")
+
+
+if __name__ == "__main__":
+    main()
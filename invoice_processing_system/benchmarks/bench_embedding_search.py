@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark tìm hóa đơn tương tự theo embedding: tính điểm cả ma trận vs nhân theo khối + top-k vs IVF
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_embedding_search.py --count 200000 --queries 100
+
+- Sinh `count` vector chuẩn hóa L2 (d=384 như paraphrase-multilingual-MiniLM) theo cụm: mỗi cụm ~ một
+  nhà cung cấp / mẫu hóa đơn, ghi thành .npy và map lại chỉ đọc như ảnh chụp chỉ mục thật
+- "full": `matrix @ q` cho cả ma trận rồi `argsort` toàn bộ điểm
+- "blocked": blocked_topk() trên memmap (khối SEARCH_BLOCK_ROWS hàng, argpartition), từng truy vấn và cả lô
+- "ivf": bộ lượng tử thô √n cụm, quét `--nprobe` cụm gần nhất; recall@k so với kết quả chính xác
+- Nếu đã cài sentence-transformers: đo thêm tốc độ encode OCR text theo lô trên CPU
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+import numpy as np
+
+from invoice_processing_system.app_invoices.embedding_index import (
+    EMBEDDINGS_AVAILABLE, blocked_topk, train_coarse_quantizer, assign_lists, encode_texts,
+)
+
+
+def make_vectors(rng, count, dim, clusters, spread):
+    """Vector theo cụm (tâm ngẫu nhiên + nhiễu), chuẩn hóa L2, sinh theo khối để đỡ tốn RAM."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    for start in range(0, count, 50000):
+        size = min(50000, count - start)
+        block = centers[rng.integers(0, clusters, size)] + spread * rng.standard_normal((size, dim)).astype(np.float32)
+        yield block / np.linalg.norm(block, axis=1, keepdims=True)
+
+
+def timed(function, queries):
+    times, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(function(query))
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200000, help='Số hóa đơn trong chỉ mục')
+    parser.add_argument('--dim', type=int, default=384, help='Số chiều embedding')
+    parser.add_argument('--clusters', type=int, default=2000, help='Số nhà cung cấp / mẫu hóa đơn')
+    parser.add_argument('--queries', type=int, default=100, help='Số truy vấn')
+    parser.add_argument('--k', type=int, default=10, help='Số hóa đơn tương tự cần lấy')
+    parser.add_argument('--nprobe', type=int, default=16, help='Số cụm IVF quét mỗi truy vấn')
+    args = parser.parse_args()
+    rng = np.random.default_rng(42)
+
+    print("⏱️ Benchmark tìm hóa đơn tương tự (embedding)")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'vectors.npy')
+        writer = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(args.count, args.dim))
+        offset = 0
+        for block in make_vectors(rng, args.count, args.dim, args.clusters, spread=0.35):
+            writer[offset:offset + len(block)] = block
+            offset += len(block)
+        writer.flush()
+        del writer
+        matrix = np.load(path, mmap_mode='r')
+        queries = np.asarray(matrix[rng.choice(args.count, args.queries, replace=False)]).copy()
+        queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        print(f"  {args.count} vector × {args.dim} chiều ({args.count * args.dim * 4 / 2**20:.0f}MB float32), "
+              f"{args.clusters} cụm, top-{args.k}")
+
+        # Ma trận nạp vào RAM chỉ được giữ bởi lambda, giải phóng ngay sau khi đo
+        full_ms, full = timed(lambda q, loaded=np.asarray(matrix): np.argsort(-(loaded @ q))[:args.k], queries)
+        blocked_ms, blocked = timed(lambda q: blocked_topk(matrix, q[None, :], args.k)[1][0], queries)
+        same = sum(set(a) == set(b) for a, b in zip(full, blocked))
+        # Nhiều truy vấn một lúc: mỗi khối ma trận được đọc một lần cho cả lô (GEMM thay vì GEMV)
+        start = time.perf_counter()
+        batched = blocked_topk(matrix, queries, args.k)[1]
+        batched_ms = (time.perf_counter() - start) * 1000 / args.queries
+        same_batched = sum(set(a) == set(b) for a, b in zip(full, batched))
+        print(f"  full   : trung vị {full_ms:.1f}ms / truy vấn (nạp cả ma trận vào RAM)")
+        print(f"  blocked: trung vị {blocked_ms:.1f}ms / truy vấn (memmap, cùng kết quả {same}/{args.queries})")
+        print(f"  blocked, lô {args.queries} truy vấn: {batched_ms:.2f}ms / truy vấn (cùng kết quả {same_batched}/{args.queries})")
+
+        nlist = max(1, int(np.sqrt(args.count)))
+        start = time.perf_counter()
+        centroids = train_coarse_quantizer(matrix, nlist)
+        assign = assign_lists(matrix, centroids)
+        order = np.argsort(assign, kind='stable')
+        ordered = np.asarray(matrix)[order]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        build = time.perf_counter() - start
+
+        def ivf_search(query):
+            probes = np.argpartition(-(centroids @ query), args.nprobe - 1)[:args.nprobe]
+            parts = [blocked_topk(ordered, query[None, :], args.k, start=offsets[c], stop=offsets[c + 1]) for c in probes]
+            scores = np.hstack([part[0] for part in parts])[0]
+            rows = np.hstack([part[1] for part in parts])[0]
+            return order[rows[np.argsort(-scores)[:args.k]]]
+
+        ivf_ms, ivf = timed(ivf_search, queries)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(full, ivf)])
+        print(f"  ivf    : trung vị {ivf_ms:.2f}ms / truy vấn, {nlist} cụm, nprobe {args.nprobe}, "
+              f"recall@{args.k} {recall:.3f} (dựng {build:.1f}s)")
+        print(f"\n🚀 lô nhanh hơn full x{full_ms / batched_ms:.0f}, ivf nhanh hơn full x{full_ms / ivf_ms:.0f}")
+
+    if EMBEDDINGS_AVAILABLE:
+        texts = [f"HÓA ĐƠN GTGT Số {i:07d} Công ty TNHH Nhà cung cấp {i % 50} Tổng cộng {i * 1000} VND" for i in range(256)]
+        encode_texts(texts[:8])  # nạp model
+        start = time.perf_counter()
+        encode_texts(texts)
+        print(f"  encode: {len(texts) / (time.perf_counter() - start):.0f} hóa đơn/s (CPU, lô)")
+    else:
+        print("  (chưa cài sentence-transformers: bỏ qua đo encode)")
+
+
+if __name__ == "__main__":
+    main()
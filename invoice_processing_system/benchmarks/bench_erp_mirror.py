@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark đối chiếu hóa đơn với ERP: gọi ERP qua HTTP mỗi hóa đơn vs bản sao ERP cục bộ có index
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_erp_mirror.py --orders 100000 --latency-ms 20
+
+- ERP giả lập (erp_stub.py) với `vendors` nhà cung cấp, `orders` PO, mỗi request trễ thêm `--latency-ms`
+- "sync": đồng bộ lần đầu (toàn bộ, theo trang) rồi đồng bộ delta sau khi ERP sửa `--changed` PO
+- "http": mỗi hóa đơn GET mọi PO của nhà cung cấp từ ERP rồi chấm bằng quy tắc đối chiếu
+- "mirror": match_invoice_to_mirror() (PO đang mở cùng MST trong khoảng tiền / ngày, index cục bộ)
+Hóa đơn truy vấn lấy từ PO đang mở (lệch tiền ≤ 0.3%, ngày +0..5) và một phần không có PO tương ứng.
+Benchmark dùng test database nên không ảnh hưởng dữ liệu thật.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+from datetime import date, timedelta
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+import requests
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+from invoice_processing_system.app_invoices.models import Invoice, ERPIntegrationConfig
+from invoice_processing_system.app_invoices.erp_stub import ERPStubData, ERPStubServer
+from invoice_processing_system.app_invoices.erp_mirror import sync_erp_mirror, match_invoice_to_mirror
+from invoice_processing_system.app_invoices.matching_rules import invoice_facts, erp_facts, get_rule_engine
+
+
+def make_invoices(rng, data, count, unmatched):
+    """(Invoice chưa lưu, erp_id PO mong đợi hoặc None)."""
+    open_orders = [row for row in data.records['purchase_orders'] if row['status'] == 'open']
+    vendors = data.records['vendors']
+    invoices = []
+    for index in range(count):
+        if index < count * unmatched:
+            vendor = rng.choice(vendors)
+            amount, day, expected = rng.randint(100, 50000) * 1000, date(2025, rng.randint(1, 12), 15), None
+        else:
+            order = rng.choice(open_orders)
+            vendor = next(v for v in vendors if v['tax_id'] == order['vendor_tax_id'])
+            amount = round(order['total_amount'] * rng.uniform(0.997, 1.003))
+            day = date.fromisoformat(order['order_date']) + timedelta(days=rng.randint(0, 5))
+            expected = order['id']
+        invoice = Invoice(total_amount=amount, ai_extracted_data={
+            'supplier_name': vendor['name'], 'supplier_tax_id': vendor['tax_id'], 'issue_date': day.strftime('%d/%m/%Y'),
+        })
+        invoices.append((invoice, expected))
+    return invoices
+
+
+def match_over_http(session, base_url, invoice):
+    """Như gọi ERP cho từng hóa đơn: lấy PO của nhà cung cấp qua HTTP rồi chấm bằng quy tắc."""
+    facts = invoice_facts(invoice)
+    response = session.get(base_url + 'purchase-orders/', params={'vendor_tax_id': facts.tax_id}, timeout=30)
+    engine, best = get_rule_engine(), None
+    for row in response.json()['results']:
+        if row['status'] != 'open':
+            continue
+        rule = engine.evaluate(facts, erp_facts({
+            'supplier_tax_id': row['vendor_tax_id'], 'total_amount': row['total_amount'], 'issue_date': row['order_date'],
+        }))
+        if rule and (best is None or rule.score > best[1].score):
+            best = (row['id'], rule)
+    return best[0] if best else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--vendors', type=int, default=2000, help='Số nhà cung cấp trong ERP')
+    parser.add_argument('--orders', type=int, default=100000, help='Số PO trong ERP')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Độ trễ mạng tới ERP mỗi request')
+    parser.add_argument('--changed', type=int, default=1000, help='Số PO ERP sửa trước lần đồng bộ delta')
+    parser.add_argument('--invoices', type=int, default=300, help='Số hóa đơn cần đối chiếu')
+    parser.add_argument('--http-invoices', type=int, default=50, help='Số hóa đơn đối chiếu qua HTTP (chậm)')
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print("⏱️ Benchmark đối chiếu hóa đơn với ERP")
+        print("=" * 50)
+        data = ERPStubData.generate(vendors=args.vendors, orders=args.orders)
+        with ERPStubServer(data, latency=args.latency_ms / 1000) as server:
+            config = ERPIntegrationConfig.objects.create(system_name='STUB', api_url=server.url, api_key='')
+            print(f"  ERP giả lập: {args.vendors} nhà cung cấp, {args.orders} PO, trễ {args.latency_ms:.0f}ms / request")
+
+            start, requests_before = time.perf_counter(), server.requests
+            sync_erp_mirror(config)
+            full = time.perf_counter() - start
+            full_requests = server.requests - requests_before
+            data.touch('purchase_orders', args.changed, status='closed')
+            start, requests_before = time.perf_counter(), server.requests
+            sync_erp_mirror(config)
+            delta = time.perf_counter() - start
+            delta_requests = server.requests - requests_before
+            print(f"  sync lần đầu: {full:.1f}s ({(args.vendors + args.orders) / full:,.0f} bản ghi/s, {full_requests} request)")
+            print(f"  sync delta  : {delta:.2f}s cho {args.changed} PO đã sửa ({delta_requests} request)")
+
+            invoices = make_invoices(rng, data, args.invoices, unmatched=0.2)
+            mirror_times, mirror_hits = [], 0
+            for invoice, expected in invoices:
+                start = time.perf_counter()
+                purchase_order, _ = match_invoice_to_mirror(invoice, save=False)
+                mirror_times.append((time.perf_counter() - start) * 1000)
+                mirror_hits += (purchase_order.erp_id if purchase_order else None) == expected
+
+            session = requests.Session()
+            http_times, agree = [], 0
+            for invoice, _ in invoices[-args.http_invoices:]:
+                start = time.perf_counter()
+                found = match_over_http(session, server.url, invoice)
+                http_times.append((time.perf_counter() - start) * 1000)
+                purchase_order, _ = match_invoice_to_mirror(invoice, save=False)
+                agree += found == (purchase_order.erp_id if purchase_order else None)
+            session.close()
+
+        mirror_times.sort()
+        print(f"  http  : trung vị {statistics.median(http_times):.1f}ms / hóa đơn "
+              f"(cùng kết quả với mirror {agree}/{len(http_times)})")
+        print(f"  mirror: trung vị {statistics.median(mirror_times):.2f}ms, p99 "
+              f"{mirror_times[int(len(mirror_times) * 0.99)]:.2f}ms / hóa đơn, đúng PO {mirror_hits}/{len(invoices)}")
+        print(f"\n🚀 Nhanh hơn x{statistics.median(http_times) / statistics.median(mirror_times):.0f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark phê duyệt hóa đơn khi phải gửi ERP: gọi ERP ngay trong request vs transactional outbox
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_erp_outbox.py --requests 100 --latency-ms 0,50,200
+
+- ERP giả lập (erp_stub.py) với độ trễ `--latency-ms` mỗi request
+- "inline": POST /api/invoices/<id>/approve/ rồi push_invoices() hóa đơn đó trong cùng request
+- "outbox": POST /api/invoices/<id>/approve/ (chỉ ghi thêm ERPOutboxEvent cùng transaction)
+- "drain": drain_outbox() gửi các sự kiện đã ghi. Mỗi hóa đơn được phê duyệt 2 lần nên một nửa sự kiện
+  bị SUPERSEDED. Lần thứ hai chạy với ERP lỗi 503 ngẫu nhiên `--failure-rate`, có một lần "worker chết"
+  sau khi ERP đã nhận lô (lease hết hạn, gửi lại). ERP phải ghi mỗi sự kiện đúng một lần.
+Benchmark dùng test database nên không ảnh hưởng dữ liệu thật.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.test.utils import setup_test_environment
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from invoice_processing_system.app_invoices.models import (
+    Invoice, InvoiceStatus, ERPIntegrationConfig, ERPOutboxEvent, OutboxStatus,
+)
+from invoice_processing_system.app_invoices.erp_stub import ERPStubData, ERPStubServer
+from invoice_processing_system.app_invoices.erp_client import push_invoices, post_records, close_push_clients
+from invoice_processing_system.app_invoices.erp_outbox import drain_outbox, claim_events
+
+
+def make_invoices(count):
+    Invoice.objects.all().delete()
+    Invoice.objects.bulk_create([
+        Invoice(file=f'invoices/bench_{i}.pdf', invoice_number=f"HD{i:07d}", total_amount=100000 + i,
+                status=InvoiceStatus.PENDING_APPROVAL, ai_extracted_data={'supplier_tax_id': f"01{i % 50:08d}"})
+        for i in range(count)
+    ])
+    return list(Invoice.objects.values_list('id', flat=True))
+
+
+def approve_all(client, invoice_ids, inline):
+    """Thời gian (ms) từng request phê duyệt; `inline` = gửi ERP ngay trong request."""
+    times = []
+    for invoice_id in invoice_ids:
+        start = time.perf_counter()
+        response = client.post(f'/api/invoices/{invoice_id}/approve/')
+        assert response.status_code == 200, response.content
+        if inline:
+            push_invoices(Invoice.objects.filter(pk=invoice_id))
+        times.append((time.perf_counter() - start) * 1000)
+    if inline:
+        ERPOutboxEvent.objects.filter(invoice_id__in=invoice_ids).delete()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=100, help='Số request phê duyệt mỗi cấu hình')
+    parser.add_argument('--latency-ms', default='0,50,200', help='Các độ trễ ERP cần đo (ms, phân tách bằng dấu phẩy)')
+    parser.add_argument('--drain-invoices', type=int, default=2000, help='Số hóa đơn cho phần đo drain')
+    parser.add_argument('--failure-rate', type=float, default=0.3, help='Tỉ lệ 503 ngẫu nhiên ở lần drain có lỗi')
+    args = parser.parse_args()
+    latencies = [float(value) for value in args.latency_ms.split(',')]
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    settings.ALLOWED_HOSTS.append('testserver')
+    settings.ERP_PUSH_BACKOFF_BASE = 0.01
+    try:
+        print("⏱️ Benchmark phê duyệt hóa đơn + gửi ERP")
+        print("=" * 50)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('bench', 'bench@example.com', 'bench'))
+        data = ERPStubData()
+        with ERPStubServer(data, seed=42) as server:
+            config = ERPIntegrationConfig.objects.create(system_name='STUB', api_url=server.url, api_key='')
+            results = []
+            for latency in latencies:
+                server.latency = latency / 1000
+                inline = statistics.median(approve_all(client, make_invoices(args.requests), inline=True))
+                outbox = statistics.median(approve_all(client, make_invoices(args.requests), inline=False))
+                results.append((latency, inline, outbox))
+                print(f"  ERP trễ {latency:>4.0f}ms: inline trung vị {inline:6.1f}ms, outbox trung vị {outbox:5.1f}ms / request")
+
+            server.latency = 0.02
+            for failure_rate in (0.0, args.failure_rate):
+                server.failure_rate = failure_rate
+                data.postings.clear(), data.deliveries.clear()
+                data.applied = data.duplicates = 0
+                invoice_ids = make_invoices(args.drain_invoices)
+                for _ in range(2):
+                    ERPOutboxEvent.objects.bulk_create([
+                        ERPOutboxEvent(invoice_id=invoice_id, event_type='invoice.approved',
+                                       payload={'reference': str(invoice_id), 'total_amount': '100000.00',
+                                                'status': InvoiceStatus.APPROVED})
+                        for invoice_id in invoice_ids
+                    ])
+                if failure_rate:
+                    # "Worker chết" sau khi ERP đã nhận lô đầu: lease 0s hết hạn ngay, lần drain sau gửi lại cùng khóa
+                    token, events = claim_events(batch_size=200, lease=0)
+                    latest = {event.invoice_id: event for event in events}
+                    post_records([dict(event.payload, idempotency_key=f"outbox-{event.id}") for event in latest.values()],
+                                 config=config)
+                start, before = time.perf_counter(), server.requests
+                totals = drain_outbox(config)
+                while ERPOutboxEvent.objects.filter(status=OutboxStatus.PENDING).exists():
+                    ERPOutboxEvent.objects.filter(status=OutboxStatus.PENDING).update(available_at=timezone.now())
+                    totals.update(drain_outbox(config))
+                drain = time.perf_counter() - start
+                events = 2 * len(invoice_ids)
+                newest = {str(invoice_id): f"outbox-{event_id}" for invoice_id, event_id in
+                          ERPOutboxEvent.objects.order_by('id').values_list('invoice_id', 'id')}
+                final = sum(data.postings.get(reference, {}).get('idempotency_key') == key for reference, key in newest.items())
+                print(f"  drain {events} sự kiện (lỗi {failure_rate:.0%}): {drain:.2f}s, {events / drain:,.0f} sự kiện/s, "
+                      f"{server.requests - before} request, gửi {totals['delivered']}, bỏ qua {totals['superseded']}, "
+                      f"thử lại {totals['retried']}")
+                print(f"    ERP ghi {data.applied} sự kiện, bỏ qua {data.duplicates} bản gửi lại (idempotent), "
+                      f"{final}/{len(invoice_ids)} hóa đơn mang trạng thái của sự kiện mới nhất")
+            close_push_clients()
+
+        latency, inline, outbox = results[-1]
+        print(f"\n🚀 Nhanh hơn x{inline / outbox:.0f} (ERP trễ {latency:.0f}ms)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
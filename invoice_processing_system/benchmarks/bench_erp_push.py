@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark ghi hóa đơn lên ERP: mỗi hóa đơn một request (kết nối mới) vs client pool + lô + song song
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_erp_push.py --invoices 2000 --latency-ms 20
+
+- ERP giả lập (erp_stub.py): mỗi request trễ `--latency-ms`, cộng `--item-latency-ms` cho mỗi bản ghi
+- "naive": mỗi hóa đơn một requests.post() (kết nối TCP mới), tuần tự, không thử lại
+- "pooled": push_invoices() (pool keep-alive, lô ERP_PUSH_BATCH_SIZE, ERP_PUSH_MAX_CONCURRENCY lô song song)
+- "lỗi 20%": ERP trả 503 ngẫu nhiên cho `--failure-rate` request, client thử lại với backoff có jitter
+- "ERP sập": mọi POST trả 503. Naive chờ từng request. Client ngắt mạch sau ERP_BREAKER_FAILURE_THRESHOLD lỗi,
+  các lô còn lại lỗi ngay (erp_error)
+Benchmark dùng test database nên không ảnh hưởng dữ liệu thật.
+"""
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+from invoice_processing_system.app_invoices.models import Invoice, InvoiceStatus, ERPIntegrationConfig
+from invoice_processing_system.app_invoices.erp_stub import ERPStubData, ERPStubServer
+from invoice_processing_system.app_invoices.erp_client import push_invoices, invoice_payload, close_push_clients
+
+
+def push_naive(base_url, invoices):
+    """Mỗi hóa đơn một request, kết nối mới mỗi lần; trả về số hóa đơn ghi được."""
+    posted = 0
+    for invoice in invoices:
+        response = requests.post(base_url + 'invoices/', json={'items': [invoice_payload(invoice)]}, timeout=30)
+        posted += response.status_code == 200 and response.json()['results'][0]['status'] == 'ok'
+    return posted
+
+
+def reset(data, invoice_ids):
+    data.postings.clear()
+    data.deliveries.clear()
+    Invoice.objects.filter(id__in=invoice_ids).update(
+        status=InvoiceStatus.APPROVED, erp_document_id=None, erp_posted_at=None, erp_error=''
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--invoices', type=int, default=2000, help='Số hóa đơn cần ghi')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Độ trễ mạng tới ERP mỗi request')
+    parser.add_argument('--item-latency-ms', type=float, default=0.2, help='Thời gian ERP xử lý mỗi bản ghi')
+    parser.add_argument('--failure-rate', type=float, default=0.2, help='Tỉ lệ request lỗi 503 ngẫu nhiên')
+    parser.add_argument('--naive-invoices', type=int, default=300, help='Số hóa đơn đo với cách naive (chậm)')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print("⏱️ Benchmark ghi hóa đơn lên ERP")
+        print("=" * 50)
+        Invoice.objects.bulk_create([
+            Invoice(file=f'invoices/bench_{i}.pdf', invoice_number=f"HD{i:07d}", total_amount=100000 + i,
+                    status=InvoiceStatus.APPROVED,
+                    ai_extracted_data={'supplier_tax_id': f"01{i % 500:08d}", 'issue_date': '15/03/2025'})
+            for i in range(args.invoices)
+        ])
+        invoice_ids = list(Invoice.objects.values_list('id', flat=True))
+        sample = list(Invoice.objects.filter(id__in=invoice_ids[:args.naive_invoices]))
+        data = ERPStubData()
+        with ERPStubServer(data, latency=args.latency_ms / 1000, item_latency=args.item_latency_ms / 1000, seed=42) as server:
+            config = ERPIntegrationConfig.objects.create(system_name='STUB', api_url=server.url, api_key='')
+            print(f"  ERP giả lập: trễ {args.latency_ms:.0f}ms / request + {args.item_latency_ms}ms / bản ghi, "
+                  f"lô {settings.ERP_PUSH_BATCH_SIZE}, song song {settings.ERP_PUSH_MAX_CONCURRENCY}")
+
+            start = time.perf_counter()
+            naive_posted = push_naive(server.url, sample)
+            naive = (time.perf_counter() - start) / len(sample)
+            print(f"  naive : {naive * 1000:.1f}ms / hóa đơn ({naive_posted}/{len(sample)} ghi được), "
+                  f"ước tính {naive * args.invoices:.1f}s cho {args.invoices} hóa đơn")
+            reset(data, invoice_ids)
+
+            start, before = time.perf_counter(), server.requests
+            result = push_invoices(Invoice.objects.filter(id__in=invoice_ids), config=config)
+            pooled = time.perf_counter() - start
+            print(f"  pooled: {pooled:.2f}s ({pooled / args.invoices * 1000:.2f}ms / hóa đơn), "
+                  f"{result.posted}/{args.invoices} ghi được, {server.requests - before} request")
+            reset(data, invoice_ids)
+
+            server.failure_rate = args.failure_rate
+            start, before = time.perf_counter(), server.requests
+            result = push_invoices(Invoice.objects.filter(id__in=invoice_ids), config=config)
+            flaky = time.perf_counter() - start
+            print(f"  lỗi {args.failure_rate:.0%}: {flaky:.2f}s, {result.posted}/{args.invoices} ghi được, "
+                  f"{server.requests - before} request (có thử lại), {result.circuit_open} lỗi do ngắt mạch")
+            reset(data, invoice_ids)
+
+            server.failure_rate, server.outage = 0, True
+            start = time.perf_counter()
+            for invoice in sample:
+                requests.post(server.url + 'invoices/', json={'items': [invoice_payload(invoice)]}, timeout=30)
+            naive_outage = (time.perf_counter() - start) / len(sample)
+            start, before = time.perf_counter(), server.requests
+            result = push_invoices(Invoice.objects.filter(id__in=invoice_ids), config=config)
+            outage = time.perf_counter() - start
+            print(f"  ERP sập: naive ước tính {naive_outage * args.invoices:.1f}s, client {outage:.2f}s "
+                  f"({server.requests - before} request, {result.circuit_open} hóa đơn lỗi do ngắt mạch)")
+            close_push_clients()
+
+        print(f"\n🚀 Nhanh hơn x{naive * args.invoices / pooled:.0f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
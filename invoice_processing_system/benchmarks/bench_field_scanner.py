@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+"""
+⏱️ Micro-benchmark bộ quét trường hóa đơn một lượt (InvoiceTextScan)
+So sánh `InvoiceDataExtractor.extract_smart_data` + `parse_invoice_text` hiện tại với bản
+cũ (~15 lần re.search/re.findall trên toàn bộ text, giữ nguyên bên dưới làm tham chiếu):
+1. Kiểm tra kết quả giống hệt trên hóa đơn mẫu và text ngẫu nhiên (fuzz)
+2. Đo thời gian mỗi tài liệu theo số trang
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_field_scanner.py --pages 1 10 50 --fuzz 2000
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from invoice_processing_system.app_invoices.ai_services import InvoiceDataExtractor
+from invoice_processing_system.app_invoices.utils import parse_invoice_text
+
+SAMPLE_PAGE = """CÔNG TY TNHH THƯƠNG MẠI DỊCH VỤ ABC
+Địa chỉ: 123 Nguyễn Trãi, Quận 1, TP.HCM  MST: 0312345678
+HÓA ĐƠN GIÁ TRỊ GIA TĂNG
+Ký hiệu: AA/23E  Số: 0001234
+Ngày 15 tháng 10 năm 2024
+Đơn vị bán hàng: Công ty ABC Trading JSC
+STT Tên hàng hóa dịch vụ ĐVT Số lượng Đơn giá Thành tiền
+1 Giấy in A4 ram 10 65.000 650.000
+2 Mực in HP hộp 2 450.000 900.000
+3 Bút bi Thiên Long hộp 5 35.000 175.000
+Cộng tiền hàng: 1.725.000
+Thuế suất GTGT: 10% Tiền thuế GTGT: 172.500
+Tổng cộng tiền thanh toán: 1.897.500 VND
+Số tiền viết bằng chữ: Một triệu tám trăm chín mươi bảy nghìn năm trăm đồng
+Hạn thanh toán: 30/10/2024
+"""
+
+FUZZ_TOKENS = [
+    'Số', 'SỐ', 'số', 'No', 'NO', 'Number', 'Hóa đơn', 'HÓA ĐƠN', 'Invoice', 'INVOICE NO', 'ngày', 'Ngày',
+    'Date', 'date', 'tháng', 'month', 'năm', 'Hạn thanh toán', 'Due date', 'Đến hạn', 'hạn', 'due',
+    'Công ty', 'Company', 'Corp', 'Ltd', 'JSC', 'ABC', 'Minh Phát', 'Tổng', 'TỔNG CỘNG', 'Total', 'TOTAL',
+    'Tổng cộng', 'VAT', 'Thuế', 'THUẾ GTGT', 'Tax', 'đ', 'Đ', 'VND', 'vnd', '₫', 'đơn', 'Đến', ':', ': ',
+    ' ', '  ', '\n', '\t', '.', ',', '/', '-', '&', '12', '1234', '12345', '1.500.000', '1,500,000.00',
+    '2.000', '999', '45.000,50', '0001234', '15/10/2024', '1-2-2023', '5', '10', 'ram', 'hộp', 'x',
+]
+
+SCANNER_FIELDS = ['invoice_number', 'supplier_name', 'total_amount', 'tax_amount', 'issue_date', 'due_date', 'items']
+
+
+# --- Bản cũ (tham chiếu) ---
+class LegacyInvoiceDataExtractor:
+    def extract_smart_data(self, ocr_text):
+        return {
+            'invoice_number': self._extract_invoice_number(ocr_text),
+            'supplier_name': self._extract_supplier_name(ocr_text),
+            'total_amount': self._extract_total_amount(ocr_text),
+            'tax_amount': self._extract_tax_amount(ocr_text),
+            'issue_date': self._extract_date(ocr_text),
+            'due_date': self._extract_due_date(ocr_text),
+            'items': self._extract_items(ocr_text),
+        }
+
+    def _extract_invoice_number(self, text: str) -> Optional[str]:
+        """
+        🔢 Trích xuất số hóa đơn thông minh
+        """
+        patterns = [
+            r'(?:Số|No|Number)[\s:]*(\d{4,10})',
+            r'(?:Hóa đơn|Invoice)[\s:]*(\d{4,10})',
+            r'(\d{4,10})(?=\s*(?:ngày|date|tháng))',
+        ]
+        
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                return match.group(1)
+        return None
+    
+    def _extract_supplier_name(self, text: str) -> Optional[str]:
+        """
+        🏢 Trích xuất tên nhà cung cấp thông minh
+        """
+        # Tìm tên công ty
+        company_patterns = [
+            r'(?:Công ty|Company|Corp|Ltd)[\s:]*([A-Za-zÀ-ỹ\t &]+)',  # tên dừng ở cuối dòng (như ai_services)
+            r'([A-Z][A-Za-zÀ-ỹ\s&]+(?:JSC|Ltd|Corp|Company))',
+        ]
+        
+        for pattern in company_patterns:
+            match = re.search(pattern, text)
+            if match:
+                return match.group(1).strip()
+        
+        # Fallback: tìm dòng đầu tiên có thể là tên công ty
+        lines = text.split('\n')[:5]  # 5 dòng đầu
+        for line in lines:
+            if len(line) > 10 and any(char.isupper() for char in line):
+                return line.strip()
+        
+        return None
+    
+    def _extract_total_amount(self, text: str) -> Optional[float]:
+        """
+        💰 Trích xuất tổng tiền thông minh
+        """
+        # Patterns cho tổng tiền
+        patterns = [
+            r'(?:Tổng|Total|Tổng cộng)[\s:]*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)',
+            r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*(?:đ|VND|₫)',
+            r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)(?=\s*(?:đ|VND|₫))',
+        ]
+        
+        amounts = []
+        for pattern in patterns:
+            matches = re.findall(pattern, text, re.IGNORECASE)
+            for match in matches:
+                try:
+                    # Clean và convert
+                    clean_amount = match.replace('.', '').replace(',', '.')
+                    amount = float(clean_amount)
+                    if amount > 1000:  # Chỉ lấy số tiền hợp lý
+                        amounts.append(amount)
+                except:
+                    continue
+        
+        # Trả về số tiền lớn nhất (thường là tổng)
+        return max(amounts) if amounts else None
+    
+    def _extract_tax_amount(self, text: str) -> Optional[float]:
+        """
+        🧾 Trích xuất thuế VAT
+        """
+        patterns = [
+            r'(?:VAT|Thuế|Tax)[\s:]*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)',
+            r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*(?:đ|VND|₫)(?=\s*(?:VAT|Thuế))',
+        ]
+        
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                try:
+                    clean_amount = match.group(1).replace('.', '').replace(',', '.')
+                    return float(clean_amount)
+                except:
+                    continue
+        return None
+    
+    def _extract_date(self, text: str) -> Optional[str]:
+        """
+        📅 Trích xuất ngày phát hành
+        """
+        date_patterns = [
+            r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
+            r'(\d{1,2}\s+(?:tháng|month)\s+\d{4})',
+            r'(?:Ngày|Date)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
+        ]
+        
+        for pattern in date_patterns:
+            match = re.search(pattern, text)
+            if match:
+                return match.group(1)
+        return None
+    
+    def _extract_due_date(self, text: str) -> Optional[str]:
+        """
+        ⏰ Trích xuất ngày đến hạn
+        """
+        patterns = [
+            r'(?:Hạn thanh toán|Due date|Đến hạn)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
+            r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})(?=\s*(?:hạn|due))',
+        ]
+        
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                return match.group(1)
+        return None
+    
+    def _extract_items(self, text: str) -> List[Dict]:
+        """
+        📦 Trích xuất danh sách sản phẩm/dịch vụ
+        """
+        items = []
+        lines = text.split('\n')
+        
+        for line in lines:
+            # Tìm dòng có số lượng, tên sản phẩm, giá
+            if re.search(r'\d+\s+[A-Za-zÀ-ỹ]+\s+\d+', line):
+                parts = line.split()
+                if len(parts) >= 3:
+                    try:
+                        quantity = int(parts[0])
+                        price = float(parts[-1].replace(',', '.'))
+                        name = ' '.join(parts[1:-1])
+                        
+                        items.append({
+                            'name': name,
+                            'quantity': quantity,
+                            'price': price,
+                            'total': quantity * price
+                        })
+                    except:
+                        continue
+        
+        return items[:10]  # Tối đa 10 items
+
+
+def legacy_parse_invoice_text(text):
+    data = {'number': None, 'date': None, 'total': None, 'tax': None}
+
+    # 1. Số hóa đơn
+    num_match = re.search(r'(?:SỐ|SỐ HÓA ĐƠN|NO|INVOICE\s*NO)\s*:?\s*([A-Z0-9/-]{3,})', text, re.IGNORECASE)
+    if num_match: data['number'] = num_match.group(1).strip()
+
+    # 2. Ngày phát hành
+    date_match = re.search(r'(?:Ngày|Date)\s*(?:(\d{1,2})[/-](\d{1,2})[/-](\d{4})|(\d{1,2})\s*tháng\s*(\d{1,2})\s*năm\s*(\d{4}))', text, re.IGNORECASE)
+    if date_match:
+        try:
+            if date_match.group(3): 
+                day, month, year = date_match.group(1), date_match.group(2), date_match.group(3)
+            else: 
+                day, month, year = date_match.group(4), date_match.group(5), date_match.group(6)
+            data['date'] = datetime(int(year), int(month), int(day)).date()
+        except (ValueError, TypeError): pass
+
+    # 3. Tổng tiền
+    total_match = re.search(r'(?:TỔNG CỘNG TIỀN THANH TOÁN|TỔNG CỘNG|TOTAL):\s*([\d\.,]+)', text, re.IGNORECASE)
+    if total_match:
+        amount_str = total_match.group(1).replace('.', '').replace(',', '.')
+        try: data['total'] = float(amount_str)
+        except ValueError: pass
+
+    # 4. Thuế
+    tax_match = re.search(r'(?:THUẾ GTGT|VAT):\s*([\d\.,]+)', text, re.IGNORECASE)
+    if tax_match:
+        amount_str = tax_match.group(1).replace('.', '').replace(',', '.')
+        try: data['tax'] = float(amount_str)
+        except ValueError: pass
+        
+    return data
+
+
+def random_text(rng, length):
+    return ''.join(rng.choice(FUZZ_TOKENS) + rng.choice(['', ' ', ' ', '\n']) for _ in range(length))
+
+
+def check_identical(texts, extractor, legacy):
+    for text in texts:
+        new = extractor.extract_smart_data(text)
+        old = legacy.extract_smart_data(text)
+        for field in SCANNER_FIELDS:
+            if new[field] != old[field]:
+                raise AssertionError(f"Khác kết quả ở '{field}': {new[field]!r} != {old[field]!r}\n{text!r}")
+        if parse_invoice_text(text) != legacy_parse_invoice_text(text):
+            raise AssertionError(f"parse_invoice_text khác kết quả\n{text!r}")
+
+
+def measure(fn, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--fuzz', type=int, default=1000, help="Số text ngẫu nhiên để kiểm tra kết quả giống hệt")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    extractor = InvoiceDataExtractor()
+    legacy = LegacyInvoiceDataExtractor()
+
+    rng = random.Random(args.seed)
+    fuzz_texts = [random_text(rng, rng.randint(1, 80)) for _ in range(args.fuzz)]
+    check_identical([SAMPLE_PAGE] + fuzz_texts, extractor, legacy)
+    print(f"✅ Kết quả giống hệt bản cũ trên {len(fuzz_texts) + 1} text (mẫu + fuzz)")
+
+    print(f"\n⏱️ Thời gian mỗi tài liệu ({args.repeat} lần)")
+    print("=" * 72)
+    for pages in args.pages:
+        text = "\n".join(SAMPLE_PAGE for _ in range(pages))
+        old_ms = measure(legacy.extract_smart_data, text, args.repeat) + measure(legacy_parse_invoice_text, text, args.repeat)
+        new_ms = measure(extractor.extract_smart_data, text, args.repeat) + measure(parse_invoice_text, text, args.repeat)
+        print(f"  {pages:3d} trang: cũ {old_ms:8.2f}ms  mới {new_ms:8.2f}ms  (nhanh hơn x{old_ms / new_ms:.1f})")
+
+
+if __name__ == "__main__":
+    main()
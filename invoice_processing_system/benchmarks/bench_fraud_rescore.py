@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark chấm lại fraud toàn bảng: vòng lặp detect_fraud từng hóa đơn vs bộ chấm pandas / NumPy
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_fraud_rescore.py --count 50000
+
+- "per-row": đọc từng hóa đơn, gọi InvoiceFraudDetector.detect_fraud, save() từng dòng (như chấm lại bằng tay)
+- "batch": rescore_invoices() (nạp theo cột, tính vector, UPDATE theo nhóm điểm các dòng thay đổi)
+Kiểm tra: 5 cờ riêng lẻ của bộ chấm lô phải trùng với detect_fraud trên mọi hóa đơn.
+Benchmark dùng test database nên không ảnh hưởng dữ liệu thật.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from decimal import Decimal
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+from invoice_processing_system.app_invoices.models import Invoice, Supplier
+from invoice_processing_system.app_invoices.ai_services import InvoiceFraudDetector
+from invoice_processing_system.app_invoices.fraud_batch import load_fraud_frame, score_fraud_frame, rescore_invoices
+
+BASE_CHECKS = ('invalid_number', 'invalid_amount', 'invalid_date', 'invalid_supplier', 'poor_ocr')
+BASE_WEIGHTS = (0.2, 0.3, 0.2, 0.1, 0.2)
+
+OCR_TEMPLATE = (
+    "HÓA ĐƠN GIÁ TRỊ GIA TĂNG\nĐơn vị bán hàng: {supplier}\nSố: {number}\n"
+    "Ngày {date}\nCộng tiền hàng: {amount:,.0f} VND\nTổng cộng thanh toán: {amount:,.0f} đ\n"
+)
+
+
+def seed_invoices(count, supplier_count=200, seed=42):
+    """Tạo `count` hóa đơn tổng hợp: phần lớn hợp lệ, một phần có lỗi / bất thường."""
+    rng = random.Random(seed)
+    now = datetime.now()
+    names = [f"Công ty TNHH Thương mại {i}" for i in range(supplier_count - 3)] + ["AB", "Công ty <script>", "Nhà cung cấp @@@"]
+    suppliers = Supplier.objects.bulk_create([Supplier(name=name) for name in names])
+    typical = {supplier.id: rng.uniform(2e5, 5e7) for supplier in suppliers}
+    round_suppliers = {supplier.id for supplier in rng.sample(suppliers, 10)}
+
+    invoices = []
+    for i in range(count):
+        supplier = rng.choice(suppliers)
+        amount = round(rng.gauss(typical[supplier.id], typical[supplier.id] * 0.1), 2)
+        if supplier.id in round_suppliers:
+            amount = round(amount, -5)
+        if rng.random() < 0.01:
+            amount = amount * 40                      # lệch xa lịch sử nhà cung cấp
+        if rng.random() < 0.01:
+            amount = rng.choice([0, 500, 5e9])        # ngoài khoảng hợp lệ
+
+        number = f"{i + 1:07d}"
+        roll = rng.random()
+        if roll < 0.01:
+            number = f"INV-{i}"                       # không phải chữ số
+        elif roll < 0.02:
+            number = f"{rng.randint(1, count):07d}"   # trùng số
+
+        issue = now - timedelta(days=rng.randint(0, 900))
+        date_text = issue.strftime('%d/%m/%Y') if rng.random() > 0.01 else '31/02/2024'
+        text = OCR_TEMPLATE.format(supplier=supplier.name, number=number, date=date_text, amount=max(amount, 0))
+        if rng.random() < 0.01:
+            text = "### ?? ##"                        # OCR kém
+
+        invoices.append(Invoice(
+            file=f"invoices/bench_{i}.jpg",
+            invoice_number=number,
+            supplier=supplier,
+            total_amount=Decimal(str(amount)).quantize(Decimal('0.01')),
+            raw_ocr_text=text,
+            ai_extracted_data={'issue_date': date_text},
+        ))
+    Invoice.objects.bulk_create(invoices, batch_size=5000)
+
+
+def rescore_per_row(detector):
+    """Chấm lại từng hóa đơn như trước đây: detect_fraud + save() từng dòng."""
+    start = time.perf_counter()
+    base_scores = {}
+    for invoice in Invoice.objects.select_related('supplier').iterator(chunk_size=2000):
+        invoice_data = {
+            'invoice_number': invoice.invoice_number or '',
+            'total_amount': float(invoice.total_amount or 0),
+            'issue_date': (invoice.ai_extracted_data or {}).get('issue_date'),
+            'supplier_name': invoice.supplier.name if invoice.supplier else '',
+        }
+        result = detector.detect_fraud(invoice_data, invoice.raw_ocr_text)
+        base_scores[invoice.id] = result['risk_score']
+        invoice.fraud_risk_score = Decimal(str(result['risk_score']))
+        invoice.fraud_risk_level = result['risk_level']
+        invoice.save(update_fields=['fraud_risk_score', 'fraud_risk_level'])
+    return time.perf_counter() - start, base_scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=50000, help='Số hóa đơn tổng hợp')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print("⏱️ Benchmark chấm lại fraud toàn bảng")
+        print("=" * 50)
+        seed_invoices(args.count)
+
+        per_row, base_scores = rescore_per_row(InvoiceFraudDetector())
+        print(f"  per-row: {args.count} hóa đơn trong {per_row:.2f}s")
+
+        # Kiểm tra 5 cờ riêng lẻ cho kết quả giống detect_fraud
+        scores = score_fraud_frame(load_fraud_frame())
+        batch_base = (scores[list(BASE_CHECKS)].astype(float) * BASE_WEIGHTS).sum(axis=1).round(2)
+        frame_ids = load_fraud_frame()['id']
+        mismatches = sum(
+            1 for invoice_id, score in zip(frame_ids, batch_base)
+            if abs(base_scores[invoice_id] - min(score, 1.0)) > 1e-9
+        )
+        print(f"  điểm 5 kiểm tra riêng lẻ khác detect_fraud: {mismatches}/{args.count}")
+
+        start = time.perf_counter()
+        result, changed = rescore_invoices()
+        batch = time.perf_counter() - start
+        print(f"  batch  : {args.count} hóa đơn trong {batch:.2f}s ({changed} dòng thay đổi)")
+        for column in ('supplier_amount_outlier', 'round_amount', 'duplicate_across_suppliers', 'duplicate_same_supplier'):
+            print(f"    {column}: {int(result[column].sum())}")
+        print(f"\n🚀 Nhanh hơn x{per_row / batch:.1f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark đối chiếu dòng hàng hóa đơn ↔ PO: vòng lặp Python (difflib từng cặp + ghép tham lam) vs
+ma trận chi phí NumPy + ghép tối ưu (linear_sum_assignment)
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_line_matching.py --lines 10,100,500
+
+- PO tổng hợp `--lines` dòng. Tên hàng ghép từ loại hàng × hãng × quy cách nên nhiều dòng gần giống nhau,
+  ~20% dòng trùng tên một dòng khác (cùng mặt hàng, khác số lượng / đơn giá).
+- Dòng hóa đơn: đảo thứ tự, tên bị "OCR" làm nhiễu (mất dấu, sai ký tự), ~10% lệch số lượng / đơn giá,
+  ~5% dòng thừa không có trên PO, ~5% dòng PO chưa lên hóa đơn.
+- "python": SequenceMatcher cho từng cặp + cùng công thức chi phí, ghép cặp rẻ nhất trước.
+- "numpy": match_line_items() (trigram cosine + độ lệch broadcast + Hungarian).
+- "tham lam": ghép cặp rẻ nhất trước trên CÙNG ma trận chi phí NumPy, để tách phần chính xác do thuật toán ghép.
+Độ chính xác = số cặp ghép đúng / số dòng hóa đơn có trên PO.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import difflib
+import statistics
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+import numpy as np
+from django.conf import settings
+
+from invoice_processing_system.app_invoices.supplier_resolver import fold_text
+from invoice_processing_system.app_invoices.line_matching import (
+    match_line_items, line_arrays, line_cost_matrix, INVOICE_LINE_KEYS, PO_LINE_KEYS,
+)
+
+KINDS = ["Giấy in", "Mực in", "Bút bi", "Laptop", "Cáp mạng", "Chuột không dây", "Màn hình", "Ổ cứng SSD",
+         "Bàn phím", "Ghế xoay", "Bàn làm việc", "Nước uống đóng chai", "Dịch vụ bảo trì", "Router wifi"]
+BRANDS = ["HP", "Dell", "Canon", "Logitech", "Thiên Long", "Double A", "LG", "Samsung", "Kingston", "TP-Link"]
+SPECS = ["A4 70gsm", "A4 80gsm", "A3", "12A", "85A", "Cat6 5m", "Cat6 10m", "24 inch", "27 inch", "256GB", "512GB",
+         "1TB", "loại 1", "loại 2", "xanh", "đen"]
+
+
+def make_case(rng, size):
+    """(dòng PO, dòng hóa đơn, {chỉ số dòng hóa đơn: chỉ số dòng PO đúng})"""
+    names = rng.sample([f"{kind} {brand} {spec}" for kind in KINDS for brand in BRANDS for spec in SPECS], size)
+    # ~20% dòng PO là "dòng tách" của một mặt hàng khác (cùng tên, khác số lượng / đơn giá, vd. giao 2 đợt)
+    for index in range(size):
+        if index and rng.random() < 0.2:
+            names[index] = names[rng.randrange(index)]
+    po_lines = []
+    for line_no, name in enumerate(names, 1):
+        quantity, unit_price = rng.randint(1, 50), rng.randint(10, 5000) * 1000
+        po_lines.append({'line_no': line_no, 'description': name, 'quantity': quantity,
+                         'unit_price': unit_price, 'amount': quantity * unit_price})
+    invoiced = [j for j in range(size) if rng.random() > 0.05]
+    items = []
+    for j in invoiced:
+        line = po_lines[j]
+        quantity, price = line['quantity'], float(line['unit_price'])
+        if rng.random() < 0.1:
+            quantity += rng.choice([-1, 1, 2])
+        if rng.random() < 0.1:
+            price *= rng.uniform(0.95, 1.05)
+        items.append(({'name': ocr_noise(rng, line['description']), 'quantity': max(quantity, 1), 'price': price,
+                       'total': max(quantity, 1) * price}, j))
+    for _ in range(max(1, size // 20)):
+        items.append(({'name': ocr_noise(rng, f"{rng.choice(KINDS)} {rng.choice(BRANDS)} khác"), 'quantity': 1,
+                       'price': 100000.0, 'total': 100000.0}, None))
+    rng.shuffle(items)
+    truth = {i: j for i, (_, j) in enumerate(items) if j is not None}
+    return po_lines, [item for item, _ in items], truth
+
+
+def ocr_noise(rng, text):
+    text = fold_text(text) if rng.random() < 0.5 else text
+    chars = list(text)
+    for _ in range(rng.randint(0, 2)):
+        position = rng.randrange(len(chars))
+        chars[position] = rng.choice('abcdeilmnou0158 ')
+    return ''.join(chars)
+
+
+def match_python(invoice_lines, po_lines, weights, min_similarity, max_cost):
+    """Cách làm thẳng: từng cặp bằng Python, ghép cặp rẻ nhất trước."""
+    pairs = []
+    for i, item in enumerate(invoice_lines):
+        for j, line in enumerate(po_lines):
+            similarity = difflib.SequenceMatcher(None, fold_text(item['name']), fold_text(line['description'])).ratio()
+            if similarity < min_similarity:
+                continue
+            quantity_gap = abs(item['quantity'] - line['quantity']) / max(item['quantity'], line['quantity'], 1e-9)
+            price_gap = abs(item['price'] - line['unit_price']) / max(item['price'], line['unit_price'], 1e-9)
+            cost = weights[0] * (1 - similarity) + weights[1] * min(quantity_gap, 1) + weights[2] * min(price_gap, 1)
+            if cost < max_cost:
+                pairs.append((cost, i, j))
+    return greedy(pairs)
+
+
+def greedy(pairs):
+    used_invoice, used_po, assignment = set(), set(), {}
+    for _, i, j in sorted(pairs):
+        if i not in used_invoice and j not in used_po:
+            used_invoice.add(i), used_po.add(j)
+            assignment[i] = j
+    return assignment
+
+
+def accuracy(assignment, truth):
+    return sum(assignment.get(i) == j for i, j in truth.items()) / len(truth)
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', default='10,100,500', help='Số dòng PO mỗi cấu hình (phân tách bằng dấu phẩy)')
+    parser.add_argument('--cases', type=int, default=20, help='Số cặp hóa đơn / PO mỗi cấu hình')
+    parser.add_argument('--python-max-lines', type=int, default=100, help='Chỉ đo vòng lặp Python tới số dòng này (chậm)')
+    args = parser.parse_args()
+    rng = random.Random(42)
+    weights = np.asarray(settings.LINE_MATCH_WEIGHTS) / sum(settings.LINE_MATCH_WEIGHTS)
+    min_similarity, max_cost = settings.LINE_MATCH_MIN_SIMILARITY, settings.LINE_MATCH_MAX_COST
+
+    print("⏱️ Benchmark đối chiếu dòng hàng hóa đơn ↔ PO")
+    print("=" * 50)
+    speedups = []
+    for size in [int(value) for value in args.lines.split(',')]:
+        python_times, numpy_times = [], []
+        python_hits, numpy_hits, greedy_hits = [], [], []
+        for _ in range(args.cases):
+            po_lines, invoice_lines, truth = make_case(rng, size)
+            elapsed, result = timed(lambda: match_line_items(invoice_lines, po_lines), repeat=3)
+            numpy_times.append(elapsed)
+            lines = {line['invoice_line'] - 1: line['po_line_no'] - 1 for line in result['lines']}
+            numpy_hits.append(accuracy(lines, truth))
+
+            cost, _ = line_cost_matrix(line_arrays(invoice_lines, INVOICE_LINE_KEYS), line_arrays(po_lines, PO_LINE_KEYS))
+            rows, cols = np.nonzero(cost < np.float32(settings.LINE_MATCH_MAX_COST))
+            greedy_hits.append(accuracy(greedy(zip(cost[rows, cols].tolist(), rows.tolist(), cols.tolist())), truth))
+
+            if size <= args.python_max_lines:
+                elapsed, assignment = timed(lambda: match_python(invoice_lines, po_lines, weights, min_similarity, max_cost), repeat=1)
+                python_times.append(elapsed)
+                python_hits.append(accuracy(assignment, truth))
+
+        numpy_ms = statistics.median(numpy_times)
+        print(f"  {size:>4} dòng: numpy + Hungarian {numpy_ms:7.2f}ms / hóa đơn, đúng {statistics.mean(numpy_hits):.1%} "
+              f"(tham lam cùng chi phí: {statistics.mean(greedy_hits):.1%})")
+        if python_times:
+            python_ms = statistics.median(python_times)
+            speedups.append((size, python_ms / numpy_ms))
+            print(f"             python + difflib {python_ms:9.2f}ms / hóa đơn, đúng {statistics.mean(python_hits):.1%}")
+
+    size, speedup = speedups[-1]
+    print(f"\n🚀 Nhanh hơn x{speedup:.0f} ({size} dòng)")
+
+
+if __name__ == "__main__":
+    main()
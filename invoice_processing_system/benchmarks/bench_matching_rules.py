@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark quy tắc đối chiếu hóa đơn ↔ ERP: thông dịch rule_logic mỗi cặp vs closure đã biên dịch
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_matching_rules.py --pairs 100000
+
+- Sinh `pairs` cặp (hóa đơn, bản ghi ERP): khớp hẳn, lệch tiền / ngày nhỏ, số hóa đơn viết khác
+  (tiền tố 0, dấu phân cách, O đọc nhầm), và cặp không liên quan
+- "interpret": mỗi cặp tách + regex từng điều kiện của rule_logic rồi mới so (như đọc text quy tắc lúc chạy)
+- "compiled": CompiledRuleSet.evaluate_many() (closure lồng nhau, ngắn mạch)
+Quy tắc được dựng từ DEFAULT_RULES + 2 quy tắc nới lỏng, không cần database.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+from datetime import date, timedelta
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from invoice_processing_system.app_invoices.matching_rules import (
+    DEFAULT_RULES, CompiledRuleSet, MatchFacts, _CLAUSES, _CLAUSE_SPLIT,
+)
+
+EXTRA_RULES = (
+    (4, "invoice_number equal\namount within 5%\nscore 0.6"),
+    (5, "supplier equal\ndate within 30 days\namount within 50000\nscore 0.5"),
+)
+
+
+def make_pair(rng, suppliers):
+    """(dict hóa đơn, dict ERP) với một trong các kiểu sai lệch hay gặp."""
+    name, tax_id = rng.choice(suppliers)
+    number = rng.randint(1, 9999999)
+    amount = rng.randint(100, 50000) * 1000
+    day = date(2025, 1, 1) + timedelta(days=rng.randint(0, 364))
+    erp = {'invoice_number': f"{number:07d}", 'supplier_tax_id': tax_id, 'supplier_name': name,
+           'total_amount': amount, 'issue_date': day.isoformat()}
+    invoice = dict(erp, issue_date=day.strftime('%d/%m/%Y'))
+    roll = rng.random()
+    if roll < 0.2:
+        invoice['total_amount'] = round(amount * rng.uniform(0.99, 1.01))
+    elif roll < 0.35:
+        invoice['invoice_number'] = rng.choice((f"{number}", f"No. {number:07d}", f"{number:07d}".replace('0', 'O')))
+        invoice['supplier_tax_id'] = None
+    elif roll < 0.45:
+        invoice['issue_date'] = (day + timedelta(days=rng.randint(1, 10))).strftime('%d/%m/%Y')
+    elif roll < 0.7:
+        other_name, other_tax = rng.choice(suppliers)
+        invoice.update(invoice_number=f"{rng.randint(1, 9999999):07d}", supplier_name=other_name,
+                       supplier_tax_id=other_tax, total_amount=rng.randint(100, 50000) * 1000)
+    return invoice, erp
+
+
+def interpret(rules, inv, erp):
+    """Đọc text quy tắc ở mỗi cặp: tách điều kiện, regex, rồi so."""
+    for priority, text in rules:
+        score, ok = 1.0, True
+        for line in text.splitlines():
+            for part in _CLAUSE_SPLIT.split(line.split('#', 1)[0]):
+                clause = ' '.join(part.lower().split())
+                if not clause or not ok:
+                    continue
+                for kind, pattern in _CLAUSES:
+                    match = pattern.match(clause)
+                    if match:
+                        break
+                if kind == 'invoice_number':
+                    ok = inv.number is not None and inv.number == erp.number
+                elif kind == 'supplier':
+                    ok = inv.tax_id == erp.tax_id if inv.tax_id and erp.tax_id else (
+                        inv.supplier is not None and inv.supplier == erp.supplier)
+                elif kind == 'amount_within':
+                    tolerance = float(match.group(1))
+                    limit = tolerance / 100 * abs(erp.amount) if match.group(2) else tolerance
+                    ok = abs(inv.amount - erp.amount) <= limit
+                elif kind == 'date_within':
+                    ok = inv.day is not None and erp.day is not None and abs(inv.day - erp.day) <= int(match.group(1))
+                elif kind == 'score':
+                    score = float(match.group(1))
+        if ok:
+            return priority, score
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pairs', type=int, default=100000, help='Số cặp hóa đơn / ERP')
+    parser.add_argument('--suppliers', type=int, default=500, help='Số nhà cung cấp')
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    print("⏱️ Benchmark quy tắc đối chiếu hóa đơn ↔ ERP")
+    print("=" * 50)
+    suppliers = [(f"Công ty TNHH Nhà cung cấp {i}", f"01{i:08d}") for i in range(args.suppliers)]
+    raw = [make_pair(rng, suppliers) for _ in range(args.pairs)]
+
+    start = time.perf_counter()
+    pairs = [(MatchFacts(**invoice), MatchFacts(**erp)) for invoice, erp in raw]
+    prepare = time.perf_counter() - start
+    rule_rows = list(DEFAULT_RULES) + list(EXTRA_RULES)
+
+    start = time.perf_counter()
+    engine = CompiledRuleSet.from_rows([(None, priority, text) for priority, text in rule_rows])
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    results = engine.evaluate_many(pairs)
+    compiled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    interpreted = [interpret(rule_rows, inv, erp) for inv, erp in pairs]
+    interpret_time = time.perf_counter() - start
+
+    order = {rule.priority: index for index, rule in enumerate(engine.rules)}
+    evaluations = sum(order[rule.priority] + 1 if rule else len(engine) for rule in results)
+    agree = sum((rule.priority, rule.score) == other if rule else other is None
+                for rule, other in zip(results, interpreted))
+    matched = {}
+    for rule in results:
+        matched[rule.priority if rule else None] = matched.get(rule.priority if rule else None, 0) + 1
+
+    print(f"  {args.pairs} cặp, {len(engine)} quy tắc (biên dịch {compile_ms:.2f}ms), "
+          f"chuẩn hóa dữ liệu {prepare:.2f}s ({prepare / args.pairs / 2 * 1e6:.1f}µs / bản ghi)")
+    print("  khớp theo quy tắc: " + ", ".join(
+        f"#{priority}: {count}" for priority, count in sorted(matched.items(), key=lambda item: item[0] or 99)
+        if priority) + f", không khớp: {matched.get(None, 0)}")
+    print(f"  interpret: {interpret_time:.2f}s, {args.pairs / interpret_time:,.0f} cặp/s")
+    print(f"  compiled : {compiled:.3f}s, {args.pairs / compiled:,.0f} cặp/s, "
+          f"{evaluations / compiled:,.0f} quy tắc/s ({evaluations / args.pairs:.2f} quy tắc / cặp), "
+          f"cùng kết quả {agree}/{args.pairs}")
+    print(f"\n🚀 Nhanh hơn x{interpret_time / compiled:.0f}")
+
+
+if __name__ == "__main__":
+    main()
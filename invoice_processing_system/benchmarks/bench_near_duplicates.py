@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark tìm hóa đơn gần trùng: quét toàn bộ chữ ký vs tra chỉ mục LSH
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_near_duplicates.py --count 20000 --queries 200
+
+- Sinh `count` hóa đơn tổng hợp (nhiều nhà cung cấp, cùng mẫu trong một nhà cung cấp), ghi chỉ mục
+- Mỗi truy vấn là bản "scan lại" của một hóa đơn có sẵn (xóa / thay / chèn ký tự với tỷ lệ `--noise`)
+- "scan": so chữ ký truy vấn với chữ ký của MỌI hóa đơn (O(n), như so OCR text với cả bảng)
+- "lsh": find_near_duplicates() (bucket LSH có index → chỉ so các ứng viên)
+Benchmark dùng test database nên không ảnh hưởng dữ liệu thật.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+import numpy as np
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+from invoice_processing_system.app_invoices.models import Invoice, InvoiceTextSignature
+from invoice_processing_system.app_invoices.duplicate_index import (
+    compute_minhash, index_invoice_texts, find_near_duplicates, unpack_signature, signature_similarity,
+    default_threshold,
+)
+
+ITEMS = [
+    "Giấy in A4 Double A", "Mực in HP 12A", "Bút bi Thiên Long", "Laptop Dell Latitude 5420",
+    "Dịch vụ vận chuyển", "Nước uống đóng chai", "Bàn làm việc", "Ghế xoay văn phòng",
+    "Phí bảo trì máy lạnh", "Cáp mạng Cat6", "Chuột không dây Logitech", "Màn hình LG 24 inch",
+]
+BUYERS = ["Nguyễn Văn An", "Trần Thị Bình", "Lê Văn Cường", "Phạm Thu Dung"]
+
+
+def vnd(value):
+    return f"{value:,}".replace(',', '.')
+
+
+def make_invoice_text(rng, supplier, number):
+    """OCR text tổng hợp theo mẫu hóa đơn GTGT của một nhà cung cấp."""
+    lines = [
+        "HÓA ĐƠN GIÁ TRỊ GIA TĂNG", "Ký hiệu: 1C23TAA", f"Số: {number:07d}",
+        f"Ngày {rng.randint(1, 28)} tháng {rng.randint(1, 12)} năm 2025",
+        f"Đơn vị bán hàng: Công ty TNHH {supplier}", f"Mã số thuế: 0{rng.randint(100000000, 999999999)}",
+        f"Địa chỉ: {rng.randint(1, 300)} Nguyễn Trãi, Thanh Xuân, Hà Nội",
+        f"Họ tên người mua hàng: {rng.choice(BUYERS)}",
+        "STT Tên hàng hóa dịch vụ ĐVT Số lượng Đơn giá Thành tiền",
+    ]
+    total = 0
+    for index in range(rng.randint(2, 8)):
+        quantity, price = rng.randint(1, 50), rng.randint(10, 5000) * 1000
+        total += quantity * price
+        lines.append(f"{index + 1} {rng.choice(ITEMS)} Cái {quantity} {vnd(price)} {vnd(quantity * price)}")
+    lines += [
+        f"Cộng tiền hàng: {vnd(total)}", "Thuế suất GTGT: 10%", f"Tiền thuế GTGT: {vnd(total // 10)}",
+        f"Tổng cộng tiền thanh toán: {vnd(total * 11 // 10)} VND", "Người mua hàng Người bán hàng (Ký, ghi rõ họ tên)",
+    ]
+    return "\n".join(lines)
+
+
+def rescan(rng, text, noise):
+    """Giả lập scan lại: xóa, thay bằng ký tự OCR hay nhầm, hoặc chèn khoảng trắng."""
+    out = []
+    for ch in text:
+        roll = rng.random()
+        if roll < noise / 3:
+            continue
+        if roll < 2 * noise / 3:
+            out.append(rng.choice('0O1lI5S8B .,'))
+        elif roll < noise:
+            out.extend((ch, ' '))
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=20000, help='Số hóa đơn trong chỉ mục')
+    parser.add_argument('--suppliers', type=int, default=100, help='Số nhà cung cấp (mẫu hóa đơn)')
+    parser.add_argument('--queries', type=int, default=200, help='Số hóa đơn nộp lại cần tìm')
+    parser.add_argument('--noise', type=float, default=0.02, help='Tỷ lệ ký tự bị OCR sai khi scan lại')
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print("⏱️ Benchmark tìm hóa đơn gần trùng")
+        print("=" * 50)
+        texts = [
+            make_invoice_text(rng, f"Nhà cung cấp {rng.randrange(args.suppliers)}", number)
+            for number in range(1, args.count + 1)
+        ]
+        invoices = Invoice.objects.bulk_create(
+            [Invoice(file=f"invoices/bench_{i}.jpg", raw_ocr_text=text) for i, text in enumerate(texts)],
+            batch_size=2000,
+        )
+        ids = [invoice.id for invoice in invoices]
+
+        start = time.perf_counter()
+        for offset in range(0, len(ids), 1000):
+            index_invoice_texts(list(zip(ids[offset:offset + 1000], texts[offset:offset + 1000])))
+        build = time.perf_counter() - start
+        print(f"  ghi chỉ mục: {args.count} hóa đơn trong {build:.1f}s ({build / args.count * 1000:.2f}ms / hóa đơn)")
+
+        targets = rng.sample(range(args.count), args.queries)
+        queries = [compute_minhash(rescan(rng, texts[i], args.noise)) for i in targets]
+        threshold = default_threshold()
+
+        # Quét: nạp mọi chữ ký (mỗi truy vấn) và so với tất cả
+        scan_times, scan_hits = [], 0
+        for target, signature in zip(targets, queries):
+            start = time.perf_counter()
+            rows = list(InvoiceTextSignature.objects.values_list('invoice_id', 'signature'))
+            matrix = np.vstack([unpack_signature(blob) for _, blob in rows])
+            similarity = signature_similarity(signature, matrix)
+            found = {rows[i][0] for i in np.flatnonzero(similarity >= threshold)}
+            scan_times.append((time.perf_counter() - start) * 1000)
+            scan_hits += ids[target] in found
+
+        lsh_times, lsh_hits, false_hits = [], 0, 0
+        for target, signature in zip(targets, queries):
+            start = time.perf_counter()
+            found = find_near_duplicates(signature, limit=10)
+            lsh_times.append((time.perf_counter() - start) * 1000)
+            found_ids = {match['invoice_id'] for match in found}
+            lsh_hits += ids[target] in found_ids
+            false_hits += len(found_ids - {ids[target]})
+
+        print(f"  ngưỡng tương đồng {threshold}, nhiễu scan lại {args.noise:.0%}, {args.queries} truy vấn")
+        print(f"  scan: trung vị {statistics.median(scan_times):.1f}ms / truy vấn, tìm đúng {scan_hits}/{args.queries}")
+        print(f"  lsh : trung vị {statistics.median(lsh_times):.2f}ms / truy vấn, tìm đúng {lsh_hits}/{args.queries}, "
+              f"{false_hits} kết quả sai")
+        print(f"\n🚀 Nhanh hơn x{statistics.median(scan_times) / statistics.median(lsh_times):.0f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
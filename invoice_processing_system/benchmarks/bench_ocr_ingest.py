@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark upload hóa đơn: OCR đồng bộ trong request vs đưa vào hàng đợi Celery
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_ocr_ingest.py --count 20 --file anh9.jpg
+
+- Chế độ "sync": task_always_eager=True -> OCR + AI chạy ngay trong request (như trước đây)
+- Chế độ "async": request chỉ lưu file + đẩy job vào broker rồi trả 202
+Benchmark dùng test database + thư mục media tạm nên không ảnh hưởng dữ liệu thật.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import setup_test_environment
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from invoice_processing_system import celery_app
+
+
+def run_uploads(client, payload, filename, count):
+    """Upload `count` file và trả về (thời gian, danh sách status code)."""
+    codes = []
+    start = time.perf_counter()
+    for _ in range(count):
+        upload = SimpleUploadedFile(filename, payload, content_type='image/jpeg')
+        response = client.post('/api/invoices/', {'file': upload}, format='multipart')
+        codes.append(response.status_code)
+    return time.perf_counter() - start, codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=20, help='Số lần upload mỗi chế độ')
+    parser.add_argument('--file', default=str(ROOT_DIR / 'anh9.jpg'), help='Ảnh hóa đơn mẫu')
+    parser.add_argument('--broker', default='memory://', help='Broker cho chế độ async')
+    args = parser.parse_args()
+
+    payload = Path(args.file).read_bytes()
+    filename = Path(args.file).name
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    settings.MEDIA_ROOT = tempfile.mkdtemp(prefix='bench_media_')
+    try:
+        user = get_user_model().objects.create_user('bench', password='bench')
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        print("⏱️ Benchmark upload hóa đơn")
+        print("=" * 50)
+
+        # Celery đọc cấu hình lazily từ settings (namespace CELERY_)
+        settings.CELERY_BROKER_URL = args.broker
+        results = {}
+        for mode in ('sync', 'async'):
+            celery_app.conf.task_always_eager = (mode == 'sync')
+            elapsed, codes = run_uploads(client, payload, filename, args.count)
+            results[mode] = elapsed
+            print(f"  {mode:5s}: {args.count} uploads trong {elapsed:.2f}s "
+                  f"-> {args.count / elapsed:.1f} uploads/s (status: {sorted(set(codes))})")
+
+        print(f"\n🚀 Throughput tăng x{results['sync'] / results['async']:.1f} cho mỗi web worker")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark OCR PDF nhiều trang theo số worker
+
+Chạy từ thư mục gốc repo (cần poppler + tesseract):
+    python invoice_processing_system/benchmarks/bench_pdf_ocr.py statement.pdf --dpi 300 --workers 1 2 4 8
+"""
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from invoice_processing_system.app_invoices.pdf_ocr import pdf_page_count, ocr_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('pdf', help='File PDF nhiều trang')
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    pages = pdf_page_count(args.pdf)
+    print(f"📑 {args.pdf}: {pages} trang @ {args.dpi} DPI")
+    print("=" * 50)
+
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        start = time.perf_counter()
+        text = ocr_pdf(args.pdf, dpi=args.dpi, max_workers=workers, max_pages=None)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"  {workers:2d} worker: {elapsed:6.2f}s  ({pages / elapsed:.2f} trang/s, "
+              f"x{baseline / elapsed:.1f}, {len(text)} ký tự)")
+
+
+if __name__ == "__main__":
+    main()
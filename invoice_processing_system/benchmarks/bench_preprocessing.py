@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark tiền xử lý ảnh trước OCR: độ trễ OCR và độ chính xác trích xuất trước/sau
+
+Chạy từ thư mục gốc repo (cần tesseract):
+    python invoice_processing_system/benchmarks/bench_preprocessing.py anh9.jpg anh10.jpg --labels labels.json
+
+File labels (tùy chọn) dạng {"anh9.jpg": {"invoice_number": "0001234", "total_amount": 1500000}}.
+Không có labels thì báo cáo tỷ lệ trường trích xuất được (fill rate).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+import pytesseract
+from PIL import Image
+
+from invoice_processing_system.app_invoices.image_preprocessing import preprocess_for_ocr
+from invoice_processing_system.app_invoices.ai_services import ai_extractor
+
+FIELDS = ['invoice_number', 'supplier_name', 'total_amount', 'tax_amount', 'issue_date']
+
+
+def score_fields(extracted, expected):
+    """Số trường đúng (có labels) hoặc số trường không rỗng (không có labels)."""
+    if expected:
+        return sum(1 for k, v in expected.items() if str(extracted.get(k)) == str(v)), len(expected)
+    return sum(1 for k in FIELDS if extracted.get(k)), len(FIELDS)
+
+
+def run(files, labels, preprocess):
+    ocr_time, prep_time, hits, total = 0.0, 0.0, 0, 0
+    for path in files:
+        start = time.perf_counter()
+        image = preprocess_for_ocr(path) if preprocess else Image.open(path)
+        prep_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        text = pytesseract.image_to_string(image, lang='vie+eng')
+        ocr_time += time.perf_counter() - start
+
+        ok, n = score_fields(ai_extractor.extract_smart_data(text), labels.get(Path(path).name))
+        hits, total = hits + ok, total + n
+    return prep_time, ocr_time, hits / total if total else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='*', default=sorted(str(p) for p in ROOT_DIR.glob('anh*.jpg')))
+    parser.add_argument('--labels', help='File JSON giá trị đúng theo tên file')
+    args = parser.parse_args()
+
+    labels = json.loads(Path(args.labels).read_text(encoding='utf-8')) if args.labels else {}
+    metric = 'độ chính xác' if labels else 'fill rate'
+
+    print(f"🖼️ Benchmark tiền xử lý trên {len(args.files)} ảnh")
+    print("=" * 50)
+    for preprocess in (False, True):
+        prep, ocr, accuracy = run(args.files, labels, preprocess)
+        name = 'có tiền xử lý' if preprocess else 'ảnh gốc'
+        print(f"  {name:14s}: tiền xử lý {prep / len(args.files) * 1000:7.1f}ms/ảnh, "
+              f"OCR {ocr / len(args.files):6.2f}s/ảnh, {metric} {accuracy:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark thời gian khởi động và bộ nhớ (RSS) của tiến trình Django / Celery worker
+
+Mỗi kịch bản chạy trong tiến trình Python mới, đo thời gian và peak RSS:
+- `manage.py check`           : chi phí mọi lệnh manage.py / web worker khi khởi động
+- `web: import views`          : nạp URLconf + views (không khởi tạo AI service nào)
+- `worker boot`                : django.setup + tasks + hook worker_process_init (nạp sẵn AI_PRELOAD_SERVICES)
+- `eager: ai_services (cũ)`    : import + khởi tạo toàn bộ AI service như trước (tham chiếu)
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_startup.py --repeat 3
+"""
+
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+SETUP = (
+    "import os, sys, django; sys.path.insert(0, {root!r}); "
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings'); "
+    "django.setup(); "
+).format(root=str(ROOT_DIR))
+
+# Đo peak RSS ngay trong tiến trình con rồi in ra dòng cuối
+REPORT_RSS = (
+    "import resource; "
+    "rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss; "
+    "print('RSS_KB', rss // 1024 if sys.platform == 'darwin' else rss)"
+)
+
+SCENARIOS = [
+    ("manage.py check", [sys.executable, str(ROOT_DIR / 'manage.py'), 'check'], False),
+    ("web: import views", [sys.executable, '-c', SETUP +
+        "import invoice_processing_system.app_invoices.views; " + REPORT_RSS], True),
+    ("worker boot", [sys.executable, '-c', SETUP +
+        "from invoice_processing_system.app_invoices import tasks; "
+        "tasks.preload_ocr_engine(); tasks.preload_ai_models(); " + REPORT_RSS], True),
+    ("eager: ai_services (cũ)", [sys.executable, '-c', SETUP +
+        "from invoice_processing_system.app_invoices import ai_services; "
+        "import sklearn.ensemble, sklearn.feature_extraction.text, pandas, joblib; "
+        "ai_services.preload_ai_services(); " + REPORT_RSS], True),
+]
+
+
+def run_once(cmd, reports_rss):
+    start = time.perf_counter()
+    result = subprocess.run(cmd, cwd=str(ROOT_DIR), capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'lỗi không rõ')
+
+    rss_kb = None
+    if reports_rss:
+        for line in result.stdout.splitlines():
+            if line.startswith('RSS_KB'):
+                rss_kb = int(line.split()[1])
+    return elapsed, rss_kb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"🚀 Benchmark khởi động ({args.repeat} lần mỗi kịch bản, lấy giá trị tốt nhất)")
+    print("=" * 64)
+    for name, cmd, reports_rss in SCENARIOS:
+        try:
+            runs = [run_once(cmd, reports_rss) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"  {name:26s}: ⚠️ bỏ qua ({e})")
+            continue
+        best = min(elapsed for elapsed, _ in runs)
+        rss = max((rss for _, rss in runs if rss), default=None)
+        rss_text = f"{rss / 1024:7.1f}MB RSS" if rss else "       -"
+        print(f"  {name:26s}: {best:6.2f}s  {rss_text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark nhận diện nhà cung cấp: quét tuần tự vs chỉ mục trigram trong RAM
+
+Chạy từ thư mục gốc repo:
+    python invoice_processing_system/benchmarks/bench_supplier_resolver.py --count 100000 --queries 2000
+
+- Sinh `count` nhà cung cấp tổng hợp (loại hình + ngành nghề + tên riêng tiếng Việt)
+- Truy vấn "có sẵn": tên của nhà cung cấp có sẵn viết kiểu khác (đổi / bỏ loại hình, bỏ dấu, chữ hoa,
+  viết tắt TNHH / CP / TM) + lỗi OCR (`--noise` ký tự bị thay bằng ký tự hay nhầm)
+- Truy vấn "mới": tên chưa có trong bảng → đúng khi không khớp ai (khớp nhầm = gộp sai nhà cung cấp)
+- "cần xem xét": không tự gộp nhưng gần giống một nhà cung cấp (SupplierResolver.near_match())
+- "scan": Jaccard trigram với MỌI nhà cung cấp (O(n)); "index": SupplierResolver.match()
+Chỉ mục dựng từ các dòng sinh sẵn nên không cần database.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+import tracemalloc
+from pathlib import Path
+
+# Setup Django
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+from invoice_processing_system.app_invoices.supplier_resolver import (
+    SupplierResolver, fold_text, normalize_supplier_name, name_trigrams,
+)
+
+# Âm tiết ghép từ phụ âm đầu + vần (có dấu): ~700 âm tiết như tên riêng thực tế
+ONSETS = "_ b c ch d đ g gi h kh l m n ng nh ph qu s t th tr v x".split()
+RHYMES = (
+    "an anh ao ai ài ải ánh ạnh ương ường inh ình ịnh ong òng ung ùng ũng ôn ơn ên iến iệt ạt ắt ức ực "
+    "ợi ộc ú ý à ân ần ấn oàn oan uy uân iêm ăng ằng ầu ưu ội ồng ải ảo ương ế ỳ ước ửu"
+).split()
+SYLLABLES = sorted({(onset.strip('_') + rhyme).capitalize() for onset in ONSETS for rhyme in RHYMES})
+FORMS = ["Công ty TNHH", "Công ty Cổ phần", "Công ty TNHH MTV", "Doanh nghiệp tư nhân", "Công ty", ""]
+FORM_ABBREV = {"Công ty TNHH": "Cty TNHH", "Công ty Cổ phần": "CTY CP", "Công ty TNHH MTV": "CT TNHH MTV"}
+LINES = ["Thương mại", "Dịch vụ", "Thương mại Dịch vụ", "Sản xuất", "Xây dựng", "Đầu tư", ""]
+LINE_ABBREV = {"Thương mại": "TM", "Dịch vụ": "DV", "Thương mại Dịch vụ": "TM DV", "Sản xuất": "SX"}
+OCR_CONFUSION = {'o': '0', 'O': '0', 'l': '1', 'i': '1', 'I': 'l', 's': '5', 'S': '5', 'B': '8', 'g': 'q', 'n': 'm', 'u': 'v'}
+
+
+def make_supplier(rng):
+    words = rng.sample(SYLLABLES, rng.choice((2, 2, 3, 3, 4)))
+    return rng.choice(FORMS), rng.choice(LINES), " ".join(words)
+
+
+def render(form, line, core):
+    return " ".join(part for part in (form, line, core) if part)
+
+
+def variant(rng, form, line, core, noise):
+    """Cùng nhà cung cấp, cách viết khác trên hóa đơn + lỗi OCR."""
+    form = rng.choice((form, FORM_ABBREV.get(form, form), "", "Công ty"))
+    line = rng.choice((line, LINE_ABBREV.get(line, line), ""))
+    name = render(form, line, core)
+    roll = rng.random()
+    if roll < 0.3:
+        name = fold_text(name)
+    elif roll < 0.6:
+        name = name.upper()
+    chars = list(name)
+    for index, ch in enumerate(chars):
+        if ch in OCR_CONFUSION and rng.random() < noise:
+            chars[index] = OCR_CONFUSION[ch]
+    return "".join(chars)
+
+
+def scan_match(rows, name, threshold):
+    """Quét tuần tự: Jaccard trigram với mọi nhà cung cấp."""
+    query = name_trigrams(normalize_supplier_name(name))
+    best = None, 0.0
+    for supplier_id, grams in rows:
+        overlap = len(query & grams)
+        score = overlap / (len(query) + len(grams) - overlap)
+        if score >= threshold and score > best[1]:
+            best = supplier_id, score
+    return best[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100000, help='Số nhà cung cấp trong chỉ mục')
+    parser.add_argument('--queries', type=int, default=2000, help='Số truy vấn (một nửa có sẵn, một nửa mới)')
+    parser.add_argument('--scan-queries', type=int, default=50, help='Số truy vấn cho quét tuần tự (chậm)')
+    parser.add_argument('--noise', type=float, default=0.05, help='Tỷ lệ ký tự dễ nhầm bị OCR sai')
+    parser.add_argument('--threshold', type=float, default=None, help='Ngưỡng Jaccard (mặc định: settings)')
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    print("⏱️ Benchmark nhận diện nhà cung cấp")
+    print("=" * 50)
+    suppliers, cores = [], set()
+    while len(suppliers) < args.count + args.queries // 2:
+        form, line, core = make_supplier(rng)
+        key = normalize_supplier_name(core)
+        if key not in cores:
+            cores.add(key)
+            suppliers.append((form, line, core))
+    known, unseen = suppliers[:args.count], suppliers[args.count:]
+    rows = [(supplier_id, render(*parts), None) for supplier_id, parts in enumerate(known, start=1)]
+
+    start = time.perf_counter()
+    resolver = SupplierResolver(threshold=args.threshold).load(rows)
+    build = time.perf_counter() - start
+    # Dựng lần nữa dưới tracemalloc (chậm hơn nhiều) chỉ để đo RAM
+    tracemalloc.start()
+    measured = SupplierResolver(threshold=args.threshold).load(rows)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+    print(f"  dựng chỉ mục: {args.count} nhà cung cấp trong {build:.2f}s, ~{memory / 2**20:.0f}MB, "
+          f"ngưỡng Jaccard {resolver.threshold} (cần xem xét từ {resolver.review_threshold})")
+
+    targets = rng.sample(range(args.count), args.queries // 2)
+    queries = [(variant(rng, *known[i], args.noise), i + 1) for i in targets]
+    queries += [(variant(rng, *parts, args.noise), None) for parts in unseen]
+
+    times, stats = [], {'correct': 0, 'wrong': 0, 'missed': 0, 'missed_review': 0,
+                        'new_ok': 0, 'new_merged': 0, 'new_review': 0}
+    for name, expected in queries:
+        start = time.perf_counter()
+        match = resolver.match(name)
+        times.append((time.perf_counter() - start) * 1000)
+        found = match.supplier_id if match else None
+        if expected is None:
+            stats['new_ok' if found is None else 'new_merged'] += 1
+        else:
+            stats['correct' if found == expected else 'missed' if found is None else 'wrong'] += 1
+        if found is None and resolver.near_match(name):
+            stats['new_review' if expected is None else 'missed_review'] += 1
+
+    scan_rows = [(supplier_id, name_trigrams(normalize_supplier_name(name))) for supplier_id, name, _ in rows]
+    scan_times, scan_agree = [], 0
+    for name, _ in queries[:args.scan_queries]:
+        start = time.perf_counter()
+        found = scan_match(scan_rows, name, resolver.threshold)
+        scan_times.append((time.perf_counter() - start) * 1000)
+        match = resolver.match(name)
+        scan_agree += found == (match.supplier_id if match else None)
+
+    times.sort()
+    existing, new = args.queries // 2, len(unseen)
+    print(f"  nhà cung cấp có sẵn ({existing}): đúng {stats['correct']}, sai {stats['wrong']}, "
+          f"không nhận ra {stats['missed']} (gắn cờ cần xem xét {stats['missed_review']})")
+    print(f"  nhà cung cấp mới ({new}): tạo mới đúng {stats['new_ok']}, gộp nhầm {stats['new_merged']} "
+          f"(gắn cờ cần xem xét {stats['new_review']})")
+    print(f"  index: trung vị {statistics.median(times):.3f}ms, p99 {times[int(len(times) * 0.99)]:.3f}ms / truy vấn")
+    print(f"  scan : trung vị {statistics.median(scan_times):.1f}ms / truy vấn "
+          f"(cùng kết quả với index {scan_agree}/{len(scan_times)})")
+    print(f"\n🚀 Nhanh hơn x{statistics.median(scan_times) / statistics.median(times):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+⏱️ Benchmark pytesseract (subprocess mỗi ảnh) vs engine Tesseract giữ sẵn trong tiến trình
+
+Chạy từ thư mục gốc repo (cần tesseract + tesserocr):
+    python invoice_processing_system/benchmarks/bench_tesseract_engine.py anh9.jpg --repeat 20
+"""
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_processing_system.settings')
+
+import django
+django.setup()
+
+import pytesseract
+
+from invoice_processing_system.app_invoices.image_preprocessing import preprocess_for_ocr
+from invoice_processing_system.app_invoices import ocr_engine
+
+
+def measure(name, ocr, images, repeat):
+    ocr(images[0])  # warm-up (lần nạp model đầu tiên)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for image in images:
+            ocr(image)
+    elapsed = time.perf_counter() - start
+    count = repeat * len(images)
+    print(f"  {name:12s}: {elapsed / count * 1000:8.1f}ms/ảnh, {count / elapsed:6.2f} ảnh/s trên 1 core")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='*', default=[str(ROOT_DIR / 'anh9.jpg')])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--lang', default='vie+eng')
+    args = parser.parse_args()
+
+    images = [preprocess_for_ocr(path) for path in args.files]
+    print(f"🔤 Benchmark OCR {len(images)} ảnh x {args.repeat} lần")
+    print("=" * 50)
+
+    subprocess_time = measure('pytesseract', lambda im: pytesseract.image_to_string(im, lang=args.lang),
+                              images, args.repeat)
+    if not ocr_engine.TESSEROCR_AVAILABLE:
+        print("  ⚠️ tesserocr chưa được cài đặt, bỏ qua engine trong tiến trình")
+        return
+    engine_time = measure('tesserocr', lambda im: ocr_engine.ocr_image_to_string(im, lang=args.lang),
+                          images, args.repeat)
+    print(f"\n🚀 Nhanh hơn x{subprocess_time / engine_time:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -78,6 +78,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'invoice_processing_system.wsgi.application'
+# Chat stream (SSE) cần ASGI: uvicorn invoice_processing_system.asgi:application
+ASGI_APPLICATION = 'invoice_processing_system.asgi.application'
 
 # ------------------------------------------------
 # Cấu hình Database - ĐÃ SỬA TRIỆT ĐỂ
@@ -135,8 +137,23 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Cấu hình OCR & AI
 # ------------------------------------------------
 TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe" 
+TESSDATA_PREFIX = None  # Thư mục tessdata cho engine tesserocr (None = mặc định)
 GOOGLE_VISION_CREDENTIALS = os.path.join(BASE_DIR, 'config', 'google_cloud_key.json') 
 
+# Tiền xử lý ảnh trước OCR: EXIF, thu nhỏ về DPI mục tiêu, nhị phân hóa, chỉnh nghiêng
+OCR_PREPROCESSING = True
+OCR_TARGET_DPI = 300
+
+# OCR file PDF: rasterize từng trang (cần poppler) và OCR song song
+PDF_OCR_DPI = 300
+PDF_OCR_WORKERS = None  # None = số core CPU
+PDF_OCR_MAX_PAGES = 100
+POPPLER_PATH = None  # Windows: đường dẫn thư mục bin của poppler
+
+# Cache kết quả OCR theo SHA-256 nội dung file (LRU, giới hạn dung lượng)
+OCR_CACHE_MAX_BYTES = 200 * 1024 * 1024
+OCR_CACHE_VERSION = 3  # Tăng khi đổi engine/cấu hình OCR để bỏ cache cũ
+
 # Đặt biến môi trường Google Cloud
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_VISION_CREDENTIALS
 
@@ -150,6 +167,128 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Ho_Chi_Minh'
 
+# OCR là tác vụ dài: mỗi worker chỉ nhận 1 job, ack sau khi chạy xong
+# để job không bị mất nếu worker chết giữa chừng
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ROUTES = {
+    'invoice_processing_system.app_invoices.tasks.process_invoice_ocr': {'queue': 'ocr'},
+    'invoice_processing_system.app_invoices.tasks.process_invoice_ocr_batch': {'queue': 'ocr'},
+    'invoice_processing_system.app_invoices.tasks.train_ai_model': {'queue': 'training'},
+    'invoice_processing_system.app_invoices.tasks.rebuild_embedding_index': {'queue': 'training'},
+    # 1 worker riêng: celery -A invoice_processing_system worker -Q erp -c 1
+    'invoice_processing_system.app_invoices.tasks.drain_erp_outbox': {'queue': 'erp'},
+}
+
+# Task định kỳ (cần chạy `celery -A invoice_processing_system beat` cạnh các worker), chu kỳ tính bằng giây
+CELERY_BEAT_SCHEDULE = {
+    # Ảnh chụp chỉ mục embedding mới: vector sau ảnh chụp cũ được mỗi tiến trình tìm kiếm đọc thêm từ DB
+    'rebuild-embedding-index': {
+        'task': 'invoice_processing_system.app_invoices.tasks.rebuild_embedding_index',
+        'schedule': 60 * 60,
+    },
+    # Bản sao ERP: delta theo mốc high-water mỗi 5 phút, đồng bộ đầy đủ (xóa bản ghi ERP đã bỏ) mỗi ngày.
+    # /match/ trả 400 cho tới lần đồng bộ đầu tiên: khi triển khai chạy `python manage.py sync_erp_mirror` một lần
+    'sync-erp-mirror': {
+        'task': 'invoice_processing_system.app_invoices.tasks.sync_erp_mirror',
+        'schedule': 5 * 60,
+    },
+    'sync-erp-mirror-full': {
+        'task': 'invoice_processing_system.app_invoices.tasks.sync_erp_mirror',
+        'schedule': 24 * 60 * 60,
+        'kwargs': {'full': True},
+    },
+}
+
+# AI service được nạp sẵn khi Celery worker khởi động (web process nạp lười ở lần dùng đầu)
+AI_PRELOAD_SERVICES = ['ai_classifier', 'ai_extractor', 'fraud_detector', 'ai_predictor']
+
+# Số luồng RandomForest của AI Classifier khi train / phân loại theo lô (-1 = mọi core)
+AI_CLASSIFIER_N_JOBS = -1
+
+# Số fold cross-validation mặc định của job huấn luyện đầy đủ
+AI_TRAINING_CV_FOLDS = 5
+
+# Registry phiên bản AI model: ai_models/<model_type>/vNNNN + file ACTIVE, giữ lại N phiên bản cũ khi dọn
+AI_MODEL_ROOT = os.path.join(BASE_DIR, 'ai_models')
+AI_MODEL_KEEP_VERSIONS = 5
+
+# Phát hiện hóa đơn gần trùng (MinHash + LSH trên OCR text): 120 hàm băm = 20 band × 6 hàng.
+# Xác suất thành ứng viên: ~98% ở độ tương đồng 0.75, ~27% ở 0.5 (hóa đơn khác cùng mẫu của 1 nhà cung cấp)
+INVOICE_MINHASH_PERMUTATIONS = 120
+INVOICE_LSH_BANDS = 20
+INVOICE_NEAR_DUPLICATE_THRESHOLD = 0.75
+
+# Nhận diện nhà cung cấp (MST chính xác, tên bỏ dấu / loại hình doanh nghiệp so khớp theo Jaccard trigram).
+# ≥ 0.9: tự gộp (benchmark 100k nhà cung cấp: 0 tên mới bị gộp nhầm; 0.8 gộp nhầm ~3%)
+# 0.8 - 0.9: tạo nhà cung cấp mới + gắn cờ cần xem xét trên hóa đơn
+SUPPLIER_MATCH_THRESHOLD = 0.9
+SUPPLIER_REVIEW_THRESHOLD = 0.8
+
+# Tìm hóa đơn tương tự: embedding OCR text (sentence-transformers, CPU) + chỉ mục vector NumPy memory-mapped.
+# Ảnh chụp chỉ mục nằm trong registry AI_MODEL_ROOT/embedding_index; từ IVF_MIN_ROWS hàng thêm bộ lượng tử thô
+# (√n cụm), mỗi truy vấn quét IVF_PROBES cụm gần nhất
+INVOICE_EMBEDDING_MODEL = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+INVOICE_EMBEDDING_BATCH_SIZE = 32
+INVOICE_EMBEDDING_MAX_CHARS = 2000
+INVOICE_EMBEDDING_IVF_MIN_ROWS = 300000
+INVOICE_EMBEDDING_IVF_PROBES = 16
+INVOICE_EMBEDDING_KEEP_SNAPSHOTS = 2
+
+# Bản sao ERP cục bộ (erp_mirror.py): đồng bộ delta nhà cung cấp + PO theo trang, đối chiếu hóa đơn chỉ truy vấn
+# PO đang mở cùng MST, tiền trong ± AMOUNT_WINDOW, ngày trong ± DATE_WINDOW_DAYS (quy tắc MatchingRule chấm điểm sau)
+ERP_MIRROR_PAGE_SIZE = 1000
+ERP_MIRROR_TIMEOUT = 30
+ERP_MIRROR_AMOUNT_WINDOW = 0.05
+ERP_MIRROR_DATE_WINDOW_DAYS = 60
+ERP_MIRROR_MAX_CANDIDATES = 50
+
+# Ghi hóa đơn lên ERP (erp_client.py): lô ERP_PUSH_BATCH_SIZE bản ghi / request, tối đa MAX_CONCURRENCY request song song
+# (= số kết nối keep-alive mỗi ERP), lỗi tạm thời thử lại với backoff lũy thừa có jitter; lỗi liên tiếp ≥ FAILURE_THRESHOLD
+# thì ngắt mạch endpoint trong RESET_TIMEOUT giây (hóa đơn nhận erp_error ngay, không gọi ERP)
+ERP_PUSH_BATCH_SIZE = 100
+ERP_PUSH_MAX_CONCURRENCY = 4
+ERP_PUSH_TIMEOUT = 30
+ERP_PUSH_MAX_RETRIES = 3
+ERP_PUSH_BACKOFF_BASE = 0.2
+ERP_PUSH_BACKOFF_MAX = 5.0
+ERP_BREAKER_FAILURE_THRESHOLD = 5
+ERP_BREAKER_RESET_TIMEOUT = 30
+
+# Outbox ERP (erp_outbox.py): phê duyệt / đối chiếu chỉ ghi sự kiện cùng transaction, worker gửi theo lô BATCH_SIZE,
+# giữ lô trong LEASE_SECONDS; lỗi tạm thời thử lại sau RETRY_BASE × 2^lần giây (tối đa RETRY_MAX), quá MAX_ATTEMPTS → FAILED
+ERP_OUTBOX_BATCH_SIZE = 500
+ERP_OUTBOX_LEASE_SECONDS = 300
+ERP_OUTBOX_MAX_ATTEMPTS = 10
+ERP_OUTBOX_RETRY_BASE = 5
+ERP_OUTBOX_RETRY_MAX = 600
+# Worker riêng `manage.py drain_erp_outbox --loop` tự poll outbox. True = đánh thức thêm task drain_erp_outbox sau mỗi commit
+# (request phải gửi 1 message tới broker: broker chậm / mất kết nối thì độ trễ phê duyệt tăng theo)
+ERP_OUTBOX_KICK_ON_COMMIT = False
+
+# Đối chiếu dòng hàng hóa đơn ↔ PO ↔ phiếu nhập (line_matching.py): chi phí = WEIGHTS · (1 - tương đồng mô tả,
+# lệch số lượng, lệch đơn giá); cặp chi phí ≥ MAX_COST hoặc tương đồng mô tả < MIN_SIMILARITY không được ghép.
+# Lệch số lượng > QUANTITY_TOLERANCE hoặc lệch đơn giá > PRICE_TOLERANCE (tỉ lệ đơn giá PO) → dòng "variance"
+LINE_MATCH_WEIGHTS = (0.5, 0.25, 0.25)
+LINE_MATCH_MIN_SIMILARITY = 0.3
+LINE_MATCH_MAX_COST = 0.35
+LINE_MATCH_QUANTITY_TOLERANCE = 0
+LINE_MATCH_PRICE_TOLERANCE = 0.01
+
+# AI Chatbot: backend 'openai' / 'local' / dotted path tới class ChatBackend ('' = openai nếu có OPENAI_API_KEY).
+# Câu hỏi kiểu FAQ được cache theo câu hỏi chuẩn hóa trong cache AI_CHAT_CACHE_ALIAS (Redis nếu cấu hình CACHES)
+AI_CHAT_BACKEND = os.getenv('AI_CHAT_BACKEND', '')
+AI_CHAT_MODEL = 'gpt-3.5-turbo'
+AI_CHAT_MAX_TOKENS = 500
+AI_CHAT_TEMPERATURE = 0.7
+AI_CHAT_TIMEOUT = 30
+AI_CHAT_CACHE_ALIAS = 'default'
+AI_CHAT_CACHE_TIMEOUT = 24 * 3600
+
+# Upload hàng loạt: số hóa đơn trong mỗi task OCR và giới hạn số file mỗi lô
+BULK_UPLOAD_OCR_CHUNK_SIZE = 20
+BULK_UPLOAD_MAX_FILES = 1000
+
 # ------------------------------------------------
 # Cấu hình Django REST Framework
 # ------------------------------------------------